@@ -0,0 +1,483 @@
+"""
+矿山储量核实报告异步提取器
+
+基于服务商的异步客户端（Gemini `client.aio`、OpenAI `AsyncOpenAI`），所有提取器共享进程级的
+HTTP连接池（keep-alive，可配置连接数上限），便于在一个事件循环中并发处理大量提取任务。
+
+用法示例:
+    import asyncio
+    from mining_report_async import create_async_extractor, configure_client_pool
+
+    async def run(files):
+        configure_client_pool(max_connections=50)
+        extractor = create_async_extractor("gemini", "gemini-2.5-flash")
+        return await asyncio.gather(*(extractor.extract_from_file(f) for f in files))
+"""
+import asyncio
+import os
+import pathlib
+import time
+import weakref
+from abc import ABC, abstractmethod
+from typing import Optional, List, Dict, Any, Tuple, Type, AsyncIterator
+
+from pydantic import BaseModel
+
+from mining_report_cache import UPLOAD_NAME_PREFIX, UploadRegistry
+from mining_report_extractor_stream import (
+    CONVERSATION_INSTRUCTIONS,
+    EXIT_COMMANDS,
+    ConversationEvent,
+    ExtractorSupportMixin,
+    MiningReport,
+    OpenAIPromptCache,
+)
+from mining_report_metrics import gemini_usage, openai_usage
+
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0  # 秒
+DEFAULT_TIMEOUT = 600.0  # 大文件上传和长文档生成耗时较长
+
+
+# ========== 共享连接池 ==========
+class AsyncClientPool:
+    """进程级共享的异步HTTP连接池
+
+    每个事件循环持有一个httpx.AsyncClient（httpx客户端不能跨事件循环使用），
+    同一事件循环中的所有提取器及Gemini/OpenAI客户端共用该连接池，复用keep-alive连接。
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Any, Any]]" = weakref.WeakKeyDictionary()
+
+    def _loop_clients(self) -> Dict[Any, Any]:
+        return self._loops.setdefault(asyncio.get_running_loop(), {})
+
+    def get_http_client(self) -> Any:
+        """获取当前事件循环的共享httpx.AsyncClient"""
+        clients = self._loop_clients()
+        if "http" not in clients:
+            try:
+                import httpx
+            except ImportError:
+                raise ImportError("请安装必需包: pip install httpx")
+            clients["http"] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=30.0),
+            )
+        return clients["http"]
+
+    def get_openai_client(self, api_key: str, base_url: Optional[str] = None) -> Any:
+        """获取当前事件循环中使用共享连接池的AsyncOpenAI客户端"""
+        clients = self._loop_clients()
+        key = ("openai", api_key, base_url)
+        if key not in clients:
+            from openai import AsyncOpenAI
+            clients[key] = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.get_http_client())
+        return clients[key]
+
+    def get_gemini_client(self, api_key: str, base_url: Optional[str] = None) -> Any:
+        """获取当前事件循环中使用共享连接池的Gemini客户端"""
+        clients = self._loop_clients()
+        key = ("gemini", api_key, base_url)
+        if key not in clients:
+            from google import genai
+            from google.genai import types
+            clients[key] = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(base_url=base_url, httpx_async_client=self.get_http_client()),
+            )
+        return clients[key]
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环的连接池"""
+        clients = self._loops.pop(asyncio.get_running_loop(), {})
+        if "http" in clients:
+            await clients["http"].aclose()
+
+
+SHARED_CLIENT_POOL = AsyncClientPool()
+
+
+def configure_client_pool(max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                          max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                          keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                          timeout: float = DEFAULT_TIMEOUT) -> None:
+    """配置共享连接池参数（需在事件循环中首次创建客户端之前调用）"""
+    SHARED_CLIENT_POOL.max_connections = max_connections
+    SHARED_CLIENT_POOL.max_keepalive_connections = max_keepalive_connections
+    SHARED_CLIENT_POOL.keepalive_expiry = keepalive_expiry
+    SHARED_CLIENT_POOL.timeout = timeout
+
+
+# ========== 异步抽象基类 ==========
+class AsyncBaseMiningReportExtractor(ExtractorSupportMixin, ABC):
+    """矿山报告异步提取器抽象基类"""
+
+    def __init__(self, api_key: Optional[str] = None, model: str = None,
+                 pool: Optional[AsyncClientPool] = None, scheduler: Optional[Any] = None, **kwargs):
+        # 请求调度、分块断点续传和上下文缓存只有同步实现，静默忽略会让调用方误以为已生效
+        options = {"scheduler": scheduler, "upload_checkpoints": kwargs.get("upload_checkpoints"),
+                   "context_cache": kwargs.get("context_cache")}
+        unsupported = [name for name, value in options.items() if value is not None]
+        if unsupported:
+            raise ValueError(f"异步提取器不支持以下选项，请使用同步提取器: {', '.join(unsupported)}")
+        super().__init__(api_key, model, **kwargs)
+        self.pool = pool or SHARED_CLIENT_POOL
+
+    @abstractmethod
+    async def extract_from_file(self, file_path: str) -> MiningReport:
+        """从PDF文件提取信息"""
+        pass
+
+    async def _load_cached(self, file_path: str) -> Optional[MiningReport]:
+        """在线程中查询缓存（计算大文件哈希不阻塞事件循环）"""
+        if self.cache is None:
+            return None
+        return await asyncio.to_thread(self._get_cached_result, file_path)
+
+    async def _store_cached(self, file_path: str, result: MiningReport) -> None:
+        """在线程中写入缓存"""
+        if self.cache is not None:
+            await asyncio.to_thread(self._put_cached_result, file_path, result)
+
+
+# ========== Gemini 异步实现 ==========
+class AsyncGeminiMiningReportExtractor(AsyncBaseMiningReportExtractor):
+    """基于Gemini异步客户端的矿山报告提取器"""
+
+    PROVIDER = "gemini"
+    FILE_SIZE_THRESHOLD = 20 * 1024 * 1024  # 内联请求的大小上限20MB
+    INLINE_MAX_BYTES = 4 * 1024 * 1024  # 默认只内联4MB以内的小文件
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash", env_file: str = ".env",
+                 base_url: Optional[str] = None, inline_max_bytes: Optional[int] = None, **kwargs):
+        super().__init__(api_key, model, **kwargs)
+        self.base_url = base_url  # 指向代理或本地模拟服务（见mining_report_benchmark.py）
+        # 与同步版本相同：超过该大小的文件经File API上传，其余以内联字节随请求发送
+        self.inline_max_bytes = min(self.INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes,
+                                    self.FILE_SIZE_THRESHOLD)
+
+        try:
+            from google import genai
+            from google.genai import types
+            from dotenv import load_dotenv
+            self.types = types
+            load_dotenv(env_file)
+        except ImportError:
+            raise ImportError("请安装必需包: pip install google-genai python-dotenv httpx")
+
+        self.api_key = api_key or os.getenv('GEMINI_API_KEY')
+        if not self.api_key:
+            raise ValueError("请提供GEMINI_API_KEY环境变量或直接传入api_key参数")
+
+    @property
+    def client(self) -> Any:
+        """当前事件循环的共享Gemini客户端"""
+        return self.pool.get_gemini_client(self.api_key, self.base_url)
+
+    async def _upload_file(self, filepath: pathlib.Path) -> Any:
+        """通过File API上传文件，启用登记表时复用仍然有效的已上传文件"""
+        file_sha256 = await asyncio.to_thread(self._upload_sha256, str(filepath)) if self.upload_registry else None
+        if file_sha256:
+            entry = self.upload_registry.lookup(self.PROVIDER, file_sha256)
+            if entry:
+                try:
+                    remote_file = await self.client.aio.files.get(name=entry["remote_id"])
+                    if str(getattr(remote_file.state, "name", remote_file.state)) == "ACTIVE":
+                        self._log("♻️ 复用已上传的Gemini文件，跳过上传")
+                        return remote_file
+                except Exception:
+                    pass
+                self.upload_registry.remove(self.PROVIDER, [entry["remote_id"]])
+
+        self._log("⏳ 正在上传文件到Gemini服务器...")
+        upload_config = {"mime_type": "application/pdf"}
+        if file_sha256:
+            upload_config["display_name"] = f"{UPLOAD_NAME_PREFIX}{file_sha256[:16]}"
+        with self._span("upload"):
+            uploaded_file = await self.client.aio.files.upload(file=filepath, config=upload_config)
+        self._add_metrics(upload_bytes=filepath.stat().st_size)
+        self._log("✅ 文件上传完成")
+
+        if file_sha256:
+            expiration = getattr(uploaded_file, "expiration_time", None)
+            expires_at = expiration.timestamp() if expiration else time.time() + UploadRegistry.GEMINI_FILE_TTL_SECONDS
+            self.upload_registry.register(self.PROVIDER, file_sha256, uploaded_file.name, expires_at)
+        return uploaded_file
+
+    async def _prepare_document(self, upload_path: str, use_file_api: Optional[bool] = None) -> Any:
+        """准备发送给模型的文档内容（内联字节或File API文件）"""
+        upload_filepath = pathlib.Path(upload_path)
+        if use_file_api is None:
+            use_file_api = upload_filepath.stat().st_size > self.inline_max_bytes
+
+        self._log(f"📁 文件大小: {self._get_file_size_mb(upload_path):.2f} MB")
+
+        if use_file_api:
+            return await self._upload_file(upload_filepath)
+        with self._span("file_read"):
+            data = await asyncio.to_thread(upload_filepath.read_bytes)
+        self._add_metrics(upload_bytes=len(data))
+        return self.types.Part.from_bytes(data=data, mime_type='application/pdf')
+
+    async def _request_structured(self, document: Any, prompt: str, schema: Type[BaseModel],
+                                  model: Optional[str] = None) -> Tuple[BaseModel, Any]:
+        """发送结构化输出请求，返回(校验后的模型, 原始响应)"""
+        with self._span("generation"):
+            response = await self.client.aio.models.generate_content(
+                model=model or self.model,
+                contents=[document, prompt],
+                config={
+                    "response_mime_type": "application/json",
+                    "response_schema": schema,
+                }
+            )
+        self._add_usage(gemini_usage(response))
+        if not response.text:
+            # 被安全策略拦截或输出达到长度上限时没有文本，直接校验只会得到难以理解的JSON解析错误
+            candidate = response.candidates[0] if response.candidates else None
+            reason = getattr(candidate, "finish_reason", None) or getattr(response, "prompt_feedback", None)
+            raise ValueError(f"模型未返回可解析的结构化结果（{reason}）")
+        with self._span("validation"):
+            return schema.model_validate_json(response.text), response
+
+    async def extract_from_file(self, file_path: str, use_file_api: Optional[bool] = None) -> MiningReport:
+        """从PDF文件提取信息"""
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        with self._track(file_path):
+            cached = await self._load_cached(file_path)
+            if cached is not None:
+                return cached
+
+            local_resources = await asyncio.to_thread(self._local_resources, file_path)
+            upload_path, is_temporary = await asyncio.to_thread(self._prepare_upload_path, file_path)
+            try:
+                document = await self._prepare_document(upload_path, use_file_api)
+            finally:
+                self._discard_upload_path(upload_path, is_temporary)
+
+            self._log("🔍 正在分析文档内容...")
+            prompt, schema = self._report_prompt(local_resources)
+            parsed, _ = await self._request_structured(document, prompt, schema)
+            result = self._with_local_resources(parsed, local_resources)
+            self._log("✅ 文档分析完成")
+            await self._store_cached(file_path, result)
+            return result
+
+
+# ========== OpenAI 异步实现（带流式对话功能） ==========
+class AsyncOpenAIMiningReportExtractorWithStreamConversation(AsyncBaseMiningReportExtractor):
+    """基于AsyncOpenAI的矿山报告提取器（带流式对话功能）
+
+    与同步版本不同，单次提取的file_id和response_id作为返回值/参数传递，
+    同一实例可在一个事件循环中并发处理多个文档。
+    """
+
+    PROVIDER = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "o4-mini", env_file: str = ".env",
+                 base_url: Optional[str] = None, prompt_cache_retention: Optional[str] = None, **kwargs):
+        super().__init__(api_key, model, **kwargs)
+        self.base_url = base_url  # 指向代理或本地模拟服务（见mining_report_benchmark.py）
+        self.prompt_cache = OpenAIPromptCache(prompt_cache_retention)
+
+        try:
+            import openai
+            from dotenv import load_dotenv
+            load_dotenv(env_file)
+        except ImportError:
+            raise ImportError("请安装必需包: pip install openai python-dotenv httpx")
+
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        if not self.api_key:
+            raise ValueError("请提供OPENAI_API_KEY环境变量或直接传入api_key参数")
+
+    @property
+    def client(self) -> Any:
+        """当前事件循环的共享AsyncOpenAI客户端"""
+        return self.pool.get_openai_client(self.api_key, self.base_url)
+
+    async def _upload_file(self, file_path: str) -> str:
+        """上传文件到OpenAI，启用登记表时复用仍然有效的已上传文件"""
+        if not self.upload_registry:
+            self._log("📤 正在上传文件到OpenAI服务器...")
+            # 传入文件句柄由HTTP客户端分段读取发送，不将整个文件读入内存
+            with self._span("upload"), open(file_path, "rb") as f:
+                file = await self.client.files.create(file=(pathlib.Path(file_path).name, f), purpose="user_data")
+            self._add_metrics(upload_bytes=pathlib.Path(file_path).stat().st_size)
+            self._log("✅ 文件上传完成")
+            return file.id
+
+        file_sha256 = await asyncio.to_thread(self._upload_sha256, file_path)
+        entry = self.upload_registry.lookup(self.PROVIDER, file_sha256)
+        if entry:
+            try:
+                await self.client.files.retrieve(entry["remote_id"])
+                self._log("♻️ 复用已上传的OpenAI文件，跳过上传")
+                return entry["remote_id"]
+            except Exception:
+                self.upload_registry.remove(self.PROVIDER, [entry["remote_id"]])
+
+        self._log("📤 正在上传文件到OpenAI服务器...")
+        ttl_seconds = self.upload_registry.openai_ttl_seconds
+        with self._span("upload"), open(file_path, "rb") as f:
+            file = await self.client.files.create(
+                file=(f"{UPLOAD_NAME_PREFIX}{file_sha256[:16]}.pdf", f),
+                purpose="user_data",
+                expires_after={"anchor": "created_at", "seconds": ttl_seconds},
+            )
+        self._add_metrics(upload_bytes=pathlib.Path(file_path).stat().st_size)
+        self._log("✅ 文件上传完成")
+        self.upload_registry.register(self.PROVIDER, file_sha256, file.id, time.time() + ttl_seconds)
+        return file.id
+
+    async def extract_with_response(self, file_path: str) -> Tuple[MiningReport, Optional[str], Optional[str]]:
+        """从PDF文件提取信息，返回(结果, file_id, response_id)；缓存命中时后两者为None"""
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        with self._track(file_path):
+            cached = await self._load_cached(file_path)
+            if cached is not None:
+                return cached, None, None
+
+            local_resources = await asyncio.to_thread(self._local_resources, file_path)
+            upload_path, is_temporary = await asyncio.to_thread(self._prepare_upload_path, file_path)
+            try:
+                self._log(f"📁 文件大小: {self._get_file_size_mb(upload_path):.2f} MB")
+                file_id = await self._upload_file(upload_path)
+                self.prompt_cache.register_document(file_id, await asyncio.to_thread(self._upload_sha256, upload_path))
+            finally:
+                self._discard_upload_path(upload_path, is_temporary)
+
+            self._log("🔍 正在分析文档内容...")
+            prompt, schema = self._report_prompt(local_resources)
+            with self._span("generation"):
+                response = await self.client.responses.parse(
+                    model=self.model,
+                    input=self.prompt_cache.document_input(file_id, prompt),
+                    text_format=schema,
+                    **self.prompt_cache.options(file_id),
+                )
+            self.prompt_cache.link(file_id, response.id)
+            self._add_usage(openai_usage(response))
+            if response.output_parsed is None:
+                # 模型拒答、输出因长度上限被截断等情况下SDK不抛出异常，只是没有解析结果
+                reason = getattr(getattr(response, "incomplete_details", None), "reason", None) or response.status
+                raise ValueError(f"模型未返回可解析的结构化结果（{reason}）")
+            result = self._with_local_resources(response.output_parsed, local_resources)
+            self._log("✅ 文档分析完成")
+            await self._store_cached(file_path, result)
+            return result, file_id, response.id
+
+    async def extract_from_file(self, file_path: str) -> MiningReport:
+        """从PDF文件提取信息"""
+        result, _, _ = await self.extract_with_response(file_path)
+        return result
+
+    async def conversation_document(self, file_path: str) -> str:
+        """上传对话随问题发送的完整报告并返回file_id（提取结果来自缓存、没有可链接的响应时使用）"""
+        file_id = await self._upload_file(file_path)
+        self.prompt_cache.register_document(file_id, await asyncio.to_thread(self._upload_sha256, file_path))
+        return file_id
+
+    async def stream_answer(self, question: str, previous_response_id: Optional[str] = None,
+                            document: Optional[str] = None) -> AsyncIterator[ConversationEvent]:
+        """基于previous_response_id链提问，流式产出回答片段，最后产出带新response_id的done事件
+
+        document为file_id时随问题一起发送文档（没有可链接的响应时使用）。
+        调用方提前关闭生成器（如客户端断开）时同时关闭上游流，不再继续生成。
+        请求布局与同步版本相同（见OpenAIPromptCache），多个会话从同一提取响应分叉时共享其缓存前缀。
+        """
+        request, added_instructions = self.prompt_cache.conversation_request(
+            question, previous_response_id, document, CONVERSATION_INSTRUCTIONS)
+        stream = await self.client.responses.create(model=self.model, stream=True, **request)
+        response_id = None
+        cached_tokens = 0
+        try:
+            async for event in stream:
+                if event.type == 'response.output_text.delta':
+                    yield ConversationEvent("delta", event.delta)
+                elif event.type in ('response.completed', 'response.done'):
+                    response_id = event.response.id
+                    cached_tokens = openai_usage(event.response).get("cached_tokens", 0)
+        finally:
+            await stream.close()
+        self.prompt_cache.link(previous_response_id or document, response_id, added_instructions)
+        yield ConversationEvent("done", response_id=response_id, source="model", cached_tokens=cached_tokens)
+
+    async def start_conversation(self, initial_response_id: str) -> None:
+        """开始对话模式（异步版本，终端输入在线程中读取，不阻塞事件循环）"""
+        print("\n" + "="*50)
+        print("💬 进入对话模式")
+        print(f"🤖 使用模型: {self.model}")
+        print("="*50)
+        print("您现在可以询问关于这份矿山报告的任何问题。")
+        print("输入 'exit' 或 '退出' 结束对话。")
+        print("="*50)
+
+        previous_response_id = initial_response_id
+        while True:
+            try:
+                user_input = (await asyncio.to_thread(input, "\n🙋 您的问题: ")).strip()
+                if user_input.lower() in EXIT_COMMANDS:
+                    print("\n👋 结束对话，感谢使用！")
+                    break
+                if not user_input:
+                    print("❌ 请输入有效的问题")
+                    continue
+
+                print("\n🤖 AI回答:")
+                print("-" * 50)
+                async for event in self.stream_answer(user_input, previous_response_id):
+                    if event.type == "delta":
+                        print(event.text, end='', flush=True)
+                    elif event.response_id:
+                        previous_response_id = event.response_id
+                print("\n" + "-" * 50)
+
+            except (KeyboardInterrupt, EOFError):
+                print("\n\n👋 用户中断对话")
+                break
+            except Exception as e:
+                print(f"\n❌ 对话过程中出现错误: {e}")
+                print("您可以尝试重新提问或退出对话。")
+
+    async def cleanup(self, file_ids: List[str]) -> None:
+        """并发删除临时上传的文件（已登记复用的文件保留到过期）"""
+        if self.upload_registry:
+            return
+
+        async def delete(file_id: str) -> None:
+            try:
+                await self.client.files.delete(file_id)
+            except Exception as e:
+                self._log(f"⚠️ 清理临时文件 {file_id} 时出现警告: {e}")
+
+        await asyncio.gather(*(delete(file_id) for file_id in file_ids if file_id))
+
+
+def create_async_extractor(provider: str, model: str, **kwargs) -> AsyncBaseMiningReportExtractor:
+    """工厂函数：创建异步提取器实例"""
+    if provider == "gemini":
+        return AsyncGeminiMiningReportExtractor(model=model, **kwargs)
+    elif provider == "openai":
+        return AsyncOpenAIMiningReportExtractorWithStreamConversation(model=model, **kwargs)
+    else:
+        raise ValueError(f"不支持的提供商: {provider}")
@@ -0,0 +1,429 @@
+"""
+矿山储量核实报告批量提取工具（非交互式）
+
+用法示例:
+    python mining_report_batch.py reports/ --provider gemini --model gemini-2.5-flash --concurrency 8
+    python mining_report_batch.py "reports/**/*.pdf" --provider openai --model o4-mini -o results
+    python mining_report_batch.py reports/ --provider gemini --journal batch_journal.jsonl  # 中断后重新运行可继续
+"""
+import argparse
+import contextlib
+import glob
+import json
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, List, Dict, Any, Callable
+
+from pydantic import BaseModel
+
+from mining_report_cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CONTEXT_CACHES,
+    DEFAULT_UPLOAD_CHECKPOINTS,
+    DEFAULT_UPLOAD_REGISTRY,
+    ContextCacheRegistry,
+    ExtractionCache,
+    UploadCheckpoints,
+    UploadReconciler,
+    UploadRegistry,
+    compute_file_sha256,
+)
+from mining_report_extractor_stream import (
+    FAST_MODELS,
+    GEMINI_MODELS,
+    OPENAI_MODELS,
+    BaseMiningReportExtractor,
+    MiningReport,
+    create_extractor,
+)
+from mining_report_hedge import HedgeStats, HedgedMiningReportExtractor
+from mining_report_metrics import FanoutMetricsSink, JSONLMetricsSink, MetricsSink, PrometheusMetricsSink
+from mining_report_pages import PageSelector
+from mining_report_journal import DEFAULT_JOURNAL_PATH, DEFAULT_MAX_ATTEMPTS, JOB_SAVED, JobJournal
+from mining_report_scheduler import ExtractionScheduler, RateLimit
+from mining_report_store import ResultStore
+from mining_report_tables import DEFAULT_MIN_CONFIDENCE, ResourceTableParser
+from mining_report_validation import ESCALATION_MODELS, ValidatedExtractor
+from mining_report_dedup import DEFAULT_MIN_SIMILARITY, DeduplicatingExtractor, SimilarityIndex
+
+
+DEFAULT_CONCURRENCY = 4
+SUMMARY_FILENAME = "batch_summary.json"
+
+
+# ========== 批量结果模型 ==========
+class BatchItemResult(BaseModel):
+    """单个文档的批量处理结果"""
+    file: str
+    status: str  # success/failed/skipped
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    elapsed_seconds: float = 0.0
+
+
+class BatchSummary(BaseModel):
+    """批量处理汇总"""
+    provider: str
+    model: str
+    concurrency: int
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    wall_clock_seconds: float = 0.0
+    items: List[BatchItemResult] = []
+
+
+# ========== 文件收集 ==========
+def collect_pdf_files(source: str, recursive: bool = False) -> List[pathlib.Path]:
+    """根据目录、glob模式或单个文件路径收集PDF文件"""
+    path = pathlib.Path(source)
+    if path.is_dir():
+        candidates = path.rglob("*") if recursive else path.glob("*")
+    elif path.is_file():
+        candidates = [path]
+    else:
+        candidates = [pathlib.Path(p) for p in glob.glob(source, recursive=True)]
+
+    files = [p for p in candidates if p.is_file() and p.suffix.lower() == ".pdf"]
+
+    # 去重并保持稳定顺序
+    return sorted(set(files))
+
+
+def _output_paths(files: List[pathlib.Path], output_dir: pathlib.Path) -> Dict[pathlib.Path, pathlib.Path]:
+    """为每个PDF分配结果文件路径，同名文件追加序号避免覆盖"""
+    used: Dict[str, int] = {}
+    paths = {}
+    for pdf_file in files:
+        stem = pdf_file.stem
+        count = used.get(stem, 0)
+        used[stem] = count + 1
+        name = f"{stem}_result.json" if count == 0 else f"{stem}_{count}_result.json"
+        paths[pdf_file] = output_dir / name
+    return paths
+
+
+# ========== 批量执行 ==========
+def run_batch(files: List[pathlib.Path],
+              provider: str,
+              model: str,
+              output_dir: str = ".",
+              concurrency: int = DEFAULT_CONCURRENCY,
+              extractor_kwargs: Optional[Dict[str, Any]] = None,
+              extract_fn: Optional[Callable[[BaseMiningReportExtractor, str], MiningReport]] = None,
+              extractor_factory: Optional[Callable[[], BaseMiningReportExtractor]] = None,
+              store: Optional[ResultStore] = None,
+              write_json: bool = True,
+              journal: Optional[JobJournal] = None) -> BatchSummary:
+    """并发提取多个PDF文件，每个文档输出一个结果文件（和/或写入结果库），并返回汇总信息
+
+    提取过程主要耗时在等待网络响应上，因此使用线程池并发执行。
+    每个工作线程持有独立的提取器实例（提取器会保存file_id等单次提取状态）。
+    extract_fn可指定提取方式（如分块提取），默认调用extract_from_file；
+    extractor_factory可替换提取器的创建方式（如对冲提取器），默认使用create_extractor。
+    store指定时结果批量写入SQLite结果库，write_json=False时不再输出单独的JSON文件。
+    journal指定时记录每个文档的处理进度：跳过已完成的文档，复用已上传的文件，失败的文档在次数上限内重试。
+    """
+    output_root = pathlib.Path(output_dir)
+    output_root.mkdir(parents=True, exist_ok=True)
+    output_paths = _output_paths(files, output_root)
+    extractor_kwargs = extractor_kwargs or {}
+    extract_fn = extract_fn or (lambda extractor, file_path: extractor.extract_from_file(file_path))
+    extractor_factory = extractor_factory or (lambda: create_extractor(provider, model, **extractor_kwargs))
+    local = threading.local()
+
+    def get_extractor() -> BaseMiningReportExtractor:
+        if not hasattr(local, "extractor"):
+            local.extractor = extractor_factory()
+        return local.extractor
+
+    def process(pdf_file: pathlib.Path) -> BatchItemResult:
+        started = time.perf_counter()
+        job = journal.claim(pdf_file) if journal is not None else None
+        if journal is not None and job is None:
+            return BatchItemResult(file=str(pdf_file), status="skipped", error="已完成或正由其它工作进程处理")
+        extractor = None
+        try:
+            extractor = get_extractor()
+            with job.activate() if job is not None else contextlib.nullcontext():
+                result = extract_fn(extractor, str(pdf_file))
+            output_path = None
+            if write_json:
+                output_path = str(output_paths[pdf_file])
+                if not extractor.save_result(result, output_path):
+                    raise IOError(f"无法写入结果文件: {output_path}")
+            if store is not None:
+                store.add(result, source_file=str(pdf_file), provider=provider, model=model,
+                          file_sha256=compute_file_sha256(str(pdf_file)))
+            if job is not None:
+                job.record(JOB_SAVED, output_path=output_path)
+            return BatchItemResult(
+                file=str(pdf_file),
+                status="success",
+                output_path=output_path,
+                elapsed_seconds=time.perf_counter() - started,
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job is not None:
+                job.fail(error)
+            return BatchItemResult(
+                file=str(pdf_file),
+                status="failed",
+                error=error,
+                elapsed_seconds=time.perf_counter() - started,
+            )
+        finally:
+            if extractor is not None and hasattr(extractor, "cleanup"):
+                extractor.cleanup()
+
+    summary = BatchSummary(provider=provider, model=model, concurrency=concurrency, total=len(files))
+    wall_started = time.perf_counter()
+
+    pending = files
+    if journal is not None:
+        pending, skipped = journal.plan(files)
+        summary.items.extend(BatchItemResult(file=str(pdf_file), status="skipped", error=reason)
+                             for pdf_file, reason in skipped)
+        if skipped:
+            print(f"⏭️ 根据任务日志跳过 {len(skipped)} 个文档（已完成或失败次数已达上限）")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = {pool.submit(process, pdf_file): pdf_file for pdf_file in pending}
+            try:
+                for done_count, future in enumerate(as_completed(futures), 1):
+                    item = future.result()
+                    summary.items.append(item)
+                    mark = {"success": "✅", "skipped": "⏭️"}.get(item.status, "❌")
+                    print(f"{mark} [{done_count}/{len(pending)}] {pathlib.Path(item.file).name} "
+                          f"({item.elapsed_seconds:.1f}s)")
+            except KeyboardInterrupt:
+                # 取消尚未开始的文档，等待进行中的文档结束（其进度已写入任务日志）
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        if store is not None:
+            store.flush()
+    summary.wall_clock_seconds = time.perf_counter() - wall_started
+    summary.succeeded = sum(1 for item in summary.items if item.status == "success")
+    summary.skipped = sum(1 for item in summary.items if item.status == "skipped")
+    summary.failed = summary.total - summary.succeeded - summary.skipped
+    summary.items.sort(key=lambda item: item.file)
+    return summary
+
+
+def save_summary(summary: BatchSummary, output_path: str) -> None:
+    """保存批量处理汇总到JSON文件"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(summary.model_dump(), f, ensure_ascii=False, indent=2)
+
+
+def print_batch_summary(summary: BatchSummary) -> None:
+    """打印批量处理汇总"""
+    print("\n" + "="*50)
+    print("📦 批量处理汇总")
+    print("="*50)
+    print(f"  • 提供商/模型: {summary.provider} - {summary.model}")
+    print(f"  • 并发数: {summary.concurrency}")
+    print(f"  • 文档总数: {summary.total}")
+    print(f"  • 成功: {summary.succeeded}")
+    print(f"  • 失败: {summary.failed}")
+    if summary.skipped:
+        print(f"  • 跳过: {summary.skipped}")
+    print(f"  • 总耗时: {summary.wall_clock_seconds:.1f}s")
+
+    failed_items = [item for item in summary.items if item.status == "failed"]
+    if failed_items:
+        print(f"\n❌ 失败文档:")
+        for item in failed_items:
+            print(f"  • {pathlib.Path(item.file).name}: {item.error}")
+
+    print("\n" + "="*50)
+
+
+# ========== 命令行入口 ==========
+def build_arg_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="矿山储量核实报告批量提取工具（非交互式）")
+    parser.add_argument("source", help="PDF目录、glob模式（如 \"reports/**/*.pdf\"）或单个PDF文件")
+    parser.add_argument("--provider", choices=["gemini", "openai"], required=True, help="AI提供商")
+    parser.add_argument("--model", help=f"模型名称（Gemini默认 {GEMINI_MODELS[0]}，OpenAI默认 {OPENAI_MODELS[0]}）")
+    parser.add_argument("-o", "--output-dir", default=".", help="结果输出目录（默认当前目录）")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="并发文档数")
+    parser.add_argument("-r", "--recursive", action="store_true", help="source为目录时递归查找子目录")
+    parser.add_argument("--env-file", default=".env", help="环境变量文件路径")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="提取结果缓存目录")
+    parser.add_argument("--no-cache", action="store_true", help="禁用提取结果缓存")
+    parser.add_argument("--upload-registry", default=DEFAULT_UPLOAD_REGISTRY, help="上传文件登记表路径")
+    parser.add_argument("--upload-checkpoints", default=DEFAULT_UPLOAD_CHECKPOINTS,
+                        help="大文件分块上传的断点记录路径（中断后重新运行时从断点继续上传）")
+    parser.add_argument("--no-upload-reuse", action="store_true", help="不复用已上传文件和上传断点，每次重新上传")
+    parser.add_argument("--context-cache-ttl", type=int,
+                        help="启用Gemini上下文缓存（文档只处理一次，分章节提取、重跑等多次请求复用），有效期N秒")
+    parser.add_argument("--context-caches", default=DEFAULT_CONTEXT_CACHES, help="Gemini上下文缓存登记表路径")
+    parser.add_argument("--page-budget", type=int, help="启用页面预筛选，仅发送相关性最高的N页（需要pypdf）")
+    parser.add_argument("--local-tables", action="store_true",
+                        help="本地解析资源量汇总表，置信时跳过模型提取资源信息（需要pypdf）")
+    parser.add_argument("--table-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f"本地解析资源量表的置信度阈值（默认 {DEFAULT_MIN_CONFIDENCE}）")
+    parser.add_argument("--chunk-pages", type=int, help="启用分块并行提取，每个片段N页（需要pypdf）")
+    parser.add_argument("--sections", action="store_true", help="启用分章节并行提取")
+    parser.add_argument("--fast-model", help="分章节提取时简单章节使用的模型（默认Gemini为gemini-2.5-flash，OpenAI为gpt-4.1-nano）")
+    parser.add_argument("--validate", action="store_true",
+                        help="本地校验提取结果，仅对未通过的子结构定向重提，并按模型阶梯逐级升级")
+    parser.add_argument("--escalation-models", nargs="+",
+                        help="--validate的模型阶梯（默认Gemini为gemini-2.5-flash gemini-2.5-pro，OpenAI为o4-mini o3）")
+    parser.add_argument("--dedup-index", help="启用近重复增量提取：相似度索引文件（如 similarity_index.db），"
+                                                  "沿用最相近的已提取报告，只提取变化页面")
+    parser.add_argument("--dedup-similarity", type=float, default=DEFAULT_MIN_SIMILARITY,
+                        help="沿用已提取报告所需的最低相似度（矿权编号相同时阈值更低）")
+    parser.add_argument("--rpm", type=float, help="每个模型每分钟请求数上限（启用限速与重试调度）")
+    parser.add_argument("--tpm", type=float, help="每个模型每分钟估算token数上限（启用限速与重试调度）")
+    parser.add_argument("--max-retries", type=int, default=5, help="可重试错误（429/5xx）的最大重试次数")
+    parser.add_argument("--hedge-provider", choices=["gemini", "openai"], help="启用对冲提取：对冲路径的提供商")
+    parser.add_argument("--hedge-model", help="对冲路径的模型（默认该提供商的第一个预设模型）")
+    parser.add_argument("--hedge-delay", type=float, default=60.0, help="主路径历史样本不足时的对冲等待秒数")
+    parser.add_argument("--hedge-stats", default="hedge_stats.json", help="对冲耗时与胜出统计文件")
+    parser.add_argument("--reconcile-uploads", action="store_true", help="处理结束后批量清理孤立的远程上传文件")
+    parser.add_argument("--store", help="将结果批量写入SQLite结果库（如 mining_reports.db）")
+    parser.add_argument("--no-json", action="store_true", help="不输出单独的结果JSON文件（需配合--store）")
+    parser.add_argument("--journal", nargs="?", const=DEFAULT_JOURNAL_PATH,
+                        help=f"启用可恢复的任务日志（默认 {DEFAULT_JOURNAL_PATH}），中断后重新运行跳过已完成的文档")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="启用任务日志时，每个文档跨运行的最大尝试次数")
+    parser.add_argument("-q", "--quiet", action="store_true", help="静默模式：不输出单个文档的阶段进度，仅输出完成情况和汇总")
+    parser.add_argument("--metrics-jsonl", help="将每次提取的阶段耗时、字节数和token用量追加写入JSONL文件")
+    parser.add_argument("--metrics-prom", help="将累计指标以Prometheus文本格式写入文件（供textfile收集器采集）")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """批量模式主函数"""
+    args = build_arg_parser().parse_args(argv)
+    model = args.model or (GEMINI_MODELS[0] if args.provider == "gemini" else OPENAI_MODELS[0])
+
+    if args.no_json and not args.store:
+        print("❌ --no-json 需要配合 --store 使用")
+        return 1
+
+    files = collect_pdf_files(args.source, recursive=args.recursive)
+    if not files:
+        print(f"❌ 未找到PDF文件: {args.source}")
+        return 1
+
+    print("🏔️  矿山储量核实报告批量提取")
+    print(f"📁 共 {len(files)} 个PDF文件，并发数 {args.concurrency}")
+
+    extractor_kwargs = {"env_file": args.env_file, "quiet": args.quiet}
+    sinks: List[MetricsSink] = []
+    if args.metrics_jsonl:
+        sinks.append(JSONLMetricsSink(args.metrics_jsonl))
+    if args.metrics_prom:
+        sinks.append(PrometheusMetricsSink(args.metrics_prom))
+    if sinks:
+        extractor_kwargs["metrics_sink"] = sinks[0] if len(sinks) == 1 else FanoutMetricsSink(sinks)
+    if not args.no_cache:
+        extractor_kwargs["cache"] = ExtractionCache(args.cache_dir)
+    if not args.no_upload_reuse:
+        extractor_kwargs["upload_registry"] = UploadRegistry(args.upload_registry)
+        extractor_kwargs["upload_checkpoints"] = UploadCheckpoints(args.upload_checkpoints)
+    if args.context_cache_ttl:
+        extractor_kwargs["context_cache"] = ContextCacheRegistry(args.context_caches, ttl_seconds=args.context_cache_ttl)
+    if args.page_budget:
+        extractor_kwargs["page_selector"] = PageSelector(page_budget=args.page_budget)
+    if args.local_tables:
+        extractor_kwargs["table_parser"] = ResourceTableParser(min_confidence=args.table_confidence)
+
+    extract_fn = None
+    scheduled_models = [(args.provider, model)]  # 本次运行会请求的模型，启用调度时分别配额
+    if args.hedge_provider and (args.chunk_pages or args.sections):
+        print("❌ --hedge-provider 不能与 --chunk-pages/--sections 同时使用")
+        return 1
+    if args.validate and (args.chunk_pages or args.sections or args.hedge_provider):
+        print("❌ --validate 不能与 --chunk-pages/--sections/--hedge-provider 同时使用")
+        return 1
+    if args.dedup_index and (args.validate or args.chunk_pages or args.sections or args.hedge_provider):
+        print("❌ --dedup-index 不能与 --validate/--chunk-pages/--sections/--hedge-provider 同时使用")
+        return 1
+    similarity_index = SimilarityIndex(args.dedup_index) if args.dedup_index else None
+    if similarity_index is not None:
+        extract_fn = lambda extractor, file_path: DeduplicatingExtractor(
+            extractor, similarity_index, min_similarity=args.dedup_similarity).extract_from_file(file_path)
+    elif args.validate:
+        escalation_models = args.escalation_models or ESCALATION_MODELS[args.provider]
+        if args.model and args.model != escalation_models[0]:
+            print(f"⚠️ --validate 按模型阶梯 {' → '.join(escalation_models)} 提取，忽略 --model {args.model}"
+                  f"（可使用 --escalation-models 指定阶梯）")
+        extract_fn = lambda extractor, file_path: ValidatedExtractor(extractor, escalation_models).extract_from_file(file_path)
+        scheduled_models += [(args.provider, escalation_model) for escalation_model in escalation_models]
+    elif args.chunk_pages:
+        extract_fn = lambda extractor, file_path: extractor.extract_chunked(file_path, pages_per_chunk=args.chunk_pages)
+    elif args.sections:
+        fast_model = args.fast_model or FAST_MODELS[args.provider]
+        extract_fn = lambda extractor, file_path: extractor.extract_sections(file_path, fast_model=fast_model)
+        scheduled_models.append((args.provider, fast_model))
+    if args.hedge_provider:
+        hedge_model = args.hedge_model or (GEMINI_MODELS[0] if args.hedge_provider == "gemini" else OPENAI_MODELS[0])
+        scheduled_models.append((args.hedge_provider, hedge_model))
+
+    if args.rpm or args.tpm:
+        # 调度器作用于每个模型请求（分章节、分块等模式的多个请求分别计入配额并单独重试）；
+        # 快速模型、升级阶梯和对冲模型各自按同样的上限限速，不会绕过调度
+        extractor_kwargs["scheduler"] = ExtractionScheduler(
+            {f"{provider}/{name}": RateLimit(rpm=args.rpm, tpm=args.tpm) for provider, name in scheduled_models},
+            max_retries=args.max_retries, quiet=args.quiet)
+
+    extractor_factory = None
+    if args.hedge_provider:
+        hedge_stats = HedgeStats(args.hedge_stats)
+        extractor_factory = lambda: HedgedMiningReportExtractor(
+            (args.provider, model), (args.hedge_provider, hedge_model),
+            default_hedge_delay=args.hedge_delay, stats=hedge_stats, **extractor_kwargs)
+
+    store = ResultStore(args.store) if args.store else None
+    journal = JobJournal(args.journal, max_attempts=args.max_attempts) if args.journal else None
+
+    try:
+        summary = run_batch(
+            files,
+            provider=args.provider,
+            model=model,
+            output_dir=args.output_dir,
+            concurrency=args.concurrency,
+            extractor_kwargs=extractor_kwargs,
+            extract_fn=extract_fn,
+            extractor_factory=extractor_factory,
+            store=store,
+            write_json=not args.no_json,
+            journal=journal,
+        )
+    except KeyboardInterrupt:
+        if journal is not None:
+            print(f"\n⏹️ 已中断，处理进度已记录到 {args.journal}，重新运行相同命令将从中断处继续")
+        else:
+            print("\n⏹️ 已中断（使用 --journal 可在重新运行时跳过已完成的文档）")
+        return 130
+    finally:
+        if store is not None:
+            store.close()
+        if similarity_index is not None:
+            similarity_index.close()
+
+    summary_path = pathlib.Path(args.output_dir) / SUMMARY_FILENAME
+    save_summary(summary, str(summary_path))
+    print_batch_summary(summary)
+    print(f"✅ 汇总已保存到: {summary_path}")
+
+    if args.reconcile_uploads and "upload_registry" in extractor_kwargs:
+        reconciler = UploadReconciler(create_extractor(args.provider, model, **extractor_kwargs),
+                                      extractor_kwargs["upload_registry"])
+        reconciler.run_once()
+    return 0 if summary.failed == 0 else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,932 @@
+"""
+矿山储量核实报告提取性能基准测试（本地模拟服务）
+
+启动一个模拟OpenAI/Gemini接口的本地HTTP服务，在不消耗真实配额的情况下，
+以不同并发数和PDF大小驱动GeminiMiningReportExtractor和
+OpenAIMiningReportExtractorWithStreamConversation，统计吞吐量（文档/秒）、
+p50/p95/p99延迟和峰值内存（RSS），用于离线发现性能回退。
+
+模拟的接口：
+- OpenAI：files.create/retrieve/list/delete、uploads.create/parts/complete（分块上传）、
+  responses.parse（非流式）、responses.create/stream（流式SSE），按请求前缀（文档或响应链）模拟提示缓存命中
+- Gemini：files.upload（可续传上传协议，含断点查询）/get/list/delete、caches.create/get/update/delete（上下文缓存）、
+  generate_content、generate_content_stream
+
+用法示例:
+    python mining_report_benchmark.py run --providers gemini openai --concurrency 1 4 16 --sizes 1 8 32 --docs 20
+    python mining_report_benchmark.py run --providers openai --error-rate 0.05 --retries 3
+    python mining_report_benchmark.py serve --port 8765   # 单独启动模拟服务，供其它工具连接
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import pathlib
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from pydantic import BaseModel
+
+from mining_report_extractor_stream import (
+    STREAM_COMPLETE,
+    MiningReport,
+    create_extractor,
+)
+
+
+MOCK_API_KEY = "mock-api-key"
+DEFAULT_RESULTS_FILE = "benchmark_results.json"
+
+# 模拟服务默认返回的提取结果
+SAMPLE_REPORT: Dict[str, Any] = {
+    "报告信息": {"报告名称": "某某金矿资源储量核实报告", "编制单位": "某某地质勘查院", "编制日期": "2023年6月"},
+    "矿权信息": {
+        "矿权名称": "某某金矿", "矿权位置": "某某省某某县", "勘查程度": "详查", "矿权类型": "采矿权",
+        "矿权编号": "C1000002009012110012345", "矿权起始日期": "2019年1月1日", "矿权截止日期": "2029年1月1日",
+        "矿区面积": "2.35平方公里", "矿区海拔": "1200-1650米",
+    },
+    "资源信息": [
+        {
+            "矿种": "金矿",
+            "资源量情况": {
+                "推断资源量": {"矿石量": "120万吨", "金属量": "3600千克", "品位": "3.0克/吨"},
+                "控制资源量": {"矿石量": "80万吨", "金属量": "2800千克", "品位": "3.5克/吨"},
+                "总计": {"矿石量": "200万吨", "金属量": "6400千克", "品位": "3.2克/吨"},
+            },
+        }
+    ],
+    "矿体分布": [
+        {"矿体编号": "Au1", "矿体长度": "850米", "矿体厚度": "2.3米", "矿体走向": "北东", "矿体倾角": "65°"},
+        {"矿体编号": "Au2", "矿体长度": "420米", "矿体厚度": "1.6米", "矿体走向": "北东", "矿体倾角": "70°"},
+    ],
+    "其它信息": "模拟服务返回的示例数据",
+}
+
+
+# ========== 模拟服务配置 ==========
+class LatencyProfile(BaseModel):
+    """延迟分布：fixed（固定值）、uniform（min~max均匀分布）或lognormal（中位数+对数标准差）
+
+    per_mb_seconds按请求体大小追加线性延迟，用于模拟上传带宽。
+    """
+    distribution: str = "lognormal"
+    median_seconds: float = 0.5
+    sigma: float = 0.5
+    min_seconds: float = 0.0
+    max_seconds: float = 1.0
+    per_mb_seconds: float = 0.0
+
+    def sample(self, rng: random.Random, size_bytes: int = 0) -> float:
+        if self.distribution == "fixed":
+            base = self.median_seconds
+        elif self.distribution == "uniform":
+            base = rng.uniform(self.min_seconds, self.max_seconds)
+        elif self.distribution == "lognormal":
+            base = rng.lognormvariate(math.log(max(self.median_seconds, 1e-6)), self.sigma)
+        else:
+            raise ValueError(f"不支持的延迟分布: {self.distribution}")
+        return max(0.0, base) + self.per_mb_seconds * size_bytes / (1024 * 1024)
+
+
+class MockServerConfig(BaseModel):
+    """模拟服务配置"""
+    upload_latency: LatencyProfile = LatencyProfile(median_seconds=0.05, sigma=0.3, per_mb_seconds=0.02)
+    generation_latency: LatencyProfile = LatencyProfile(median_seconds=0.5, sigma=0.5)
+    metadata_latency: LatencyProfile = LatencyProfile(distribution="fixed", median_seconds=0.01)
+    error_rate: float = 0.0  # 生成和上传请求按此概率返回错误
+    error_statuses: List[int] = [429, 500, 503]
+    retry_after_seconds: Optional[float] = 1.0
+    stream_chunks: int = 20  # 流式响应拆分的片段数
+    input_tokens: int = 20000
+    cached_token_ratio: float = 0.9  # 命中上下文/提示缓存时，输入token中按缓存计的比例
+    payload: Dict[str, Any] = SAMPLE_REPORT
+    seed: Optional[int] = None
+
+
+# ========== 模拟服务 ==========
+class MockProviderServer(ThreadingHTTPServer):
+    """模拟OpenAI和Gemini接口的本地HTTP服务
+
+    OpenAI客户端使用 base_url=openai_base_url，Gemini客户端使用 base_url=gemini_base_url。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config: Optional[MockServerConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _MockRequestHandler)
+        self.config = config or MockServerConfig()
+        self.payload_text = json.dumps(self.config.payload, ensure_ascii=False)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.uploads: Dict[str, Dict[str, Any]] = {}  # Gemini可续传上传会话与OpenAI Upload对象
+        self.cached_contents: Dict[str, Dict[str, Any]] = {}  # Gemini上下文缓存
+        self.prompt_prefixes: set = set()  # OpenAI已处理过的请求前缀（文档file_id或响应ID）
+        self.request_counts: Dict[str, int] = {}
+        self.error_counts: Dict[str, int] = {}
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def gemini_base_url(self) -> str:
+        return self.url
+
+    def base_url_for(self, provider: str) -> str:
+        return self.openai_base_url if provider == "openai" else self.gemini_base_url
+
+    def start(self) -> "MockProviderServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-provider", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """停止服务"""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+    def delay(self, profile: LatencyProfile, size_bytes: int = 0) -> float:
+        with self._lock:
+            return profile.sample(self._rng, size_bytes)
+
+    def pick_error(self, endpoint: str) -> Optional[int]:
+        """按错误率决定本次请求是否返回错误，返回HTTP状态码"""
+        with self._lock:
+            if self.config.error_rate <= 0 or self._rng.random() >= self.config.error_rate:
+                return None
+            self.error_counts[endpoint] = self.error_counts.get(endpoint, 0) + 1
+            return self._rng.choice(self.config.error_statuses)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": dict(self.request_counts), "errors": dict(self.error_counts)}
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    """按路径分发到OpenAI或Gemini的模拟实现"""
+
+    server: MockProviderServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    # ---------- 请求与响应工具 ----------
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, provider: str) -> None:
+        headers = {}
+        if status == 429 and self.server.config.retry_after_seconds is not None:
+            headers["Retry-After"] = f"{self.server.config.retry_after_seconds:g}"
+        message = "模拟服务注入的错误"
+        if provider == "openai":
+            body = {"error": {"message": message, "type": "server_error", "code": str(status)}}
+        else:
+            body = {"error": {"code": status, "message": message,
+                              "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}}
+        self._send_json(status, body, headers)
+
+    def _start_sse(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_sse(self, data: Dict[str, Any], event: Optional[str] = None) -> None:
+        message = (f"event: {event}\n" if event else "") + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        self.wfile.write(message.encode("utf-8"))
+        self.wfile.flush()
+
+    def _payload_pieces(self) -> List[str]:
+        text = self.server.payload_text
+        size = max(1, math.ceil(len(text) / max(1, self.server.config.stream_chunks)))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _simulate(self, endpoint: str, provider: str, profile: LatencyProfile, size_bytes: int = 0,
+                  inject_errors: bool = True) -> bool:
+        """记录请求、注入错误并模拟延迟，返回是否应继续正常响应"""
+        self.server.count(endpoint)
+        status = self.server.pick_error(endpoint) if inject_errors else None
+        time.sleep(self.server.delay(profile, size_bytes))
+        if status is not None:
+            self._send_error(status, provider)
+            return False
+        return True
+
+    # ---------- 分发 ----------
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def do_DELETE(self) -> None:
+        self._dispatch("DELETE")
+
+    def do_PATCH(self) -> None:
+        self._dispatch("PATCH")
+
+    def _dispatch(self, method: str) -> None:
+        parsed = urlparse(self.path)
+        path = parsed.path
+        body = self._read_body() if method in ("POST", "PATCH") else b""
+        try:
+            if path.startswith("/v1/"):
+                self._handle_openai(method, path[len("/v1/"):], body)
+            elif path.startswith("/upload/v1beta/files"):
+                self._handle_gemini_upload(parse_qs(parsed.query), body)
+            elif path.startswith("/v1beta/"):
+                self._handle_gemini(method, path[len("/v1beta/"):], body)
+            else:
+                self._send_json(404, {"error": {"message": f"未知路径: {path}"}})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # ---------- OpenAI ----------
+    def _openai_file_object(self, file_id: str) -> Dict[str, Any]:
+        entry = self.server.files[file_id]
+        return {"id": file_id, "object": "file", "bytes": entry["bytes"], "created_at": entry["created_at"],
+                "filename": entry["name"], "purpose": "user_data", "status": "processed"}
+
+    def _handle_openai(self, method: str, route: str, body: bytes) -> None:
+        config = self.server.config
+        if route == "files" and method == "POST":
+            if not self._simulate("openai.files.create", "openai", config.upload_latency, len(body)):
+                return
+            match = re.search(rb'filename="([^"]*)"', body)
+            file_id = f"file-{uuid.uuid4().hex[:24]}"
+            self.server.files[file_id] = {"name": match.group(1).decode("utf-8", "replace") if match else "upload.pdf",
+                                          "bytes": len(body), "created_at": int(time.time())}
+            self._send_json(200, self._openai_file_object(file_id))
+        elif route == "files" and method == "GET":
+            self._simulate("openai.files.list", "openai", config.metadata_latency, inject_errors=False)
+            self._send_json(200, {"object": "list", "has_more": False,
+                                  "data": [self._openai_file_object(file_id) for file_id in list(self.server.files)]})
+        elif route.startswith("files/"):
+            file_id = route[len("files/"):]
+            self._simulate(f"openai.files.{method.lower()}", "openai", config.metadata_latency, inject_errors=False)
+            if file_id not in self.server.files:
+                self._send_json(404, {"error": {"message": f"No such File object: {file_id}", "type": "invalid_request_error"}})
+            elif method == "DELETE":
+                self.server.files.pop(file_id, None)
+                self._send_json(200, {"id": file_id, "object": "file", "deleted": True})
+            else:
+                self._send_json(200, self._openai_file_object(file_id))
+        elif route == "uploads" or route.startswith("uploads/"):
+            self._handle_openai_upload(route, body)
+        elif route == "responses" and method == "POST":
+            request = json.loads(body or b"{}")
+            stream = bool(request.get("stream"))
+            endpoint = "openai.responses.stream" if stream else "openai.responses.create"
+            if not self._simulate(endpoint, "openai", config.generation_latency):
+                return
+            response_id = f"resp_{uuid.uuid4().hex[:24]}"
+            cached_tokens = self._openai_cached_tokens(request, response_id)
+            if stream:
+                self._stream_openai_response(request, response_id, cached_tokens)
+            else:
+                self._send_json(200, self._openai_response(request, self.server.payload_text,
+                                                           response_id=response_id, cached_tokens=cached_tokens))
+        else:
+            self._send_json(404, {"error": {"message": f"未模拟的OpenAI接口: {method} /v1/{route}"}})
+
+    def _handle_openai_upload(self, route: str, body: bytes) -> None:
+        """OpenAI Uploads API：创建Upload对象、逐块添加分块、按分块ID顺序完成并生成文件"""
+        config = self.server.config
+        parts = route.split("/")
+        if len(parts) == 1:
+            self._simulate("openai.uploads.create", "openai", config.metadata_latency, inject_errors=False)
+            request = json.loads(body or b"{}")
+            upload_id = f"upload_{uuid.uuid4().hex[:24]}"
+            self.server.uploads[upload_id] = {"filename": request.get("filename", "upload.pdf"),
+                                              "bytes": int(request.get("bytes", 0)), "parts": {},
+                                              "created_at": int(time.time()), "status": "pending"}
+            self._send_json(200, self._openai_upload_object(upload_id))
+            return
+        upload = self.server.uploads.get(parts[1])
+        if upload is None:
+            self._send_json(404, {"error": {"message": f"No such Upload: {parts[1]}", "type": "invalid_request_error"}})
+            return
+        action = parts[2] if len(parts) > 2 else ""
+        if action == "parts":
+            if not self._simulate("openai.uploads.parts", "openai", config.upload_latency, len(body)):
+                return
+            part_id = f"part_{uuid.uuid4().hex[:24]}"
+            upload["parts"][part_id] = len(self._multipart_field(body, "data"))
+            self._send_json(200, {"id": part_id, "object": "upload.part", "created_at": int(time.time()),
+                                  "upload_id": parts[1]})
+        elif action == "complete":
+            self._simulate("openai.uploads.complete", "openai", config.metadata_latency, inject_errors=False)
+            part_ids = json.loads(body or b"{}").get("part_ids", [])
+            received = sum(upload["parts"].get(part_id, 0) for part_id in part_ids)
+            if received != upload["bytes"]:
+                self._send_json(400, {"error": {"message": f"分块总字节数 {received} 与声明的 {upload['bytes']} 不一致",
+                                                "type": "invalid_request_error"}})
+                return
+            file_id = f"file-{uuid.uuid4().hex[:24]}"
+            self.server.files[file_id] = {"name": upload["filename"], "bytes": received, "created_at": int(time.time())}
+            upload["status"] = "completed"
+            self._send_json(200, {**self._openai_upload_object(parts[1]), "file": self._openai_file_object(file_id)})
+        elif action == "cancel":
+            upload["status"] = "cancelled"
+            self._send_json(200, self._openai_upload_object(parts[1]))
+        else:
+            self._send_json(404, {"error": {"message": f"未模拟的OpenAI接口: POST /v1/{route}"}})
+
+    def _openai_upload_object(self, upload_id: str) -> Dict[str, Any]:
+        upload = self.server.uploads[upload_id]
+        return {"id": upload_id, "object": "upload", "bytes": upload["bytes"], "created_at": upload["created_at"],
+                "expires_at": upload["created_at"] + 3600, "filename": upload["filename"], "purpose": "user_data",
+                "status": upload["status"]}
+
+    def _multipart_field(self, body: bytes, field: str) -> bytes:
+        """从multipart/form-data请求体中取出指定字段的内容"""
+        boundary = self.headers.get("Content-Type", "").partition("boundary=")[2].strip('"').encode()
+        for part in body.split(b"--" + boundary):
+            headers, _, content = part.partition(b"\r\n\r\n")
+            if f'name="{field}"'.encode() in headers:
+                return content[:-2] if content.endswith(b"\r\n") else content
+        return b""
+
+    def _openai_cached_tokens(self, request: Dict[str, Any], response_id: str) -> int:
+        """模拟前缀缓存：请求以已处理过的文档或响应链开头时命中；instructions参数位于上下文开头，会使前缀失效"""
+        prefix = request.get("previous_response_id")
+        if prefix is None and isinstance(request.get("input"), list):
+            for message in request["input"]:
+                for part in message.get("content") if isinstance(message.get("content"), list) else []:
+                    if part.get("type") == "input_file":
+                        prefix = part.get("file_id")
+                        break
+                break
+        with self.server._lock:
+            hit = prefix is not None and prefix in self.server.prompt_prefixes and not request.get("instructions")
+            if prefix is not None:
+                self.server.prompt_prefixes.add(prefix)
+            self.server.prompt_prefixes.add(response_id)
+        return int(self.server.config.input_tokens * self.server.config.cached_token_ratio) if hit else 0
+
+    def _openai_response(self, request: Dict[str, Any], text: Optional[str], status: str = "completed",
+                         response_id: Optional[str] = None, cached_tokens: int = 0) -> Dict[str, Any]:
+        message = {"id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+                   "status": status, "content": []}
+        if text is not None:
+            message["content"].append({"type": "output_text", "text": text, "annotations": []})
+        output_tokens = len(text or "") // 2
+        return {
+            "id": response_id or f"resp_{uuid.uuid4().hex[:24]}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": status,
+            "model": request.get("model", ""),
+            "output": [message] if text is not None else [],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "text": request.get("text") or {"format": {"type": "text"}},
+            "previous_response_id": request.get("previous_response_id"),
+            "usage": {
+                "input_tokens": self.server.config.input_tokens,
+                "input_tokens_details": {"cached_tokens": cached_tokens},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": self.server.config.input_tokens + output_tokens,
+            } if status == "completed" else None,
+        }
+
+    def _stream_openai_response(self, request: Dict[str, Any], response_id: str, cached_tokens: int = 0) -> None:
+        pieces = self._payload_pieces()
+        chunk_delay = self.server.delay(self.server.config.generation_latency) / max(1, len(pieces))
+        created = self._openai_response(request, None, "in_progress", response_id)
+        final = self._openai_response(request, self.server.payload_text, "completed", response_id, cached_tokens)
+        item = dict(final["output"][0], status="in_progress", content=[])
+        item_id = item["id"]
+        sequence = iter(range(1_000_000))
+
+        def send(event_type: str, **fields: Any) -> None:
+            self._send_sse({"type": event_type, "sequence_number": next(sequence), **fields}, event_type)
+
+        self._start_sse()
+        send("response.created", response=created)
+        send("response.in_progress", response=created)
+        send("response.output_item.added", output_index=0, item=item)
+        send("response.content_part.added", item_id=item_id, output_index=0, content_index=0,
+             part={"type": "output_text", "text": "", "annotations": []})
+        for piece in pieces:
+            time.sleep(chunk_delay)
+            send("response.output_text.delta", item_id=item_id, output_index=0, content_index=0,
+                 delta=piece, logprobs=[])
+        send("response.output_text.done", item_id=item_id, output_index=0, content_index=0,
+             text=self.server.payload_text, logprobs=[])
+        send("response.content_part.done", item_id=item_id, output_index=0, content_index=0,
+             part=final["output"][0]["content"][0])
+        send("response.output_item.done", output_index=0, item=final["output"][0])
+        send("response.completed", response=final)
+
+    # ---------- Gemini ----------
+    def _gemini_file_object(self, name: str) -> Dict[str, Any]:
+        entry = self.server.files[name]
+        expiration = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(entry["created_at"] + 48 * 3600))
+        return {"name": name, "displayName": entry["name"], "mimeType": "application/pdf",
+                "sizeBytes": str(entry["bytes"]), "state": "ACTIVE", "expirationTime": expiration,
+                "uri": f"{self.server.url}/v1beta/{name}"}
+
+    def _handle_gemini_upload(self, query: Dict[str, List[str]], body: bytes) -> None:
+        """Gemini可续传上传：start请求返回上传地址，随后按块上传，最后一块带finalize"""
+        command = self.headers.get("X-Goog-Upload-Command", "")
+        config = self.server.config
+        if "start" in command:
+            if not self._simulate("gemini.files.upload", "gemini", config.metadata_latency):
+                return
+            upload_id = uuid.uuid4().hex
+            metadata = json.loads(body or b"{}").get("file", {})
+            display_name = metadata.get("displayName") or metadata.get("display_name")  # SDK按snake_case发送
+            self.server.uploads[upload_id] = {"name": display_name or "upload.pdf", "bytes": 0}
+            self._send_json(200, {}, {"X-Goog-Upload-URL": f"{self.server.url}/upload/v1beta/files?upload_id={upload_id}",
+                                      "X-Goog-Upload-Status": "active"})
+            return
+
+        upload_id = (query.get("upload_id") or [""])[0]
+        upload = self.server.uploads.get(upload_id)
+        if upload is None:
+            self._send_json(404, {"error": {"code": 404, "message": "未知的上传会话", "status": "NOT_FOUND"}})
+            return
+        if command == "query":
+            self.server.count("gemini.files.upload_query")
+            self._send_json(200, {}, {"X-Goog-Upload-Status": "active",
+                                      "X-Goog-Upload-Size-Received": str(upload["bytes"])})
+            return
+        if not self._simulate("gemini.files.upload_chunk", "gemini", config.upload_latency, len(body)):
+            return
+        offset = int(self.headers.get("X-Goog-Upload-Offset") or upload["bytes"])
+        if offset != upload["bytes"]:
+            self._send_json(400, {"error": {"code": 400, "message": f"偏移量不一致: {offset} != {upload['bytes']}",
+                                            "status": "INVALID_ARGUMENT"}})
+            return
+        upload["bytes"] += len(body)
+        if "finalize" not in command:
+            self._send_json(200, {}, {"X-Goog-Upload-Status": "active"})
+            return
+        self.server.uploads.pop(upload_id, None)
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        self.server.files[name] = {"name": upload["name"], "bytes": upload["bytes"], "created_at": int(time.time())}
+        self._send_json(200, {"file": self._gemini_file_object(name)}, {"X-Goog-Upload-Status": "final"})
+
+    def _gemini_cached_content(self, name: str) -> Dict[str, Any]:
+        entry = self.server.cached_contents[name]
+        timestamp = lambda value: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(value))
+        return {"name": name, "model": entry["model"], "displayName": entry["display_name"],
+                "createTime": timestamp(entry["created_at"]), "updateTime": timestamp(entry["updated_at"]),
+                "expireTime": timestamp(entry["expires_at"]), "usageMetadata": {"totalTokenCount": entry["tokens"]}}
+
+    def _handle_gemini_cache(self, method: str, route: str, body: bytes) -> None:
+        """Gemini上下文缓存：创建时按ttl设置过期时间，更新时续期，过期后按不存在处理"""
+        config = self.server.config
+        request = json.loads(body or b"{}")
+        ttl = float(str(request.get("ttl") or "3600s").rstrip("s"))
+        now = time.time()
+        if route == "cachedContents" and method == "POST":
+            if not self._simulate("gemini.caches.create", "gemini", config.upload_latency):
+                return
+            name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+            self.server.cached_contents[name] = {
+                "model": request.get("model", ""), "display_name": request.get("displayName", ""),
+                "tokens": config.input_tokens, "created_at": now, "updated_at": now, "expires_at": now + ttl,
+            }
+            self._send_json(200, self._gemini_cached_content(name))
+            return
+        self._simulate(f"gemini.caches.{method.lower()}", "gemini", config.metadata_latency, inject_errors=False)
+        entry = self.server.cached_contents.get(route)
+        if entry is None or entry["expires_at"] <= now:
+            self.server.cached_contents.pop(route, None)
+            self._send_json(403, {"error": {"code": 403, "message": "CachedContent not found (or permission denied)",
+                                            "status": "PERMISSION_DENIED"}})
+        elif method == "DELETE":
+            self.server.cached_contents.pop(route, None)
+            self._send_json(200, {})
+        else:
+            if method == "PATCH":
+                entry.update(updated_at=now, expires_at=now + ttl)
+            self._send_json(200, self._gemini_cached_content(route))
+
+    def _gemini_generation_cache(self, body: bytes) -> Optional[int]:
+        """生成请求引用的上下文缓存的token数；未引用时返回0，引用的缓存不存在或已过期时返回None"""
+        name = json.loads(body or b"{}").get("cachedContent")
+        if not name:
+            return 0
+        entry = self.server.cached_contents.get(name)
+        if entry is None or entry["expires_at"] <= time.time():
+            self._send_json(403, {"error": {"code": 403, "message": "CachedContent not found (or permission denied)",
+                                            "status": "PERMISSION_DENIED"}})
+            return None
+        return int(entry["tokens"] * self.server.config.cached_token_ratio)
+
+    def _gemini_chunk(self, text: str, final: bool, cached_tokens: int = 0) -> Dict[str, Any]:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        chunk = {"candidates": [candidate], "modelVersion": "mock"}
+        if final:
+            candidate["finishReason"] = "STOP"
+            output_tokens = len(self.server.payload_text) // 2
+            chunk["usageMetadata"] = {"promptTokenCount": self.server.config.input_tokens,
+                                      "candidatesTokenCount": output_tokens,
+                                      "totalTokenCount": self.server.config.input_tokens + output_tokens}
+            if cached_tokens:
+                chunk["usageMetadata"]["cachedContentTokenCount"] = cached_tokens
+        return chunk
+
+    def _handle_gemini(self, method: str, route: str, body: bytes) -> None:
+        config = self.server.config
+        if route == "files" and method == "GET":
+            self._simulate("gemini.files.list", "gemini", config.metadata_latency, inject_errors=False)
+            self._send_json(200, {"files": [self._gemini_file_object(name) for name in list(self.server.files)]})
+        elif route.startswith("files/"):
+            self._simulate(f"gemini.files.{method.lower()}", "gemini", config.metadata_latency, inject_errors=False)
+            if route not in self.server.files:
+                self._send_json(404, {"error": {"code": 404, "message": f"File {route} not found", "status": "NOT_FOUND"}})
+            elif method == "DELETE":
+                self.server.files.pop(route, None)
+                self._send_json(200, {})
+            else:
+                self._send_json(200, self._gemini_file_object(route))
+        elif route == "cachedContents" or route.startswith("cachedContents/"):
+            self._handle_gemini_cache(method, route, body)
+        elif route.startswith("models/") and route.endswith(":generateContent"):
+            if self._simulate("gemini.generate_content", "gemini", config.generation_latency, len(body)):
+                cached_tokens = self._gemini_generation_cache(body)
+                if cached_tokens is not None:
+                    self._send_json(200, self._gemini_chunk(self.server.payload_text, True, cached_tokens))
+        elif route.startswith("models/") and route.endswith(":streamGenerateContent"):
+            if not self._simulate("gemini.generate_content_stream", "gemini", config.metadata_latency, len(body)):
+                return
+            cached_tokens = self._gemini_generation_cache(body)
+            if cached_tokens is None:
+                return
+            pieces = self._payload_pieces()
+            chunk_delay = self.server.delay(config.generation_latency) / max(1, len(pieces))
+            self._start_sse()
+            for index, piece in enumerate(pieces):
+                time.sleep(chunk_delay)
+                final = index == len(pieces) - 1
+                self._send_sse(self._gemini_chunk(piece, final, cached_tokens if final else 0))
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"未模拟的Gemini接口: {method} /v1beta/{route}",
+                                            "status": "NOT_FOUND"}})
+
+
+def _serve_in_process(config_json: str, port_queue: "multiprocessing.Queue") -> None:
+    server = MockProviderServer(MockServerConfig.model_validate_json(config_json))
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_mock_server_process(config: MockServerConfig) -> Tuple[multiprocessing.Process, str]:
+    """在独立进程中启动模拟服务（避免与被测提取器争用GIL、计入其内存），返回(进程, 服务地址)"""
+    port_queue: "multiprocessing.Queue" = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_in_process, args=(config.model_dump_json(), port_queue),
+                                      name="mock-provider", daemon=True)
+    process.start()
+    port = port_queue.get(timeout=30)
+    return process, f"http://127.0.0.1:{port}"
+
+
+# ========== 测试数据与统计 ==========
+def make_synthetic_pdf(output_path: str, size_mb: float) -> str:
+    """生成指定大小的单页PDF（以不可压缩的填充流对象凑足大小），返回文件路径"""
+    padding = os.urandom(max(0, int(size_mb * 1024 * 1024) - 1024))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>",
+        b"<< /Length " + str(len(padding)).encode() + b" >>\nstream\n" + padding + b"\nendstream",
+    ]
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref_offset = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    pathlib.Path(output_path).write_bytes(bytes(data))
+    return output_path
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """线性插值分位数（q取0~1）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def current_rss_bytes() -> Optional[int]:
+    """当前进程常驻内存（优先psutil，其次/proc，均不可用时返回None）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RSSSampler:
+    """后台线程定期采样RSS，记录运行期间的峰值"""
+
+    def __init__(self, interval_seconds: float = 0.05):
+        self.interval_seconds = interval_seconds
+        self.peak_bytes: Optional[int] = current_rss_bytes()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.interval_seconds):
+            rss = current_rss_bytes()
+            if rss is not None:
+                self.peak_bytes = max(self.peak_bytes or 0, rss)
+
+    def __enter__(self) -> "RSSSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, rss)
+
+
+class BenchmarkResult(BaseModel):
+    """单个基准测试场景（提供商 × 模式 × 并发数 × PDF大小）的结果"""
+    provider: str
+    model: str
+    mode: str
+    concurrency: int
+    pdf_size_mb: float
+    docs: int
+    succeeded: int = 0
+    failed: int = 0
+    wall_clock_seconds: float = 0.0
+    docs_per_second: float = 0.0
+    latency_p50: Optional[float] = None
+    latency_p95: Optional[float] = None
+    latency_p99: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    errors: List[str] = []
+
+
+# ========== 基准测试执行 ==========
+def run_case(provider: str, model: str, base_url: str, pdf_path: str, pdf_size_mb: float,
+             concurrency: int, docs: int, mode: str = "extract", retries: int = 0,
+             extractor_kwargs: Optional[Dict[str, Any]] = None) -> BenchmarkResult:
+    """以给定并发数对同一PDF重复提取docs次，统计吞吐量、延迟分位数和峰值内存
+
+    每个工作线程持有独立的提取器实例；retries>0时提取器经ExtractionScheduler发送模型请求，
+    注入的错误只重发失败的那个请求（流式请求只排队、不重试）。
+    """
+    extractor_kwargs = dict(extractor_kwargs or {})
+    extractor_kwargs.setdefault("api_key", MOCK_API_KEY)
+    extractor_kwargs.setdefault("quiet", True)
+    local = threading.local()
+    if retries > 0:
+        from mining_report_scheduler import ExtractionScheduler
+        extractor_kwargs["scheduler"] = ExtractionScheduler(limits={}, max_retries=retries, base_delay=0.2,
+                                                            max_delay=5.0, quiet=True)
+
+    def extract_once() -> MiningReport:
+        if not hasattr(local, "extractor"):
+            local.extractor = create_extractor(provider, model, base_url=base_url, **extractor_kwargs)
+        extractor = local.extractor
+        try:
+            if mode == "stream":
+                for item in extractor.extract_stream(pdf_path):
+                    if item.section == STREAM_COMPLETE:
+                        return item.value
+                raise RuntimeError("流式提取未返回完整结果")
+            return extractor.extract_from_file(pdf_path)
+        finally:
+            if hasattr(extractor, "cleanup"):
+                extractor.cleanup()
+
+    def timed(_: int) -> Tuple[Optional[float], Optional[str]]:
+        started = time.perf_counter()
+        try:
+            extract_once()
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    result = BenchmarkResult(provider=provider, model=model, mode=mode, concurrency=concurrency,
+                             pdf_size_mb=pdf_size_mb, docs=docs)
+    with RSSSampler() as sampler:
+        wall_started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            outcomes = list(pool.map(timed, range(docs)))
+        result.wall_clock_seconds = time.perf_counter() - wall_started
+
+    latencies = [latency for latency, _ in outcomes if latency is not None]
+    result.succeeded = len(latencies)
+    result.failed = docs - result.succeeded
+    result.errors = sorted({error for _, error in outcomes if error})[:5]
+    result.docs_per_second = result.succeeded / result.wall_clock_seconds if result.wall_clock_seconds else 0.0
+    result.latency_p50 = percentile(latencies, 0.50)
+    result.latency_p95 = percentile(latencies, 0.95)
+    result.latency_p99 = percentile(latencies, 0.99)
+    if sampler.peak_bytes is not None:
+        result.peak_rss_mb = sampler.peak_bytes / (1024 * 1024)
+    return result
+
+
+def run_benchmark(providers: Dict[str, str], concurrencies: List[int], sizes_mb: List[float], docs: int,
+                  config: Optional[MockServerConfig] = None, mode: str = "extract", retries: int = 0,
+                  server_url: Optional[str] = None) -> List[BenchmarkResult]:
+    """对每个提供商、并发数和PDF大小组合运行基准测试
+
+    providers为{提供商: 模型}；未指定server_url时在独立进程中启动模拟服务。
+    """
+    process = None
+    if server_url is None:
+        process, server_url = start_mock_server_process(config or MockServerConfig())
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="mining_bench_") as tmp_dir:
+            for size_mb in sizes_mb:
+                pdf_path = make_synthetic_pdf(str(pathlib.Path(tmp_dir) / f"synthetic_{size_mb:g}mb.pdf"), size_mb)
+                for provider, model in providers.items():
+                    base_url = f"{server_url}/v1" if provider == "openai" else server_url
+                    for concurrency in concurrencies:
+                        result = run_case(provider, model, base_url, pdf_path, size_mb, concurrency, docs,
+                                          mode=mode, retries=retries)
+                        print_result_row(result)
+                        results.append(result)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+    return results
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def print_result_header() -> None:
+    print(f"{'提供商/模型':<28}{'模式':<8}{'并发':>5}{'大小':>8}{'成功':>6}{'失败':>6}"
+          f"{'文档/秒':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'峰值RSS':>11}")
+    print("-" * 108)
+
+
+def print_result_row(result: BenchmarkResult) -> None:
+    rss = "-" if result.peak_rss_mb is None else f"{result.peak_rss_mb:.0f}MB"
+    print(f"{result.provider + '/' + result.model:<28}{result.mode:<8}{result.concurrency:>5}"
+          f"{result.pdf_size_mb:>6g}MB{result.succeeded:>6}{result.failed:>6}{result.docs_per_second:>9.2f}"
+          f"{_format_seconds(result.latency_p50):>9}{_format_seconds(result.latency_p95):>9}"
+          f"{_format_seconds(result.latency_p99):>9}{rss:>11}")
+    for error in result.errors:
+        print(f"    ⚠️ {error}")
+
+
+# ========== 命令行入口 ==========
+def _add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal",
+                        help="生成请求的延迟分布")
+    parser.add_argument("--generation-median", type=float, default=0.5, help="生成请求的延迟中位数（秒）")
+    parser.add_argument("--generation-sigma", type=float, default=0.5, help="lognormal分布的对数标准差")
+    parser.add_argument("--generation-max", type=float, default=1.0, help="uniform分布的最大延迟（秒）")
+    parser.add_argument("--upload-per-mb", type=float, default=0.02, help="上传每MB追加的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="上传和生成请求的错误注入概率")
+    parser.add_argument("--error-statuses", type=int, nargs="+", default=[429, 500, 503], help="注入错误的HTTP状态码")
+    parser.add_argument("--payload", help="模拟返回的MiningReport JSON文件（默认使用内置示例）")
+    parser.add_argument("--seed", type=int, help="随机种子（复现延迟和错误序列）")
+
+
+def _config_from_args(args: argparse.Namespace) -> MockServerConfig:
+    config = MockServerConfig(
+        generation_latency=LatencyProfile(distribution=args.latency, median_seconds=args.generation_median,
+                                          sigma=args.generation_sigma, max_seconds=args.generation_max),
+        upload_latency=LatencyProfile(median_seconds=0.05, sigma=0.3, per_mb_seconds=args.upload_per_mb),
+        error_rate=args.error_rate,
+        error_statuses=args.error_statuses,
+        seed=args.seed,
+    )
+    if args.payload:
+        payload = json.loads(pathlib.Path(args.payload).read_text(encoding="utf-8"))
+        config.payload = MiningReport.model_validate(payload).model_dump(exclude_none=True)
+    return config
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="矿山储量核实报告提取性能基准测试（本地模拟服务）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="启动模拟服务并运行基准测试")
+    run_parser.add_argument("--providers", nargs="+", choices=["gemini", "openai"], default=["gemini", "openai"])
+    run_parser.add_argument("--gemini-model", default="gemini-2.5-flash")
+    run_parser.add_argument("--openai-model", default="o4-mini")
+    run_parser.add_argument("--mode", choices=["extract", "stream"], default="extract",
+                            help="extract调用extract_from_file，stream调用extract_stream")
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="并发数列表")
+    run_parser.add_argument("--sizes", type=float, nargs="+", default=[1, 8, 32], help="合成PDF大小列表（MB）")
+    run_parser.add_argument("--docs", type=int, default=20, help="每个场景提取的文档数")
+    run_parser.add_argument("--retries", type=int, default=0, help="失败的模型请求经调度器重发的次数（流式请求不重试）")
+    run_parser.add_argument("--server-url", help="连接已启动的模拟服务（如 http://127.0.0.1:8765）")
+    run_parser.add_argument("-o", "--output", default=DEFAULT_RESULTS_FILE, help="结果JSON文件")
+    _add_server_arguments(run_parser)
+
+    serve_parser = subparsers.add_parser("serve", help="仅启动模拟服务")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    _add_server_arguments(serve_parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """基准测试主函数"""
+    args = build_arg_parser().parse_args(argv)
+    config = _config_from_args(args)
+
+    if args.command == "serve":
+        server = MockProviderServer(config, host=args.host, port=args.port)
+        print(f"🧪 模拟服务已启动: {server.url}")
+        print(f"  • OpenAI base_url: {server.openai_base_url}")
+        print(f"  • Gemini base_url: {server.gemini_base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 模拟服务已停止")
+        finally:
+            server.server_close()
+        return 0
+
+    models = {"gemini": args.gemini_model, "openai": args.openai_model}
+    providers = {provider: models[provider] for provider in args.providers}
+    print("🏔️  矿山储量核实报告提取性能基准测试")
+    print(f"📊 场景: {len(providers)} 个提供商 × {len(args.concurrency)} 种并发 × {len(args.sizes)} 种PDF大小，"
+          f"每个场景 {args.docs} 个文档\n")
+    print_result_header()
+    results = run_benchmark(providers, args.concurrency, args.sizes, args.docs, config=config,
+                            mode=args.mode, retries=args.retries, server_url=args.server_url)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump([result.model_dump() for result in results], f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 结果已保存到: {args.output}")
+    return 0 if all(result.failed == 0 for result in results) else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,462 @@
+"""
+矿山储量核实报告提取结果缓存与各类持久化登记表（上传文件、分块上传断点、上下文缓存）
+
+- ExtractionCache按内容寻址：键由PDF内容SHA-256、提供商、模型名称和提示词/Schema哈希组成，值为校验后的MiningReport，
+  重复提取同一份报告（重跑、不同输出目录）时直接返回缓存结果，不再上传和请求模型。按总大小和存活时间淘汰
+- UploadRegistry按(提供商, 内容SHA-256)登记已上传的远程文件，跨运行复用仍在有效期内的文件；
+  多个进程共用同一份登记表时，每次读改写都持有旁路<登记表>.lock文件上的文件锁
+- UploadReconciler定期删除本工具上传、但已不在登记表中或已过期的远程文件
+- UploadCheckpoints按(提供商, 内容SHA-256)记录可续传分块上传的断点，进程重启后从断点继续
+- ContextCacheRegistry按(提供商, 模型, 文档SHA-256)登记Gemini上下文缓存，有效期内复用并按需续期
+
+用法示例:
+    cache = ExtractionCache(".extraction_cache", max_size_mb=500, max_age_days=30)
+    registry = UploadRegistry()
+    extractor = create_extractor("gemini", "gemini-2.5-flash", cache=cache, upload_registry=registry)
+    result = extractor.extract_from_file("report.pdf")   # 第二次提取命中缓存
+    UploadReconciler(extractor, registry).run_once()     # 清理孤立的远程文件
+"""
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple, Iterator
+
+if TYPE_CHECKING:  # 仅用于类型注解，运行时延迟导入以避免与提取器模块循环导入
+    from mining_report_extractor_stream import BaseMiningReportExtractor, MiningReport
+
+try:
+    import fcntl
+except ImportError:  # Windows下仅使用进程内的线程锁
+    fcntl = None
+
+
+DEFAULT_CACHE_DIR = ".extraction_cache"
+DEFAULT_UPLOAD_REGISTRY = ".upload_registry.json"
+DEFAULT_UPLOAD_CHECKPOINTS = ".upload_checkpoints.json"
+DEFAULT_CONTEXT_CACHES = ".context_caches.json"
+CONTEXT_CACHE_TTL_SECONDS = 3600  # Gemini上下文缓存的有效期（按存储时长计费）
+CONTEXT_CACHE_REFRESH_SECONDS = 10 * 60  # 复用时剩余有效期不足该值则续期
+UPLOAD_NAME_PREFIX = "mining-report-"  # 远程文件名前缀，用于识别本工具上传的文件
+
+
+# ========== 内容哈希 ==========
+_FILE_HASH_MEMO: Dict[Tuple[str, int, int], str] = {}
+
+
+def compute_file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的SHA-256（按路径、大小和修改时间在进程内记忆，避免重复读取大文件）"""
+    path = pathlib.Path(file_path).resolve()
+    stat = path.stat()
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _FILE_HASH_MEMO:
+        return _FILE_HASH_MEMO[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    _FILE_HASH_MEMO[memo_key] = digest.hexdigest()
+    return _FILE_HASH_MEMO[memo_key]
+
+
+# ========== 提取结果缓存 ==========
+class ExtractionCache:
+    """基于内容寻址的提取结果磁盘缓存
+
+    键由PDF内容SHA-256、提供商、模型名称和提示词/Schema哈希组成，
+    值为校验后的MiningReport。支持按总大小和存活时间淘汰。
+
+    时间统一使用条目文件的时间戳：mtime为写入时间（判断过期），atime为最近读取时间（按最近使用淘汰）。
+    写入时累计条目总大小，只在超过上限或距上次清理超过EVICT_INTERVAL_SECONDS时才扫描目录。
+    """
+
+    EVICT_INTERVAL_SECONDS = 3600  # 过期条目最多每小时扫描清理一次
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: float = 500,
+                 max_age_days: float = 30):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._total_size: Optional[int] = None  # 条目总大小（上次扫描后加上本进程的写入），未扫描时为None
+        self._last_evict = 0.0
+
+    @staticmethod
+    def make_key(file_sha256: str, provider: str, model: str, prompt_hash: str) -> str:
+        """生成缓存键"""
+        raw = "|".join([file_sha256, provider, model, prompt_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional["MiningReport"]:
+        """读取缓存，过期或损坏的条目视为未命中并删除"""
+        from mining_report_extractor_stream import MiningReport
+
+        entry_path = self._entry_path(key)
+        now = time.time()
+        try:
+            stat = entry_path.stat()
+            if now - stat.st_mtime > self.max_age_seconds:
+                entry_path.unlink(missing_ok=True)
+                return None
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            entry_path.unlink(missing_ok=True)
+            return None
+
+        try:
+            result = MiningReport.model_validate(entry["result"])
+        except Exception:
+            entry_path.unlink(missing_ok=True)
+            return None
+
+        # 只更新访问时间（写入时间不变，过期仍按写入时间计算），按最近使用顺序淘汰
+        with contextlib.suppress(OSError):
+            os.utime(entry_path, (now, stat.st_mtime))
+        return result
+
+    def put(self, key: str, result: "MiningReport", **metadata: Any) -> None:
+        """写入缓存（先在同一目录写唯一的临时文件再原子替换），总大小超限或到达清理间隔时执行淘汰"""
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "created_at": time.time(),
+            **metadata,
+            "result": result.model_dump(),
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{key}.", suffix=".tmp", dir=entry_path.parent)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            try:
+                old_size = entry_path.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+            new_size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            pathlib.Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size += new_size - old_size
+            due = (self._total_size is None or self._total_size > self.max_size_bytes
+                   or time.time() - self._last_evict > self.EVICT_INTERVAL_SECONDS)
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期条目，并在总大小超限时按最近访问时间从旧到新删除，返回删除数量"""
+        now = time.time()
+        entries = []
+        removed = 0
+        for entry_path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                entry_path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            entry_path.unlink(missing_ok=True)
+            total_size -= size
+            removed += 1
+
+        with self._lock:
+            self._total_size = total_size
+            self._last_evict = now
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        for entry_path in self.cache_dir.glob("*/*.json"):
+            entry_path.unlink(missing_ok=True)
+        with self._lock:
+            self._total_size = 0
+
+
+# ========== JSON登记文件 ==========
+@contextlib.contextmanager
+def locked_file(lock: threading.Lock, lock_path: pathlib.Path) -> Iterator[None]:
+    """进程内线程锁 + 跨进程文件锁（锁在独立的.lock文件上，数据文件被os.replace替换后仍锁同一个inode）"""
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class JSONFileStore:
+    """多个进程共用的JSON登记文件（上传文件登记表、分块上传断点等）
+
+    内容为{键: 记录}字典；每次读改写都持有旁路<文件>.lock上的文件锁，写入时先写临时文件再原子替换。
+    """
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+        self._lock = threading.Lock()
+
+    def _locked(self) -> contextlib.AbstractContextManager:
+        """持有进程内线程锁和跨进程文件锁"""
+        return locked_file(self._lock, self.lock_path)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ========== 上传文件登记表 ==========
+class UploadRegistry(JSONFileStore):
+    """持久化的远程上传文件登记表
+
+    按(提供商, PDF内容SHA-256)记录已上传文件的远程ID和过期时间，
+    跨运行复用仍然有效的OpenAI file_id或Gemini文件，避免重复上传大文件。
+    """
+
+    GEMINI_FILE_TTL_SECONDS = 48 * 3600  # Gemini File API文件保留48小时
+    EXPIRY_MARGIN_SECONDS = 10 * 60  # 临近过期的文件不再复用，避免请求期间失效
+
+    def __init__(self, registry_path: str = DEFAULT_UPLOAD_REGISTRY, openai_ttl_hours: float = 7 * 24):
+        super().__init__(registry_path)
+        self.openai_ttl_seconds = int(openai_ttl_hours * 3600)
+
+    @staticmethod
+    def _entry_key(provider: str, file_sha256: str) -> str:
+        return f"{provider}:{file_sha256}"
+
+    def lookup(self, provider: str, file_sha256: str) -> Optional[Dict[str, Any]]:
+        """查找仍在有效期内的上传记录"""
+        with self._locked():
+            entry = self._load().get(self._entry_key(provider, file_sha256))
+        if entry and entry["expires_at"] - time.time() > self.EXPIRY_MARGIN_SECONDS:
+            return entry
+        return None
+
+    def register(self, provider: str, file_sha256: str, remote_id: str, expires_at: float, **extra: Any) -> None:
+        """登记新上传的远程文件"""
+        with self._locked():
+            entries = self._load()
+            entries[self._entry_key(provider, file_sha256)] = {
+                "provider": provider,
+                "remote_id": remote_id,
+                "uploaded_at": time.time(),
+                "expires_at": expires_at,
+                **extra,
+            }
+            self._save(entries)
+
+    def remove(self, provider: str, remote_ids: List[str]) -> None:
+        """移除指定远程文件的登记记录"""
+        remote_ids = set(remote_ids)
+        with self._locked():
+            entries = self._load()
+            entries = {
+                key: entry for key, entry in entries.items()
+                if not (entry["provider"] == provider and entry["remote_id"] in remote_ids)
+            }
+            self._save(entries)
+
+    def live_remote_ids(self, provider: str) -> set:
+        """返回该提供商仍在有效期内的远程文件ID集合"""
+        now = time.time()
+        with self._locked():
+            entries = self._load()
+        return {
+            entry["remote_id"] for entry in entries.values()
+            if entry["provider"] == provider and entry["expires_at"] > now
+        }
+
+
+class UploadReconciler:
+    """后台清理孤立的远程上传文件
+
+    定期列出提供商侧由本工具上传（文件名带UPLOAD_NAME_PREFIX前缀）的文件，
+    将登记表中不存在或已过期的文件并发批量删除，并同步清理登记表。
+    """
+
+    def __init__(self, extractor: "BaseMiningReportExtractor", registry: UploadRegistry,
+                 interval_seconds: float = 3600, max_workers: int = 8):
+        self.extractor = extractor
+        self.registry = registry
+        self.interval_seconds = interval_seconds
+        self.max_workers = max_workers
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """执行一次清理，返回删除的远程文件数量"""
+        provider = self.extractor.upload_provider
+        live_ids = self.registry.live_remote_ids(provider)
+        orphans = [
+            remote_id for remote_id, name in self.extractor.list_remote_uploads()
+            if (name or "").startswith(UPLOAD_NAME_PREFIX) and remote_id not in live_ids
+        ]
+        if not orphans:
+            return 0
+
+        def delete(remote_id: str) -> bool:
+            try:
+                self.extractor.delete_remote_upload(remote_id)
+                return True
+            except Exception as e:
+                self.extractor.log(f"⚠️ 删除远程文件 {remote_id} 时出现警告: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            deleted = [remote_id for remote_id, ok in zip(orphans, pool.map(delete, orphans)) if ok]
+        self.registry.remove(provider, deleted)
+        self.extractor.log(f"🗑️ 已清理 {len(deleted)} 个孤立的远程文件")
+        return len(deleted)
+
+    def _loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.extractor.log(f"⚠️ 清理远程文件时出现警告: {e}")
+            self._stop_event.wait(self.interval_seconds)
+
+    def start(self) -> None:
+        """启动后台清理线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name="upload-reconciler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台清理线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# ========== 分块上传断点 ==========
+class UploadCheckpoints(JSONFileStore):
+    """持久化的分块上传断点记录
+
+    按(提供商, PDF内容SHA-256)记录上传会话（Gemini上传地址或OpenAI upload_id）、
+    服务端已确认的偏移量和已完成的分块ID。连接中断或进程重启后从断点继续，上传完成后删除记录。
+    """
+
+    # 会话有效期：OpenAI的Upload对象创建1小时后过期，Gemini可续传会话按1天保守估计
+    SESSION_TTL_SECONDS = {"openai": 3600, "gemini": 24 * 3600}
+
+    def __init__(self, checkpoints_path: str = DEFAULT_UPLOAD_CHECKPOINTS):
+        super().__init__(checkpoints_path)
+
+    def get(self, provider: str, file_sha256: str, file_size: int) -> Optional[Dict[str, Any]]:
+        """查找仍在会话有效期内、文件大小一致的断点"""
+        with self._locked():
+            state = self._load().get(f"{provider}:{file_sha256}")
+        if not state or state.get("size") != file_size:
+            return None
+        if time.time() - state.get("created_at", 0) > self.SESSION_TTL_SECONDS.get(provider, 3600):
+            return None
+        return state
+
+    def save(self, provider: str, file_sha256: str, state: Dict[str, Any]) -> None:
+        """记录断点（每个分块确认后调用）"""
+        with self._locked():
+            entries = self._load()
+            entries[f"{provider}:{file_sha256}"] = {**state, "updated_at": time.time()}
+            self._save(entries)
+
+    def remove(self, provider: str, file_sha256: str) -> None:
+        """上传完成后删除断点"""
+        with self._locked():
+            entries = self._load()
+            if entries.pop(f"{provider}:{file_sha256}", None) is not None:
+                self._save(entries)
+
+
+# ========== 上下文缓存登记表 ==========
+class ContextCacheRegistry(JSONFileStore):
+    """持久化的提供商上下文缓存登记表（Gemini cachedContents）
+
+    按(提供商, 模型, 文档SHA-256)记录缓存名称和过期时间：有效期内直接复用（无需再次读取和上传文档），
+    剩余有效期不足refresh_seconds时续期，已过期的记录在查询时清除。
+    """
+
+    EXPIRY_MARGIN_SECONDS = 60  # 临近过期的缓存不再复用，避免请求期间失效
+
+    def __init__(self, registry_path: str = DEFAULT_CONTEXT_CACHES, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+                 refresh_seconds: int = CONTEXT_CACHE_REFRESH_SECONDS):
+        super().__init__(registry_path)
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+
+    @staticmethod
+    def _entry_key(provider: str, model: str, file_sha256: str) -> str:
+        return f"{provider}:{model}:{file_sha256}"
+
+    def lookup(self, provider: str, model: str, file_sha256: str) -> Optional[Dict[str, Any]]:
+        """查找仍在有效期内的缓存记录，同时清除已过期的记录"""
+        now = time.time()
+        with self._locked():
+            entries = self._load()
+            live = {key: entry for key, entry in entries.items()
+                    if entry["expires_at"] - now > self.EXPIRY_MARGIN_SECONDS}
+            if len(live) != len(entries):
+                self._save(live)
+        return live.get(self._entry_key(provider, model, file_sha256))
+
+    def needs_refresh(self, entry: Dict[str, Any]) -> bool:
+        return entry["expires_at"] - time.time() < self.refresh_seconds
+
+    def register(self, provider: str, model: str, file_sha256: str, name: str, expires_at: float) -> None:
+        """登记新建或续期后的缓存"""
+        with self._locked():
+            entries = self._load()
+            key = self._entry_key(provider, model, file_sha256)
+            created_at = entries.get(key, {}).get("created_at") if entries.get(key, {}).get("name") == name else None
+            entries[key] = {
+                "provider": provider,
+                "model": model,
+                "name": name,
+                "created_at": created_at or time.time(),
+                "expires_at": expires_at,
+            }
+            self._save(entries)
+
+    def remove(self, provider: str, model: str, file_sha256: str) -> None:
+        """移除已在服务端失效的缓存记录"""
+        with self._locked():
+            entries = self._load()
+            if entries.pop(self._entry_key(provider, model, file_sha256), None) is not None:
+                self._save(entries)
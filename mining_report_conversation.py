@@ -0,0 +1,397 @@
+"""
+矿山储量核实报告对话加速（回答缓存 + 本地检索）
+
+start_conversation默认将每个问题基于previous_response_id链发送给模型，每轮都要重新处理整份报告上下文，
+不同分析人员提出的相同问题也会重复付费。ConversationAccelerator在其前面增加三层：
+1. 回答缓存：按PDF内容SHA-256 + 规范化后的问题缓存回答，命中时通过同一流式输出路径回放
+2. 本地检索：对已提取的MiningReport字段和PDF文本层分段建立BM25索引（文本分段按文档缓存，只提取一次）
+3. 小提示词回答：检索命中时只把相关字段和少量段落发给模型；模型判断摘录不足以回答时，
+   才回退为基于完整文档的链式对话
+
+用法示例:
+    extractor = create_extractor("openai", "o4-mini")
+    result = extractor.extract_from_file("report.pdf")
+    accelerator = ConversationAccelerator(extractor, "report.pdf", result)
+    extractor.start_conversation(accelerator)
+
+    for event in accelerator.stream_answer("探明资源量的金属量是多少？"):
+        print(event.text, end="")
+"""
+import hashlib
+import json
+import math
+import os
+import pathlib
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Optional, List, Dict, Any, Tuple, Iterator, NamedTuple
+
+from pydantic import BaseModel
+
+from mining_report_cache import compute_file_sha256
+from mining_report_extractor_stream import (
+    ConversationEvent,
+    MiningReport,
+    OpenAIMiningReportExtractorWithStreamConversation,
+)
+
+
+DEFAULT_CONVERSATION_CACHE_DIR = ".conversation_cache"
+CONVERSATION_CACHE_VERSION = "1"  # 提示词或检索方式变化时递增，使旧回答失效
+PASSAGE_CHARS = 400
+PASSAGE_OVERLAP = 80
+REPLAY_CHUNK_CHARS = 24
+INSUFFICIENT_MARKER = "无法根据摘录回答"
+
+EXCERPT_PROMPT_TEMPLATE = """
+以下是一份矿山储量核实报告中与问题相关的摘录，包括已提取的结构化字段和报告原文段落。
+
+【已提取字段】
+{facts}
+
+【报告原文段落】
+{passages}
+
+{history}请仅根据以上摘录回答问题：{question}
+如果摘录不足以回答该问题，请只回复"{marker}"，不要输出其它内容。
+"""
+
+# 问句中常见但不携带信息的字/词，检索时忽略
+QUESTION_STOPWORDS = {
+    "请问", "问一", "一下", "告诉", "诉我", "我想", "想知", "知道", "这个", "这份", "份报", "个报",
+    "报告", "是多", "多少", "什么", "是什", "么是", "哪些", "哪个", "有哪", "有多", "怎么", "如何",
+    "的是", "是否", "吗", "呢", "的", "了", "是",
+}
+_QUESTION_PREFIXES = ("请问", "请告诉我", "我想知道", "想问一下", "问一下")
+# 指代此前问答的追问，回答依赖对话上下文，不查询也不写入回答缓存
+FOLLOW_UP_MARKERS = ("它", "这些", "那些", "上述", "上面", "刚才", "前面", "那个", "还有呢")
+_ASCII_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CJK_RUN_PATTERN = re.compile(r"[一-鿿]+")
+
+
+# ========== 问题规范化与分词 ==========
+def normalize_question(question: str) -> str:
+    """规范化问题文本：全角转半角、小写、去掉空白、标点和常见礼貌前缀，用作回答缓存键"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = "".join(ch for ch in text if not ch.isspace() and not unicodedata.category(ch).startswith(("P", "S")))
+    for prefix in _QUESTION_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    return text
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25分词：中文按相邻两字切分（单字片段保留单字），英文和数字按词切分"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = _ASCII_TOKEN_PATTERN.findall(text)
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+# ========== BM25检索 ==========
+class Passage(NamedTuple):
+    """检索单元：PDF文本段落（page为从1开始的页码）或已提取字段（page为None）"""
+    page: Optional[int]
+    text: str
+
+
+class BM25Index:
+    """内存中的BM25倒排索引"""
+
+    def __init__(self, passages: List[Passage], k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for doc_id, passage in enumerate(passages):
+            counts = Counter(tokenize(passage.text))
+            self._lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                self._postings.setdefault(token, []).append((doc_id, count))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def idf(self, token: str) -> float:
+        df = len(self._postings.get(token, ()))
+        return math.log(1 + (len(self.passages) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 5, min_score: float = 0.0) -> List[Tuple[Passage, float]]:
+        """返回得分最高的top_k个检索单元及得分"""
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)) - QUESTION_STOPWORDS:
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self.idf(token)
+            for doc_id, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / (self._avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(self.passages[doc_id], score) for doc_id, score in ranked[:top_k] if score >= min_score]
+
+
+def report_facts(report: Optional[MiningReport]) -> List[Passage]:
+    """将已提取的MiningReport展开为"路径：值"形式的字段检索单元（资源信息、矿体分布以矿种、矿体编号标注）"""
+    facts: List[Passage] = []
+
+    def walk(label: str, value: Any) -> None:
+        if value is None or value == "" or value == []:
+            return
+        if isinstance(value, BaseModel):
+            for name, child in value:
+                walk(f"{label} {name}".strip(), child)
+        elif isinstance(value, list):
+            for index, item in enumerate(value, 1):
+                tag = getattr(item, "矿种", None) or getattr(item, "矿体编号", None) or str(index)
+                walk(f"{label}（{tag}）", item)
+        else:
+            facts.append(Passage(None, f"{label}：{value}"))
+
+    walk("", report)
+    return facts
+
+
+def extract_pdf_passages(file_path: str, passage_chars: int = PASSAGE_CHARS,
+                         overlap: int = PASSAGE_OVERLAP) -> List[Passage]:
+    """读取PDF文本层并按固定字数（带重叠）切分为段落；没有文本层的页面（扫描件）跳过"""
+    try:
+        import pypdf
+    except ImportError:
+        raise ImportError("请安装必需包: pip install pypdf")
+
+    passages = []
+    step = max(1, passage_chars - overlap)
+    for page_number, page in enumerate(pypdf.PdfReader(file_path).pages, 1):
+        try:
+            text = re.sub(r"\s+", " ", page.extract_text() or "").strip()
+        except Exception:
+            continue
+        for start in range(0, len(text), step):
+            passages.append(Passage(page_number, text[start:start + passage_chars]))
+            if start + passage_chars >= len(text):
+                break
+    return passages
+
+
+# ========== 回答缓存 ==========
+class AnswerCache:
+    """对话回答与PDF文本分段的磁盘缓存
+
+    回答按(PDF内容SHA-256, 规范化后的问题)缓存，不同分析人员提出的相同问题直接回放；
+    文本分段按PDF内容SHA-256缓存，每份文档只读取一次文本层。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CONVERSATION_CACHE_DIR, max_age_days: float = 30):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_sha256: str, question: str) -> str:
+        raw = "|".join([file_sha256, normalize_question(question), CONVERSATION_CACHE_VERSION])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _write_json(self, path: pathlib.Path, data: Any) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path: pathlib.Path) -> Optional[Any]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            path.unlink(missing_ok=True)
+            return None
+
+    def _answer_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / "answers" / key[:2] / f"{key}.json"
+
+    def get_answer(self, file_sha256: str, question: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的回答（含answer、source、model等），过期或损坏视为未命中"""
+        entry_path = self._answer_path(self.make_key(file_sha256, question))
+        entry = self._read_json(entry_path)
+        if not entry or not entry.get("answer"):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.max_age_seconds:
+            entry_path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def put_answer(self, file_sha256: str, question: str, answer: str, **metadata: Any) -> None:
+        self._write_json(self._answer_path(self.make_key(file_sha256, question)), {
+            "created_at": time.time(),
+            "question": question,
+            **metadata,
+            "answer": answer,
+        })
+
+    def get_passages(self, file_sha256: str) -> Optional[List[Passage]]:
+        data = self._read_json(self.cache_dir / "passages" / f"{file_sha256}.json")
+        if data is None:
+            return None
+        return [Passage(page, text) for page, text in data]
+
+    def put_passages(self, file_sha256: str, passages: List[Passage]) -> None:
+        self._write_json(self.cache_dir / "passages" / f"{file_sha256}.json", [list(p) for p in passages])
+
+
+# ========== 对话加速 ==========
+class ConversationAccelerator:
+    """回答缓存 → 字段/段落检索 + 小提示词 → 完整文档链式对话 的三级回答路由
+
+    stream_answer()与extractor.stream_answer()产出相同的ConversationEvent序列，
+    start_conversation对缓存回答、小提示词回答和模型链式回答使用同一输出路径。
+    """
+
+    def __init__(self, extractor: OpenAIMiningReportExtractorWithStreamConversation, file_path: str,
+                 report: Optional[MiningReport] = None, cache: Optional[AnswerCache] = None,
+                 excerpt_model: Optional[str] = None, top_k_facts: int = 8, top_k_passages: int = 4,
+                 min_score: float = 1.0, history_turns: int = 3):
+        self.extractor = extractor
+        self.file_path = file_path
+        self.cache = cache if cache is not None else AnswerCache()
+        self.excerpt_model = excerpt_model  # 小提示词回答使用的模型，默认与提取器相同
+        self.top_k_facts = top_k_facts
+        self.top_k_passages = top_k_passages
+        self.min_score = min_score
+        self.history_turns = history_turns
+        self.file_sha256 = compute_file_sha256(file_path)
+        self.fact_index = BM25Index(report_facts(report))
+        self.passage_index = BM25Index(self._load_passages())
+        # 未进入previous_response_id链的问答（缓存、小提示词），回退到链式对话时补充给模型
+        self._unchained_turns: List[Tuple[str, str]] = []
+        self._recent_turns: List[Tuple[str, str]] = []
+
+    def _load_passages(self) -> List[Passage]:
+        passages = self.cache.get_passages(self.file_sha256)
+        if passages is not None:
+            return passages
+        try:
+            passages = extract_pdf_passages(self.file_path)
+        except Exception as e:
+            self.extractor.log(f"⚠️ 读取PDF文本层失败，仅检索已提取字段: {e}")
+            return []
+        self.cache.put_passages(self.file_sha256, passages)
+        self.extractor.log(f"📚 已建立报告检索索引（{len(passages)} 个段落）")
+        return passages
+
+    def build_excerpts(self, question: str) -> Optional[Tuple[str, str]]:
+        """检索与问题相关的字段和段落，返回(字段文本, 段落文本)，均未命中时返回None"""
+        facts = self.fact_index.search(question, self.top_k_facts, self.min_score)
+        passages = self.passage_index.search(question, self.top_k_passages, self.min_score)
+        if not facts and not passages:
+            return None
+        fact_text = "\n".join(f"- {passage.text}" for passage, _ in facts) or "（无）"
+        passage_text = "\n".join(f"[第{passage.page}页] {passage.text}" for passage, _ in passages) or "（无）"
+        return fact_text, passage_text
+
+    def _history_text(self) -> str:
+        turns = self._recent_turns[-self.history_turns:] if self.history_turns else []
+        if not turns:
+            return ""
+        lines = "\n".join(f"问：{question}\n答：{answer}" for question, answer in turns)
+        return f"【此前的问答】\n{lines}\n\n"
+
+    def _remember(self, question: str, answer: str, chained: bool) -> None:
+        self._recent_turns.append((question, answer))
+        if chained:
+            self._unchained_turns.clear()
+        else:
+            self._unchained_turns.append((question, answer))
+
+    def _is_follow_up(self, question: str) -> bool:
+        text = question.replace("其它", "其他")  # "其它"即"其他"，其中的"它"不是指代
+        return bool(self._recent_turns) and any(marker in text for marker in FOLLOW_UP_MARKERS)
+
+    @staticmethod
+    def _replay(answer: str) -> Iterator[ConversationEvent]:
+        for start in range(0, len(answer), REPLAY_CHUNK_CHARS):
+            yield ConversationEvent("delta", answer[start:start + REPLAY_CHUNK_CHARS])
+
+    def _stream_excerpt_answer(self, question: str, excerpts: Tuple[str, str],
+                               parts: List[str]) -> Iterator[ConversationEvent]:
+        """以小提示词流式回答；回答开头为INSUFFICIENT_MARKER时不输出任何片段（parts保持为空）"""
+        prompt = EXCERPT_PROMPT_TEMPLATE.format(facts=excerpts[0], passages=excerpts[1], history=self._history_text(),
+                                                question=question, marker=INSUFFICIENT_MARKER)
+        pending = ""
+        decided = False
+        for event in self.extractor.stream_answer(prompt, model=self.excerpt_model):
+            if event.type != "delta":
+                continue
+            if decided:
+                parts.append(event.text)
+                yield event
+                continue
+            # 先缓冲开头，确认不是"摘录不足"标记后再输出
+            pending += event.text
+            stripped = pending.lstrip()
+            if stripped.startswith(INSUFFICIENT_MARKER):
+                return
+            if len(stripped) >= len(INSUFFICIENT_MARKER) or not INSUFFICIENT_MARKER.startswith(stripped):
+                decided = True
+                parts.append(pending)
+                yield ConversationEvent("delta", pending)
+        if not decided and pending.strip() and not INSUFFICIENT_MARKER.startswith(pending.strip()):
+            parts.append(pending)
+            yield ConversationEvent("delta", pending)
+
+    def stream_answer(self, question: str, previous_response_id: Optional[str] = None) -> Iterator[ConversationEvent]:
+        """按 回答缓存 → 摘录小提示词 → 完整文档链式对话 的顺序回答，产出ConversationEvent"""
+        cacheable = not self._is_follow_up(question)
+        cached = self.cache.get_answer(self.file_sha256, question) if cacheable else None
+        if cached is not None:
+            yield from self._replay(cached["answer"])
+            self._remember(question, cached["answer"], chained=False)
+            yield ConversationEvent("done", source="cache")
+            return
+
+        excerpts = self.build_excerpts(question)
+        if excerpts is not None:
+            parts: List[str] = []
+            yield from self._stream_excerpt_answer(question, excerpts, parts)
+            if parts:
+                answer = "".join(parts)
+                if cacheable:
+                    self.cache.put_answer(self.file_sha256, question, answer, source="excerpts",
+                                          model=self.excerpt_model or self.extractor.model)
+                self._remember(question, answer, chained=False)
+                yield ConversationEvent("done", source="excerpts")
+                return
+
+        # 回退：基于完整文档链式提问，补充未进入链的问答作为上下文
+        chained_input = question
+        if self._unchained_turns:
+            lines = "\n".join(f"问：{q}\n答：{a}" for q, a in self._unchained_turns[-self.history_turns:])
+            chained_input = f"此前的问答：\n{lines}\n\n当前问题：{question}"
+        document = None
+        if previous_response_id is None:
+            # 提取结果来自缓存时没有可链接的响应，随问题发送文档
+            document = self.extractor.conversation_document(self.file_path)
+        parts = []
+        done = None
+        for event in self.extractor.stream_answer(chained_input, previous_response_id, document=document):
+            if event.type == "delta":
+                parts.append(event.text)
+                yield event
+            else:
+                done = event
+        answer = "".join(parts)
+        if answer and cacheable:
+            self.cache.put_answer(self.file_sha256, question, answer, source="model", model=self.extractor.model)
+        self._remember(question, answer, chained=True)
+        yield done or ConversationEvent("done", source="model")
@@ -0,0 +1,449 @@
+"""
+矿山储量核实报告常驻提取守护进程（Unix Socket）
+
+每次命令行调用都要启动解释器、导入pydantic和服务商SDK、加载.env、创建客户端并重新建立TLS连接，
+对定时任务中逐个文件调用的小报告而言，这些开销往往超过提取本身。守护进程常驻内存，
+保持已初始化的提取器和连接池；瘦客户端只使用标准库，通过Unix Socket提交PDF并接收MiningReport JSON。
+
+本文件顶层只导入少量标准库（不导入pathlib、subprocess等较重的模块），pydantic、提取器和服务商SDK
+仅在守护进程启动时导入，瘦客户端不受影响。
+
+用法示例:
+    python mining_report_daemon.py serve --provider gemini --model gemini-2.5-flash --prewarm &
+    python mining_report_daemon.py submit report.pdf -o report_result.json
+    python mining_report_daemon.py submit report.pdf --spawn --provider openai   # 守护进程未运行时自动启动
+    python mining_report_daemon.py status
+    python mining_report_daemon.py profile       # 测量瘦客户端与完整提取器的导入耗时
+    python mining_report_daemon.py stop
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+
+
+DEFAULT_MAX_WORKERS = 4
+RESPONSE_CHUNK_BYTES = 64 * 1024
+SPAWN_TIMEOUT_SECONDS = 60.0
+EXTRACTION_MODES = ["single", "sections", "chunked"]
+
+
+def default_socket_path() -> str:
+    """默认Socket路径：优先XDG_RUNTIME_DIR（仅当前用户可访问），否则使用临时目录并带上用户ID"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "mining_report.sock")
+    import tempfile
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"mining_report_{uid}.sock")
+
+
+# ========== 瘦客户端 ==========
+class DaemonNotRunning(Exception):
+    """守护进程未运行（Socket不存在或拒绝连接）"""
+
+
+def send_request(request: Dict[str, Any], socket_path: Optional[str] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+    """发送一条JSON请求并等待JSON响应（每个连接一次请求）"""
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("当前平台不支持Unix Socket")
+    socket_path = socket_path or default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise DaemonNotRunning(f"守护进程未运行: {socket_path}")
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(RESPONSE_CHUNK_BYTES)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    if not chunks:
+        raise ConnectionError("守护进程未返回响应")
+    return json.loads(b"".join(chunks))
+
+
+def spawn_daemon(socket_path: str, serve_args: List[str]) -> None:
+    """在后台启动守护进程并等待其开始监听"""
+    import subprocess
+    log_path = os.path.splitext(socket_path)[0] + ".log"
+    with open(log_path, "ab") as log_file:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--socket", socket_path, "serve", *serve_args],
+            stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+    deadline = time.monotonic() + SPAWN_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"守护进程启动失败，请查看日志: {log_path}")
+        try:
+            send_request({"op": "ping"}, socket_path, timeout=1.0)
+            return
+        except (DaemonNotRunning, ConnectionError, OSError):
+            time.sleep(0.1)
+    raise TimeoutError(f"守护进程启动超时，请查看日志: {log_path}")
+
+
+# ========== 守护进程 ==========
+def _timed_import(module: str) -> float:
+    """导入模块并返回耗时（秒）；已导入的模块耗时接近0"""
+    import importlib
+    started = time.perf_counter()
+    importlib.import_module(module)
+    return time.perf_counter() - started
+
+
+class ExtractorPool:
+    """按(提供商, 模型)保存已初始化的提取器；提取器带有单次提取状态，每次提取独占一个实例"""
+
+    def __init__(self, extractor_kwargs: Dict[str, Any], provider_kwargs: Optional[Dict[str, Dict[str, Any]]] = None):
+        from mining_report_extractor_stream import create_extractor
+        self._create = create_extractor
+        self.extractor_kwargs = extractor_kwargs
+        self.provider_kwargs = provider_kwargs or {}  # 仅对某个提供商生效的参数，如api_key、base_url
+        self._idle: Dict[Tuple[str, str], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def checkout(self, provider: str, model: str) -> Any:
+        with self._lock:
+            idle = self._idle.get((provider, model))
+            if idle:
+                return idle.pop()
+        return self._create(provider, model, **self.extractor_kwargs, **self.provider_kwargs.get(provider, {}))
+
+    def checkin(self, provider: str, model: str, extractor: Any) -> None:
+        with self._lock:
+            self._idle.setdefault((provider, model), []).append(extractor)
+
+
+class WorkerDaemon:
+    """常驻提取服务：启动时完成导入、.env加载和客户端创建（可选预热连接），按请求执行提取"""
+
+    def __init__(self, socket_path: Optional[str] = None, provider: str = "gemini", model: Optional[str] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS, env_file: str = ".env", use_cache: bool = True,
+                 prewarm: bool = False, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.socket_path = socket_path or default_socket_path()
+        self.provider = provider
+        self.model = model
+        self.max_workers = max_workers
+        self.env_file = env_file
+        self.use_cache = use_cache
+        self.prewarm = prewarm
+        self.provider_kwargs = {key: value for key, value in (("api_key", api_key), ("base_url", base_url)) if value}
+        self.started_at = time.time()
+        self.startup: Dict[str, float] = {}
+        self.stats = {"requests": 0, "succeeded": 0, "failed": 0}
+        self.pool: Optional[ExtractorPool] = None
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._stats_lock = threading.Lock()
+        self._server = None
+
+    def import_modules(self) -> None:
+        """导入提取所需的依赖并记录耗时（这部分正是每次命令行调用都要重复付出的启动开销）"""
+        sdk_module = "google.genai" if self.provider == "gemini" else "openai"
+        for module in ("pydantic", "dotenv", "mining_report_extractor_stream", sdk_module):
+            if f"import:{module}" not in self.startup:
+                self.startup[f"import:{module}"] = round(_timed_import(module), 4)
+
+    def warm_up(self) -> None:
+        """导入依赖、创建默认提取器（并可选预热连接），记录各阶段耗时"""
+        self.import_modules()
+        from mining_report_cache import ExtractionCache, UploadCheckpoints, UploadRegistry
+        from mining_report_extractor_stream import GEMINI_MODELS, OPENAI_MODELS
+        self.model = self.model or (GEMINI_MODELS[0] if self.provider == "gemini" else OPENAI_MODELS[0])
+        extractor_kwargs: Dict[str, Any] = {"env_file": self.env_file, "quiet": True,
+                                            "upload_registry": UploadRegistry(), "upload_checkpoints": UploadCheckpoints()}
+        if self.use_cache:
+            extractor_kwargs["cache"] = ExtractionCache()
+        self.pool = ExtractorPool(extractor_kwargs, {self.provider: self.provider_kwargs})
+
+        started = time.perf_counter()
+        extractors = [self.pool.checkout(self.provider, self.model) for _ in range(self.max_workers)]
+        self.startup["init_extractors"] = round(time.perf_counter() - started, 4)
+
+        if self.prewarm:
+            # 列出远程文件是一次轻量请求，用于提前完成DNS解析和TLS握手
+            started = time.perf_counter()
+            try:
+                extractors[0].list_remote_uploads()
+            except Exception as e:
+                print(f"⚠️ 预热连接失败: {e}")
+            self.startup["prewarm_connection"] = round(time.perf_counter() - started, 4)
+
+        for extractor in extractors:
+            self.pool.checkin(self.provider, self.model, extractor)
+
+    def _extract(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        file_path = request.get("file")
+        if not file_path or not os.path.isfile(file_path):
+            return {"ok": False, "error": f"文件不存在: {file_path}"}
+        provider = request.get("provider") or self.provider
+        model = request.get("model") or (self.model if provider == self.provider else None)
+        if not model:
+            return {"ok": False, "error": "请求的提供商与守护进程默认提供商不同，需指定model"}
+        mode = request.get("mode") or "single"
+        if mode not in EXTRACTION_MODES:
+            return {"ok": False, "error": f"不支持的提取方式: {mode}"}
+
+        with self._slots:
+            started = time.perf_counter()
+            extractor = self.pool.checkout(provider, model)
+            try:
+                if mode == "sections":
+                    result = extractor.extract_sections(file_path)
+                elif mode == "chunked":
+                    result = extractor.extract_chunked(file_path, pages_per_chunk=int(request.get("chunk_pages") or 40))
+                else:
+                    result = extractor.extract_from_file(file_path)
+                metrics = extractor.last_metrics.model_dump() if extractor.last_metrics else None
+            finally:
+                if hasattr(extractor, "cleanup"):
+                    extractor.cleanup()
+                self.pool.checkin(provider, model, extractor)
+        return {"ok": True, "result": result.model_dump(exclude_none=True), "metrics": metrics,
+                "elapsed_seconds": round(time.perf_counter() - started, 4)}
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """处理一条请求（op: extract/ping/status/shutdown）"""
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "status":
+            return {"ok": True, "pid": os.getpid(), "provider": self.provider, "model": self.model,
+                    "max_workers": self.max_workers, "uptime_seconds": round(time.time() - self.started_at, 1),
+                    "startup": self.startup, **self.stats}
+        if op == "shutdown":
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+            return {"ok": True}
+        if op != "extract":
+            return {"ok": False, "error": f"未知操作: {op}"}
+
+        with self._stats_lock:
+            self.stats["requests"] += 1
+        try:
+            response = self._extract(request)
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        with self._stats_lock:
+            self.stats["succeeded" if response["ok"] else "failed"] += 1
+        name = os.path.basename(str(request.get("file")))
+        print(f"{'✅' if response['ok'] else '❌'} {name} ({response.get('elapsed_seconds', 0):.1f}s)", flush=True)
+        return response
+
+    def serve_forever(self) -> None:
+        """监听Unix Socket直到收到shutdown请求或被中断"""
+        import socketserver
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                line = self.rfile.readline()
+                try:
+                    response = daemon.handle(json.loads(line))
+                except ValueError:
+                    response = {"ok": False, "error": "请求不是有效的JSON"}
+                try:
+                    self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8"))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(self.socket_path):
+            try:
+                send_request({"op": "ping"}, self.socket_path, timeout=1.0)
+                raise RuntimeError(f"守护进程已在运行: {self.socket_path}")
+            except (DaemonNotRunning, ConnectionError):
+                os.unlink(self.socket_path)  # 上次异常退出遗留的Socket文件
+
+        self._server = Server(self.socket_path, Handler)
+        os.chmod(self.socket_path, 0o600)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+# ========== 导入耗时测量 ==========
+def measure_import_time(statement: str) -> Tuple[float, List[Tuple[int, str]]]:
+    """在新解释器中用 -X importtime 执行语句，返回(总导入耗时秒, [(累计微秒, 顶层模块名)]按耗时降序)"""
+    import subprocess
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                               capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    top_level = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # 只统计被直接导入的顶层模块
+            top_level.append((int(cumulative), name.strip()))
+    top_level.sort(reverse=True)
+    return sum(us for us, _ in top_level) / 1e6, top_level
+
+
+def measure_startup(statement: str, runs: int = 5) -> float:
+    """新解释器执行语句的墙钟耗时（取多次运行的最小值，秒）"""
+    import subprocess
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=os.path.dirname(os.path.abspath(__file__)),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def print_import_profile() -> None:
+    """对比空解释器、瘦客户端和完整提取器的启动耗时"""
+    cases = [
+        ("空解释器", "pass"),
+        ("瘦客户端", "import mining_report_daemon"),
+        ("完整提取器（不含SDK）", "import mining_report_extractor_stream"),
+        ("完整提取器 + Gemini SDK", "import mining_report_extractor_stream, google.genai"),
+        ("完整提取器 + OpenAI SDK", "import mining_report_extractor_stream, openai"),
+    ]
+    print("⏱️ 启动耗时（新解释器墙钟时间，取5次最小值）:")
+    for label, statement in cases:
+        try:
+            seconds = measure_startup(statement)
+            import_seconds, top = measure_import_time(statement)
+        except Exception as e:
+            print(f"  • {label}: 测量失败 {e}")
+            continue
+        heaviest = "、".join(f"{name} {us / 1000:.0f}ms" for us, name in top[:3])
+        print(f"  • {label}: {seconds * 1000:.0f} ms（导入 {import_seconds * 1000:.0f} ms: {heaviest}）")
+
+
+# ========== 命令行入口 ==========
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="矿山储量核实报告常驻提取守护进程")
+    parser.add_argument("--socket", default=None, help=f"Unix Socket路径（默认 {default_socket_path()}）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="启动守护进程（前台运行）")
+    serve_parser.add_argument("--provider", choices=["gemini", "openai"], default="gemini", help="默认AI提供商")
+    serve_parser.add_argument("--model", help="默认模型名称")
+    serve_parser.add_argument("-w", "--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="同时进行的提取数")
+    serve_parser.add_argument("--env-file", default=".env", help="环境变量文件路径")
+    serve_parser.add_argument("--no-cache", action="store_true", help="禁用提取结果缓存")
+    serve_parser.add_argument("--prewarm", action="store_true", help="启动时发起一次轻量请求，提前建立TLS连接")
+    serve_parser.add_argument("--base-url", help="服务商API地址（代理或本地模拟服务）")
+    serve_parser.add_argument("--mock", action="store_true", help="在进程内启动本地模拟服务并连接（不消耗配额）")
+
+    submit_parser = subparsers.add_parser("submit", help="提交PDF并输出MiningReport JSON")
+    submit_parser.add_argument("file", help="PDF文件路径")
+    submit_parser.add_argument("-o", "--output", help="结果JSON输出路径（默认输出到标准输出）")
+    submit_parser.add_argument("--provider", choices=["gemini", "openai"], help="提供商（默认使用守护进程的设置）")
+    submit_parser.add_argument("--model", help="模型名称")
+    submit_parser.add_argument("--mode", choices=EXTRACTION_MODES, default="single", help="提取方式")
+    submit_parser.add_argument("--chunk-pages", type=int, help="分块提取时每个片段的页数")
+    submit_parser.add_argument("--spawn", action="store_true", help="守护进程未运行时在后台自动启动")
+    submit_parser.add_argument("--timing", action="store_true", help="输出客户端耗时和服务端提取耗时")
+
+    subparsers.add_parser("status", help="查看守护进程状态和启动耗时")
+    subparsers.add_parser("stop", help="停止守护进程")
+    subparsers.add_parser("profile", help="测量瘦客户端与完整提取器的启动导入耗时")
+    return parser
+
+
+def _submit(args: argparse.Namespace, socket_path: str, started: float) -> int:
+    request = {"op": "extract", "file": os.path.abspath(args.file), "provider": args.provider,
+               "model": args.model, "mode": args.mode, "chunk_pages": args.chunk_pages}
+    try:
+        response = send_request(request, socket_path)
+    except DaemonNotRunning as e:
+        if not args.spawn:
+            print(f"❌ {e}（使用 serve 启动，或加 --spawn 自动启动）", file=sys.stderr)
+            return 2
+        serve_args = ["--provider", args.provider] if args.provider else []
+        serve_args += ["--model", args.model] if args.model else []
+        try:
+            spawn_daemon(socket_path, serve_args)
+        except (RuntimeError, TimeoutError) as spawn_error:
+            print(f"❌ {spawn_error}", file=sys.stderr)
+            return 2
+        response = send_request(request, socket_path)
+
+    if not response.get("ok"):
+        print(f"❌ 提取失败: {response.get('error')}", file=sys.stderr)
+        return 1
+    output = json.dumps(response["result"], ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.timing:
+        client_seconds = time.perf_counter() - started - response.get("elapsed_seconds", 0)
+        print(f"⏱️ 服务端提取 {response.get('elapsed_seconds', 0):.3f}s，客户端开销 {client_seconds * 1000:.0f} ms",
+              file=sys.stderr)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    started = time.perf_counter()
+    args = build_arg_parser().parse_args(argv)
+    socket_path = args.socket or default_socket_path()
+
+    if args.command == "serve":
+        print("🏔️  矿山储量核实报告提取守护进程")
+        daemon = WorkerDaemon(socket_path, provider=args.provider, model=args.model, max_workers=args.max_workers,
+                              env_file=args.env_file, use_cache=not args.no_cache, prewarm=args.prewarm,
+                              base_url=args.base_url)
+        daemon.import_modules()
+        mock = None
+        if args.mock:
+            from mining_report_benchmark import MOCK_API_KEY, MockProviderServer
+            mock = MockProviderServer().start()
+            daemon.provider_kwargs.update(api_key=MOCK_API_KEY, base_url=(
+                mock.openai_base_url if args.provider == "openai" else mock.gemini_base_url))
+            print(f"🧪 已启动本地模拟服务: {mock.url}")
+        daemon.warm_up()
+        print(f"🔧 {daemon.provider} - {daemon.model}，并发数 {daemon.max_workers}")
+        for stage, seconds in daemon.startup.items():
+            print(f"  • {stage}: {seconds * 1000:.0f} ms")
+        print(f"🔌 监听: {socket_path}", flush=True)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if mock is not None:
+                mock.stop()
+        print("👋 守护进程已停止")
+        return 0
+
+    if args.command == "profile":
+        print_import_profile()
+        return 0
+
+    if args.command == "submit":
+        return _submit(args, socket_path, started)
+
+    try:
+        response = send_request({"op": "status" if args.command == "status" else "shutdown"}, socket_path,
+                                timeout=10.0)
+    except DaemonNotRunning as e:
+        print(f"❌ {e}")
+        return 2
+    if args.command == "stop":
+        print("✅ 守护进程已停止")
+    else:
+        print(json.dumps(response, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
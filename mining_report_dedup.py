@@ -0,0 +1,638 @@
+"""
+矿山储量核实报告近重复检测与增量提取
+
+语料中有大量几乎相同的报告：重新扫描的版本、修编版本、同一矿权逐年提交的报告。
+逐份从头提取时，大部分字段其实没有变化。本模块为已提取的报告建立相似度索引，
+新报告入库时找到最相近的已提取报告，以其MiningReport为基线，只把发生变化的页面发送给模型：
+
+- MinHasher：基于PDF文本层的字符shingle计算MinHash签名（整份文档及逐页），并从文本中识别矿权编号
+- SimilarityIndex：SQLite持久化的LSH索引（签名分段分桶，按桶和矿权编号查找候选），
+  查找只比较同桶或同矿权编号的候选，不随语料规模线性增长
+- DeduplicatingExtractor：相似度达到阈值时比对逐页指纹（文本MinHash + 页内数字），
+  页面均未变化时直接沿用基线结果；只有部分页面变化时仅将这些页面与基线结果一起发送给模型，
+  再与基线合并（变化页面中出现的矿种整体替换其资源量），合并结果须通过本地校验；
+  基线有页面被删除、变化页面过多、没有文本层、没有匹配或合并结果校验不通过时照常整体提取
+
+用法示例:
+    from mining_report_dedup import DeduplicatingExtractor, SimilarityIndex
+
+    index = SimilarityIndex("similarity_index.db")
+    extractor = create_extractor("gemini", "gemini-2.5-flash")
+    result = DeduplicatingExtractor(extractor, index).extract_from_file("report_2024修编.pdf")
+
+    python mining_report_dedup.py build reports/ results/      # 用已有的提取结果建立索引
+    python mining_report_dedup.py query report.pdf             # 查找最相近的已提取报告及变化页面
+"""
+import argparse
+import hashlib
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from typing import Optional, List, Dict, Any, Tuple, Iterable, NamedTuple
+
+from mining_report_cache import compute_file_sha256
+from mining_report_extractor_stream import (
+    BaseMiningReportExtractor,
+    MiningReport,
+    merge_mining_reports,
+    normalize_mineral_name,
+)
+from mining_report_pages import write_pdf_pages
+from mining_report_validation import check_report
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时逐个计算（结果相同，速度较慢）
+    np = None
+
+
+DEFAULT_INDEX_PATH = "similarity_index.db"
+NUM_PERM = 128  # 文档签名长度
+LSH_BANDS = 32  # 签名分为32段、每段4个值：相似度约0.5时开始以较高概率落入同一个桶
+PAGE_NUM_PERM = 32  # 逐页签名长度（取文档签名的前32个哈希函数）
+SHINGLE_SIZE = 5  # 字符shingle长度（中文报告按字符切分）
+MINHASH_SEED = 20240601
+DEFAULT_MIN_SIMILARITY = 0.8  # 不同矿权编号（或未识别到编号）时沿用基线所需的最低相似度
+DEFAULT_RIGHTS_MIN_SIMILARITY = 0.5  # 同一矿权编号（如逐年报告）时所需的最低相似度
+PAGE_MATCH_SIMILARITY = 0.9  # 页面文本相似度不低于该值且页内数字完全一致时视为未变化
+DEFAULT_MAX_CHANGED_RATIO = 0.5  # 变化页面超过该比例时整体重新提取
+MAX_BUCKET_CANDIDATES = 50  # 每个桶最多取最近写入的50个候选，避免模板化页面形成的大桶拖慢查找
+MAX_BASELINE_CANDIDATES = 5  # 相似度最高的5个候选逐页比较，取变化页面最少者作为基线
+MIN_CHARS_PER_PAGE = 20  # 平均每页文本少于该字符数时视为扫描件，不参与索引
+
+_PRIME = (1 << 32) + 15  # 大于2^32的素数，哈希函数为 (a·x + b) mod p
+_MAX_HASH = (1 << 32) - 1
+# 页眉页脚中的页码行（如"12"、"- 12 -"、"第12页 共80页"），插页后页码整体后移不应视为内容变化
+PAGE_NUMBER_LINE = re.compile(r"^[-—–\s]*(?:第\s*)?\d{1,4}\s*页?(?:\s*[/共]\s*\d{1,4}\s*页?)?[-—–\s]*$")
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+# 探矿权证号（T开头）、采矿许可证号（C开头）
+MINING_RIGHT_NUMBER_PATTERN = re.compile(r"(?<![A-Za-z0-9])[TC]\d{12,22}(?!\d)")
+
+REVISION_PROMPT_TEMPLATE = """{prompt}
+
+**注意：** 当前文档只包含报告中相对已提取版本发生变化的页面（{pages}，完整报告共{total}页），
+其余页面与已提取版本相同。已提取版本的结果如下，仅供统一矿种名称、矿体编号等写法参考：
+
+```json
+{baseline}
+```
+
+只提取当前页面中实际出现的信息，当前页面中没有出现的字段一律返回null，不要照抄上述结果或推测其它页面的内容。
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    file_sha256 TEXT UNIQUE,
+    source_file TEXT,
+    page_count INTEGER NOT NULL,
+    signature BLOB NOT NULL,
+    page_signatures BLOB NOT NULL,
+    page_digests BLOB NOT NULL,
+    text_pages TEXT NOT NULL,
+    indexed_at REAL NOT NULL,
+    result_json TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    PRIMARY KEY (band, bucket, document_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets_document ON lsh_buckets(document_id);
+
+CREATE TABLE IF NOT EXISTS mining_right_numbers (
+    number TEXT NOT NULL,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    PRIMARY KEY (number, document_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_mining_right_numbers_document ON mining_right_numbers(document_id);
+"""
+
+
+# ========== 文档指纹 ==========
+class PageFingerprint(NamedTuple):
+    """单页指纹：文本MinHash签名、页内数字序列的摘要、是否有文本层"""
+    signature: Tuple[int, ...]
+    numbers_digest: bytes
+    has_text: bool
+
+
+class DocumentFingerprint(NamedTuple):
+    """整份文档的指纹：文档签名（各页签名逐位取最小值）、逐页指纹、文本中出现的矿权编号"""
+    signature: Tuple[int, ...]
+    pages: List[PageFingerprint]
+    mining_right_numbers: List[str]
+    text_chars: int
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    @property
+    def has_text(self) -> bool:
+        """文本层是否足以比较（扫描件返回False）"""
+        return bool(self.pages) and self.text_chars >= MIN_CHARS_PER_PAGE * len(self.pages)
+
+
+def normalize_page_text(text: str) -> str:
+    """去除页码行和空白字符"""
+    lines = [line for line in text.splitlines() if not PAGE_NUMBER_LINE.match(line)]
+    return re.sub(r"\s+", "", "".join(lines))
+
+
+def normalize_mining_right_number(number: Optional[str]) -> str:
+    """统一矿权编号写法（去除空白、转为大写）"""
+    return re.sub(r"\s+", "", number or "").upper()
+
+
+def estimate_similarity(a: Iterable[int], b: Iterable[int]) -> float:
+    """由两个等长MinHash签名估计Jaccard相似度"""
+    pairs = list(zip(a, b))
+    return sum(x == y for x, y in pairs) / len(pairs) if pairs else 0.0
+
+
+class MinHasher:
+    """字符shingle的MinHash签名（整份文档 + 逐页），同一参数下结果与是否安装numpy无关"""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = MINHASH_SEED,
+                 page_num_perm: int = PAGE_NUM_PERM):
+        if page_num_perm > num_perm:
+            raise ValueError("page_num_perm不能大于num_perm")
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.page_num_perm = page_num_perm
+        # 由种子确定的哈希函数系数（a、b小于2^31，a·x + b在uint64范围内不会溢出）
+        digest = hashlib.shake_256(f"minhash:{seed}".encode()).digest(8 * num_perm)
+        coefficients = array("I", digest)
+        self._a = [(value & 0x7FFFFFFF) | 1 for value in coefficients[:num_perm]]
+        self._b = [value & 0x7FFFFFFF for value in coefficients[num_perm:]]
+        if np is not None:
+            self._np_a = np.array(self._a, dtype=np.uint64)
+            self._np_b = np.array(self._b, dtype=np.uint64)
+
+    def _shingle_hashes(self, text: str) -> List[int]:
+        if not text:
+            return []
+        if len(text) <= self.shingle_size:
+            return [zlib.crc32(text.encode("utf-8"))]
+        return list({zlib.crc32(text[i:i + self.shingle_size].encode("utf-8"))
+                     for i in range(len(text) - self.shingle_size + 1)})
+
+    def signature(self, hashes: List[int]) -> Tuple[int, ...]:
+        """shingle哈希集合的MinHash签名（空集合时各位为最大值）"""
+        if not hashes:
+            return (_MAX_HASH,) * self.num_perm
+        if np is not None:
+            values = np.array(hashes, dtype=np.uint64)[:, None]
+            permuted = (values * self._np_a + self._np_b) % np.uint64(_PRIME) & np.uint64(_MAX_HASH)
+            return tuple(int(value) for value in permuted.min(axis=0))
+        return tuple(min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes) for a, b in zip(self._a, self._b))
+
+    def fingerprint_pages(self, texts: List[str]) -> DocumentFingerprint:
+        """由逐页文本计算文档指纹"""
+        pages: List[PageFingerprint] = []
+        signatures: List[Tuple[int, ...]] = []
+        numbers: List[str] = []
+        text_chars = 0
+        for raw in texts:
+            text = normalize_page_text(raw)
+            text_chars += len(text)
+            signature = self.signature(self._shingle_hashes(text))
+            signatures.append(signature)
+            digest = hashlib.blake2b("|".join(NUMBER_PATTERN.findall(text)).encode(), digest_size=8).digest()
+            pages.append(PageFingerprint(signature[:self.page_num_perm], digest, bool(text)))
+            numbers.extend(MINING_RIGHT_NUMBER_PATTERN.findall(text))
+        document = tuple(min(column) for column in zip(*signatures)) if signatures else (_MAX_HASH,) * self.num_perm
+        return DocumentFingerprint(document, pages, sorted(set(numbers)), text_chars)
+
+    def fingerprint(self, file_path: str) -> DocumentFingerprint:
+        """读取PDF文本层并计算文档指纹"""
+        try:
+            import pypdf
+        except ImportError:
+            raise ImportError("请安装必需包: pip install pypdf")
+
+        texts = []
+        for page in pypdf.PdfReader(file_path).pages:
+            try:
+                texts.append(page.extract_text() or "")
+            except Exception:
+                texts.append("")
+        return self.fingerprint_pages(texts)
+
+
+def match_pages(pages: List[PageFingerprint], baseline: List[PageFingerprint],
+                threshold: float = PAGE_MATCH_SIMILARITY) -> List[Optional[int]]:
+    """逐页查找基线中内容相同的页面，返回对应的基线页码（从0开始），没有对应页面时为None
+
+    页面与基线中某页文本相似度不低于threshold且页内数字完全一致时视为相同（不要求页码对应，
+    插页、删页后其余页面仍能匹配）；没有文本层的页面无法比较，一律没有对应页面。
+    """
+    by_digest: Dict[bytes, List[int]] = {}
+    for j, page in enumerate(baseline):
+        if page.has_text:
+            by_digest.setdefault(page.numbers_digest, []).append(j)
+    return [next((j for j in by_digest.get(page.numbers_digest, [])
+                  if estimate_similarity(page.signature, baseline[j].signature) >= threshold), None)
+            if page.has_text else None
+            for page in pages]
+
+
+def changed_pages(pages: List[PageFingerprint], baseline: List[PageFingerprint],
+                  threshold: float = PAGE_MATCH_SIMILARITY) -> List[int]:
+    """返回相对基线发生变化的页码（从0开始），即在基线中没有对应页面的页面"""
+    return [i for i, match in enumerate(match_pages(pages, baseline, threshold)) if match is None]
+
+
+def removed_pages(pages: List[PageFingerprint], baseline: List[PageFingerprint],
+                  threshold: float = PAGE_MATCH_SIMILARITY) -> List[int]:
+    """返回在新文档中被删除的基线页码（从0开始）
+
+    按未变化的页面将两份文档对齐，相邻两个对齐页面之间，基线中没有对应页面的页数多于新文档中
+    变化页面的页数时，多出的基线页面（取该段最后几页）视为已删除；数量不多于变化页面时视为被修改。
+    """
+    matches = match_pages(pages, baseline, threshold)
+    matched = {j for j in matches if j is not None}
+    anchors = [(-1, -1)]
+    for i, j in enumerate(matches):
+        if j is not None and j > anchors[-1][1]:
+            anchors.append((i, j))
+    anchors.append((len(pages), len(baseline)))
+
+    removed: List[int] = []
+    for (start_new, start_base), (end_new, end_base) in zip(anchors, anchors[1:]):
+        unmatched = [j for j in range(start_base + 1, end_base) if j not in matched]
+        edited = sum(matches[i] is None for i in range(start_new + 1, end_new))
+        if len(unmatched) > edited:
+            removed.extend(unmatched[edited:])
+    return removed
+
+
+def format_page_ranges(pages: List[int]) -> str:
+    """将页码（从0开始）格式化为"第3-5、12页\""""
+    ranges: List[List[int]] = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return "第" + "、".join(f"{start + 1}" if start == end else f"{start + 1}-{end + 1}" for start, end in ranges) + "页"
+
+
+def apply_revision(delta: MiningReport, baseline: MiningReport) -> MiningReport:
+    """将变化页面的提取结果与基线合并
+
+    标量字段取变化页面中出现的值，其余沿用基线；变化页面中出现的矿种，其资源量情况整体替换为
+    变化页面中的版本（资源量各类别相互关联，逐字段合并会把新旧数据拼在一起，总计与各类别不再对应）。
+    """
+    merged = merge_mining_reports([delta, baseline])
+    revised = {normalize_mineral_name(info.矿种): info.资源量情况
+               for info in delta.资源信息 or [] if info.资源量情况 is not None}
+    for info in merged.资源信息 or []:
+        mineral = normalize_mineral_name(info.矿种)
+        if mineral in revised:
+            info.资源量情况 = revised[mineral]
+    return merged
+
+
+# ========== 相似度索引 ==========
+class SimilarityMatch(NamedTuple):
+    """最相近的已提取报告、相对其发生变化的页面及基线中已被删除的页面"""
+    document_id: int
+    source_file: Optional[str]
+    similarity: float
+    same_mining_right: bool
+    changed_pages: List[int]
+    report: MiningReport
+    removed_pages: List[int] = []
+
+
+def _pack(values: Iterable[int]) -> bytes:
+    return array("I", values).tobytes()
+
+
+def _unpack(blob: bytes) -> Tuple[int, ...]:
+    values = array("I")
+    values.frombytes(blob)
+    return tuple(values)
+
+
+class SimilarityIndex:
+    """SQLite持久化的MinHash LSH索引
+
+    文档签名分为bands段，每段哈希为一个桶；查找时只取与查询文档至少共享一个桶、
+    或文本中出现相同矿权编号的文档作为候选，再以完整签名估计相似度。
+    同一file_sha256再次写入时替换旧记录。实例可在多个线程间共享（内部加锁）。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH, hasher: Optional[MinHasher] = None,
+                 bands: int = LSH_BANDS):
+        self.db_path = db_path
+        self.hasher = hasher or MinHasher()
+        if self.hasher.num_perm % bands:
+            raise ValueError(f"签名长度{self.hasher.num_perm}不能被bands={bands}整除")
+        self.bands = bands
+        self.rows = self.hasher.num_perm // bands
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._check_parameters()
+
+    def __enter__(self) -> "SimilarityIndex":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _check_parameters(self) -> None:
+        """签名参数写入索引；以不同参数打开已有索引时报错（签名无法互相比较）"""
+        hasher = self.hasher
+        parameters = {"num_perm": hasher.num_perm, "page_num_perm": hasher.page_num_perm,
+                      "shingle_size": hasher.shingle_size, "seed": hasher.seed, "bands": self.bands}
+        with self._lock, self._conn:
+            stored = {row["key"]: row["value"] for row in self._conn.execute("SELECT key, value FROM index_meta")}
+            if not stored:
+                self._conn.executemany("INSERT INTO index_meta (key, value) VALUES (?, ?)",
+                                       [(key, str(value)) for key, value in parameters.items()])
+                return
+        mismatched = [key for key, value in parameters.items() if stored.get(key) != str(value)]
+        if mismatched:
+            raise ValueError(f"相似度索引 {self.db_path} 的参数与当前设置不一致: {', '.join(mismatched)}")
+
+    def _buckets(self, signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+        buckets = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(_pack(signature[band * self.rows:(band + 1) * self.rows]), digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, "big", signed=True)))
+        return buckets
+
+    # ---------- 写入 ----------
+    def add(self, fingerprint: DocumentFingerprint, result: MiningReport, source_file: Optional[str] = None,
+            file_sha256: Optional[str] = None) -> Optional[int]:
+        """写入一份已提取报告的指纹和结果，返回文档ID；没有文本层的文档不写入，返回None"""
+        if not fingerprint.has_text:
+            return None
+        numbers = set(fingerprint.mining_right_numbers)
+        if result.矿权信息 is not None and result.矿权信息.矿权编号:
+            numbers.add(normalize_mining_right_number(result.矿权信息.矿权编号))
+        pages = fingerprint.pages
+        with self._lock, self._conn:
+            if file_sha256:
+                self._conn.execute("DELETE FROM documents WHERE file_sha256 = ?", (file_sha256,))
+            cursor = self._conn.execute(
+                "INSERT INTO documents (file_sha256, source_file, page_count, signature, page_signatures, "
+                "page_digests, text_pages, indexed_at, result_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_sha256, source_file, len(pages), _pack(fingerprint.signature),
+                 _pack(value for page in pages for value in page.signature),
+                 b"".join(page.numbers_digest for page in pages),
+                 "".join("1" if page.has_text else "0" for page in pages),
+                 time.time(), result.model_dump_json(exclude_none=True)),
+            )
+            document_id = cursor.lastrowid
+            self._conn.executemany("INSERT INTO lsh_buckets (band, bucket, document_id) VALUES (?, ?, ?)",
+                                   [(band, bucket, document_id) for band, bucket in self._buckets(fingerprint.signature)])
+            self._conn.executemany("INSERT INTO mining_right_numbers (number, document_id) VALUES (?, ?)",
+                                   [(number, document_id) for number in sorted(numbers) if number])
+        return document_id
+
+    # ---------- 查找 ----------
+    def candidates(self, fingerprint: DocumentFingerprint) -> Tuple[set, set]:
+        """返回(LSH同桶的文档ID, 矿权编号相同的文档ID)，均通过索引查找"""
+        lsh_ids, rights_ids = set(), set()
+        with self._lock:
+            for band, bucket in self._buckets(fingerprint.signature):
+                lsh_ids.update(row[0] for row in self._conn.execute(
+                    "SELECT document_id FROM lsh_buckets WHERE band = ? AND bucket = ? "
+                    "ORDER BY document_id DESC LIMIT ?", (band, bucket, MAX_BUCKET_CANDIDATES)))
+            for number in fingerprint.mining_right_numbers:
+                rights_ids.update(row[0] for row in self._conn.execute(
+                    "SELECT document_id FROM mining_right_numbers WHERE number = ? ORDER BY document_id DESC LIMIT ?",
+                    (number, MAX_BUCKET_CANDIDATES)))
+        return lsh_ids, rights_ids
+
+    def query(self, fingerprint: DocumentFingerprint, min_similarity: float = DEFAULT_MIN_SIMILARITY,
+              rights_min_similarity: float = DEFAULT_RIGHTS_MIN_SIMILARITY,
+              page_similarity: float = PAGE_MATCH_SIMILARITY,
+              file_sha256: Optional[str] = None) -> Optional[SimilarityMatch]:
+        """查找最相近的已提取报告，相似度未达到阈值（矿权编号相同时为rights_min_similarity）时返回None
+
+        相似度最高的若干候选逐页比较，取被删除页面、变化页面最少者（相同时取相似度高、矿权编号相同、较新写入者）；
+        file_sha256与候选相同（同一文件再次入库）时视为没有变化页面。
+        """
+        if not fingerprint.has_text:
+            return None
+        lsh_ids, rights_ids = self.candidates(fingerprint)
+        ids = sorted(lsh_ids | rights_ids)
+        if not ids:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, signature FROM documents WHERE id IN ({', '.join('?' * len(ids))})", ids).fetchall()
+
+        ranked = []
+        for row in rows:
+            similarity = estimate_similarity(fingerprint.signature, _unpack(row["signature"]))
+            same_right = row["id"] in rights_ids
+            if similarity >= (rights_min_similarity if same_right else min_similarity):
+                ranked.append((similarity, same_right, row["id"]))
+        if not ranked:
+            return None
+
+        best: Optional[Tuple[Tuple[int, float, bool, int], SimilarityMatch]] = None
+        for similarity, same_right, document_id in sorted(ranked, reverse=True)[:MAX_BASELINE_CANDIDATES]:
+            with self._lock:
+                row = self._conn.execute("SELECT * FROM documents WHERE id = ?", (document_id,)).fetchone()
+            if file_sha256 and row["file_sha256"] == file_sha256:
+                changed, removed = [], []
+            else:
+                baseline = self._page_fingerprints(row)
+                changed = changed_pages(fingerprint.pages, baseline, page_similarity)
+                removed = removed_pages(fingerprint.pages, baseline, page_similarity)
+            rank = (-len(removed), -len(changed), similarity, same_right, document_id)
+            if best is None or rank > best[0]:
+                best = (rank, SimilarityMatch(document_id, row["source_file"], similarity, same_right, changed,
+                                              MiningReport.model_validate_json(row["result_json"]), removed))
+        return best[1]
+
+    def _page_fingerprints(self, row: sqlite3.Row) -> List[PageFingerprint]:
+        signatures, digests, width = _unpack(row["page_signatures"]), row["page_digests"], self.hasher.page_num_perm
+        return [PageFingerprint(signatures[i * width:(i + 1) * width], digests[i * 8:(i + 1) * 8], flag == "1")
+                for i, flag in enumerate(row["text_pages"])]
+
+    def counts(self) -> Dict[str, int]:
+        """已索引的文档数、桶记录数和矿权编号数"""
+        with self._lock:
+            return {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("documents", "lsh_buckets", "mining_right_numbers")}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ========== 增量提取 ==========
+class DeduplicatingExtractor:
+    """近重复报告的增量提取：沿用最相近的已提取报告作为基线，只将变化的页面发送给模型"""
+
+    def __init__(self, extractor: BaseMiningReportExtractor, index: SimilarityIndex,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                 rights_min_similarity: float = DEFAULT_RIGHTS_MIN_SIMILARITY,
+                 max_changed_ratio: float = DEFAULT_MAX_CHANGED_RATIO):
+        self.extractor = extractor
+        self.index = index
+        self.min_similarity = min_similarity
+        self.rights_min_similarity = rights_min_similarity
+        self.max_changed_ratio = max_changed_ratio
+        self.last_match: Optional[SimilarityMatch] = None  # 最近一次提取使用的基线（整体提取时为None）
+
+    def extract_from_file(self, file_path: str) -> MiningReport:
+        """从PDF文件提取信息，结果写入相似度索引供后续报告复用"""
+        extractor = self.extractor
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        with extractor.track(file_path, "dedup") as metrics:
+            cached = extractor.get_cached_result(file_path, "dedup")
+            if cached is not None:
+                self.last_match = None
+                return cached
+
+            with extractor.span("dedup"):
+                file_sha256 = compute_file_sha256(file_path)
+                fingerprint = self.index.hasher.fingerprint(file_path)
+                match = self.index.query(fingerprint, self.min_similarity, self.rights_min_similarity,
+                                         file_sha256=file_sha256)
+            self.last_match = None
+            if match is not None:
+                metrics.dedup_similarity = round(match.similarity, 4)
+                reason = "矿权编号相同，" if match.same_mining_right else ""
+                extractor.log(f"🔗 找到相近的已提取报告: {match.source_file}（{reason}相似度 {match.similarity:.2f}，"
+                               f"{len(match.changed_pages)}/{fingerprint.page_count} 页有变化）")
+
+            result = None
+            if match is None:
+                pass
+            elif match.removed_pages:
+                # 被删除页面上的数据（如已注销的矿体、资源量类别）仍留在基线结果中，只提取变化页面无法将其去除
+                extractor.log(f"📄 基线报告的{format_page_ranges(match.removed_pages)}在新版本中已删除，整体重新提取")
+            elif len(match.changed_pages) > self.max_changed_ratio * fingerprint.page_count:
+                extractor.log("📄 变化页面过多，整体重新提取")
+            elif not match.changed_pages:
+                self.last_match = match
+                extractor.add_metrics(dedup_reused_pages=fingerprint.page_count)
+                extractor.log("✅ 页面内容均未变化，沿用基线结果")
+                result = match.report
+            else:
+                result = self._extract_changed(file_path, match, fingerprint.page_count)
+                if result is not None:
+                    self.last_match = match
+                    extractor.add_metrics(dedup_changed_pages=len(match.changed_pages),
+                                           dedup_reused_pages=fingerprint.page_count - len(match.changed_pages))
+            if result is None:
+                result = extractor.extract_from_file(file_path)
+
+            self.index.add(fingerprint, result, source_file=str(file_path), file_sha256=file_sha256)
+            extractor.put_cached_result(file_path, result, "dedup")
+            return result
+
+    def _extract_changed(self, file_path: str, match: SimilarityMatch, total_pages: int) -> Optional[MiningReport]:
+        """只提取变化页面并与基线合并，合并结果出现基线没有的校验问题时返回None（由调用方整体重新提取）"""
+        extractor = self.extractor
+        local_resources = extractor.local_resources(file_path)
+        with extractor.span("file_read"):
+            delta_path, _ = write_pdf_pages(file_path, match.changed_pages, prefix="changed_")
+        pages = format_page_ranges(match.changed_pages)
+        try:
+            # 延迟上传的提供商（如Gemini内联传输）在请求时才读取文件，请求结束前不能删除临时PDF
+            with extractor.open_document(delta_path, select_pages=False, register=False) as document:
+                extractor.log(f"🔍 正在提取变化页面（{pages}）...")
+                prompt, schema = extractor.report_prompt(local_resources)
+                prompt = REVISION_PROMPT_TEMPLATE.format(
+                    prompt=prompt, pages=pages, total=total_pages,
+                    baseline=match.report.model_dump_json(exclude_none=True, indent=2))
+                parsed, _ = extractor.request_structured(document, prompt, schema)
+        finally:
+            pathlib.Path(delta_path).unlink(missing_ok=True)
+
+        result = apply_revision(extractor.with_local_resources(parsed, local_resources), match.report)
+        baseline_issues = {(issue.code, issue.target) for issue in check_report(match.report)}
+        new_issues = [issue for issue in check_report(result) if (issue.code, issue.target) not in baseline_issues]
+        if new_issues:
+            extractor.log(f"⚠️ 合并结果未通过校验（{'；'.join(issue.message for issue in new_issues)}），整体重新提取")
+            return None
+        extractor.log("✅ 变化页面已与基线结果合并")
+        return result
+
+
+# ========== 命令行入口 ==========
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="矿山报告近重复检测：建立相似度索引、查找最相近的已提取报告")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="相似度索引文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="用已有的批量提取结果（<文件名>_result.json）建立索引")
+    build.add_argument("reports", help="PDF报告目录")
+    build.add_argument("results", help="提取结果JSON目录")
+
+    query = subparsers.add_parser("query", help="查找与PDF最相近的已提取报告及变化页面")
+    query.add_argument("file", help="PDF文件路径")
+    query.add_argument("--min-similarity", type=float, default=DEFAULT_MIN_SIMILARITY, help="最低相似度")
+    query.add_argument("--rights-min-similarity", type=float, default=DEFAULT_RIGHTS_MIN_SIMILARITY,
+                       help="矿权编号相同时的最低相似度")
+    args = parser.parse_args(argv)
+
+    with SimilarityIndex(args.index) as index:
+        if args.command == "build":
+            results = pathlib.Path(args.results)
+            indexed = skipped = 0
+            for pdf_file in sorted(pathlib.Path(args.reports).rglob("*.pdf")):
+                result_file = results / f"{pdf_file.stem}_result.json"
+                if not result_file.exists():
+                    continue
+                report = MiningReport.model_validate_json(result_file.read_text(encoding="utf-8"))
+                fingerprint = index.hasher.fingerprint(str(pdf_file))
+                if index.add(fingerprint, report, source_file=str(pdf_file),
+                             file_sha256=compute_file_sha256(str(pdf_file))) is None:
+                    skipped += 1
+                    print(f"⚠️ {pdf_file.name} 没有文本层，未写入索引")
+                else:
+                    indexed += 1
+            print(f"✅ 写入 {indexed} 份报告，跳过 {skipped} 份；索引共 {index.counts()['documents']} 份报告")
+            return 0
+
+        fingerprint = index.hasher.fingerprint(args.file)
+        if not fingerprint.has_text:
+            print("❌ 文档没有文本层，无法比较")
+            return 1
+        match = index.query(fingerprint, args.min_similarity, args.rights_min_similarity)
+        if match is None:
+            print("📭 没有相近的已提取报告")
+            return 1
+        print(f"🔗 最相近: {match.source_file}（相似度 {match.similarity:.2f}"
+              f"{'，矿权编号相同' if match.same_mining_right else ''}）")
+        if match.removed_pages:
+            print(f"🗑️ 基线中已删除的页面: {format_page_ranges(match.removed_pages)}（将整体重新提取）")
+        if match.changed_pages:
+            print(f"📄 变化页面: {format_page_ranges(match.changed_pages)}（{len(match.changed_pages)}/{fingerprint.page_count}）")
+        elif not match.removed_pages:
+            print("✅ 页面内容均未变化")
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,41 @@
+import io
 import os
 import json
+import time
+import hashlib
+import re
 import pathlib
-from typing import Optional, List, Dict, Any, Tuple
+import threading
+import contextlib
+import contextvars
+import itertools
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple, Type, Iterator, NamedTuple, Callable, ContextManager
 from abc import ABC, abstractmethod
 from pydantic import BaseModel
 
+from mining_report_cache import (
+    UPLOAD_NAME_PREFIX,
+    ContextCacheRegistry,
+    ExtractionCache,
+    UploadRegistry,
+    UploadCheckpoints,
+    compute_file_sha256,
+)
+from mining_report_pages import PageSelector, split_pdf_pages
+from mining_report_metrics import (
+    CURRENT_METRICS,
+    CURRENT_RETRY_ATTEMPT,
+    ExtractionMetrics,
+    MetricsSink,
+    count_pdf_pages,
+    current_metrics,
+    gemini_usage,
+    openai_usage,
+)
+from mining_report_streaming import IncrementalJSONSectionParser
+
 
 # ========== Pydantic 数据模型 ==========
 class ReportInfo(BaseModel):
@@ -75,6 +106,30 @@ class MiningReport(BaseModel):
     其它信息: Optional[str] = None
 
 
+# 分章节提取使用的子Schema（结构化输出要求根节点为对象，列表字段需包装）
+class ResourceInfoList(BaseModel):
+    """资源信息列表模型"""
+    资源信息: Optional[List[ResourceInfo]] = None
+
+
+class OreBodyDistributionList(BaseModel):
+    """矿体分布列表模型"""
+    矿体分布: Optional[List[OreBodyDistribution]] = None
+
+
+class OtherInfo(BaseModel):
+    """其它信息模型"""
+    其它信息: Optional[str] = None
+
+
+class MiningReportWithoutResources(BaseModel):
+    """不含资源信息的报告模型（资源量表已由本地解析时使用）"""
+    报告信息: Optional[ReportInfo] = None
+    矿权信息: Optional[MiningRightsInfo] = None
+    矿体分布: Optional[List[OreBodyDistribution]] = None
+    其它信息: Optional[str] = None
+
+
 # ========== 提示词配置 ==========
 EXTRACTION_PROMPT = """
 你是一名地质和矿业领域的专家，请仔细分析这个矿山储量核实报告PDF文档，按照以下结构提取信息并以JSON格式返回：
@@ -147,6 +202,20 @@ EXTRACTION_PROMPT = """
 请仔细阅读文档内容，特别注意资源量统计表格，确保提取的信息准确完整。
 """
 
+CHUNK_PROMPT_TEMPLATE = """{prompt}
+
+**注意：** 当前文档是完整报告第{start}-{end}页的片段（完整报告共{total}页）。
+只提取该片段中实际出现的信息，片段中没有出现的字段一律返回null，不要推测或补全其它页面的内容。
+"""
+
+SECTION_PROMPT_TEMPLATE = """
+你是一名地质和矿业领域的专家，请仔细分析这个矿山储量核实报告PDF文档，只提取以下「{section}」部分的信息并以JSON格式返回：
+
+{section_text}
+
+如果某些信息在文档中未找到，请在对应字段填入null，切不可没有根据地胡乱编造！
+"""
+
 CONVERSATION_INSTRUCTIONS = """
 你是一名地质和矿业领域的专家，请你仔细阅读报告内容，认真回答用户的问题，
 注意答案需要条理清晰，如果遇到不知道或者报告中没有的问题可直言不知道，
@@ -160,37 +229,672 @@ OPENAI_MODELS = ["o4-mini", "o3", "gpt-4.1-nano"]
 EXIT_COMMANDS = ['exit', 'quit', '退出', '结束']
 CONFIRM_CHOICES = ['y', 'yes', '是', '好']
 DENY_CHOICES = ['n', 'no', '否', '不']
+# 分章节提取：章节名称 → 子Schema；报告信息等简单章节可路由到更快的模型
+EXTRACTION_SECTIONS: Dict[str, Type[BaseModel]] = {
+    "报告信息": ReportInfo,
+    "矿权信息": MiningRightsInfo,
+    "资源信息": ResourceInfoList,
+    "矿体分布": OreBodyDistributionList,
+    "其它信息": OtherInfo,
+}
+FAST_SECTIONS = ["报告信息", "矿权信息", "其它信息"]
+FAST_MODELS = {"gemini": "gemini-2.5-flash", "openai": "gpt-4.1-nano"}
+# 分块上传：每块8MB（Gemini要求除最后一块外为256KB的整数倍，OpenAI单块上限64MB）
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+RESUMABLE_UPLOAD_THRESHOLD = 32 * 1024 * 1024  # 超过该大小的文件使用可续传分块上传
+UPLOAD_CHUNK_RETRIES = 5  # 单次上传中瞬时错误（连接中断、5xx）的最大续传次数
+UPLOAD_BUFFER_BYTES = 256 * 1024  # 分块内容从磁盘分段读取发送时的缓冲区大小
 
 
-# ========== 抽象基类 ==========
-class BaseMiningReportExtractor(ABC):
-    """矿山报告提取器抽象基类"""
+# ========== 提取结果缓存 ==========
+@lru_cache(maxsize=16)
+def compute_prompt_hash(prompt: str = EXTRACTION_PROMPT) -> str:
+    """计算提示词与MiningReport JSON Schema的组合哈希，提示词或模型结构变化时缓存自动失效"""
+    schema = json.dumps(MiningReport.model_json_schema(), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256((prompt + "\n" + schema).encode("utf-8")).hexdigest()
+
+
+# ========== 分块可续传上传 ==========
+class FileSlice(io.RawIOBase):
+    """文件[offset, offset + length)区间的只读视图
+    
+    作为请求体交给HTTP客户端，由其按小缓冲区分段读取发送，分块内容不整体读入内存；
+    支持seek，客户端重试时可从区间开头重新读取。
+    """
+    
+    def __init__(self, file_path: str, offset: int, length: int):
+        super().__init__()
+        self.name = pathlib.Path(file_path).name
+        self._file = open(file_path, "rb")
+        self._start = offset
+        self._length = length
+        self._position = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._length}[whence]
+        self._position = min(max(0, base + offset), self._length)
+        return self._position
+    
+    def readinto(self, buffer: Any) -> int:
+        size = min(len(buffer), self._length - self._position)
+        if size <= 0:
+            return 0
+        self._file.seek(self._start + self._position)
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._position += read
+        return read
+    
+    @property
+    def length(self) -> int:
+        return self._length
+    
+    def iter_buffers(self, buffer_size: int = UPLOAD_BUFFER_BYTES) -> Iterator[bytes]:
+        """从区间开头按固定大小的缓冲区逐段读取"""
+        self.seek(0)
+        yield from iter(lambda: self.read(buffer_size), b"")
+    
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+# ========== 上下文缓存 ==========
+class CachedDocument:
+    """已写入Gemini上下文缓存的文档
+    
+    同一模型的请求只发送提示词并引用缓存名称；其它模型（如分章节提取的快速模型）或缓存失效时
+    通过load()读取/上传原文档直接发送（复用缓存时原文档按需加载）。
+    """
     
-    def __init__(self, api_key: Optional[str] = None, model: str = None):
+    def __init__(self, name: str, model: str, file_sha256: str, load: Callable[[], Any], document: Any = None):
+        self.name: Optional[str] = name
+        self.model = model
+        self.file_sha256 = file_sha256
+        self._load = load
+        self._document = document
+        self._lock = threading.Lock()
+    
+    def usable_for(self, model: str) -> bool:
+        return self.name is not None and model == self.model
+    
+    def document(self) -> Any:
+        with self._lock:
+            if self._document is None:
+                self._document = self._load()
+            return self._document
+    
+    def loaded_document(self) -> Any:
+        """已加载的原文档（尚未加载时为None，不触发读取或上传）"""
+        return self._document
+
+
+class OpenAIPromptCache:
+    """OpenAI提示缓存（前缀缓存）的请求布局
+    
+    OpenAI自动缓存请求中相同的前缀（1024 tokens以上），因此同一报告的所有请求都按固定布局组织：
+    文档在前、提示词在后；对话指令不使用instructions参数（它位于上下文开头，会使已缓存的文档和
+    previous_response_id链前缀全部失效），而是以developer消息追加在文档或链之后，且同一条链只追加一次。
+    同一报告的请求还携带相同的prompt_cache_key，使其路由到同一缓存。
+    """
+    
+    def __init__(self, retention: Optional[str] = None):
+        self.retention = retention  # 如"24h"：延长缓存保留时间（部分模型支持）
+        self._keys: Dict[str, str] = {}  # file_id/response_id → prompt_cache_key
+        self._instructed: Dict[str, str] = {}  # response_id → 链中已包含的对话指令
+        self._lock = threading.Lock()
+    
+    def register_document(self, file_id: str, file_sha256: str) -> None:
+        with self._lock:
+            self._keys[file_id] = f"{UPLOAD_NAME_PREFIX}{file_sha256[:16]}"
+    
+    def options(self, anchor: Optional[str]) -> Dict[str, Any]:
+        """请求的缓存参数（anchor为file_id或previous_response_id）"""
+        options: Dict[str, Any] = {}
+        with self._lock:
+            key = self._keys.get(anchor) if anchor else None
+        if key:
+            options["prompt_cache_key"] = key
+        if self.retention:
+            options["prompt_cache_retention"] = self.retention
+        return options
+    
+    def link(self, anchor: Optional[str], response_id: Optional[str], instructions: Optional[str] = None) -> None:
+        """记录新响应继承的缓存键，以及其链中已包含的对话指令"""
+        if not response_id:
+            return
+        with self._lock:
+            if anchor in self._keys:
+                self._keys[response_id] = self._keys[anchor]
+            instructions = instructions or self._instructed.get(anchor)
+            if instructions:
+                self._instructed[response_id] = instructions
+    
+    @staticmethod
+    def document_input(document: str, prompt: str, instructions: Optional[str] = None) -> List[Dict[str, Any]]:
+        """文档在前、提示词在后的输入消息；instructions以developer消息放在文档之后"""
+        file_part = {"type": "input_file", "file_id": document}
+        text_part = {"type": "input_text", "text": prompt}
+        if not instructions:
+            return [{"role": "user", "content": [file_part, text_part]}]
+        return [
+            {"role": "user", "content": [file_part]},
+            {"role": "developer", "content": instructions},
+            {"role": "user", "content": [text_part]},
+        ]
+    
+    def conversation_request(self, question: str, previous_response_id: Optional[str] = None,
+                             document: Optional[str] = None,
+                             instructions: str = CONVERSATION_INSTRUCTIONS) -> Tuple[Dict[str, Any], Optional[str]]:
+        """对话请求参数，返回(请求参数, 新响应链中新增的指令)"""
+        anchor = previous_response_id or document
+        if previous_response_id:
+            with self._lock:
+                instructed = self._instructed.get(previous_response_id) == instructions
+            if instructed:
+                request_input: Any = question
+                added = None
+            else:
+                request_input = [{"role": "developer", "content": instructions}, {"role": "user", "content": question}]
+                added = instructions
+            request = {"previous_response_id": previous_response_id, "input": request_input}
+        elif document:
+            request = {"input": self.document_input(document, question, instructions)}
+            added = instructions
+        else:
+            # 不带文档的独立请求（如摘录小提示词）没有可复用的文档前缀，指令放在开头
+            request = {"instructions": instructions, "input": question}
+            added = None
+        return {**request, **self.options(anchor)}, added
+
+
+# ========== 分块提取（Map-Reduce） ==========
+def _is_empty(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _merge_models(models: List[Optional[BaseModel]], model_type: Type[BaseModel]) -> Optional[BaseModel]:
+    """字段级合并：按顺序取第一个非空值，嵌套模型递归合并"""
+    present = [m for m in models if m is not None]
+    if not present:
+        return None
+    
+    merged = {}
+    for field_name in model_type.model_fields:
+        values = [getattr(m, field_name) for m in present if not _is_empty(getattr(m, field_name))]
+        if values and isinstance(values[0], BaseModel):
+            merged[field_name] = _merge_models(values, type(values[0]))
+        else:
+            merged[field_name] = values[0] if values else None
+    return model_type(**merged)
+
+
+def normalize_mineral_name(name: Optional[str]) -> str:
+    """统一矿种名称（如"金" → "金矿"）"""
+    name = re.sub(r"\s+", "", name or "")
+    if name and not name.endswith("矿"):
+        name += "矿"
+    return name
+
+
+def normalize_ore_body_id(ore_body_id: Optional[str]) -> str:
+    """统一矿体编号（去除空白字符）"""
+    return re.sub(r"\s+", "", ore_body_id or "")
+
+
+def merge_mining_reports(reports: List[MiningReport]) -> MiningReport:
+    """确定性合并多个片段的提取结果
+    
+    - 报告信息/矿权信息：按片段顺序取每个字段的第一个非空值
+    - 资源信息：按矿种合并，各资源量类别逐字段取第一个非空值
+    - 矿体分布：按矿体编号去重合并，无编号的矿体按内容去重
+    - 其它信息：去重后拼接
+    """
+    resources: Dict[str, List[ResourceInfo]] = {}
+    ore_bodies: Dict[str, List[OreBodyDistribution]] = {}
+    other_info: List[str] = []
+    
+    for report in reports:
+        for resource in report.资源信息 or []:
+            resources.setdefault(normalize_mineral_name(resource.矿种), []).append(resource)
+        for ore_body in report.矿体分布 or []:
+            key = normalize_ore_body_id(ore_body.矿体编号) or ore_body.model_dump_json()
+            ore_bodies.setdefault(key, []).append(ore_body)
+        if not _is_empty(report.其它信息) and report.其它信息 not in other_info:
+            other_info.append(report.其它信息)
+    
+    merged_resources = []
+    for mineral, group in resources.items():
+        resource = _merge_models(group, ResourceInfo)
+        if mineral:
+            resource.矿种 = mineral
+        merged_resources.append(resource)
+    
+    return MiningReport(
+        报告信息=_merge_models([r.报告信息 for r in reports], ReportInfo),
+        矿权信息=_merge_models([r.矿权信息 for r in reports], MiningRightsInfo),
+        资源信息=merged_resources or None,
+        矿体分布=[_merge_models(group, OreBodyDistribution) for group in ore_bodies.values()] or None,
+        其它信息="；".join(other_info) or None,
+    )
+
+
+# ========== 分章节并行提取 ==========
+class SectionExtractionError(Exception):
+    """部分章节提取失败，partial保存已成功章节组装的结果，failed为失败章节及其异常"""
+    
+    def __init__(self, partial: MiningReport, failed: Dict[str, Exception]):
+        self.partial = partial
+        self.failed = failed
+        details = "；".join(f"{section}: {error}" for section, error in failed.items())
+        super().__init__(f"以下章节提取失败: {details}")
+
+
+@lru_cache(maxsize=1)
+def _prompt_sections() -> Dict[str, str]:
+    """按"## "标题将EXTRACTION_PROMPT拆分为各章节说明"""
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for line in EXTRACTION_PROMPT.splitlines():
+        if line.startswith("## "):
+            current = line[3:].strip()
+            sections[current] = [line]
+        elif current is not None:
+            sections[current].append(line)
+    return {name: "\n".join(lines).strip() for name, lines in sections.items()}
+
+
+def prompt_section_text(section: str) -> str:
+    """EXTRACTION_PROMPT中某个章节的说明（含"## "标题）"""
+    return _prompt_sections()[section]
+
+
+def build_section_prompt(section: str) -> str:
+    """生成单个章节的提取提示词（章节说明直接取自EXTRACTION_PROMPT）"""
+    return SECTION_PROMPT_TEMPLATE.format(section=section, section_text=prompt_section_text(section))
+
+
+def strip_prompt_section(prompt: str, section: str) -> str:
+    """从提示词中删除某个"## "章节（如资源信息已由本地解析时删除该章节说明）"""
+    lines: List[str] = []
+    skipping = False
+    for line in prompt.splitlines():
+        if line.startswith("## "):
+            skipping = line[3:].strip() == section
+        if not skipping:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def assemble_sections(section_results: Dict[str, BaseModel]) -> MiningReport:
+    """将各章节的提取结果组装为MiningReport"""
+    fields: Dict[str, Any] = {}
+    for section, value in section_results.items():
+        if isinstance(value, (ResourceInfoList, OreBodyDistributionList, OtherInfo)):
+            fields[section] = getattr(value, section)
+        else:
+            fields[section] = value
+    return MiningReport(**fields)
+
+
+# ========== 流式结构化提取 ==========
+STREAM_COMPLETE = "MiningReport"  # 流式提取最后一项的章节名，value为完整的MiningReport
+
+# 流式输出中逐项产出的列表章节及其元素模型
+STREAM_LIST_SECTIONS: Dict[str, Type[BaseModel]] = {
+    "资源信息": ResourceInfo,
+    "矿体分布": OreBodyDistribution,
+}
+STREAM_OBJECT_SECTIONS: Dict[str, Type[BaseModel]] = {
+    "报告信息": ReportInfo,
+    "矿权信息": MiningRightsInfo,
+}
+
+
+class StreamedSection(NamedTuple):
+    """流式提取中已完成的章节：列表章节按元素产出，index为元素序号"""
+    section: str
+    index: Optional[int]
+    value: Any
+
+
+def parse_streamed_section(section: str, index: Optional[int], raw: str) -> Optional[StreamedSection]:
+    """将增量解析得到的原始JSON校验为对应的模型，列表章节整体完成时返回None（元素已逐个产出）"""
+    if section in STREAM_LIST_SECTIONS:
+        if index is None:
+            return None
+        return StreamedSection(section, index, STREAM_LIST_SECTIONS[section].model_validate_json(raw))
+    value = json.loads(raw)
+    if section in STREAM_OBJECT_SECTIONS and value is not None:
+        value = STREAM_OBJECT_SECTIONS[section].model_validate(value)
+    return StreamedSection(section, None, value)
+
+
+def iter_report_sections(report: MiningReport) -> Iterator[StreamedSection]:
+    """按流式输出的顺序逐项产出已有MiningReport的章节（用于缓存命中时回放）"""
+    for section in MiningReport.model_fields:
+        value = getattr(report, section)
+        if section in STREAM_LIST_SECTIONS:
+            for index, item in enumerate(value or []):
+                yield StreamedSection(section, index, item)
+        else:
+            yield StreamedSection(section, None, value)
+    yield StreamedSection(STREAM_COMPLETE, None, report)
+
+
+# ========== 提取器通用功能 ==========
+# 由批量任务日志（见mining_report_journal.py）在处理文档期间设置，提取器据此记录上传/生成/校验进度并复用已上传的文件
+CURRENT_JOB: contextvars.ContextVar = contextvars.ContextVar("current_batch_job", default=None)
+# 当前上下文中模型请求实际发送的文件（精简PDF、分块、变化页面等），调度器按其页数估算token
+_SENT_FILE: contextvars.ContextVar = contextvars.ContextVar("sent_file", default=None)
+
+
+class ExtractorSupportMixin:
+    """提取器通用功能（缓存、页面预筛选、运行指标、结果保存与打印），同步和异步提取器共用"""
+    
+    PROVIDER: str = ""
+    
+    def __init__(self, api_key: Optional[str] = None, model: str = None,
+                 cache: Optional[ExtractionCache] = None,
+                 upload_registry: Optional[UploadRegistry] = None,
+                 upload_checkpoints: Optional[UploadCheckpoints] = None,
+                 context_cache: Optional[ContextCacheRegistry] = None,
+                 page_selector: Optional[PageSelector] = None,
+                 table_parser: Optional[Any] = None,
+                 metrics_sink: Optional[MetricsSink] = None,
+                 quiet: bool = False):
         self.api_key = api_key
         self.model = model
         self.prompt = EXTRACTION_PROMPT
+        self.cache = cache
+        self.upload_registry = upload_registry
+        self.upload_checkpoints = upload_checkpoints
+        self.context_cache = context_cache
+        self.page_selector = page_selector
+        self.table_parser = table_parser
+        self.metrics_sink = metrics_sink
+        self.quiet = quiet
+        self.last_metrics: Optional[ExtractionMetrics] = None
+        self._upload_keys: Dict[str, str] = {}  # 临时精简PDF路径 -> 内容键（源文件哈希+选中页码）
+    
+    def _log(self, message: str) -> None:
+        """输出进度信息（quiet模式下不输出）"""
+        if not self.quiet:
+            print(message)
+    
+    def _new_metrics(self, file_path: str, mode: str) -> ExtractionMetrics:
+        """创建一条提取指标记录，启用指标输出时读取文件大小和页数"""
+        metrics = ExtractionMetrics(file=str(file_path), provider=self.PROVIDER, model=self.model, mode=mode,
+                                    started_at=time.time(), retries=CURRENT_RETRY_ATTEMPT.get())
+        if self.metrics_sink is not None:
+            started = time.perf_counter()
+            metrics.file_size_bytes = pathlib.Path(file_path).stat().st_size
+            metrics.page_count = count_pdf_pages(file_path)
+            metrics.add_span("file_read", time.perf_counter() - started)
+        return metrics
+    
+    def _finish_metrics(self, metrics: ExtractionMetrics, started: float, error: Optional[BaseException]) -> None:
+        """补全状态和总耗时并输出到指标接收端，输出失败不影响提取流程"""
+        metrics.total_seconds = round(time.perf_counter() - started, 6)
+        if error is None:
+            metrics.status = "success"
+        else:
+            metrics.status = "failed"
+            metrics.error = f"{type(error).__name__}: {error}"
+        if isinstance(error, GeneratorExit):
+            metrics.status = "cancelled"
+            metrics.error = None
+        self.last_metrics = metrics
+        if self.metrics_sink is not None:
+            try:
+                self.metrics_sink.emit(metrics.model_dump())
+            except Exception as e:
+                self._log(f"⚠️ 输出运行指标时出现警告: {e}")
+    
+    @contextlib.contextmanager
+    def _track(self, file_path: str, mode: str = "single") -> Iterator[ExtractionMetrics]:
+        """记录一次提取的运行指标；嵌套调用（如分块提取回退到整体提取）复用外层记录"""
+        current = current_metrics()
+        if current is not None:
+            yield current
+            return
+        started = time.perf_counter()
+        metrics = self._new_metrics(file_path, mode)
+        token = CURRENT_METRICS.set(metrics)
+        error: Optional[BaseException] = None
+        try:
+            yield metrics
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            CURRENT_METRICS.reset(token)
+            self._finish_metrics(metrics, started, error)
+    
+    @staticmethod
+    @contextlib.contextmanager
+    def _span(stage: str) -> Iterator[None]:
+        """累计当前提取在某一阶段（upload/generation/validation等）的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics = current_metrics()
+            if metrics is not None:
+                metrics.add_span(stage, time.perf_counter() - started)
+    
+    @staticmethod
+    def _add_metrics(**amounts: float) -> None:
+        """累加当前提取的计数类指标（未在记录指标时忽略）"""
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.add(**amounts)
+    
+    def _add_usage(self, usage: Dict[str, int]) -> None:
+        """累加一次模型请求的token用量，命中提供商上下文/提示缓存时输出缓存token数"""
+        self._add_metrics(requests=1, **usage)
+        if usage.get("cached_tokens"):
+            self._log(f"⚡ 命中上下文缓存: {usage['cached_tokens']}/{usage.get('input_tokens', 0)} 输入tokens")
+    
+    @staticmethod
+    def _job_progress(state: str, **fields: Any) -> None:
+        """记录批量任务进度（uploaded/generated/validated），未在任务日志中处理时忽略"""
+        job = CURRENT_JOB.get()
+        if job is not None:
+            job.record(state, **fields)
+    
+    def _job_remote_id(self, upload_sha256: str) -> Optional[str]:
+        """查询任务日志中该上传内容在之前运行中的远程文件ID"""
+        job = CURRENT_JOB.get()
+        return job.remote_id(self.PROVIDER, upload_sha256) if job is not None else None
     
     def _get_file_size_mb(self, file_path: str) -> float:
         """获取文件大小（MB）"""
         file_size_bytes = pathlib.Path(file_path).stat().st_size
         return file_size_bytes / (1024 * 1024)
     
-    @abstractmethod
-    def extract_from_file(self, file_path: str) -> MiningReport:
-        """从PDF文件提取信息"""
-        pass
+    def _cache_key(self, file_path: str, variant: str = "") -> str:
+        """生成当前提供商/模型/提示词下该文件的缓存键，variant用于区分不同的提取模式
+        
+        影响结果的各项选项逐一附加到键中（而非只取其一），任一选项不同都不会命中其它配置的结果。
+        """
+        parts = [self.model]
+        if variant:
+            parts.append(variant)
+        if self.page_selector is not None:
+            # 页面预筛选会改变模型看到的内容，需区分缓存
+            parts.append(self.page_selector.options_key)
+        if self.table_parser is not None:
+            # 置信的资源量表由本地解析，结果与模型提取不同，需区分缓存
+            parts.append(f"tables={self.table_parser.min_confidence}")
+        return ExtractionCache.make_key(
+            compute_file_sha256(file_path), self.PROVIDER, "|".join(parts), compute_prompt_hash(self.prompt)
+        )
+    
+    def _prepare_upload_path(self, file_path: str) -> Tuple[str, bool]:
+        """返回实际发送的文件路径及其是否为临时文件（启用页面预筛选时可能为精简PDF）"""
+        if self.page_selector is None:
+            return file_path, False
+        try:
+            with self._span("file_read"):
+                trimmed = self.page_selector.build_trimmed_pdf(file_path)
+        except Exception as e:
+            self._log(f"⚠️ 页面预筛选失败，使用完整文档: {e}")
+            trimmed = None
+        if trimmed is None:
+            return file_path, False
+        trimmed_path, pages, total_pages = trimmed
+        selection = f"{compute_file_sha256(file_path)}|pages={','.join(map(str, pages))}"
+        self._upload_keys[trimmed_path] = hashlib.sha256(selection.encode("utf-8")).hexdigest()
+        self._log(f"✂️ 页面预筛选: 保留 {len(pages)}/{total_pages} 页 "
+                  f"({self._get_file_size_mb(file_path):.2f} MB → {self._get_file_size_mb(trimmed_path):.2f} MB)")
+        return trimmed_path, True
+    
+    def _upload_sha256(self, upload_path: str) -> str:
+        """上传文件在登记表、上下文缓存等处使用的内容键
+        
+        精简PDF按源文件哈希+选中页码登记（同一份报告、同样的选页在各次运行中复用同一个远程文件），
+        其它文件为文件内容的SHA-256。
+        """
+        return self._upload_keys.get(str(upload_path)) or compute_file_sha256(str(upload_path))
+    
+    def _discard_upload_path(self, upload_path: str, is_temporary: bool) -> None:
+        """删除_prepare_upload_path生成的临时文件"""
+        if is_temporary:
+            self._upload_keys.pop(upload_path, None)
+            pathlib.Path(upload_path).unlink(missing_ok=True)
+    
+    def _local_resources(self, file_path: str) -> Optional[List[ResourceInfo]]:
+        """本地解析资源量汇总表（mining_report_tables.ResourceTableParser），置信时返回资源信息，否则返回None"""
+        if self.table_parser is None:
+            return None
+        try:
+            with self._span("table_parse"):
+                parsed = self.table_parser.parse(file_path)
+        except Exception as e:
+            self._log(f"⚠️ 本地解析资源量表失败，由模型提取: {e}")
+            return None
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.table_confidence = parsed.confidence
+        if not parsed.confident:
+            if parsed.resources:
+                self._log(f"📊 资源量表解析置信度 {parsed.confidence:.2f} 不足，由模型提取资源信息")
+            return None
+        self._log(f"📊 本地解析资源量表（第{','.join(map(str, parsed.pages))}页，置信度 {parsed.confidence:.2f}），"
+                  f"跳过模型提取资源信息")
+        return parsed.resources
+    
+    def _report_prompt(self, local_resources: Optional[List[ResourceInfo]]) -> Tuple[str, Type[BaseModel]]:
+        """完整报告请求的提示词和Schema：资源信息已由本地解析时删除该章节"""
+        if local_resources is None:
+            return self.prompt, MiningReport
+        return strip_prompt_section(self.prompt, "资源信息"), MiningReportWithoutResources
+    
+    @staticmethod
+    def _with_local_resources(parsed: BaseModel, local_resources: Optional[List[ResourceInfo]]) -> MiningReport:
+        """将本地解析的资源信息合并到模型提取结果中"""
+        if local_resources is None:
+            return parsed
+        return MiningReport(资源信息=local_resources, **parsed.model_dump())
+    
+    def _get_cached_result(self, file_path: str, variant: str = "") -> Optional[MiningReport]:
+        """查询提取结果缓存（未启用缓存时返回None）"""
+        if self.cache is None:
+            return None
+        result = self.cache.get(self._cache_key(file_path, variant))
+        if result is not None:
+            metrics = current_metrics()
+            if metrics is not None:
+                metrics.cache_hit = True
+            self._log("⚡ 命中提取结果缓存，跳过上传和分析")
+        return result
+    
+    def _put_cached_result(self, file_path: str, result: MiningReport, variant: str = "") -> None:
+        """写入提取结果缓存，写入失败不影响提取流程"""
+        if self.cache is None:
+            return
+        try:
+            self.cache.put(self._cache_key(file_path, variant), result,
+                           provider=self.PROVIDER, model=self.model,
+                           file_sha256=compute_file_sha256(file_path))
+        except OSError as e:
+            self._log(f"⚠️ 写入缓存时出现警告: {e}")
+    
+    # 以下公开方法供外部提取策略（校验升级、增量提取、对话加速、服务端等）组合提取流程
+    def log(self, message: str) -> None:
+        """输出进度信息（quiet模式下不输出）"""
+        self._log(message)
+    
+    def track(self, file_path: str, mode: str = "single") -> ContextManager[ExtractionMetrics]:
+        """记录一次提取的运行指标（嵌套调用复用外层记录）"""
+        return self._track(file_path, mode)
+    
+    def span(self, stage: str) -> ContextManager[None]:
+        """累计当前提取在某一阶段的耗时"""
+        return self._span(stage)
+    
+    def add_metrics(self, **amounts: float) -> None:
+        """累加当前提取的计数类指标"""
+        self._add_metrics(**amounts)
+    
+    def get_cached_result(self, file_path: str, variant: str = "") -> Optional[MiningReport]:
+        """查询提取结果缓存（未启用缓存时返回None）"""
+        return self._get_cached_result(file_path, variant)
+    
+    def put_cached_result(self, file_path: str, result: MiningReport, variant: str = "") -> None:
+        """写入提取结果缓存"""
+        self._put_cached_result(file_path, result, variant)
+    
+    def local_resources(self, file_path: str) -> Optional[List[ResourceInfo]]:
+        """本地解析资源量汇总表，置信时返回资源信息，否则返回None"""
+        return self._local_resources(file_path)
+    
+    def report_prompt(self, local_resources: Optional[List[ResourceInfo]]) -> Tuple[str, Type[BaseModel]]:
+        """完整报告请求的提示词和Schema"""
+        return self._report_prompt(local_resources)
+    
+    def with_local_resources(self, parsed: BaseModel, local_resources: Optional[List[ResourceInfo]]) -> MiningReport:
+        """将本地解析的资源信息合并到模型提取结果中"""
+        return self._with_local_resources(parsed, local_resources)
+    
+    def print_streamed_section(self, item: StreamedSection) -> None:
+        """打印流式提取中刚完成的章节"""
+        if item.section == STREAM_COMPLETE:
+            return
+        label = item.section if item.index is None else f"{item.section}[{item.index + 1}]"
+        if isinstance(item.value, BaseModel):
+            print(f"\n📦 {label}:")
+            for field, value in item.value.model_dump(exclude_none=True).items():
+                print(f"  • {field}: {value}")
+        else:
+            print(f"\n📦 {label}: {item.value or 'N/A'}")
     
     def save_result(self, result: MiningReport, output_path: str) -> bool:
-        """保存结果到文件"""
+        """保存结果到文件（启用指标输出时记录一条save事件）"""
         try:
+            started = time.perf_counter()
             result_dict = result.model_dump(exclude_none=True)
             with open(output_path, 'w', encoding='utf-8') as f:
                 json.dump(result_dict, f, ensure_ascii=False, indent=2)
-            print(f"✅ 结果已保存到: {output_path}")
+            if self.metrics_sink is not None:
+                self.metrics_sink.emit({
+                    "event": "save", "file": str(output_path), "provider": self.PROVIDER, "model": self.model,
+                    "seconds": round(time.perf_counter() - started, 6),
+                    "bytes": pathlib.Path(output_path).stat().st_size,
+                })
+            self._log(f"✅ 结果已保存到: {output_path}")
             return True
         except Exception as e:
-            print(f"❌ 保存文件时出错: {e}")
+            self._log(f"❌ 保存文件时出错: {e}")
             return False
     
     def print_summary(self, result: MiningReport) -> None:
@@ -234,14 +938,401 @@ class BaseMiningReportExtractor(ABC):
         print("\n" + "="*50)
 
 
+# ========== 抽象基类 ==========
+class BaseMiningReportExtractor(ExtractorSupportMixin, ABC):
+    """矿山报告提取器抽象基类
+    
+    scheduler为ExtractionScheduler（见mining_report_scheduler.py）时，每个模型请求按提供商/模型配额排队，
+    可重试错误（429/5xx）由调度器退避后重新发送该请求；priority为排队优先级（默认为批量回填优先级）。
+    """
+    
+    def __init__(self, *args: Any, scheduler: Optional[Any] = None, priority: Optional[int] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.priority = priority
+    
+    @abstractmethod
+    def extract_from_file(self, file_path: str) -> MiningReport:
+        """从PDF文件提取信息"""
+        pass
+    
+    def _prepare_document(self, upload_path: str, model: Optional[str] = None, register: bool = True) -> Any:
+        """准备发送给模型的文档内容（上传文件或内联字节），model为将要使用的模型（默认self.model）
+        
+        register为False时（分块、变化页面等一次性的临时PDF）不写入上传文件登记表，释放文档时删除远程文件。
+        """
+        raise NotImplementedError(f"{type(self).__name__} 未实现文档准备")
+    
+    def _release_document(self, document: Any) -> None:
+        """释放_prepare_document创建的临时远程资源"""
+        pass
+    
+    @contextlib.contextmanager
+    def _open_document(self, file_path: str, **options: Any) -> Iterator[Any]:
+        """准备文档（启用页面预筛选时为临时精简PDF），使用结束后释放文档并删除临时文件
+        
+        上下文缓存的CachedDocument在换用其它模型或缓存失效时才读取文件，临时文件必须保留到文档释放之后。
+        """
+        upload_path, is_temporary = self._prepare_upload_path(file_path)
+        try:
+            with self._document(upload_path, **options) as document:
+                yield document
+        finally:
+            self._discard_upload_path(upload_path, is_temporary)
+    
+    @contextlib.contextmanager
+    def _document(self, upload_path: str, **options: Any) -> Iterator[Any]:
+        """准备upload_path的文档内容，使用结束后释放；期间发出的模型请求按该文件的页数估算token"""
+        document = self._prepare_document(upload_path, **options)
+        token = _SENT_FILE.set(upload_path)
+        try:
+            yield document
+        finally:
+            _SENT_FILE.reset(token)
+            self._release_document(document)
+    
+    def _start_chunked_upload(self, file_path: str, file_size: int, **options: Any) -> str:
+        """创建分块上传会话，返回会话标识（Gemini上传地址/OpenAI upload_id）"""
+        raise NotImplementedError(f"{type(self).__name__} 未实现分块上传")
+    
+    def _send_upload_chunk(self, state: Dict[str, Any], chunk: FileSlice, offset: int, final: bool) -> Any:
+        """上传一个分块（可在state中记录分块ID），最后一块返回服务端的完成结果"""
+        raise NotImplementedError(f"{type(self).__name__} 未实现分块上传")
+    
+    def _query_upload_offset(self, state: Dict[str, Any]) -> int:
+        """查询服务端已确认接收的字节数（默认以本地记录为准，分块要么完整确认要么视为未上传）"""
+        return state["offset"]
+    
+    def _complete_chunked_upload(self, state: Dict[str, Any], final_result: Any) -> Any:
+        """完成分块上传，返回远程文件"""
+        return final_result
+    
+    def _chunked_upload(self, file_path: str, file_sha256: Optional[str] = None, **options: Any) -> Any:
+        """可续传分块上传：分块内容经固定大小的缓冲区从磁盘分段发送，内存占用与文件大小无关
+        
+        每个分块确认后更新断点；连接中断或5xx等瞬时错误时向服务端查询已接收的偏移量并从断点继续。
+        启用断点记录（upload_checkpoints）且已知内容哈希时，进程重启后也能从上次的断点继续。
+        """
+        from mining_report_scheduler import classify_error
+        
+        file_size = os.path.getsize(file_path)
+        checkpoints = self.upload_checkpoints if file_sha256 else None
+        state = checkpoints.get(self.PROVIDER, file_sha256, file_size) if checkpoints else None
+        resumed_bytes = 0
+        if state is not None:
+            try:
+                state["offset"] = self._query_upload_offset(state)
+                resumed_bytes = state["offset"]
+                self._log(f"⏯️ 从断点继续上传: {state['offset'] / (1024 * 1024):.1f}/"
+                          f"{file_size / (1024 * 1024):.1f} MB")
+            except Exception as e:
+                self._log(f"⚠️ 断点已失效，重新上传: {e}")
+                state = None
+        if state is None:
+            state = {"session": self._start_chunked_upload(file_path, file_size, **options),
+                     "size": file_size, "offset": 0, "part_ids": [], "created_at": time.time()}
+            if checkpoints:
+                checkpoints.save(self.PROVIDER, file_sha256, state)
+        
+        started = time.perf_counter()
+        sent_bytes = 0
+        failures = 0
+        final_result = None
+        while True:
+            try:
+                if failures:
+                    confirmed = self._query_upload_offset(state)
+                    # 每次续传都从开头算起的已确认字节不需重发；多次续传只计最远的断点，不重复累加
+                    resumed_bytes = max(resumed_bytes, confirmed)
+                    state["offset"] = confirmed
+                for offset in range(state["offset"], file_size, UPLOAD_CHUNK_BYTES):
+                    length = min(UPLOAD_CHUNK_BYTES, file_size - offset)
+                    with FileSlice(file_path, offset, length) as chunk:
+                        final_result = self._send_upload_chunk(state, chunk, offset, offset + length >= file_size)
+                    state["offset"] = offset + length
+                    sent_bytes += length
+                    self._add_metrics(upload_bytes=length, upload_chunks=1)
+                    if checkpoints:
+                        checkpoints.save(self.PROVIDER, file_sha256, state)
+                break
+            except Exception as e:
+                retryable, _, retry_after = classify_error(e)
+                if not retryable or failures >= UPLOAD_CHUNK_RETRIES:
+                    raise
+                failures += 1
+                delay = retry_after if retry_after is not None else min(2 ** failures, 30)
+                self._log(f"⚠️ 分块上传中断（{type(e).__name__}），{delay:.0f}秒后从断点继续")
+                time.sleep(delay)
+        
+        remote_file = self._complete_chunked_upload(state, final_result)
+        if checkpoints:
+            checkpoints.remove(self.PROVIDER, file_sha256)
+        
+        elapsed = time.perf_counter() - started
+        seconds_saved = resumed_bytes * elapsed / sent_bytes if sent_bytes else 0.0
+        self._add_metrics(upload_resumed_bytes=resumed_bytes, upload_seconds_saved=round(seconds_saved, 3))
+        if resumed_bytes:
+            self._log(f"✅ 断点续传免于重新发送 {resumed_bytes / (1024 * 1024):.1f} MB（约 {seconds_saved:.1f} 秒）")
+        return remote_file
+    
+    def _schedule_options(self) -> Dict[str, Any]:
+        """调度参数：token按本次请求实际发送的文件页数估算（分块请求只计该片段，未经_document发送时按整份报告计）"""
+        metrics = current_metrics()
+        options: Dict[str, Any] = {"file_path": _SENT_FILE.get() or (metrics.file if metrics is not None else None)}
+        if self.priority is not None:
+            options["priority"] = self.priority
+        return options
+    
+    def _scheduled(self, model: Optional[str], request: Callable[[], Any]) -> Any:
+        """执行一次模型请求；设置了调度器时按配额排队，可重试错误退避后重新发送并计入重试次数"""
+        if self.scheduler is None:
+            return request()
+        
+        def attempt() -> Any:
+            if CURRENT_RETRY_ATTEMPT.get():
+                self._add_metrics(retries=1)
+            return request()
+        
+        return self.scheduler.run(self.PROVIDER, model or self.model, attempt, **self._schedule_options())
+    
+    def _reserve_quota(self, model: Optional[str]) -> None:
+        """流式请求只排队获取配额（已产出的片段无法撤回，出错时不重试）"""
+        if self.scheduler is not None:
+            self.scheduler.acquire(self.PROVIDER, model or self.model, **self._schedule_options())
+    
+    def _request_structured(self, document: Any, prompt: str, schema: Type[BaseModel],
+                            model: Optional[str] = None) -> Tuple[BaseModel, Any]:
+        """发送结构化输出请求，返回(校验后的模型, 原始响应)"""
+        raise NotImplementedError(f"{type(self).__name__} 未实现结构化请求")
+    
+    def _stream_structured_text(self, document: Any, prompt: str, schema: Type[BaseModel],
+                                model: Optional[str] = None) -> Iterator[str]:
+        """发送流式结构化输出请求，逐段产出JSON文本"""
+        raise NotImplementedError(f"{type(self).__name__} 未实现流式请求")
+    
+    def _request_report(self, document: Any, local_resources: Optional[List[ResourceInfo]] = None,
+                        model: Optional[str] = None) -> Tuple[MiningReport, Any]:
+        """请求完整报告；资源信息已由本地解析时只请求其余章节，再合并为MiningReport"""
+        prompt, schema = self._report_prompt(local_resources)
+        parsed, response = self._request_structured(document, prompt, schema, model)
+        return self._with_local_resources(parsed, local_resources), response
+    
+    def open_document(self, file_path: str, select_pages: bool = True, **options: Any) -> ContextManager[Any]:
+        """准备发送给模型的文档，使用结束后释放；select_pages为False时直接发送该文件（如已裁剪的临时PDF）"""
+        if select_pages:
+            return self._open_document(file_path, **options)
+        return self._document(file_path, **options)
+    
+    def request_structured(self, document: Any, prompt: str, schema: Type[BaseModel],
+                           model: Optional[str] = None) -> Tuple[BaseModel, Any]:
+        """发送结构化输出请求（按调度器配额排队），返回(校验后的模型, 原始响应)"""
+        return self._request_structured(document, prompt, schema, model)
+    
+    def request_report(self, document: Any, local_resources: Optional[List[ResourceInfo]] = None,
+                       model: Optional[str] = None) -> Tuple[MiningReport, Any]:
+        """请求完整报告，返回(MiningReport, 原始响应)"""
+        return self._request_report(document, local_resources, model)
+    
+    def extract_stream(self, file_path: str) -> Iterator[StreamedSection]:
+        """流式提取：每个顶层章节（报告信息、矿权信息、每个ResourceInfo、每个OreBodyDistribution等）
+        完整时立即产出校验后的模型，最后一项的section为STREAM_COMPLETE，value为完整的MiningReport
+        
+        生成器在独立的contextvars上下文中逐步执行：运行指标等上下文变量只在取下一项期间生效，
+        不会泄漏到调用方在两次迭代之间执行的代码（如消费方同时进行的其它提取）。
+        """
+        context = contextvars.copy_context()
+        steps = self._extract_stream(file_path)
+        try:
+            while True:
+                try:
+                    item = context.run(next, steps)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            context.run(steps.close)
+    
+    def _extract_stream(self, file_path: str) -> Iterator[StreamedSection]:
+        """extract_stream的实际实现（需在同一上下文中逐步执行）"""
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        
+        with self._track(file_path, "stream"):
+            cached = self._get_cached_result(file_path)
+            if cached is not None:
+                yield from iter_report_sections(cached)
+                return
+            
+            with self._open_document(file_path) as document:
+                self._log("🔍 正在流式分析文档内容...")
+                parser = IncrementalJSONSectionParser()
+                deltas = iter(self._stream_structured_text(document, self.prompt, MiningReport))
+                while True:
+                    with self._span("generation"):
+                        delta = next(deltas, None)
+                    if delta is None:
+                        break
+                    for section, index, raw in parser.feed(delta):
+                        with self._span("validation"):
+                            item = parse_streamed_section(section, index, raw)
+                        if item is not None:
+                            yield item
+            
+            self._job_progress("generated")
+            with self._span("validation"):
+                result = MiningReport.model_validate_json(parser.buffer)
+            self._job_progress("validated")
+            self._log("✅ 文档分析完成")
+            self._put_cached_result(file_path, result)
+            yield StreamedSection(STREAM_COMPLETE, None, result)
+    
+    def extract_chunked(self, file_path: str, pages_per_chunk: int = 40, overlap_pages: int = 1,
+                        max_workers: int = 4) -> MiningReport:
+        """分块并行提取：按页码范围拆分文档，并行提取各片段后在本地确定性合并
+        
+        整体延迟取决于最大的片段而非总页数；文档页数不超过pages_per_chunk时等同于extract_from_file。
+        """
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        
+        variant = f"chunked={pages_per_chunk}/{overlap_pages}"
+        with self._track(file_path, "chunked"):
+            cached = self._get_cached_result(file_path, variant)
+            if cached is not None:
+                return cached
+            
+            with self._span("file_read"):
+                total_pages, chunks = split_pdf_pages(file_path, pages_per_chunk, overlap_pages)
+            if not chunks:
+                return self.extract_from_file(file_path)
+            
+            self._log(f"🧩 分块提取: 共 {total_pages} 页，拆分为 {len(chunks)} 个片段并行处理")
+            
+            def extract_chunk(chunk: Tuple[Tuple[int, int], str]) -> MiningReport:
+                (start, end), chunk_path = chunk
+                with self._document(chunk_path, register=False) as document:
+                    prompt = CHUNK_PROMPT_TEMPLATE.format(prompt=self.prompt, start=start + 1, end=end, total=total_pages)
+                    partial, _ = self._request_structured(document, prompt, MiningReport)
+                self._log(f"✅ 片段 第{start + 1}-{end}页 分析完成")
+                return partial
+            
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                    # 每个任务复制当前上下文，使各片段的耗时和token用量计入同一条指标记录
+                    futures = [pool.submit(contextvars.copy_context().run, extract_chunk, chunk) for chunk in chunks]
+                    partials = [future.result() for future in futures]
+            finally:
+                for _, chunk_path in chunks:
+                    pathlib.Path(chunk_path).unlink(missing_ok=True)
+            
+            result = merge_mining_reports(partials)
+            self._log("✅ 片段结果合并完成")
+            self._put_cached_result(file_path, result, variant)
+            return result
+    
+    def extract_sections(self, file_path: str, sections: Optional[List[str]] = None,
+                         fast_model: Optional[str] = None,
+                         section_models: Optional[Dict[str, str]] = None,
+                         max_retries: int = 1) -> MiningReport:
+        """分章节并行提取：每个章节使用更小的提示词和子Schema并发请求，再组装为MiningReport
+        
+        fast_model指定时，FAST_SECTIONS中的简单章节使用该模型；section_models可逐章节指定模型。
+        每个章节失败后单独重试max_retries次，仍失败时抛出SectionExtractionError，
+        可仅对失败章节调用extract_sections(sections=[...])补提取。
+        """
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        
+        sections = sections or list(EXTRACTION_SECTIONS)
+        models = {section: self.model for section in sections}
+        if fast_model:
+            models.update({section: fast_model for section in sections if section in FAST_SECTIONS})
+        models.update({section: model for section, model in (section_models or {}).items() if section in models})
+        
+        variant = "sections=" + ",".join(f"{section}:{models[section]}" for section in sections)
+        with self._track(file_path, "sections"):
+            cached = self._get_cached_result(file_path, variant)
+            if cached is not None:
+                return cached
+            
+            results: Dict[str, BaseModel] = {}
+            if "资源信息" in sections:
+                local_resources = self._local_resources(file_path)
+                if local_resources is not None:
+                    results["资源信息"] = ResourceInfoList(资源信息=local_resources)
+                    sections = [section for section in sections if section != "资源信息"]
+            if not sections:
+                result = assemble_sections(results)
+                self._put_cached_result(file_path, result, variant)
+                return result
+            
+            self._log(f"🧩 分章节提取: {', '.join(f'{section}({models[section]})' for section in sections)}")
+            
+            def extract_section(document: Any, section: str) -> BaseModel:
+                prompt = build_section_prompt(section)
+                for attempt in range(max_retries + 1):
+                    try:
+                        value, _ = self._request_structured(document, prompt, EXTRACTION_SECTIONS[section], models[section])
+                        self._log(f"✅ {section} 提取完成")
+                        return value
+                    except Exception as e:
+                        if attempt == max_retries:
+                            raise
+                        self._add_metrics(retries=1)
+                        self._log(f"⚠️ {section} 提取失败，正在重试: {e}")
+            
+            failed: Dict[str, Exception] = {}
+            with self._open_document(file_path) as document, ThreadPoolExecutor(max_workers=len(sections)) as pool:
+                futures = {section: pool.submit(contextvars.copy_context().run, extract_section, document, section)
+                           for section in sections}
+                for section, future in futures.items():
+                    try:
+                        results[section] = future.result()
+                    except Exception as e:
+                        failed[section] = e
+            
+            result = assemble_sections(results)
+            if failed:
+                raise SectionExtractionError(result, failed)
+            
+            self._put_cached_result(file_path, result, variant)
+            return result
+    
+    @property
+    def upload_provider(self) -> str:
+        """上传文件所属的提供商（上传文件登记表中的provider）"""
+        return self.PROVIDER
+    
+    @abstractmethod
+    def list_remote_uploads(self) -> List[Tuple[str, str]]:
+        """列出提供商侧的上传文件，返回(远程ID, 文件名)列表"""
+        pass
+    
+    @abstractmethod
+    def delete_remote_upload(self, remote_id: str) -> None:
+        """删除提供商侧的上传文件"""
+        pass
+
+
 # ========== Gemini 实现 ==========
 class GeminiMiningReportExtractor(BaseMiningReportExtractor):
     """基于Gemini的矿山报告提取器"""
     
-    FILE_SIZE_THRESHOLD = 20 * 1024 * 1024  # 20MB
+    PROVIDER = "gemini"
+    FILE_SIZE_THRESHOLD = 20 * 1024 * 1024  # 内联请求的大小上限20MB
+    INLINE_MAX_BYTES = 4 * 1024 * 1024  # 默认只内联4MB以内的小文件
+    API_BASE_URL = "https://generativelanguage.googleapis.com"
     
-    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash", env_file: str = ".env"):
-        super().__init__(api_key, model)
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash", env_file: str = ".env",
+                 base_url: Optional[str] = None, inline_max_bytes: Optional[int] = None, **kwargs):
+        super().__init__(api_key, model, **kwargs)
+        # 内联字节需整体读入内存（编码后约为文件的2~3倍），更大的文件经File API从磁盘流式上传，
+        # 每个任务的内存占用以该阈值为上限（不超过内联请求上限FILE_SIZE_THRESHOLD）
+        self.inline_max_bytes = min(self.INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes,
+                                    self.FILE_SIZE_THRESHOLD)
+        self.base_url = base_url
+        self._upload_http = None  # 分块上传使用的HTTP客户端（首次分块上传时创建）
+        self._temporary_uploads: set = set()  # 未登记的临时文件（分块、变化页面等），释放文档时删除
         
         try:
             from google import genai
@@ -257,56 +1348,342 @@ class GeminiMiningReportExtractor(BaseMiningReportExtractor):
         if not self.api_key:
             raise ValueError("请提供GEMINI_API_KEY环境变量或直接传入api_key参数")
         
-        self.client = genai.Client(api_key=self.api_key)
+        # base_url用于指向代理或本地模拟服务（见mining_report_benchmark.py）
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self.client = genai.Client(api_key=self.api_key, http_options=http_options)
     
-    def extract_from_file(self, file_path: str, use_file_api: Optional[bool] = None) -> MiningReport:
-        """从PDF文件提取信息"""
-        filepath = pathlib.Path(file_path)
-        if not filepath.exists():
-            raise FileNotFoundError(f"文件不存在: {file_path}")
+    def _upload_file(self, filepath: pathlib.Path, register: bool = True) -> Any:
+        """通过File API上传文件，启用登记表或任务日志时复用仍然有效的已上传文件（register为False时不使用登记表）"""
+        track_upload = (self.upload_registry is not None or self.upload_checkpoints is not None
+                        or CURRENT_JOB.get() is not None)
+        file_sha256 = self._upload_sha256(str(filepath)) if track_upload else None
+        job_remote_id = self._job_remote_id(file_sha256) if file_sha256 else None
+        if job_remote_id:
+            remote_file = self._get_active_file(job_remote_id)
+            if remote_file is not None:
+                self._log("♻️ 复用任务日志中已上传的Gemini文件，跳过上传")
+                return remote_file
+        if file_sha256 and self.upload_registry and register:
+            entry = self.upload_registry.lookup(self.PROVIDER, file_sha256)
+            if entry:
+                remote_file = self._get_active_file(entry["remote_id"])
+                if remote_file is not None:
+                    self._log("♻️ 复用已上传的Gemini文件，跳过上传")
+                    self._job_progress("uploaded", provider=self.PROVIDER, upload_sha256=file_sha256,
+                                       file_id=remote_file.name)
+                    return remote_file
+                self.upload_registry.remove(self.PROVIDER, [entry["remote_id"]])
         
-        file_size_mb = self._get_file_size_mb(file_path)
+        self._log("⏳ 正在上传文件到Gemini服务器...")
+        upload_config = {"mime_type": "application/pdf"}
+        if file_sha256 and self.upload_registry and register:
+            # 只有登记表管理的文件带前缀，孤立文件清理据此识别
+            upload_config["display_name"] = f"{UPLOAD_NAME_PREFIX}{file_sha256[:16]}"
+        file_size = filepath.stat().st_size
+        with self._span("upload"):
+            if file_size > RESUMABLE_UPLOAD_THRESHOLD:
+                uploaded_file = self._chunked_upload(str(filepath), file_sha256,
+                                                     display_name=upload_config.get("display_name"))
+            else:
+                uploaded_file = self.client.files.upload(file=filepath, config=upload_config)
+                self._add_metrics(upload_bytes=file_size)
+        self._log("✅ 文件上传完成")
+        
+        if file_sha256:
+            self._job_progress("uploaded", provider=self.PROVIDER, upload_sha256=file_sha256, file_id=uploaded_file.name)
+        if file_sha256 and self.upload_registry and register:
+            expiration = getattr(uploaded_file, "expiration_time", None)
+            expires_at = expiration.timestamp() if expiration else time.time() + UploadRegistry.GEMINI_FILE_TTL_SECONDS
+            self.upload_registry.register(self.PROVIDER, file_sha256, uploaded_file.name, expires_at)
+        elif not register:
+            self._temporary_uploads.add(uploaded_file.name)
+        return uploaded_file
+    
+    def _get_active_file(self, remote_id: str) -> Optional[Any]:
+        """获取仍处于ACTIVE状态的远程文件，不存在或不可用时返回None"""
+        try:
+            remote_file = self.client.files.get(name=remote_id)
+        except Exception:
+            return None
+        if str(getattr(remote_file.state, "name", remote_file.state)) == "ACTIVE":
+            return remote_file
+        return None
+    
+    def _upload_request(self, url: str, command: str, content: Optional[Iterator[bytes]] = None,
+                        headers: Optional[Dict[str, str]] = None, **kwargs: Any) -> Any:
+        """发送可续传上传协议请求，非2xx响应按SDK的APIError抛出（便于判断是否可重试）"""
+        if self._upload_http is None:
+            import httpx
+            self._upload_http = httpx.Client(timeout=httpx.Timeout(300.0, connect=30.0))
+        response = self._upload_http.post(url, content=content, headers={
+            "x-goog-api-key": self.api_key, "X-Goog-Upload-Command": command, **(headers or {}),
+        }, **kwargs)
+        self.genai.errors.APIError.raise_for_response(response)
+        return response
+    
+    def _start_chunked_upload(self, file_path: str, file_size: int, display_name: Optional[str] = None) -> str:
+        """创建Gemini可续传上传会话，返回上传地址"""
+        metadata = {"mimeType": "application/pdf"}
+        if display_name:
+            metadata["displayName"] = display_name
+        response = self._upload_request(
+            f"{(self.base_url or self.API_BASE_URL).rstrip('/')}/upload/v1beta/files", "start",
+            headers={"X-Goog-Upload-Protocol": "resumable",
+                     "X-Goog-Upload-Header-Content-Length": str(file_size),
+                     "X-Goog-Upload-Header-Content-Type": "application/pdf"},
+            json={"file": metadata},
+        )
+        upload_url = response.headers["x-goog-upload-url"]
+        if self.base_url:
+            # 与SDK一致：经代理或模拟服务访问时，上传地址改用base_url的协议和主机
+            from urllib.parse import urlparse, urlunparse
+            base = urlparse(self.base_url)
+            upload_url = urlunparse(urlparse(upload_url)._replace(scheme=base.scheme, netloc=base.netloc))
+        return upload_url
+    
+    def _send_upload_chunk(self, state: Dict[str, Any], chunk: FileSlice, offset: int, final: bool) -> Any:
+        """上传一个分块，最后一块带finalize并返回文件名"""
+        response = self._upload_request(state["session"], "upload, finalize" if final else "upload",
+                                        chunk.iter_buffers(), headers={"X-Goog-Upload-Offset": str(offset),
+                                                                       "Content-Length": str(chunk.length)})
+        return response.json()["file"]["name"] if final else None
+    
+    def _query_upload_offset(self, state: Dict[str, Any]) -> int:
+        """查询Gemini已接收的字节数"""
+        response = self._upload_request(state["session"], "query")
+        if response.headers.get("x-goog-upload-status") != "active":
+            raise RuntimeError(f"Gemini上传会话已结束（{response.headers.get('x-goog-upload-status')}），无法续传")
+        return int(response.headers.get("x-goog-upload-size-received") or 0)
+    
+    def _complete_chunked_upload(self, state: Dict[str, Any], final_result: Any) -> Any:
+        """获取上传完成的文件对象"""
+        return self.client.files.get(name=final_result)
+    
+    def list_remote_uploads(self) -> List[Tuple[str, str]]:
+        """列出Gemini File API中的文件"""
+        return [(f.name, f.display_name) for f in self.client.files.list()]
+    
+    def delete_remote_upload(self, remote_id: str) -> None:
+        """删除Gemini File API中的文件"""
+        self.client.files.delete(name=remote_id)
+    
+    def _prepare_document(self, upload_path: str, model: Optional[str] = None, register: bool = True,
+                          use_file_api: Optional[bool] = None) -> Any:
+        """准备发送给模型的文档内容；启用上下文缓存时返回model（默认self.model）的CachedDocument
+        （复用缓存时不读取和上传文档）
+        """
+        if self.context_cache is None:
+            return self._load_document(upload_path, use_file_api, register)
+        return self._cached_document(upload_path, lambda: self._load_document(upload_path, use_file_api, register),
+                                     model)
+    
+    def _release_document(self, document: Any) -> None:
+        """删除未登记的临时上传文件（已登记复用的文件保留到过期）"""
+        if isinstance(document, CachedDocument):
+            document = document.loaded_document()
+        name = getattr(document, "name", None)
+        if name not in self._temporary_uploads:
+            return
+        self._temporary_uploads.discard(name)
+        try:
+            self.client.files.delete(name=name)
+        except Exception as e:
+            self._log(f"⚠️ 清理临时文件时出现警告: {e}")
+    
+    def _load_document(self, upload_path: str, use_file_api: Optional[bool] = None, register: bool = True) -> Any:
+        """读取文档内容（内联字节或File API文件）"""
+        upload_filepath = pathlib.Path(upload_path)
+        file_size_mb = self._get_file_size_mb(upload_path)
         
         # 自动判断是否使用File API
         if use_file_api is None:
-            use_file_api = filepath.stat().st_size > self.FILE_SIZE_THRESHOLD
+            use_file_api = upload_filepath.stat().st_size > self.inline_max_bytes
         
-        print(f"📁 文件大小: {file_size_mb:.2f} MB")
+        self._log(f"📁 文件大小: {file_size_mb:.2f} MB")
         
         if use_file_api:
-            print(f"📤 使用File API上传（文件大小超过{self.FILE_SIZE_THRESHOLD/(1024*1024):.0f}MB阈值）")
-            print("⏳ 正在上传文件到Gemini服务器...")
-            uploaded_file = self.client.files.upload(file=filepath)
-            file_content = uploaded_file
-            print("✅ 文件上传完成")
-        else:
-            print(f"📤 使用直接字节上传")
-            file_content = self.types.Part.from_bytes(
-                data=filepath.read_bytes(),
-                mime_type='application/pdf',
-            )
-        
-        print("🔍 正在分析文档内容...")
-        response = self.client.models.generate_content(
-            model=self.model,
-            contents=[file_content, self.prompt],
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": MiningReport,
-            }
+            self._log(f"📤 使用File API上传（文件大小超过{self.inline_max_bytes/(1024*1024):.0f}MB阈值）")
+            return self._upload_file(upload_filepath, register)
+        
+        self._log(f"📤 使用直接字节上传")
+        with self._span("file_read"):
+            data = upload_filepath.read_bytes()
+        # 内联字节随生成请求一起发送，计入上传字节数
+        self._add_metrics(upload_bytes=len(data))
+        return self.types.Part.from_bytes(
+            data=data,
+            mime_type='application/pdf',
         )
+    
+    def _cached_document(self, upload_path: str, load: Callable[[], Any], model: Optional[str] = None) -> Any:
+        """复用（必要时续期）或新建该文档在model上的上下文缓存；创建失败（如文档token数低于缓存下限）时返回原文档"""
+        model = model or self.model
+        file_sha256 = self._upload_sha256(upload_path)
+        entry = self.context_cache.lookup(self.PROVIDER, model, file_sha256)
+        if entry is not None and self.context_cache.needs_refresh(entry):
+            try:
+                cache = self.client.caches.update(
+                    name=entry["name"],
+                    config=self.types.UpdateCachedContentConfig(ttl=f"{self.context_cache.ttl_seconds}s"),
+                )
+                entry["expires_at"] = self._cache_expiry(cache)
+                self.context_cache.register(self.PROVIDER, model, file_sha256, entry["name"], entry["expires_at"])
+                self._add_metrics(context_cache_refreshed=1)
+            except Exception as e:
+                self._log(f"⚠️ 上下文缓存续期失败，重新创建: {e}")
+                self.context_cache.remove(self.PROVIDER, model, file_sha256)
+                entry = None
+        if entry is not None:
+            self._add_metrics(context_cache_reused=1)
+            self._log(f"♻️ 复用上下文缓存 {entry['name']}（剩余 {(entry['expires_at'] - time.time()) / 60:.0f} 分钟），"
+                      f"无需重新发送文档")
+            return CachedDocument(entry["name"], model, file_sha256, load)
         
-        result = MiningReport.model_validate_json(response.text)
-        print("✅ 文档分析完成")
-        return result
+        document = load()
+        try:
+            with self._span("context_cache"):
+                cache = self.client.caches.create(
+                    model=model,
+                    config=self.types.CreateCachedContentConfig(
+                        contents=[document],
+                        ttl=f"{self.context_cache.ttl_seconds}s",
+                        display_name=f"{UPLOAD_NAME_PREFIX}{file_sha256[:16]}",
+                    ),
+                )
+        except Exception as e:
+            self._log(f"⚠️ 创建上下文缓存失败，直接发送文档: {e}")
+            return document
+        self.context_cache.register(self.PROVIDER, model, file_sha256, cache.name, self._cache_expiry(cache))
+        self._add_metrics(context_cache_created=1)
+        self._log(f"🗄️ 已创建上下文缓存 {cache.name}（有效期 {self.context_cache.ttl_seconds / 60:.0f} 分钟）")
+        return CachedDocument(cache.name, model, file_sha256, load, document)
+    
+    def _cache_expiry(self, cache: Any) -> float:
+        expire_time = getattr(cache, "expire_time", None)
+        return expire_time.timestamp() if expire_time else time.time() + self.context_cache.ttl_seconds
+    
+    def _generation_request(self, document: Any, prompt: str, schema: Type[BaseModel],
+                            model: str) -> Tuple[List[Any], Dict[str, Any]]:
+        """生成请求的contents和config：文档已缓存且模型一致时只发送提示词并引用缓存"""
+        config: Dict[str, Any] = {
+            "response_mime_type": "application/json",
+            "response_schema": schema,
+        }
+        if isinstance(document, CachedDocument):
+            if document.usable_for(model):
+                return [prompt], {**config, "cached_content": document.name}
+            document = document.document()
+        return [document, prompt], config
+    
+    def _drop_missing_cache(self, document: Any, error: Exception) -> bool:
+        """请求引用的上下文缓存已在服务端过期或被删除时，清除登记并改为直接发送文档，返回是否可以重试"""
+        if not (isinstance(document, CachedDocument) and document.name is not None
+                and isinstance(error, self.genai.errors.ClientError) and error.code in (403, 404)):
+            return False
+        self._log(f"⚠️ 上下文缓存 {document.name} 已失效，改为直接发送文档")
+        document.name = None
+        self.context_cache.remove(self.PROVIDER, document.model, document.file_sha256)
+        return True
+    
+    def _request_structured(self, document: Any, prompt: str, schema: Type[BaseModel],
+                            model: Optional[str] = None) -> Tuple[BaseModel, Any]:
+        """发送结构化输出请求，返回(校验后的模型, 原始响应)"""
+        model = model or self.model
+        
+        def generate() -> Any:
+            with self._span("generation"):
+                contents, config = self._generation_request(document, prompt, schema, model)
+                try:
+                    return self.client.models.generate_content(model=model, contents=contents, config=config)
+                except Exception as e:
+                    if not self._drop_missing_cache(document, e):
+                        raise
+                    contents, config = self._generation_request(document, prompt, schema, model)
+                    return self.client.models.generate_content(model=model, contents=contents, config=config)
+        
+        response = self._scheduled(model, generate)
+        self._add_usage(gemini_usage(response))
+        self._job_progress("generated")
+        if not response.text:
+            # 被安全策略拦截或输出达到长度上限时没有文本，直接校验只会得到难以理解的JSON解析错误
+            candidate = response.candidates[0] if response.candidates else None
+            reason = getattr(candidate, "finish_reason", None) or getattr(response, "prompt_feedback", None)
+            raise ValueError(f"模型未返回可解析的结构化结果（{reason}）")
+        with self._span("validation"):
+            parsed = schema.model_validate_json(response.text)
+        self._job_progress("validated")
+        return parsed, response
+    
+    def _stream_structured_text(self, document: Any, prompt: str, schema: Type[BaseModel],
+                                model: Optional[str] = None) -> Iterator[str]:
+        """发送流式结构化输出请求，逐段产出JSON文本"""
+        model = model or self.model
+        self._reserve_quota(model)
+        contents, config = self._generation_request(document, prompt, schema, model)
+        stream = self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+        try:
+            first_chunk = next(stream, None)
+        except Exception as e:
+            if not self._drop_missing_cache(document, e):
+                raise
+            contents, config = self._generation_request(document, prompt, schema, model)
+            stream = self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+            first_chunk = next(stream, None)
+        last_chunk = None
+        for chunk in itertools.chain([first_chunk] if first_chunk is not None else [], stream):
+            last_chunk = chunk
+            if chunk.text:
+                yield chunk.text
+        # 流式响应的最后一个分片携带完整的token用量
+        self._add_usage(gemini_usage(last_chunk))
+    
+    def extract_from_file(self, file_path: str, use_file_api: Optional[bool] = None) -> MiningReport:
+        """从PDF文件提取信息"""
+        filepath = pathlib.Path(file_path)
+        if not filepath.exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        
+        with self._track(file_path):
+            cached = self._get_cached_result(file_path)
+            if cached is not None:
+                return cached
+            
+            local_resources = self._local_resources(file_path)
+            with self._open_document(file_path, use_file_api=use_file_api) as file_content:
+                self._log("🔍 正在分析文档内容...")
+                result, _ = self._request_report(file_content, local_resources)
+            
+            self._log("✅ 文档分析完成")
+            self._put_cached_result(file_path, result)
+            return result
 
 
 # ========== OpenAI 实现（带流式对话功能） ==========
+# 非模型链式对话的回答来源说明
+CONVERSATION_SOURCE_LABELS = {
+    "cache": "命中回答缓存，未调用模型",
+    "excerpts": "根据报告字段和检索段落回答，未发送完整文档",
+}
+
+
+class ConversationEvent(NamedTuple):
+    """流式对话事件：type为delta（回答片段）或done（回答结束，附带response_id和回答来源）"""
+    type: str
+    text: str = ""
+    response_id: Optional[str] = None
+    source: Optional[str] = None  # model（模型链式对话）/cache（回答缓存）/excerpts（报告字段与检索段落）
+    cached_tokens: int = 0  # 模型回答时命中提示缓存的输入token数
+
+
 class OpenAIMiningReportExtractorWithStreamConversation(BaseMiningReportExtractor):
     """基于OpenAI的矿山报告提取器（带流式对话功能）"""
     
-    def __init__(self, api_key: Optional[str] = None, model: str = "o4-mini", env_file: str = ".env"):
-        super().__init__(api_key, model)
+    PROVIDER = "openai"
+    
+    def __init__(self, api_key: Optional[str] = None, model: str = "o4-mini", env_file: str = ".env",
+                 base_url: Optional[str] = None, prompt_cache_retention: Optional[str] = None, **kwargs):
+        super().__init__(api_key, model, **kwargs)
+        self.prompt_cache = OpenAIPromptCache(prompt_cache_retention)
         
         try:
             from openai import OpenAI
@@ -320,60 +1697,224 @@ class OpenAIMiningReportExtractorWithStreamConversation(BaseMiningReportExtracto
         if not self.api_key:
             raise ValueError("请提供OPENAI_API_KEY环境变量或直接传入api_key参数")
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
         self.file_id = None  # 保存上传的文件ID
-        self.initial_response_id = None  # 保存初始提取响应的ID
-    
-    def _upload_file(self, file_path: str) -> str:
-        """上传文件到OpenAI"""
-        print("📤 正在上传文件到OpenAI服务器...")
-        with open(file_path, "rb") as f:
-            file = self.client.files.create(file=f, purpose="user_data")
-        print("✅ 文件上传完成")
+        self.initial_response_id = None  # 保存初始提取响应的ID（命中结果缓存时为None）
+        self._temporary_uploads: set = set()  # 未登记的临时文件（分块等），释放文档时删除
+    
+    def _create_remote_file(self, file_path: str, file_sha256: Optional[str] = None,
+                            ttl_seconds: Optional[int] = None) -> str:
+        """上传文件并返回file_id：大文件使用可续传分块上传（Uploads API），其余以文件句柄流式上传"""
+        file_size = os.path.getsize(file_path)
+        # 只有登记表管理的文件带前缀，孤立文件清理据此识别
+        filename = f"{UPLOAD_NAME_PREFIX}{file_sha256[:16]}.pdf" if ttl_seconds else pathlib.Path(file_path).name
+        options = {"expires_after": {"anchor": "created_at", "seconds": ttl_seconds}} if ttl_seconds else {}
+        with self._span("upload"):
+            if file_size > RESUMABLE_UPLOAD_THRESHOLD:
+                return self._chunked_upload(file_path, file_sha256, filename=filename, **options)
+            with open(file_path, "rb") as f:
+                file = self.client.files.create(file=(filename, f), purpose="user_data", **options)
+        self._add_metrics(upload_bytes=file_size)
         return file.id
     
+    def _start_chunked_upload(self, file_path: str, file_size: int, filename: str = "upload.pdf",
+                              **options: Any) -> str:
+        """创建OpenAI Upload对象，返回upload_id"""
+        upload = self.client.uploads.create(bytes=file_size, filename=filename, mime_type="application/pdf",
+                                            purpose="user_data", **options)
+        return upload.id
+    
+    def _send_upload_chunk(self, state: Dict[str, Any], chunk: FileSlice, offset: int, final: bool) -> Any:
+        """上传一个分块并记录分块ID"""
+        part = self.client.uploads.parts.create(state["session"], data=chunk)
+        state["part_ids"].append(part.id)
+        return None
+    
+    def _complete_chunked_upload(self, state: Dict[str, Any], final_result: Any) -> str:
+        """按顺序提交分块ID完成上传，返回file_id"""
+        upload = self.client.uploads.complete(state["session"], part_ids=state["part_ids"])
+        return upload.file.id
+    
+    def _upload_file(self, file_path: str, register: bool = True) -> str:
+        """上传文件到OpenAI，启用登记表或任务日志时复用仍然有效的已上传文件（register为False时不使用登记表）"""
+        track_upload = self.upload_checkpoints is not None or CURRENT_JOB.get() is not None
+        file_sha256 = self._upload_sha256(file_path) if track_upload else None
+        job_remote_id = self._job_remote_id(file_sha256) if file_sha256 else None
+        if job_remote_id:
+            try:
+                self.client.files.retrieve(job_remote_id)
+                self._log("♻️ 复用任务日志中已上传的OpenAI文件，跳过上传")
+                return job_remote_id
+            except Exception:
+                pass
+        
+        if not self.upload_registry or not register:
+            self._log("📤 正在上传文件到OpenAI服务器...")
+            file_id = self._create_remote_file(file_path, file_sha256)
+            self._log("✅ 文件上传完成")
+            if file_sha256:
+                self._job_progress("uploaded", provider=self.PROVIDER, upload_sha256=file_sha256, file_id=file_id)
+            if self.upload_registry:
+                self._temporary_uploads.add(file_id)
+            return file_id
+        
+        file_sha256 = file_sha256 or self._upload_sha256(file_path)
+        entry = self.upload_registry.lookup(self.PROVIDER, file_sha256)
+        if entry:
+            try:
+                self.client.files.retrieve(entry["remote_id"])
+                self._log("♻️ 复用已上传的OpenAI文件，跳过上传")
+                self._job_progress("uploaded", provider=self.PROVIDER, upload_sha256=file_sha256,
+                                   file_id=entry["remote_id"])
+                return entry["remote_id"]
+            except Exception:
+                self.upload_registry.remove(self.PROVIDER, [entry["remote_id"]])
+        
+        self._log("📤 正在上传文件到OpenAI服务器...")
+        ttl_seconds = self.upload_registry.openai_ttl_seconds
+        file_id = self._create_remote_file(file_path, file_sha256, ttl_seconds)
+        self._log("✅ 文件上传完成")
+        self._job_progress("uploaded", provider=self.PROVIDER, upload_sha256=file_sha256, file_id=file_id)
+        self.upload_registry.register(self.PROVIDER, file_sha256, file_id, time.time() + ttl_seconds)
+        return file_id
+    
+    def list_remote_uploads(self) -> List[Tuple[str, str]]:
+        """列出OpenAI中用途为user_data的文件"""
+        return [(f.id, f.filename) for f in self.client.files.list(purpose="user_data")]
+    
+    def delete_remote_upload(self, remote_id: str) -> None:
+        """删除OpenAI中的文件"""
+        self.client.files.delete(remote_id)
+    
+    def _prepare_document(self, upload_path: str, model: Optional[str] = None, register: bool = True) -> str:
+        """上传文档并返回file_id（上传的文件与模型无关）"""
+        file_size_mb = self._get_file_size_mb(upload_path)
+        self._log(f"📁 文件大小: {file_size_mb:.2f} MB")
+        file_id = self._upload_file(upload_path, register)
+        self.prompt_cache.register_document(file_id, self._upload_sha256(upload_path))
+        return file_id
+    
+    def _release_document(self, document: str) -> None:
+        """删除临时上传的文件（已登记复用的文件保留）"""
+        if self.upload_registry:
+            if document not in self._temporary_uploads:
+                return
+            self._temporary_uploads.discard(document)
+        try:
+            self.client.files.delete(document)
+        except Exception as e:
+            self._log(f"⚠️ 清理临时文件时出现警告: {e}")
+    
+    def _request_structured(self, document: str, prompt: str, schema: Type[BaseModel],
+                            model: Optional[str] = None) -> Tuple[BaseModel, Any]:
+        """发送结构化输出请求，返回(校验后的模型, 原始响应)（SDK在解析时完成校验，计入generation阶段）"""
+        
+        def generate() -> Any:
+            with self._span("generation"):
+                return self.client.responses.parse(
+                    model=model or self.model,
+                    input=self.prompt_cache.document_input(document, prompt),
+                    text_format=schema,
+                    **self.prompt_cache.options(document),
+                )
+        
+        response = self._scheduled(model, generate)
+        self.prompt_cache.link(document, response.id)
+        self._add_usage(openai_usage(response))
+        self._job_progress("generated")
+        if response.output_parsed is None:
+            # 模型拒答、输出因长度上限被截断等情况下SDK不抛出异常，只是没有解析结果
+            reason = getattr(getattr(response, "incomplete_details", None), "reason", None) or response.status
+            raise ValueError(f"模型未返回可解析的结构化结果（{reason}）")
+        self._job_progress("validated")
+        return response.output_parsed, response
+    
+    def _stream_structured_text(self, document: str, prompt: str, schema: Type[BaseModel],
+                                model: Optional[str] = None) -> Iterator[str]:
+        """发送流式结构化输出请求，逐段产出JSON文本，结束后保存响应ID用于后续对话"""
+        self.file_id = document
+        self._reserve_quota(model)
+        with self.client.responses.stream(
+            model=model or self.model,
+            input=self.prompt_cache.document_input(document, prompt),
+            text_format=schema,
+            **self.prompt_cache.options(document),
+        ) as stream:
+            for event in stream:
+                if event.type == 'response.output_text.delta':
+                    yield event.delta
+            final_response = stream.get_final_response()
+            self.initial_response_id = final_response.id
+            self.prompt_cache.link(document, final_response.id)
+            self._add_usage(openai_usage(final_response))
+    
     def extract_from_file(self, file_path: str) -> MiningReport:
         """从PDF文件提取信息"""
         filepath = pathlib.Path(file_path)
         if not filepath.exists():
             raise FileNotFoundError(f"文件不存在: {file_path}")
         
-        file_size_mb = self._get_file_size_mb(file_path)
-        print(f"📁 文件大小: {file_size_mb:.2f} MB")
-        
-        self.file_id = self._upload_file(file_path)
-        
-        print("🔍 正在分析文档内容...")
-        response = self.client.responses.parse(
-            model=self.model,
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "file_id": self.file_id,
-                        },
-                        {
-                            "type": "input_text",
-                            "text": self.prompt,
-                        },
-                    ]
-                }
-            ],
-            text_format=MiningReport,
-        )
-        
-        # 保存初始响应ID，用于后续对话
-        self.initial_response_id = response.id
+        with self._track(file_path):
+            cached = self._get_cached_result(file_path)
+            if cached is not None:
+                # 命中缓存时没有上传文档、也没有可链接的响应：清除上一份报告的对话状态，
+                # 避免后续对话沿用其响应链；对话模式需通过ConversationAccelerator按需上传本报告
+                self.file_id = None
+                self.initial_response_id = None
+                return cached
+            
+            local_resources = self._local_resources(file_path)
+            upload_path, is_temporary = self._prepare_upload_path(file_path)
+            try:
+                self.file_id = self._prepare_document(upload_path)
+            finally:
+                self._discard_upload_path(upload_path, is_temporary)
+            
+            self._log("🔍 正在分析文档内容...")
+            result, response = self._request_report(self.file_id, local_resources)
+            
+            # 保存初始响应ID，用于后续对话
+            self.initial_response_id = response.id
+            
+            self._log("✅ 文档分析完成")
+            self._put_cached_result(file_path, result)
+            return result
+    
+    def conversation_document(self, file_path: str) -> str:
+        """返回对话随问题发送的完整报告file_id（提取结果来自缓存、没有可链接的响应时按需上传一次）"""
+        if self.file_id is None:
+            self.file_id = self._prepare_document(file_path)
+        return self.file_id
+    
+    def stream_answer(self, question: str, previous_response_id: Optional[str] = None,
+                      document: Optional[str] = None, model: Optional[str] = None,
+                      instructions: str = CONVERSATION_INSTRUCTIONS) -> Iterator[ConversationEvent]:
+        """提问并流式产出回答片段，最后产出带新response_id的done事件
         
-        result = response.output_parsed
-        print("✅ 文档分析完成")
-        return result
+        previous_response_id用于链式对话；document为file_id时随问题一起发送文档（没有可链接的响应时使用）。
+        请求按OpenAIPromptCache的固定布局组织，使报告文档和已有的响应链作为前缀命中提示缓存。
+        """
+        request, added_instructions = self.prompt_cache.conversation_request(
+            question, previous_response_id, document, instructions)
+        stream = self.client.responses.create(model=model or self.model, stream=True, **request)
+        response_id = None
+        cached_tokens = 0
+        for event in stream:
+            if event.type == 'response.output_text.delta':
+                yield ConversationEvent("delta", event.delta)
+            elif event.type in ('response.completed', 'response.done'):
+                response_id = event.response.id
+                cached_tokens = openai_usage(event.response).get("cached_tokens", 0)
+        self.prompt_cache.link(previous_response_id or document, response_id, added_instructions)
+        yield ConversationEvent("done", response_id=response_id, source="model", cached_tokens=cached_tokens)
     
-    def start_conversation(self):
-        """开始对话模式"""
-        if not self.initial_response_id:
+    def start_conversation(self, accelerator: Optional[Any] = None):
+        """开始对话模式
+        
+        accelerator为ConversationAccelerator（见mining_report_conversation.py）时，先查询回答缓存、
+        尝试根据报告字段和检索段落以小提示词回答，必要时才基于完整文档链式提问。
+        """
+        if not self.initial_response_id and accelerator is None:
             print("❌ 请先提取报告信息后再进入对话模式")
             return
         
@@ -405,32 +1946,29 @@ class OpenAIMiningReportExtractorWithStreamConversation(BaseMiningReportExtracto
                 print("\n🤖 AI回答:")
                 print("-" * 50)
                 
-                # 使用流式输出
-                stream = self.client.responses.create(
-                    model=self.model,
-                    instructions=CONVERSATION_INSTRUCTIONS,
-                    previous_response_id=previous_response_id,
-                    input=user_input,
-                    stream=True,
-                )
-                
-                # 收集完整响应以获取response_id
-                full_response = ""
-                response_id = None
+                if accelerator is not None:
+                    events = accelerator.stream_answer(user_input, previous_response_id)
+                else:
+                    events = self.stream_answer(user_input, previous_response_id)
                 
-                for event in stream:
-                    if event.type == 'response.output_text.delta':
-                        print(event.delta, end='', flush=True)
-                        full_response += event.delta
-                    elif event.type == 'response.done':
-                        # 获取response_id用于下一轮对话
-                        response_id = event.response.id
+                # 缓存回答与模型回答使用同一输出路径
+                source = None
+                cached_tokens = 0
+                for event in events:
+                    if event.type == "delta":
+                        print(event.text, end='', flush=True)
+                    else:
+                        source = event.source
+                        cached_tokens = event.cached_tokens
+                        # 更新对话ID，用于下一轮对话
+                        if event.response_id:
+                            previous_response_id = event.response_id
                 
                 print("\n" + "-" * 50)
-                
-                # 更新对话ID
-                if response_id:
-                    previous_response_id = response_id
+                if source in CONVERSATION_SOURCE_LABELS:
+                    self._log(f"⚡ {CONVERSATION_SOURCE_LABELS[source]}")
+                elif cached_tokens:
+                    self._log(f"⚡ 命中提示缓存: {cached_tokens} 输入tokens")
                 
             except KeyboardInterrupt:
                 print("\n\n👋 用户中断对话")
@@ -440,13 +1978,16 @@ class OpenAIMiningReportExtractorWithStreamConversation(BaseMiningReportExtracto
                 print("您可以尝试重新提问或退出对话。")
     
     def cleanup(self):
-        """清理上传的文件"""
-        if self.file_id:
+        """清理上传的文件（已登记复用的文件保留到过期，由UploadReconciler统一清理）"""
+        if self.file_id and self.upload_registry:
+            self.file_id = None
+        elif self.file_id:
             try:
                 self.client.files.delete(self.file_id)
-                print("🗑️ 临时文件已清理")
+                self.file_id = None
+                self._log("🗑️ 临时文件已清理")
             except Exception as e:
-                print(f"⚠️ 清理临时文件时出现警告: {e}")
+                self._log(f"⚠️ 清理临时文件时出现警告: {e}")
 
 
 # ========== 用户交互函数 ==========
@@ -500,7 +2041,8 @@ def create_extractor(provider: str = None, model: str = None, **kwargs) -> BaseM
     if provider is None or model is None:
         provider, model = get_user_choice()
     
-    print(f"\n🔧 创建提取器: {provider} - {model}")
+    if not kwargs.get("quiet"):
+        print(f"\n🔧 创建提取器: {provider} - {model}")
     
     if provider == "gemini":
         return GeminiMiningReportExtractor(model=model, **kwargs)
@@ -546,7 +2088,8 @@ def main():
     try:
         # 获取用户选择
         provider, model = get_user_choice()
-        extractor = create_extractor(provider, model)
+        extractor = create_extractor(provider, model, cache=ExtractionCache(), upload_registry=UploadRegistry(),
+                                     upload_checkpoints=UploadCheckpoints())
         
         # 获取文件路径
         pdf_file = get_pdf_file()
@@ -567,7 +2110,10 @@ def main():
         # 如果是OpenAI，询问是否进入对话模式
         if provider == "openai" and isinstance(extractor, OpenAIMiningReportExtractorWithStreamConversation):
             if ask_yes_no("💬 是否进入提问环节？"):
-                extractor.start_conversation()
+                # 回答缓存与本地检索（见mining_report_conversation.py）
+                from mining_report_conversation import ConversationAccelerator
+                accelerator = ConversationAccelerator(extractor, pdf_file, result)
+                extractor.start_conversation(accelerator)
         
     except KeyboardInterrupt:
         print("\n\n👋 用户取消操作")
@@ -0,0 +1,244 @@
+"""
+矿山储量核实报告对冲/故障转移提取器（降低尾延迟）
+
+HedgedMiningReportExtractor组合两条路径（提供商/模型）：先启动主路径，若主路径在其历史耗时的
+hedge_percentile分位数内未返回（或直接失败），则在另一提供商或另一模型上发起对冲请求，
+返回第一个通过MiningReport校验的结果。落败路径的结果被丢弃并清理其上传文件。
+HedgeStats持久化各路径的耗时样本和胜出次数，用于确定对冲等待时间（样本不足时使用默认值）。
+
+用法示例:
+    stats = HedgeStats("hedge_stats.json")
+    extractor = HedgedMiningReportExtractor(("gemini", "gemini-2.5-flash"), ("openai", "o4-mini"),
+                                            hedge_percentile=0.95, stats=stats)
+    result = extractor.extract_from_file("report.pdf")
+    print(extractor.last_winner)   # 如 "hedge:openai/o4-mini"
+"""
+import contextvars
+import json
+import os
+import pathlib
+import queue
+import threading
+import time
+from collections import deque
+from typing import Optional, List, Dict, Tuple
+
+from mining_report_extractor_stream import BaseMiningReportExtractor, MiningReport, create_extractor
+
+
+# ========== 耗时统计 ==========
+class HedgeStats:
+    """记录各路径的提取耗时与胜出次数，用于按延迟分位数确定对冲等待时间"""
+
+    def __init__(self, stats_path: Optional[str] = None, max_samples: int = 200):
+        self.stats_path = pathlib.Path(stats_path) if stats_path else None
+        self.max_samples = max_samples
+        self.latencies: Dict[str, deque] = {}
+        self.wins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.stats_path and self.stats_path.exists():
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.latencies = {label: deque(values, maxlen=max_samples) for label, values in data.get("latencies", {}).items()}
+            self.wins = data.get("wins", {})
+
+    def _save(self) -> None:
+        if not self.stats_path:
+            return
+        data = {"latencies": {label: list(values) for label, values in self.latencies.items()}, "wins": self.wins}
+        tmp_path = self.stats_path.with_name(f"{self.stats_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.stats_path)
+
+    def record_latency(self, label: str, seconds: float) -> None:
+        """记录一次成功提取的耗时"""
+        with self._lock:
+            self.latencies.setdefault(label, deque(maxlen=self.max_samples)).append(round(seconds, 3))
+            self._save()
+
+    def record_win(self, path: str) -> None:
+        """记录胜出路径（如"primary:gemini/gemini-2.5-flash"）"""
+        with self._lock:
+            self.wins[path] = self.wins.get(path, 0) + 1
+            self._save()
+
+    def percentile(self, label: str, q: float, min_samples: int) -> Optional[float]:
+        """返回耗时的q分位数，样本不足时返回None"""
+        with self._lock:
+            samples = sorted(self.latencies.get(label, []))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(q * len(samples) + 0.5) - 1))
+        return samples[index]
+
+
+# ========== 对冲/故障转移提取器 ==========
+class HedgedMiningReportExtractor(BaseMiningReportExtractor):
+    """对冲/故障转移提取器
+
+    先启动主路径；若主路径在其历史耗时的hedge_percentile分位数内未返回（或直接失败），
+    则在另一提供商或另一模型上发起对冲请求，返回第一个通过MiningReport校验的结果。
+    胜出路径记录在last_winner和stats中（多个实例可共享同一个HedgeStats）。
+    胜出路径的提取器保留在last_extractor中（可读取其last_metrics等），下一次提取前不会被其它调用复用。
+    同步调用无法中断进行中的HTTP请求：结果已确定后尚未开始提取的路径直接退出，
+    已在进行中的落败路径会在后台完成后被丢弃并清理其上传文件。
+    只支持extract_from_file，分块、分章节和流式提取请直接使用单个提取器。
+    """
+
+    PROVIDER = "hedged"
+
+    def __init__(self, primary: Tuple[str, str], hedge: Tuple[str, str], hedge_percentile: float = 0.95,
+                 default_hedge_delay: float = 60.0, min_samples: int = 20,
+                 stats: Optional[HedgeStats] = None, **extractor_kwargs):
+        super().__init__(None, f"{primary[0]}/{primary[1]}->{hedge[0]}/{hedge[1]}",
+                         quiet=extractor_kwargs.get("quiet", False))
+        self.legs = {"primary": primary, "hedge": hedge}
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.extractor_kwargs = extractor_kwargs
+        self.stats = stats or HedgeStats()
+        self.last_winner: Optional[str] = None
+        self.last_extractor: Optional[BaseMiningReportExtractor] = None
+        self._last_leg: Optional[str] = None
+        self._idle: Dict[str, List[BaseMiningReportExtractor]] = {"primary": [], "hedge": []}
+        self._lock = threading.Lock()
+
+    def _label(self, leg: str) -> str:
+        provider, model = self.legs[leg]
+        return f"{provider}/{model}"
+
+    def _checkout(self, leg: str) -> BaseMiningReportExtractor:
+        """取出空闲的提取器实例（落败路径可能仍在后台运行，不能复用其实例）"""
+        with self._lock:
+            if self._idle[leg]:
+                return self._idle[leg].pop()
+        provider, model = self.legs[leg]
+        return create_extractor(provider, model, **self.extractor_kwargs)
+
+    def _checkin(self, leg: str, extractor: BaseMiningReportExtractor) -> None:
+        with self._lock:
+            self._idle[leg].append(extractor)
+
+    def _release_last(self) -> None:
+        """将上一次胜出的提取器放回空闲池（调用方在下一次提取前仍可读取last_extractor）"""
+        if self.last_extractor is not None:
+            self._checkin(self._last_leg, self.last_extractor)
+            self.last_extractor = None
+
+    def hedge_delay(self) -> float:
+        """对冲等待时间：主路径历史耗时的分位数，样本不足时使用默认值"""
+        delay = self.stats.percentile(self._label("primary"), self.hedge_percentile, self.min_samples)
+        return self.default_hedge_delay if delay is None else delay
+
+    def extract_from_file(self, file_path: str) -> MiningReport:
+        """从PDF文件提取信息（主路径超时或失败时发起对冲请求）"""
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        self._release_last()
+
+        # 每条路径恰好放入一条结果：(路径, 提取器, 结果, 异常, 是否胜出)
+        outcomes: "queue.Queue[Tuple[str, Optional[BaseMiningReportExtractor], Optional[MiningReport], Optional[Exception], bool]]" = queue.Queue()
+        decided = {"winner": None}
+        decided_lock = threading.Lock()
+
+        def run_leg(leg: str) -> None:
+            extractor: Optional[BaseMiningReportExtractor] = None
+            result: Optional[MiningReport] = None
+            error: Optional[Exception] = None
+            won = False
+            try:
+                with decided_lock:
+                    if decided["winner"] is not None:
+                        return  # 结果已确定，不再发起请求
+                extractor = self._checkout(leg)
+                started = time.perf_counter()
+                result = extractor.extract_from_file(file_path)
+                self.stats.record_latency(self._label(leg), time.perf_counter() - started)
+                # 胜出路径在放入结果之前确定，落败路径据此清理自己的上传文件
+                with decided_lock:
+                    if decided["winner"] is None:
+                        decided["winner"] = leg
+                        won = True
+                if not won and hasattr(extractor, "cleanup"):
+                    self._log(f"🛑 已丢弃落败路径 {self._label(leg)} 的结果")
+                    extractor.cleanup()
+            except Exception as e:
+                error = e
+            finally:
+                # 胜出路径的提取器交给调用方（last_extractor），在下一次提取时才放回空闲池
+                if extractor is not None and not won:
+                    self._checkin(leg, extractor)
+                outcomes.put((leg, extractor, result, error, won))
+
+        def launch(leg: str) -> None:
+            # 复制上下文，使两条路径都能记录到当前的批量任务日志
+            threading.Thread(target=contextvars.copy_context().run, args=(run_leg, leg),
+                             name=f"hedged-{leg}", daemon=True).start()
+
+        launch("primary")
+        launched = ["primary"]
+        errors: Dict[str, Exception] = {}
+        delay = self.hedge_delay()
+        deadline = time.monotonic() + delay
+
+        while True:
+            timeout = None if "hedge" in launched else max(0.0, deadline - time.monotonic())
+            try:
+                leg, extractor, result, error, won = outcomes.get(timeout=timeout)
+            except queue.Empty:
+                self._log(f"⏱️ 主路径 {self._label('primary')} 超过 {delay:.1f}s 未返回，启动对冲路径 {self._label('hedge')}")
+                launch("hedge")
+                launched.append("hedge")
+                continue
+
+            if error is None and not won:
+                continue  # 已确定胜出路径的结果会随后取出（两条路径几乎同时完成）
+            if error is None:
+                self.last_winner = f"{leg}:{self._label(leg)}"
+                self.last_extractor = extractor
+                self._last_leg = leg
+                self.stats.record_win(self.last_winner)
+                self._log(f"🏁 胜出路径: {self.last_winner}")
+                return result
+
+            errors[leg] = error
+            self._log(f"⚠️ 路径 {self._label(leg)} 提取失败: {error}")
+            if "hedge" not in launched:
+                self._log(f"🔀 故障转移到 {self._label('hedge')}")
+                launch("hedge")
+                launched.append("hedge")
+            elif len(errors) == len(launched):
+                details = "；".join(f"{self._label(leg)}: {e}" for leg, e in errors.items())
+                raise RuntimeError(f"所有路径均提取失败: {details}") from error
+
+    @property
+    def upload_provider(self) -> str:
+        """远程文件管理委托给主路径，登记表按主路径的提供商查询"""
+        return self.legs["primary"][0]
+
+    def list_remote_uploads(self) -> List[Tuple[str, str]]:
+        """列出主路径提供商侧的上传文件"""
+        extractor = self._checkout("primary")
+        try:
+            return extractor.list_remote_uploads()
+        finally:
+            self._checkin("primary", extractor)
+
+    def delete_remote_upload(self, remote_id: str) -> None:
+        """删除主路径提供商侧的上传文件"""
+        extractor = self._checkout("primary")
+        try:
+            extractor.delete_remote_upload(remote_id)
+        finally:
+            self._checkin("primary", extractor)
+
+    def cleanup(self):
+        """清理各路径提取器上传的文件"""
+        self._release_last()
+        with self._lock:
+            extractors = [e for idle in self._idle.values() for e in idle]
+        for extractor in extractors:
+            if hasattr(extractor, "cleanup"):
+                extractor.cleanup()
@@ -0,0 +1,377 @@
+"""
+矿山储量核实报告批量任务日志（可恢复）
+
+多文档批量提取时，将每个文档的处理进度以追加写入的方式记录到JSONL日志中：
+    queued → running → uploaded（附远程文件ID）→ generated → validated → saved / failed
+
+- 每条记录一次性追加写入（O_APPEND + 文件锁 + fsync），崩溃最多丢失最后一条未写完的记录，
+  读取时自动忽略不完整的末行
+- 重新运行时跳过已保存（且文件内容未变化）的文档；已上传的文档复用远程文件ID，不再重复上传；
+  失败的文档在达到最大尝试次数前自动重试
+- 多个进程/线程可同时写入同一份日志：认领文档时在文件锁内完成"读取最新状态 + 写入running"，
+  其它存活的工作进程已认领的文档会被跳过，已退出进程遗留的认领自动失效
+- 文件锁加在旁路的<日志>.lock文件上（压缩日志会替换日志文件本身）；其它进程发现日志文件被替换后从头回放
+
+用法示例:
+    journal = JobJournal("batch_journal.jsonl", max_attempts=3)
+    pending, skipped = journal.plan(files)
+    for pdf_file in pending:
+        job = journal.claim(pdf_file)
+        if job is None:
+            continue  # 其它工作进程正在处理
+        with job.activate():
+            result = extractor.extract_from_file(str(pdf_file))  # 提取器自动记录uploaded/generated/validated
+        extractor.save_result(result, "result.json")
+        job.record(JOB_SAVED, output_path="result.json")
+
+    python mining_report_journal.py batch_journal.jsonl          # 查看各状态的文档数
+    python mining_report_journal.py batch_journal.jsonl --failed # 列出失败的文档
+"""
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import socket
+import threading
+import time
+import uuid
+from typing import Optional, List, Dict, Any, Tuple, Iterator, ContextManager
+
+from pydantic import BaseModel
+
+from mining_report_cache import compute_file_sha256, locked_file
+from mining_report_extractor_stream import CURRENT_JOB
+
+
+DEFAULT_JOURNAL_PATH = "batch_journal.jsonl"
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 6 * 3600  # 其它主机上的认领超过该时长未更新视为失效
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_UPLOADED = "uploaded"
+JOB_GENERATED = "generated"
+JOB_VALIDATED = "validated"
+JOB_SAVED = "saved"
+JOB_FAILED = "failed"
+JOB_STATES = [JOB_QUEUED, JOB_RUNNING, JOB_UPLOADED, JOB_GENERATED, JOB_VALIDATED, JOB_SAVED, JOB_FAILED]
+# 提取过程中的进度阶段只向前推进（分块/分章节提取会多次上传、生成和校验）
+_PROGRESS_ORDER = {state: order for order, state in enumerate(JOB_STATES)}
+_ADVANCING_STATES = (JOB_UPLOADED, JOB_GENERATED, JOB_VALIDATED)
+
+
+# ========== 任务记录 ==========
+class JobRecord(BaseModel):
+    """日志回放后单个文档的最新状态"""
+    job: str
+    file: str
+    sha256: Optional[str] = None
+    state: str = JOB_QUEUED
+    attempts: int = 0
+    remote_ids: Dict[str, str] = {}  # "提供商:上传内容SHA-256" → 远程文件ID
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    owner: Optional[Dict[str, Any]] = None
+    updated_at: float = 0.0
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class JobHandle:
+    """单个文档本次处理的句柄；activate()期间提取器通过CURRENT_JOB记录进度并复用已上传的文件"""
+
+    def __init__(self, journal: "JobJournal", record: JobRecord):
+        self.journal = journal
+        self.job = record.job
+        self.file = record.file
+        self.sha256 = record.sha256
+        self.attempts = record.attempts
+        self.remote_ids = dict(record.remote_ids)
+        self.state = record.state
+        self._lock = threading.Lock()
+
+    def remote_id(self, provider: str, upload_sha256: str) -> Optional[str]:
+        """查询之前运行中已上传的远程文件ID（提取器仍需确认远程文件有效）"""
+        with self._lock:
+            return self.remote_ids.get(f"{provider}:{upload_sha256}")
+
+    def record(self, state: str, provider: Optional[str] = None, upload_sha256: Optional[str] = None,
+               file_id: Optional[str] = None, **fields: Any) -> None:
+        """记录进度；uploaded需附带provider、upload_sha256和file_id，generated/validated只在向前推进时写入"""
+        with self._lock:
+            if state == JOB_UPLOADED:
+                key = f"{provider}:{upload_sha256}"
+                if self.remote_ids.get(key) == file_id:
+                    return
+                self.remote_ids[key] = file_id
+                fields["remote_ids"] = {key: file_id}
+            elif state in _ADVANCING_STATES and _PROGRESS_ORDER[self.state] >= _PROGRESS_ORDER[state]:
+                return
+            if state not in _ADVANCING_STATES or _PROGRESS_ORDER[state] > _PROGRESS_ORDER[self.state]:
+                self.state = state
+        self.journal.append(self.job, state, **fields)
+
+    def fail(self, error: str) -> None:
+        self.record(JOB_FAILED, error=error)
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator["JobHandle"]:
+        """在当前上下文中设置CURRENT_JOB（线程池任务需通过contextvars.copy_context()传递）"""
+        token = CURRENT_JOB.set(self)
+        try:
+            yield self
+        finally:
+            CURRENT_JOB.reset(token)
+
+
+# ========== 任务日志 ==========
+class JobJournal:
+    """追加写入的JSONL批量任务日志，支持崩溃后恢复和多个工作进程并发写入"""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, fsync: bool = True):
+        self.path = pathlib.Path(path)
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.fsync = fsync
+        self.owner = {"host": socket.gethostname(), "pid": os.getpid(), "run": uuid.uuid4().hex[:12]}
+        self._records: Dict[str, JobRecord] = {}
+        self._offset = 0
+        self._file_id: Optional[Tuple[int, int]] = None  # 已回放的日志文件(st_dev, st_ino)
+        self._hashes: Dict[str, str] = {}  # plan()计算的文件哈希，claim()直接使用
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def job_key(file_path) -> str:
+        """文档在日志中的键（绝对路径）"""
+        return str(pathlib.Path(file_path).resolve())
+
+    def _locked(self) -> ContextManager[None]:
+        """进程内线程锁 + 跨进程文件锁（锁文件不随日志压缩替换，所有进程始终锁同一个inode）"""
+        return locked_file(self._lock, self.lock_path)
+
+    def _apply(self, entry: Dict[str, Any]) -> None:
+        key = entry.get("job")
+        if not key:
+            return
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = JobRecord(job=key, file=entry.get("file", key))
+        state = entry.get("state")
+        if state == JOB_RUNNING:
+            record.error = None
+        if state in _ADVANCING_STATES:
+            if record.state not in (JOB_SAVED, JOB_FAILED) and _PROGRESS_ORDER[state] > _PROGRESS_ORDER[record.state]:
+                record.state = state
+        elif state in JOB_STATES:
+            record.state = state
+        for field in ("file", "sha256", "attempts", "output_path", "error", "owner"):
+            if field in entry:
+                setattr(record, field, entry[field])
+        record.remote_ids.update(entry.get("remote_ids") or {})
+        record.updated_at = entry.get("time", record.updated_at)
+
+    def _refresh_locked(self) -> None:
+        """从上次读取的位置继续回放日志（包括其它进程追加的记录），忽略尚未写完的末行
+
+        日志文件被替换（其它进程压缩了日志）时，原来的读取位置不再有效，清空状态后从头回放。
+        """
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if (stat.st_dev, stat.st_ino) != self._file_id or stat.st_size < self._offset:
+                    if self._file_id is not None:
+                        self._records.clear()
+                    self._file_id = (stat.st_dev, stat.st_ino)
+                    self._offset = 0
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n")
+        if end < 0:
+            return
+        for line in data[:end].split(b"\n"):
+            try:
+                self._apply(json.loads(line))
+            except ValueError:
+                continue  # 崩溃时写了一半的记录
+        self._offset += end + 1
+
+    def _append_locked(self, entries: List[Dict[str, Any]]) -> None:
+        payload = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size:
+                os.lseek(fd, size - 1, os.SEEK_SET)
+                if os.read(fd, 1) != b"\n":
+                    payload = b"\n" + payload  # 上次崩溃留下不完整的末行，另起一行避免与新记录粘连
+            os.write(fd, payload)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        # 先回放其它进程在本次写入之前追加的记录，再回放本次写入
+        self._refresh_locked()
+
+    def append(self, job: str, state: str, **fields: Any) -> None:
+        """追加一条状态记录"""
+        entry = {"job": job, "state": state, "time": time.time(), **fields}
+        with self._locked():
+            self._refresh_locked()
+            self._append_locked([entry])
+
+    def refresh(self) -> Dict[str, JobRecord]:
+        """读取最新日志，返回 文档键 → 最新状态"""
+        with self._locked():
+            self._refresh_locked()
+            return dict(self._records)
+
+    def get(self, file_path) -> Optional[JobRecord]:
+        return self.refresh().get(self.job_key(file_path))
+
+    def _skip_reason(self, record: Optional[JobRecord], sha256: str) -> Optional[str]:
+        if record is None or record.sha256 != sha256:
+            return None
+        if record.state == JOB_SAVED:
+            return "已完成"
+        if record.state == JOB_FAILED and record.attempts >= self.max_attempts:
+            return f"已失败 {record.attempts} 次（上限 {self.max_attempts}）"
+        return None
+
+    def _claimed_by_other(self, record: JobRecord) -> bool:
+        """判断文档是否正被其它存活的工作进程处理"""
+        owner = record.owner or {}
+        if record.state in (JOB_QUEUED, JOB_SAVED, JOB_FAILED) or owner.get("run") == self.owner["run"]:
+            return False
+        if owner.get("host") == self.owner["host"] and owner.get("pid"):
+            return _pid_alive(owner["pid"])
+        return time.time() - record.updated_at < self.lease_seconds
+
+    def plan(self, files: List[pathlib.Path]) -> Tuple[List[pathlib.Path], List[Tuple[pathlib.Path, str]]]:
+        """划分待处理和跳过的文档，并为待处理的新文档写入queued记录；返回(待处理, [(跳过的文档, 原因)])"""
+        hashes = {pdf_file: compute_file_sha256(str(pdf_file)) for pdf_file in files}
+        pending, skipped, queued = [], [], []
+        with self._locked():
+            self._refresh_locked()
+            for pdf_file in files:
+                key = self.job_key(pdf_file)
+                self._hashes[key] = hashes[pdf_file]
+                record = self._records.get(key)
+                reason = self._skip_reason(record, hashes[pdf_file])
+                if reason:
+                    skipped.append((pdf_file, reason))
+                    continue
+                pending.append(pdf_file)
+                if record is None or record.sha256 != hashes[pdf_file]:
+                    queued.append({"job": key, "state": JOB_QUEUED, "time": time.time(), "file": str(pdf_file),
+                                   "sha256": hashes[pdf_file], "attempts": 0})
+            if queued:
+                self._append_locked(queued)
+        return pending, skipped
+
+    def claim(self, file_path) -> Optional[JobHandle]:
+        """认领文档并写入running记录；文档已完成、失败次数达上限或正被其它工作进程处理时返回None
+
+        使用plan()时计算的文件哈希（未经plan()的文档才重新计算），避免大文件在同一次运行中哈希两遍。
+        """
+        key = self.job_key(file_path)
+        with self._lock:
+            sha256 = self._hashes.pop(key, None)
+        sha256 = sha256 or compute_file_sha256(str(file_path))
+        with self._locked():
+            self._refresh_locked()
+            record = self._records.get(key)
+            if self._skip_reason(record, sha256) or (record is not None and self._claimed_by_other(record)):
+                return None
+            if record is None or record.sha256 != sha256:
+                # 文件内容变化后之前的上传和尝试次数不再有效
+                record = JobRecord(job=key, file=str(file_path), sha256=sha256)
+            attempts = record.attempts + 1
+            self._append_locked([{
+                "job": key, "state": JOB_RUNNING, "time": time.time(), "file": str(file_path),
+                "sha256": sha256, "attempts": attempts, "owner": self.owner,
+            }])
+            return JobHandle(self, self._records[key])
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的文档数"""
+        counts = {state: 0 for state in JOB_STATES}
+        for record in self.refresh().values():
+            counts[record.state] = counts.get(record.state, 0) + 1
+        return counts
+
+    def compact(self) -> int:
+        """将日志重写为每个文档一条最新状态记录，返回压缩后的记录数
+
+        有文档正被其它存活的工作进程处理时抛出RuntimeError（其进度记录须写入同一份日志）；
+        空闲的其它进程在下次读写时会发现日志文件已被替换并从头回放。
+        """
+        with self._locked():
+            self._refresh_locked()
+            live = [record for record in self._records.values() if self._claimed_by_other(record)]
+            if live:
+                raise RuntimeError(f"有 {len(live)} 个文档正被其它工作进程处理，请在其结束后再压缩日志")
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in self._records.values():
+                    entry = record.model_dump(exclude={"updated_at"})
+                    entry["time"] = record.updated_at
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            stat = self.path.stat()
+            self._file_id = (stat.st_dev, stat.st_ino)
+            self._offset = stat.st_size
+            return len(self._records)
+
+
+# ========== 命令行入口 ==========
+def main() -> int:
+    parser = argparse.ArgumentParser(description="查看矿山储量核实报告批量任务日志")
+    parser.add_argument("journal", nargs="?", default=DEFAULT_JOURNAL_PATH, help="任务日志路径")
+    parser.add_argument("--failed", action="store_true", help="列出失败的文档及错误信息")
+    parser.add_argument("--compact", action="store_true", help="压缩日志（每个文档只保留最新状态）")
+    args = parser.parse_args()
+
+    if not pathlib.Path(args.journal).exists():
+        print(f"❌ 任务日志不存在: {args.journal}")
+        return 1
+
+    journal = JobJournal(args.journal)
+    if args.compact:
+        try:
+            print(f"🗜️ 日志已压缩为 {journal.compact()} 条记录")
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+
+    print(f"📒 任务日志: {args.journal}")
+    for state, count in journal.counts().items():
+        if count:
+            print(f"  • {state}: {count}")
+
+    if args.failed:
+        failed = [record for record in journal.refresh().values() if record.state == JOB_FAILED]
+        if failed:
+            print(f"\n❌ 失败文档:")
+            for record in failed:
+                print(f"  • {pathlib.Path(record.file).name}（{record.attempts} 次）: {record.error}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,251 @@
+"""
+矿山储量核实报告提取运行指标
+
+每次提取记录一条ExtractionMetrics：各阶段耗时（file_read/upload/generation/validation/save等）、
+文件与上传字节数、token用量、重试次数和缓存命中等，提取结束后交给MetricsSink输出：
+- JSONLMetricsSink：每条记录追加为JSONL文件中的一行
+- PrometheusMetricsSink：按Prometheus文本格式累计，可写入node_exporter的textfile目录
+- CallbackMetricsSink / FanoutMetricsSink：转交回调函数 / 同时输出到多个接收端
+
+提取器在当前上下文（CURRENT_METRICS，通过current_metrics()读取）中记录指标，线程池任务需通过contextvars.copy_context()传递；
+调度器重试时设置CURRENT_RETRY_ATTEMPT，指标据此记录重试次数。
+
+用法示例:
+    sink = FanoutMetricsSink([JSONLMetricsSink("metrics.jsonl"), PrometheusMetricsSink("mining_report.prom")])
+    extractor = create_extractor("gemini", "gemini-2.5-flash", metrics_sink=sink, quiet=True)
+    extractor.extract_from_file("report.pdf")
+    print(extractor.last_metrics.spans)
+"""
+import contextvars
+import json
+import os
+import pathlib
+import threading
+from typing import Optional, List, Dict, Any, Tuple
+
+from pydantic import BaseModel
+
+
+# ========== 指标记录 ==========
+# 当前线程（或asyncio任务）正在记录的提取指标；线程池任务需通过contextvars.copy_context()传递
+CURRENT_METRICS: contextvars.ContextVar = contextvars.ContextVar("current_extraction_metrics", default=None)
+# 由调度器在重试时设置，提取指标据此记录重试次数
+CURRENT_RETRY_ATTEMPT: contextvars.ContextVar = contextvars.ContextVar("current_retry_attempt", default=0)
+
+
+def current_metrics() -> Optional["ExtractionMetrics"]:
+    """当前上下文正在记录的提取指标（不在提取过程中时返回None）"""
+    return CURRENT_METRICS.get()
+
+
+def count_pdf_pages(file_path: str) -> Optional[int]:
+    """读取PDF页数（未安装pypdf或读取失败时返回None）"""
+    try:
+        import pypdf
+        return len(pypdf.PdfReader(file_path).pages)
+    except Exception:
+        return None
+
+
+class ExtractionMetrics(BaseModel):
+    """单次提取的运行指标：各阶段耗时、文件与上传字节数、token用量及重试次数"""
+    event: str = "extraction"
+    file: str
+    provider: str
+    model: Optional[str] = None
+    mode: str = "single"
+    status: str = "running"
+    error: Optional[str] = None
+    started_at: float
+    total_seconds: Optional[float] = None
+    spans: Dict[str, float] = {}  # 阶段名 → 累计秒数（file_read/table_parse/dedup/upload/context_cache/generation/validation/save）
+    file_size_bytes: Optional[int] = None
+    page_count: Optional[int] = None
+    upload_bytes: int = 0
+    upload_chunks: int = 0
+    upload_resumed_bytes: int = 0  # 断点续传免于重新发送的字节数
+    upload_seconds_saved: float = 0.0  # 按本次实测上传速率估算的续传节省时间
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_tokens: int = 0
+    context_cache_created: int = 0  # 新建的Gemini上下文缓存数
+    context_cache_reused: int = 0  # 复用的Gemini上下文缓存数（免于读取和上传文档）
+    context_cache_refreshed: int = 0  # 复用时续期的缓存数
+    validation_issues: int = 0  # 首次提取未通过本地校验的问题数（见mining_report_validation.py）
+    reask_requests: int = 0  # 对失败子结构的定向重提请求数
+    escalations: int = 0  # 升级到更强模型的重提轮数
+    dedup_similarity: Optional[float] = None  # 与最相近的已提取报告的估计相似度（见mining_report_dedup.py，无匹配时为None）
+    dedup_reused_pages: int = 0  # 与基线报告相同、沿用基线结果而未发送给模型的页数
+    dedup_changed_pages: int = 0  # 相对基线报告发生变化、发送给模型重新提取的页数
+    retries: int = 0
+    cache_hit: bool = False
+    table_confidence: Optional[float] = None  # 本地资源量表解析的置信度（未启用时为None）
+
+    def add_span(self, stage: str, seconds: float) -> None:
+        """累加阶段耗时（分块、分章节提取会多次进入同一阶段）"""
+        with _METRICS_LOCK:
+            self.spans[stage] = round(self.spans.get(stage, 0.0) + seconds, 6)
+
+    def add(self, **amounts: float) -> None:
+        """累加计数类指标（字节数、请求数、token数、节省秒数）"""
+        with _METRICS_LOCK:
+            for field, amount in amounts.items():
+                setattr(self, field, getattr(self, field) + (amount or 0))
+
+
+_METRICS_LOCK = threading.Lock()
+
+
+# ========== token用量 ==========
+def gemini_usage(response: Any) -> Dict[str, int]:
+    """从Gemini响应的usage_metadata读取token用量"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {
+        "input_tokens": getattr(usage, "prompt_token_count", None) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        "reasoning_tokens": getattr(usage, "thoughts_token_count", None) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+    }
+
+
+def openai_usage(response: Any) -> Dict[str, int]:
+    """从OpenAI Responses API响应的usage读取token用量"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    output_details = getattr(usage, "output_tokens_details", None)
+    input_details = getattr(usage, "input_tokens_details", None)
+    return {
+        "input_tokens": getattr(usage, "input_tokens", None) or 0,
+        "output_tokens": getattr(usage, "output_tokens", None) or 0,
+        "reasoning_tokens": getattr(output_details, "reasoning_tokens", None) or 0,
+        "cached_tokens": getattr(input_details, "cached_tokens", None) or 0,
+    }
+
+
+# ========== 指标输出 ==========
+class MetricsSink:
+    """指标输出接口：emit()接收一条字典形式的指标记录"""
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JSONLMetricsSink(MetricsSink):
+    """将每条指标记录追加为JSONL文件中的一行"""
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class CallbackMetricsSink(MetricsSink):
+    """将指标记录转交给回调函数（如接入已有的监控客户端）"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        self.callback(record)
+
+
+class FanoutMetricsSink(MetricsSink):
+    """将指标记录同时输出到多个接收端"""
+
+    def __init__(self, sinks: List[MetricsSink]):
+        self.sinks = list(sinks)
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+class PrometheusMetricsSink(MetricsSink):
+    """按Prometheus文本格式累计指标
+
+    render()返回当前的文本暴露格式；指定path时每条记录后原子写入该文件，
+    可由node_exporter的textfile收集器采集。
+    """
+
+    PREFIX = "mining_report"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = pathlib.Path(path) if path else None
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def _inc(self, name: str, amount: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        labels = {"provider": str(record.get("provider") or ""), "model": str(record.get("model") or "")}
+        with self._lock:
+            if record.get("event") == "save":
+                self._inc("stage_seconds_total", record.get("seconds", 0.0), stage="save", **labels)
+                self._inc("stage_runs_total", 1, stage="save", **labels)
+                self._inc("saved_bytes_total", record.get("bytes", 0), **labels)
+            else:
+                self._inc("extractions_total", 1, status=record.get("status", ""), **labels)
+                self._inc("extraction_seconds_total", record.get("total_seconds") or 0.0, **labels)
+                for stage, seconds in (record.get("spans") or {}).items():
+                    self._inc("stage_seconds_total", seconds, stage=stage, **labels)
+                    self._inc("stage_runs_total", 1, stage=stage, **labels)
+                self._inc("upload_bytes_total", record.get("upload_bytes", 0), **labels)
+                self._inc("upload_resumed_bytes_total", record.get("upload_resumed_bytes", 0), **labels)
+                self._inc("upload_seconds_saved_total", record.get("upload_seconds_saved", 0.0), **labels)
+                self._inc("requests_total", record.get("requests", 0), **labels)
+                self._inc("retries_total", record.get("retries", 0), **labels)
+                self._inc("cache_hits_total", 1 if record.get("cache_hit") else 0, **labels)
+                self._inc("validation_issues_total", record.get("validation_issues", 0), **labels)
+                self._inc("reask_requests_total", record.get("reask_requests", 0), **labels)
+                self._inc("escalations_total", record.get("escalations", 0), **labels)
+                for kind in ("reused", "changed"):
+                    self._inc("dedup_pages_total", record.get(f"dedup_{kind}_pages", 0), kind=kind, **labels)
+                for action in ("created", "reused", "refreshed"):
+                    self._inc("context_cache_total", record.get(f"context_cache_{action}", 0), action=action, **labels)
+                for kind in ("input", "output", "reasoning", "cached"):
+                    self._inc("tokens_total", record.get(f"{kind}_tokens", 0), type=kind, **labels)
+            text = self._render_locked()
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(text, encoding="utf-8")
+            os.replace(tmp_path, self.path)
+
+    def _render_locked(self) -> str:
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            metric = f"{self.PREFIX}_{name}"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(
+                '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels
+            )
+            lines.append(f"{metric}{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def render(self) -> str:
+        """返回Prometheus文本暴露格式"""
+        with self._lock:
+            return self._render_locked()
@@ -0,0 +1,462 @@
+"""
+矿山储量核实报告数值规范化（批量）
+
+将提取结果中的自由文本数值（如"23.5万吨"、"965公斤"、"4.11克/吨"、"6%"、"平均1.2米"、
+"二〇一八年六月"）批量解析为规范数值列：
+- 矿石量 → 吨
+- 金属量 → 千克
+- 品位 → 克/吨 或 %（分别存放）
+- 长度/宽度/厚度 → 米
+- 日期 → ISO格式（YYYY、YYYY-MM 或 YYYY-MM-DD）
+
+每列同时保留原始字符串和解析置信度（exact/approx/failed）。解析使用预编译正则和单位换算表，
+对重复字符串去重后只解析一次；安装numpy时数值列为float64数组（失败为NaN），并使用numpy汇总。
+
+用法示例:
+    from mining_report_normalize import resource_table, sum_resource_categories
+    table = resource_table(reports)                # reports为MiningReport或其字典列表
+    totals = sum_resource_categories(table)        # {(矿种, 类别): {"ore_tonnes": ..., "metal_kg": ...}}
+
+    python mining_report_normalize.py results/ --csv resources.csv
+"""
+import argparse
+import csv
+import glob
+import json
+import math
+import pathlib
+import re
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Callable, NamedTuple, Union
+
+from mining_report_extractor_stream import (
+    MiningReport,
+    normalize_mineral_name,
+    normalize_ore_body_id,
+)
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时使用Python列表
+    np = None
+
+
+CONFIDENCE_EXACT = "exact"    # 字符串恰好为"数值+单位"
+CONFIDENCE_APPROX = "approx"  # 含修饰词（约、平均、以上）、范围或多余文字，取首个/中间值
+CONFIDENCE_FAILED = "failed"  # 无法解析
+
+RESOURCE_CATEGORIES = ["推断资源量", "控制资源量", "探明资源量", "总计"]
+
+# 省级行政区简称（用于从矿权位置中识别省份）
+PROVINCES = [
+    "北京", "天津", "上海", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江", "江苏", "浙江", "安徽", "福建",
+    "江西", "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西", "甘肃", "青海",
+    "台湾", "内蒙古", "广西", "西藏", "宁夏", "新疆", "香港", "澳门",
+]
+
+# ========== 单位换算表 ==========
+# 质量单位 → 吨（与mining_report_tables.ORE_UNITS识别的写法保持一致，含"×10⁴t"等科学计数写法）
+MASS_UNITS_TONNES: Dict[str, float] = {
+    "亿吨": 1e8, "万吨": 1e4, "千吨": 1e3, "百万吨": 1e6, "吨": 1.0,
+    "亿t": 1e8, "万t": 1e4, "Mt": 1e6, "kt": 1e3, "t": 1.0,
+    "×10⁴t": 1e4, "10⁴t": 1e4, "×10⁴吨": 1e4, "10⁴吨": 1e4,
+    "千克": 1e-3, "公斤": 1e-3, "kg": 1e-3,
+    "克": 1e-6, "g": 1e-6,
+    "万盎司": 1e4 * 31.1034768e-6, "盎司": 31.1034768e-6, "oz": 31.1034768e-6,
+}
+# 品位单位 → (规范单位, 换算系数)
+GRADE_UNITS: Dict[str, Tuple[str, float]] = {
+    "克/吨": ("g/t", 1.0), "克每吨": ("g/t", 1.0), "g/t": ("g/t", 1.0), "克/t": ("g/t", 1.0),
+    "×10⁻⁶": ("g/t", 1.0), "×10-6": ("g/t", 1.0), "ppm": ("g/t", 1.0),
+    "千克/吨": ("g/t", 1000.0), "kg/t": ("g/t", 1000.0),
+    "%": ("%", 1.0), "％": ("%", 1.0),
+}
+# 长度单位 → 米
+LENGTH_UNITS_METRES: Dict[str, float] = {
+    "千米": 1000.0, "公里": 1000.0, "km": 1000.0,
+    "米": 1.0, "m": 1.0,
+    "厘米": 0.01, "cm": 0.01,
+}
+
+# ========== 预编译正则 ==========
+_FULLWIDTH = str.maketrans("０１２３４５６７８９．，～－／：", "0123456789.,~-/:")
+_NUMBER = r"\d+(?:\.\d+)?"
+_RANGE_SEPARATORS = r"[-~至到]"
+_APPROX_WORDS = re.compile(r"约|平均|大于|小于|以上|以下|左右|不足|超过|近|逾|>|<|≥|≤")
+
+
+def _unit_alternation(units: Iterable[str]) -> str:
+    # 长单位优先匹配（"万吨"先于"吨"，"kg/t"先于"kg"）
+    return "|".join(re.escape(unit) for unit in sorted(units, key=len, reverse=True))
+
+
+class _QuantityPattern(NamedTuple):
+    """"数值(+范围)+单位"的预编译正则，及小写单位到换算表键的映射（匹配不区分大小写）"""
+    pattern: "re.Pattern"
+    units: Dict[str, str]
+
+
+def _quantity_pattern(units: Iterable[str]) -> _QuantityPattern:
+    units = list(units)
+    pattern = re.compile(
+        rf"(?P<low>{_NUMBER})(?:\s*{_RANGE_SEPARATORS}\s*(?P<high>{_NUMBER}))?\s*(?P<unit>{_unit_alternation(units)})",
+        re.IGNORECASE,
+    )
+    return _QuantityPattern(pattern, {unit.lower(): unit for unit in units})
+
+
+_MASS_PATTERN = _quantity_pattern(MASS_UNITS_TONNES)
+_GRADE_PATTERN = _quantity_pattern(GRADE_UNITS)
+_LENGTH_PATTERN = _quantity_pattern(LENGTH_UNITS_METRES)
+
+_PROVINCE_PATTERN = re.compile("|".join(sorted(PROVINCES, key=len, reverse=True)))
+
+_CHINESE_DIGITS = {"〇": 0, "零": 0, "○": 0, "О": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+                   "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CHINESE_NUMBER = re.compile(r"[〇零○О一二两三四五六七八九十]+")
+_DATE_PATTERN = re.compile(
+    r"(?P<year>(?:19|20)\d{2})\s*(?:年|[.\-/])\s*(?:(?P<month>\d{1,2})\s*(?:月|[.\-/])?\s*(?:(?P<day>\d{1,2})\s*日?)?)?"
+)
+_COMPACT_DATE_PATTERN = re.compile(r"(?<!\d)(?P<year>(?:19|20)\d{2})(?P<month>[01]\d)(?P<day>[0-3]\d)(?!\d)")
+_YEAR_ONLY_PATTERN = re.compile(r"(?<!\d)(?P<year>(?:19|20)\d{2})(?!\d)")
+
+
+# ========== 单值解析 ==========
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", "", text.translate(_FULLWIDTH)).replace(",", "")
+
+
+def _match_quantity(quantity: _QuantityPattern, text: Optional[str]) -> Tuple[Optional[float], Optional[str], str]:
+    """匹配"数值(+范围)+单位"，返回(数值, 换算表中的单位, 置信度)；范围取中间值"""
+    if not text:
+        return None, None, CONFIDENCE_FAILED
+    cleaned = _clean(text)
+    match = quantity.pattern.search(cleaned)
+    if match is None:
+        return None, None, CONFIDENCE_FAILED
+    low = float(match.group("low"))
+    high = match.group("high")
+    value = (low + float(high)) / 2 if high else low
+    unit = quantity.units[match.group("unit").lower()]
+    exact = match.group(0) == cleaned and not high and not _APPROX_WORDS.search(cleaned)
+    return value, unit, CONFIDENCE_EXACT if exact else CONFIDENCE_APPROX
+
+
+def parse_tonnes(text: Optional[str]) -> Tuple[float, str]:
+    """解析质量（矿石量）为吨，返回(数值, 置信度)，失败时数值为NaN"""
+    value, unit, confidence = _match_quantity(_MASS_PATTERN, text)
+    if value is None:
+        return math.nan, confidence
+    return value * MASS_UNITS_TONNES[unit], confidence
+
+
+def parse_metal_kg(text: Optional[str]) -> Tuple[float, str]:
+    """解析金属量为千克，返回(数值, 置信度)，失败时数值为NaN"""
+    tonnes, confidence = parse_tonnes(text)
+    return tonnes * 1000.0, confidence
+
+
+def parse_grade(text: Optional[str]) -> Tuple[float, Optional[str], str]:
+    """解析品位，返回(数值, 规范单位g/t或%, 置信度)，失败时数值为NaN"""
+    value, unit, confidence = _match_quantity(_GRADE_PATTERN, text)
+    if value is None:
+        return math.nan, None, confidence
+    canonical_unit, factor = GRADE_UNITS[unit]
+    return value * factor, canonical_unit, confidence
+
+
+def parse_metres(text: Optional[str]) -> Tuple[float, str]:
+    """解析长度（长度、宽度、厚度、海拔）为米，返回(数值, 置信度)，失败时数值为NaN"""
+    value, unit, confidence = _match_quantity(_LENGTH_PATTERN, text)
+    if value is None:
+        return math.nan, confidence
+    return value * LENGTH_UNITS_METRES[unit], confidence
+
+
+def parse_province(text: Optional[str]) -> Optional[str]:
+    """从矿权位置等地址文本中识别省级行政区（返回简称，如"四川"）"""
+    if not text:
+        return None
+    match = _PROVINCE_PATTERN.search(text)
+    return match.group(0) if match else None
+
+
+def _chinese_to_arabic(match: "re.Match") -> str:
+    """中文数字转阿拉伯数字：含"十"时按位值（二十三 → 23），否则逐位转换（二〇一八 → 2018）"""
+    text = match.group(0)
+    if "十" not in text:
+        return "".join(str(_CHINESE_DIGITS[ch]) for ch in text)
+    tens, _, ones = text.partition("十")
+    return str((_CHINESE_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CHINESE_DIGITS.get(ones, 0) if ones else 0))
+
+
+def parse_date(text: Optional[str]) -> Tuple[Optional[str], str]:
+    """解析日期为ISO格式（精确到年、月或日），返回(ISO字符串, 置信度)"""
+    if not text:
+        return None, CONFIDENCE_FAILED
+    cleaned = _CHINESE_NUMBER.sub(_chinese_to_arabic, _clean(text))
+    match = _DATE_PATTERN.search(cleaned) or _COMPACT_DATE_PATTERN.search(cleaned)
+    if match is None:
+        match = _YEAR_ONLY_PATTERN.search(cleaned)
+        if match is None:
+            return None, CONFIDENCE_FAILED
+        return match.group("year"), CONFIDENCE_APPROX
+
+    year = int(match.group("year"))
+    month = int(match.group("month")) if match.group("month") else None
+    day = int(match.group("day")) if match.group("day") else None
+    if month is not None and not 1 <= month <= 12:
+        return str(year), CONFIDENCE_APPROX
+    if day is not None and not 1 <= day <= 31:
+        day = None
+    iso = f"{year:04d}" + (f"-{month:02d}" if month else "") + (f"-{day:02d}" if month and day else "")
+    exact = match.group(0).rstrip("./-") == cleaned.rstrip("./-") and month is not None
+    return iso, CONFIDENCE_EXACT if exact else CONFIDENCE_APPROX
+
+
+# ========== 批量解析 ==========
+class NormalizedColumn(NamedTuple):
+    """规范化后的一列：数值（numpy数组或列表，失败为NaN/None）、原始字符串、置信度，品位列附带单位"""
+    values: Any
+    original: List[Optional[str]]
+    confidence: List[str]
+    units: Optional[List[Optional[str]]] = None
+
+
+def _as_array(values: List[float]) -> Any:
+    return values if np is None else np.asarray(values, dtype=np.float64)
+
+
+def _parse_unique(texts: List[Optional[str]], parser: Callable[[Optional[str]], Tuple]) -> List[Tuple]:
+    """逐项解析，相同字符串只解析一次（报告中的数值和单位写法高度重复）"""
+    parsed: Dict[Optional[str], Tuple] = {}
+    for text in texts:
+        if text not in parsed:
+            parsed[text] = parser(text)
+    return [parsed[text] for text in texts]
+
+
+def _numeric_column(texts: List[Optional[str]], parser: Callable[[Optional[str]], Tuple[float, str]]) -> NormalizedColumn:
+    rows = _parse_unique(texts, parser)
+    return NormalizedColumn(_as_array([value for value, _ in rows]), list(texts),
+                            [confidence for _, confidence in rows])
+
+
+def normalize_tonnes(texts: List[Optional[str]]) -> NormalizedColumn:
+    """批量解析矿石量为吨"""
+    return _numeric_column(texts, parse_tonnes)
+
+
+def normalize_metal_kg(texts: List[Optional[str]]) -> NormalizedColumn:
+    """批量解析金属量为千克"""
+    return _numeric_column(texts, parse_metal_kg)
+
+
+def normalize_metres(texts: List[Optional[str]]) -> NormalizedColumn:
+    """批量解析长度为米"""
+    return _numeric_column(texts, parse_metres)
+
+
+def normalize_grades(texts: List[Optional[str]]) -> NormalizedColumn:
+    """批量解析品位，units列为g/t或%"""
+    rows = _parse_unique(texts, parse_grade)
+    return NormalizedColumn(_as_array([value for value, _, _ in rows]), list(texts),
+                            [confidence for _, _, confidence in rows], [unit for _, unit, _ in rows])
+
+
+def normalize_dates(texts: List[Optional[str]]) -> NormalizedColumn:
+    """批量解析日期，values为ISO字符串列表（失败为None）"""
+    rows = _parse_unique(texts, parse_date)
+    return NormalizedColumn([iso for iso, _ in rows], list(texts), [confidence for _, confidence in rows])
+
+
+# ========== 报告级表格 ==========
+ReportLike = Union[MiningReport, Dict[str, Any]]
+
+
+def _as_report(report: ReportLike) -> MiningReport:
+    return report if isinstance(report, MiningReport) else MiningReport.model_validate(report)
+
+
+def resource_table(reports: Iterable[ReportLike]) -> Dict[str, Any]:
+    """将资源量展开为"报告 × 矿种 × 资源量类别"的列式表
+
+    返回的字典包含 report_index、矿种、类别 以及 ore_tonnes、metal_kg、grade 三个NormalizedColumn。
+    """
+    report_index: List[int] = []
+    minerals: List[str] = []
+    categories: List[str] = []
+    ores: List[Optional[str]] = []
+    metals: List[Optional[str]] = []
+    grades: List[Optional[str]] = []
+    for index, report in enumerate(reports):
+        for resource in _as_report(report).资源信息 or []:
+            quantities = resource.资源量情况
+            if quantities is None:
+                continue
+            mineral = normalize_mineral_name(resource.矿种)
+            for category in RESOURCE_CATEGORIES:
+                detail = getattr(quantities, category)
+                if detail is None:
+                    continue
+                report_index.append(index)
+                minerals.append(mineral)
+                categories.append(category)
+                ores.append(detail.矿石量)
+                metals.append(detail.金属量)
+                grades.append(detail.品位)
+    return {
+        "report_index": report_index,
+        "矿种": minerals,
+        "类别": categories,
+        "ore_tonnes": normalize_tonnes(ores),
+        "metal_kg": normalize_metal_kg(metals),
+        "grade": normalize_grades(grades),
+    }
+
+
+def ore_body_table(reports: Iterable[ReportLike]) -> Dict[str, Any]:
+    """将矿体分布展开为"报告 × 矿体"的列式表（尺寸为米，矿石量为吨，金属量为千克）"""
+    report_index: List[int] = []
+    ore_body_ids: List[str] = []
+    fields: Dict[str, List[Optional[str]]] = {name: [] for name in
+                                               ("矿体长度", "矿体宽度", "矿体厚度", "矿体矿石量", "矿体金属量", "矿体品位")}
+    for index, report in enumerate(reports):
+        for ore_body in _as_report(report).矿体分布 or []:
+            report_index.append(index)
+            ore_body_ids.append(normalize_ore_body_id(ore_body.矿体编号))
+            for name, values in fields.items():
+                values.append(getattr(ore_body, name))
+    return {
+        "report_index": report_index,
+        "矿体编号": ore_body_ids,
+        "length_m": normalize_metres(fields["矿体长度"]),
+        "width_m": normalize_metres(fields["矿体宽度"]),
+        "thickness_m": normalize_metres(fields["矿体厚度"]),
+        "ore_tonnes": normalize_tonnes(fields["矿体矿石量"]),
+        "metal_kg": normalize_metal_kg(fields["矿体金属量"]),
+        "grade": normalize_grades(fields["矿体品位"]),
+    }
+
+
+def date_table(reports: Iterable[ReportLike]) -> Dict[str, NormalizedColumn]:
+    """报告编制日期和矿权起止日期的ISO规范化列"""
+    compiled: List[Optional[str]] = []
+    starts: List[Optional[str]] = []
+    ends: List[Optional[str]] = []
+    for report in reports:
+        report = _as_report(report)
+        compiled.append(report.报告信息.编制日期 if report.报告信息 else None)
+        starts.append(report.矿权信息.矿权起始日期 if report.矿权信息 else None)
+        ends.append(report.矿权信息.矿权截止日期 if report.矿权信息 else None)
+    return {"编制日期": normalize_dates(compiled), "矿权起始日期": normalize_dates(starts),
+            "矿权截止日期": normalize_dates(ends)}
+
+
+def sum_resource_categories(table: Dict[str, Any],
+                            min_confidence: str = CONFIDENCE_APPROX) -> Dict[Tuple[str, str], Dict[str, float]]:
+    """按(矿种, 类别)汇总矿石量（吨）和金属量（千克），跳过NaN和低于min_confidence的值"""
+    accepted = {CONFIDENCE_EXACT} if min_confidence == CONFIDENCE_EXACT else {CONFIDENCE_EXACT, CONFIDENCE_APPROX}
+    keys = list(zip(table["矿种"], table["类别"]))
+    groups: Dict[Tuple[str, str], int] = {}
+    codes = [groups.setdefault(key, len(groups)) for key in keys]
+    totals: Dict[Tuple[str, str], Dict[str, float]] = {key: {} for key in groups}
+
+    for field in ("ore_tonnes", "metal_kg"):
+        column: NormalizedColumn = table[field]
+        if np is not None:
+            mask = np.isin(np.asarray(column.confidence, dtype=object), list(accepted)) & ~np.isnan(column.values)
+            sums = np.bincount(np.asarray(codes, dtype=np.int64)[mask], weights=column.values[mask],
+                               minlength=len(groups))
+            for key, code in groups.items():
+                totals[key][field] = float(sums[code])
+        else:
+            sums = [0.0] * len(groups)
+            for code, value, confidence in zip(codes, column.values, column.confidence):
+                if confidence in accepted and not math.isnan(value):
+                    sums[code] += value
+            for key, code in groups.items():
+                totals[key][field] = sums[code]
+    return totals
+
+
+def table_rows(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """将列式表转换为行字典（NormalizedColumn展开为 数值、原文、置信度 三列），便于导出CSV"""
+    rows = []
+    length = len(table["report_index"])
+    for i in range(length):
+        row: Dict[str, Any] = {}
+        for name, column in table.items():
+            if isinstance(column, NormalizedColumn):
+                value = column.values[i]
+                if isinstance(value, float) or (np is not None and isinstance(value, np.floating)):
+                    value = None if math.isnan(value) else float(value)
+                row[name] = value
+                if column.units is not None:
+                    row[f"{name}_unit"] = column.units[i]
+                row[f"{name}_original"] = column.original[i]
+                row[f"{name}_confidence"] = column.confidence[i]
+            else:
+                row[name] = column[i]
+        rows.append(row)
+    return rows
+
+
+# ========== 命令行入口 ==========
+def load_reports(source: str) -> Tuple[List[str], List[MiningReport]]:
+    """从结果JSON文件、目录或glob模式加载提取结果（batch_summary.json等非结果文件会被跳过）"""
+    path = pathlib.Path(source)
+    if path.is_dir():
+        files = sorted(path.glob("*.json"))
+    elif path.is_file():
+        files = [path]
+    else:
+        files = sorted(pathlib.Path(p) for p in glob.glob(source, recursive=True))
+    names, reports = [], []
+    for file in files:
+        try:
+            data = json.loads(file.read_text(encoding="utf-8"))
+            if isinstance(data, dict) and set(data) & set(MiningReport.model_fields):
+                reports.append(MiningReport.model_validate(data))
+                names.append(str(file))
+        except (OSError, ValueError):
+            continue
+    return names, reports
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """汇总提取结果中各矿种、各类别的资源量"""
+    parser = argparse.ArgumentParser(description="矿山储量核实报告数值规范化与资源量汇总")
+    parser.add_argument("source", help="结果JSON目录、glob模式或单个文件")
+    parser.add_argument("--csv", help="导出规范化后的资源量明细CSV")
+    parser.add_argument("--exact-only", action="store_true", help="汇总时仅使用完全匹配的数值")
+    args = parser.parse_args(argv)
+
+    names, reports = load_reports(args.source)
+    if not reports:
+        print(f"❌ 未找到提取结果: {args.source}")
+        return 1
+
+    table = resource_table(reports)
+    totals = sum_resource_categories(table, CONFIDENCE_EXACT if args.exact_only else CONFIDENCE_APPROX)
+    failed = sum(confidence == CONFIDENCE_FAILED and original
+                 for field in ("ore_tonnes", "metal_kg")
+                 for original, confidence in zip(table[field].original, table[field].confidence))
+
+    print(f"📊 共 {len(reports)} 份报告，{len(table['report_index'])} 条资源量记录，{failed} 个数值无法解析")
+    for (mineral, category), values in sorted(totals.items()):
+        print(f"  • {mineral} {category}: 矿石量 {values['ore_tonnes']:,.1f} 吨，金属量 {values['metal_kg']:,.1f} 千克")
+
+    if args.csv:
+        rows = table_rows(table)
+        for row in rows:
+            row["report_index"] = names[row["report_index"]]
+        with open(args.csv, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["report_index"])
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"✅ 明细已保存到: {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+"""
+矿山储量核实报告页面相关性预筛选
+
+200多页的报告中，提取字段通常只来自封面、矿权章节、资源量汇总表和矿体描述表等少数页面。
+PageSelector在上传前读取PDF文本层，按EXTRACTION_PROMPT中各字段对应的关键词和资源量编码为每页打分，
+只将得分最高的页面（始终包含封面、扉页）写入精简PDF发送，减少上传字节数、输入token和延迟。
+页数不超过预算、缺少文本层（扫描件）或没有页面命中关键词时回退为完整文档。需要安装pypdf。
+
+用法示例:
+    selector = PageSelector(page_budget=30)
+    extractor = create_extractor("gemini", "gemini-2.5-flash", page_selector=selector)
+    result = extractor.extract_from_file("large_report.pdf")
+
+    pages = selector.select_pages("large_report.pdf")   # 保留的页码（从0开始），None表示使用完整文档
+
+split_pdf_pages按页码范围将PDF拆分为相邻重叠的临时文件，供分块提取（extract_chunked）逐块请求后合并。
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Optional, List, Dict, Any, Tuple
+
+
+# ========== 关键词与资源量编码 ==========
+# 关键词及权重，取自EXTRACTION_PROMPT中各字段对应的报告章节
+PAGE_KEYWORDS: Dict[str, float] = {
+    # 报告信息（封面、扉页）
+    "报告": 0.5, "编制单位": 3.0, "编制日期": 2.0, "委托": 1.0, "提交单位": 2.0,
+    # 矿权信息
+    "矿权": 2.0, "探矿权": 2.0, "采矿权": 2.0, "勘查许可证": 3.0, "采矿许可证": 3.0,
+    "证号": 2.0, "有效期": 2.0, "勘查程度": 2.0, "普查": 1.0, "详查": 1.0, "勘探": 1.0,
+    "生产规模": 2.0, "矿区面积": 2.0, "海拔": 1.0, "以往地质工作": 2.0, "以往勘查": 2.0,
+    # 资源信息
+    "资源量": 2.0, "储量": 1.5, "保有": 2.0, "推断": 1.5, "控制": 1.0, "探明": 1.5,
+    "矿石量": 3.0, "金属量": 3.0, "品位": 2.0, "伴生": 1.5, "估算结果": 3.0, "汇总表": 2.0,
+    # 矿体分布
+    "矿体": 1.5, "矿体编号": 3.0, "长度": 0.5, "厚度": 1.0, "走向": 1.0, "倾角": 1.0,
+}
+# 资源量类别编码：333/332/331 及 1、2开头的编码（如111、122b、2S22）
+RESOURCE_CODE_PATTERN = re.compile(r"(?<![\d.])(?:33[123]|[12][12]{2}b?|2S2[12])(?![\d.])")
+RESOURCE_CODE_WEIGHT = 4.0
+
+
+# ========== 页面预筛选 ==========
+class PageSelector:
+    """基于PDF文本层的本地页面相关性预筛选
+
+    按EXTRACTION_PROMPT中的关键词和资源量编码为每页打分，保留得分最高的页面生成精简PDF，
+    以减少上传字节数、输入token和延迟。页数不超过预算、缺少文本层（扫描件）
+    或没有页面命中关键词时回退为完整文档。
+    """
+
+    def __init__(self, page_budget: int = 30, head_pages: int = 3, min_chars_per_page: int = 20,
+                 keywords: Optional[Dict[str, float]] = None):
+        try:
+            import pypdf
+            self.pypdf = pypdf
+        except ImportError:
+            raise ImportError("请安装必需包: pip install pypdf")
+
+        self.page_budget = page_budget
+        self.head_pages = head_pages  # 封面、扉页总是保留
+        self.min_chars_per_page = min_chars_per_page
+        self.keywords = keywords or PAGE_KEYWORDS
+
+    @property
+    def options_key(self) -> str:
+        """影响选页结果的全部参数，用于区分结果缓存"""
+        keywords = json.dumps(sorted(self.keywords.items()), ensure_ascii=False)
+        digest = hashlib.sha256(keywords.encode("utf-8")).hexdigest()[:12]
+        return (f"pages={self.page_budget},head={self.head_pages},"
+                f"chars={self.min_chars_per_page},keywords={digest}")
+
+    def score_text(self, text: str) -> float:
+        """计算单页文本的相关性得分"""
+        score = sum(weight * text.count(keyword) for keyword, weight in self.keywords.items())
+        score += RESOURCE_CODE_WEIGHT * len(RESOURCE_CODE_PATTERN.findall(text))
+        return score
+
+    def select_pages(self, file_path: str, reader: Optional[Any] = None) -> Optional[List[int]]:
+        """返回需要保留的页码（从0开始，按原顺序），应使用完整文档时返回None（可传入已打开的PdfReader）"""
+        reader = reader or self.pypdf.PdfReader(file_path)
+        page_count = len(reader.pages)
+        if page_count <= self.page_budget:
+            return None
+
+        texts = []
+        for page in reader.pages:
+            try:
+                texts.append(page.extract_text() or "")
+            except Exception:
+                texts.append("")
+
+        # 文本层过少视为扫描件，无法可靠打分
+        if sum(len(text.strip()) for text in texts) < self.min_chars_per_page * page_count:
+            return None
+
+        scores = [self.score_text(text) for text in texts]
+        head = list(range(min(self.head_pages, page_count)))
+        ranked = sorted(
+            (i for i in range(page_count) if i not in head and scores[i] > 0),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+        if not ranked:
+            return None
+
+        return sorted(head + ranked[:max(0, self.page_budget - len(head))])
+
+    def build_trimmed_pdf(self, file_path: str) -> Optional[Tuple[str, List[int], int]]:
+        """生成仅包含相关页面的临时PDF，返回(临时PDF路径, 保留的页码, 总页数)，应使用完整文档时返回None
+
+        打分和写出共用同一个PdfReader，PDF只解析一次。
+        """
+        reader = self.pypdf.PdfReader(file_path)
+        pages = self.select_pages(file_path, reader)
+        if pages is None:
+            return None
+
+        trimmed_path, total_pages = write_pdf_pages(file_path, pages, prefix="trimmed_", reader=reader)
+        return trimmed_path, pages, total_pages
+
+
+# ========== 页面写出与拆分 ==========
+def write_pdf_pages(file_path: str, pages: List[int], prefix: str = "pages_",
+                    reader: Optional[Any] = None) -> Tuple[str, int]:
+    """将指定页面（从0开始，按给定顺序）写入临时PDF，返回(临时PDF路径, 原文档总页数)（可传入已打开的PdfReader）"""
+    try:
+        import pypdf
+    except ImportError:
+        raise ImportError("请安装必需包: pip install pypdf")
+
+    reader = reader or pypdf.PdfReader(file_path)
+    writer = pypdf.PdfWriter()
+    for page_index in pages:
+        writer.add_page(reader.pages[page_index])
+
+    fd, output_path = tempfile.mkstemp(prefix=prefix, suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        writer.write(f)
+    return output_path, len(reader.pages)
+
+
+def split_pdf_pages(file_path: str, pages_per_chunk: int,
+                    overlap_pages: int = 1) -> Tuple[int, List[Tuple[Tuple[int, int], str]]]:
+    """按页码范围将PDF拆分为多个临时文件
+
+    返回(总页数, [((起始页, 结束页), 临时文件路径), ...])，页码从0开始、左闭右开。
+    相邻片段重叠overlap_pages页，避免跨页表格被截断。总页数不超过pages_per_chunk时不拆分。
+    """
+    try:
+        import pypdf
+    except ImportError:
+        raise ImportError("请安装必需包: pip install pypdf")
+
+    reader = pypdf.PdfReader(file_path)
+    total_pages = len(reader.pages)
+    if total_pages <= pages_per_chunk:
+        return total_pages, []
+
+    step = max(1, pages_per_chunk - overlap_pages)
+    chunks = []
+    for start in range(0, total_pages, step):
+        end = min(start + pages_per_chunk, total_pages)
+        chunk_path, _ = write_pdf_pages(file_path, list(range(start, end)), prefix=f"chunk_{start + 1}-{end}_",
+                                        reader=reader)
+        chunks.append(((start, end), chunk_path))
+        if end == total_pages:
+            break
+    return total_pages, chunks
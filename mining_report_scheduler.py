@@ -0,0 +1,282 @@
+"""
+矿山储量核实报告提取任务调度器（限速与重试）
+
+位于提取器与服务商调用之间（传给create_extractor的scheduler参数，逐个模型请求排队和重试）：
+- 按提供商、按模型分别维护请求数（RPM）和估算token数（TPM）令牌桶
+- 优先级队列：交互任务优先于批量回填任务获得配额。优先级只在同一"提供商/模型"的队列内生效：
+  不同模型的请求各自排队，互不抢占；同一提供商的各模型共享提供商级令牌桶时按到达顺序竞争
+- 429/5xx等可重试错误使用带抖动的指数退避，并遵守Retry-After；
+  限速错误会暂停该模型的令牌桶，避免所有任务同时重试（惊群）
+
+分块、分章节、校验重提取等模式一次提取会发出多个请求，每个请求分别计入配额，
+使用其它模型的请求（如分章节的fast_model、模型升级阶梯）计入该模型的队列和令牌桶。
+
+用法示例:
+    scheduler = ExtractionScheduler({"gemini": RateLimit(rpm=1000, tpm=4_000_000),
+                                     "gemini/gemini-2.5-pro": RateLimit(rpm=150, tpm=2_000_000)})
+    extractor = create_extractor("gemini", "gemini-2.5-pro", scheduler=scheduler, priority=PRIORITY_INTERACTIVE)
+    result = extractor.extract_from_file("report.pdf")
+"""
+import email.utils
+import heapq
+import itertools
+import pathlib
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Callable, NamedTuple, Tuple
+
+from mining_report_metrics import CURRENT_RETRY_ATTEMPT
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKFILL = 10
+
+# 估算token：PDF每页约数百token（Gemini按页计258 token，另含文本层），另加提示词和输出
+PDF_TOKENS_PER_PAGE = 560
+PROMPT_TOKENS = 2000
+OUTPUT_TOKENS = 4000
+BYTES_PER_PAGE_FALLBACK = 100 * 1024  # 无法读取页数时按文件大小估算
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimit(NamedTuple):
+    """每分钟请求数和每分钟token数上限（None表示不限制）"""
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+
+
+# 默认配额（按账户等级调整）；键为"提供商"或"提供商/模型"
+DEFAULT_RATE_LIMITS: Dict[str, RateLimit] = {
+    "gemini/gemini-2.5-flash": RateLimit(rpm=1000, tpm=1_000_000),
+    "gemini/gemini-2.5-pro": RateLimit(rpm=150, tpm=2_000_000),
+    "openai/o4-mini": RateLimit(rpm=1000, tpm=2_000_000),
+    "openai/o3": RateLimit(rpm=500, tpm=1_000_000),
+    "openai/gpt-4.1-nano": RateLimit(rpm=5000, tpm=4_000_000),
+}
+
+
+# ========== 令牌桶 ==========
+class TokenBucket:
+    """令牌桶：容量为一分钟配额，按配额/60每秒匀速补充（非线程安全，由调度器加锁）"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """获取amount个令牌需要等待的秒数（超过容量的请求按容量计，避免永远无法满足）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Limiter:
+    """单个提供商或模型的请求数/token数令牌桶，以及限速错误后的暂停时间"""
+
+    def __init__(self, limit: RateLimit):
+        self.requests = TokenBucket(limit.rpm) if limit.rpm else None
+        self.tokens = TokenBucket(limit.tpm) if limit.tpm else None
+        self.blocked_until = 0.0
+
+    def wait_time(self, requests: int, tokens: int) -> float:
+        wait = max(0.0, self.blocked_until - time.monotonic())
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(requests))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def consume(self, requests: int, tokens: int) -> None:
+        if self.requests:
+            self.requests.consume(requests)
+        if self.tokens:
+            self.tokens.consume(tokens)
+
+
+# ========== 错误分类与退避 ==========
+def estimate_tokens(file_path: Optional[str]) -> int:
+    """根据PDF页数（或文件大小）估算单次提取消耗的token数"""
+    if not file_path:
+        return PROMPT_TOKENS + OUTPUT_TOKENS
+    stat = pathlib.Path(file_path).stat()
+    return _estimate_file_tokens(str(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=256)
+def _estimate_file_tokens(file_path: str, size: int, mtime_ns: int) -> int:
+    """按(路径, 大小, 修改时间)缓存估算结果，同一报告的多个请求只读取一次页数"""
+    try:
+        import pypdf
+        page_count = len(pypdf.PdfReader(file_path).pages)
+    except Exception:
+        page_count = max(1, size // BYTES_PER_PAGE_FALLBACK)
+    return int(page_count * PDF_TOKENS_PER_PAGE + PROMPT_TOKENS + OUTPUT_TOKENS)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> Tuple[bool, Optional[int], Optional[float]]:
+    """判断服务商异常是否可重试，返回(可重试, HTTP状态码, Retry-After秒数)
+
+    兼容OpenAI（status_code/response.headers）和Gemini（code/response.headers）的异常类型，
+    网络超时、连接中断按可重试处理。
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    status = status if isinstance(status, int) else None
+
+    retry_after = None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        retry_after = _parse_retry_after(headers.get("retry-after"))
+
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES, status, retry_after
+    name = type(error).__name__
+    transient = any(word in name for word in ("Timeout", "Connect", "RemoteProtocol", "ReadError", "WriteError"))
+    return transient, None, retry_after
+
+
+# ========== 调度器 ==========
+class ExtractionScheduler:
+    """提供商感知的限速与重试调度器
+
+    run()在调用线程中执行任务：先按优先级排队获取配额，再调用任务函数，
+    遇到可重试错误时退避后重新排队；acquire()只排队获取配额（用于无法重试的流式请求）；
+    submit()使用内部线程池异步执行并返回Future。优先级在每个"提供商/模型"队列内比较。
+    """
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None, max_retries: int = 5,
+                 base_delay: float = 2.0, max_delay: float = 120.0, max_workers: int = 8, quiet: bool = False):
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+        self.quiet = quiet
+        self._cond = threading.Condition()
+        self._limiters: Dict[str, _Limiter] = {}
+        self._queues: Dict[str, List[Tuple[int, int]]] = {}
+        self._seq = itertools.count()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _limiters_for(self, provider: str, model: str) -> List[_Limiter]:
+        limiters = []
+        for key in (provider, f"{provider}/{model}"):
+            if key in self.limits:
+                if key not in self._limiters:
+                    self._limiters[key] = _Limiter(self.limits[key])
+                limiters.append(self._limiters[key])
+        return limiters
+
+    def _acquire(self, provider: str, model: str, priority: int, requests: int, tokens: int) -> None:
+        """在该提供商/模型的队列中按优先级排队，轮到本任务且提供商、模型两级令牌桶都满足时扣减配额"""
+        queue_key = f"{provider}/{model}"
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            queue = self._queues.setdefault(queue_key, [])
+            heapq.heappush(queue, ticket)
+            try:
+                while True:
+                    if queue[0] == ticket:
+                        limiters = self._limiters_for(provider, model)
+                        wait = max([limiter.wait_time(requests, tokens) for limiter in limiters] or [0.0])
+                        if wait <= 0:
+                            for limiter in limiters:
+                                limiter.consume(requests, tokens)
+                            return
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+
+    def _block(self, provider: str, model: str, seconds: float) -> None:
+        """限速错误后暂停该模型的令牌桶，其它排队任务同样等待"""
+        with self._cond:
+            until = time.monotonic() + seconds
+            for limiter in self._limiters_for(provider, model):
+                limiter.blocked_until = max(limiter.blocked_until, until)
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """带完全抖动的指数退避；服务商给出Retry-After时以其为下限"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def acquire(self, provider: str, model: str, file_path: Optional[str] = None,
+                priority: int = PRIORITY_BACKFILL, estimated_tokens: Optional[int] = None, requests: int = 1) -> None:
+        """只按优先级排队获取配额，不执行任务也不重试"""
+        tokens = estimated_tokens if estimated_tokens is not None else estimate_tokens(file_path)
+        self._acquire(provider, model, priority, requests, tokens)
+
+    def run(self, provider: str, model: str, fn: Callable[[], Any], file_path: Optional[str] = None,
+            priority: int = PRIORITY_BACKFILL, estimated_tokens: Optional[int] = None, requests: int = 1) -> Any:
+        """在当前线程中按配额执行任务函数，可重试错误自动退避重试，返回任务结果"""
+        tokens = estimated_tokens if estimated_tokens is not None else estimate_tokens(file_path)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(provider, model, priority, requests, tokens)
+            # 提取器的运行指标通过该上下文变量记录当前是第几次重试
+            token = CURRENT_RETRY_ATTEMPT.set(attempt)
+            try:
+                return fn()
+            except Exception as e:
+                retryable, status, retry_after = classify_error(e)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                if status == 429:
+                    self._block(provider, model, retry_after if retry_after is not None else delay)
+                label = f"HTTP {status}" if status else type(e).__name__
+                if not self.quiet:
+                    print(f"⚠️ {provider}/{model} 请求失败（{label}），{delay:.1f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+            finally:
+                CURRENT_RETRY_ATTEMPT.reset(token)
+
+    def submit(self, provider: str, model: str, fn: Callable[[], Any], file_path: Optional[str] = None,
+               priority: int = PRIORITY_BACKFILL, estimated_tokens: Optional[int] = None,
+               requests: int = 1) -> Future:
+        """异步提交任务，返回Future"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extraction")
+        return self._pool.submit(self.run, provider, model, fn, file_path, priority, estimated_tokens, requests)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭内部线程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
@@ -0,0 +1,489 @@
+"""
+矿山储量核实报告提取与对话服务（HTTP + SSE）
+
+单个asyncio进程同时为多名分析人员、多份报告提供提取和流式对话：
+- POST /extract      {"file": "reports/a.pdf", "user": "alice"}  → 提取结果、report_id（可选同时创建会话）
+- POST /ask          {"report_id": "...", "user": "alice", "question": "..."}  → Server-Sent Events流
+                     event: delta  data: {"text": "..."}    （来自response.output_text.delta）
+                     event: done   data: {"response_id": "...", "source": "model"}
+                     event: error  data: {"error": "..."}
+- GET  /sessions     当前会话列表；DELETE /sessions {"report_id": "...", "user": "..."} 结束会话
+- GET  /healthz      健康检查与运行统计
+
+会话按(报告, 用户)区分，各自保存previous_response_id链；同一会话同时进行的提问数受限（超出返回429），
+全局同时进行的模型流数受限（排队等待），SSE逐条写出并等待客户端读取（drain），慢客户端不会堆积内存，
+客户端断开时立即关闭上游流；空闲超时的会话由后台任务清理，会话数超过上限时淘汰最久未使用的空闲会话。
+
+用法示例:
+    python mining_report_server.py --provider openai --model o4-mini --report-dir reports/ --port 8080
+    python mining_report_server.py --mock --report-dir reports/   # 使用本地模拟服务（不消耗配额）
+
+    curl -X POST localhost:8080/extract -d '{"file": "a.pdf", "user": "alice"}'
+    curl -N -X POST localhost:8080/ask -d '{"report_id": "...", "user": "alice", "question": "主要矿种是什么？"}'
+"""
+import argparse
+import asyncio
+import http
+import json
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlsplit
+
+from mining_report_async import AsyncBaseMiningReportExtractor, create_async_extractor
+from mining_report_cache import ExtractionCache, UploadRegistry, compute_file_sha256
+from mining_report_extractor_stream import (
+    GEMINI_MODELS,
+    OPENAI_MODELS,
+    MiningReport,
+)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_SESSION_CONCURRENCY = 1  # 同一会话的提问按previous_response_id链顺序进行
+DEFAULT_MAX_STREAMS = 32
+DEFAULT_MAX_EXTRACTIONS = 4
+DEFAULT_IDLE_TIMEOUT = 30 * 60  # 秒
+MAX_BODY_BYTES = 1024 * 1024
+SSE_WRITE_BUFFER_HIGH = 64 * 1024  # 写缓冲超过该值时drain()等待客户端读取
+
+
+class HTTPError(Exception):
+    """以指定状态码返回给客户端的错误"""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# ========== 报告与会话 ==========
+class ReportState:
+    """已提取的报告：本地路径、提取结果，以及可供会话链接的file_id和提取响应ID"""
+
+    def __init__(self, report_id: str, file_path: str, result: MiningReport,
+                 file_id: Optional[str], response_id: Optional[str]):
+        self.report_id = report_id
+        self.file_path = file_path
+        self.result = result
+        self.file_id = file_id
+        self.response_id = response_id  # 缓存命中时为None，首次提问随问题发送文档
+        self.extracted_at = time.time()
+
+
+class ConversationSession:
+    """单个用户针对单份报告的对话会话"""
+
+    def __init__(self, report: ReportState, user: str):
+        self.report = report
+        self.user = user
+        self.previous_response_id = report.response_id
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+        self.active = 0  # 正在进行的提问数
+        self.turns = 0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.report.report_id, self.user
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "report_id": self.report.report_id,
+            "user": self.user,
+            "turns": self.turns,
+            "active": self.active,
+            "idle_seconds": round(time.monotonic() - self.last_active, 1),
+            "previous_response_id": self.previous_response_id,
+        }
+
+
+# ========== 服务 ==========
+class ConversationServer:
+    """基于asyncio的多会话提取与流式对话服务"""
+
+    def __init__(self, extractor: AsyncBaseMiningReportExtractor, report_dir: Optional[str] = None,
+                 host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 session_concurrency: int = DEFAULT_SESSION_CONCURRENCY,
+                 max_streams: int = DEFAULT_MAX_STREAMS,
+                 max_extractions: int = DEFAULT_MAX_EXTRACTIONS,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 sweep_interval: float = 60.0,
+                 quiet: bool = False):
+        self.extractor = extractor
+        self.report_dir = pathlib.Path(report_dir).resolve() if report_dir else None
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.session_concurrency = session_concurrency
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.quiet = quiet
+        self.reports: Dict[str, ReportState] = {}
+        self.sessions: "OrderedDict[Tuple[str, str], ConversationSession]" = OrderedDict()
+        self.stats = {"requests": 0, "extractions": 0, "questions": 0, "rejected": 0, "evicted": 0,
+                      "disconnects": 0}
+        self._max_streams = max_streams
+        self._max_extractions = max_extractions
+        self._streams: Optional[asyncio.Semaphore] = None
+        self._extractions: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, "asyncio.Future[ReportState]"] = {}
+        self._uploads: Dict[str, "asyncio.Future[str]"] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._sweeper: Optional["asyncio.Task[None]"] = None
+
+    def _log(self, message: str) -> None:
+        if not self.quiet:
+            print(message)
+
+    # ----- 生命周期 -----
+    async def start(self) -> "ConversationServer":
+        """绑定端口并启动空闲会话清理任务（port为0时由系统分配，启动后写回self.port）"""
+        self._streams = asyncio.Semaphore(self._max_streams)
+        self._extractions = asyncio.Semaphore(self._max_extractions)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._sweeper = asyncio.create_task(self._sweep_loop())
+        self._log(f"🌐 服务已启动: http://{self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # ----- 报告提取 -----
+    def _resolve_file(self, file_path: str) -> pathlib.Path:
+        """解析请求中的PDF路径；指定report_dir时只允许访问该目录下的文件"""
+        path = pathlib.Path(file_path)
+        if self.report_dir is not None:
+            path = (self.report_dir / path).resolve()
+            if self.report_dir not in path.parents:
+                raise HTTPError(403, f"不允许访问报告目录之外的文件: {file_path}")
+        if not path.is_file() or path.suffix.lower() != ".pdf":
+            raise HTTPError(404, f"PDF文件不存在: {file_path}")
+        return path
+
+    async def extract_report(self, file_path: str) -> Tuple[ReportState, bool]:
+        """提取报告，返回(报告, 是否已提取过)；同一份报告的并发提取请求共享同一次提取"""
+        path = self._resolve_file(file_path)
+        report_id = (await asyncio.to_thread(compute_file_sha256, str(path)))[:16]
+        if report_id in self.reports:
+            return self.reports[report_id], True
+        if report_id in self._inflight:
+            return await asyncio.shield(self._inflight[report_id]), True
+
+        future: "asyncio.Future[ReportState]" = asyncio.get_running_loop().create_future()
+        self._inflight[report_id] = future
+        try:
+            async with self._extractions:
+                self._log(f"🚀 开始提取: {path.name}")
+                if hasattr(self.extractor, "extract_with_response"):
+                    result, file_id, response_id = await self.extractor.extract_with_response(str(path))
+                else:
+                    result, file_id, response_id = await self.extractor.extract_from_file(str(path)), None, None
+            report = ReportState(report_id, str(path), result, file_id, response_id)
+            self.reports[report_id] = report
+            self.stats["extractions"] += 1
+            future.set_result(report)
+            return report, False
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有其它等待者时避免"异常未被获取"的警告
+            raise
+        finally:
+            del self._inflight[report_id]
+
+    async def report_document(self, report: ReportState) -> str:
+        """返回随问题发送的报告file_id；多个会话同时首次提问时共享同一次上传"""
+        if report.file_id is not None:
+            return report.file_id
+        if report.report_id in self._uploads:
+            return await asyncio.shield(self._uploads[report.report_id])
+
+        future: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        self._uploads[report.report_id] = future
+        try:
+            report.file_id = await self.extractor.conversation_document(report.file_path)
+            future.set_result(report.file_id)
+            return report.file_id
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._uploads[report.report_id]
+
+    # ----- 会话管理 -----
+    def get_session(self, report_id: str, user: str) -> ConversationSession:
+        """获取或创建会话；会话数达到上限时淘汰最久未使用的空闲会话"""
+        key = (report_id, user)
+        session = self.sessions.get(key)
+        if session is not None:
+            self.sessions.move_to_end(key)
+            return session
+        report = self.reports.get(report_id)
+        if report is None:
+            raise HTTPError(404, f"报告不存在，请先调用 /extract: {report_id}")
+        if len(self.sessions) >= self.max_sessions:
+            idle = next((s for s in self.sessions.values() if s.active == 0), None)
+            if idle is None:
+                raise HTTPError(503, "会话数已达上限", {"Retry-After": "5"})
+            del self.sessions[idle.key]
+            self.stats["evicted"] += 1
+        session = self.sessions[key] = ConversationSession(report, user)
+        return session
+
+    def evict_idle(self) -> int:
+        """清理空闲超时的会话，返回清理数量"""
+        now = time.monotonic()
+        expired = [key for key, session in self.sessions.items()
+                   if session.active == 0 and now - session.last_active > self.idle_timeout]
+        for key in expired:
+            del self.sessions[key]
+        self.stats["evicted"] += len(expired)
+        return len(expired)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.evict_idle()
+            if removed:
+                self._log(f"🧹 已清理 {removed} 个空闲会话")
+
+    # ----- 对话 -----
+    async def ask(self, session: ConversationSession, question: str, writer: asyncio.StreamWriter) -> None:
+        """以SSE流式返回回答；客户端断开时关闭上游流，回答完成后推进会话的previous_response_id链"""
+        if not hasattr(self.extractor, "stream_answer"):
+            raise HTTPError(400, f"提供商 {self.extractor.PROVIDER} 不支持对话")
+        if session.active >= self.session_concurrency:
+            self.stats["rejected"] += 1
+            raise HTTPError(429, "该会话已有正在进行的提问", {"Retry-After": "1"})
+
+        session.active += 1
+        session.last_active = time.monotonic()
+        try:
+            await self._start_sse(writer)
+            async with self._streams:
+                report = session.report
+                document = None
+                if session.previous_response_id is None:
+                    # 提取结果来自缓存时没有可链接的响应，首次提问随问题发送文档
+                    document = await self.report_document(report)
+                events = self.extractor.stream_answer(question, session.previous_response_id, document=document)
+                try:
+                    async for event in events:
+                        if event.type == "delta":
+                            await self._send_event(writer, "delta", {"text": event.text})
+                        else:
+                            if event.response_id:
+                                session.previous_response_id = event.response_id
+                            session.turns += 1
+                            self.stats["questions"] += 1
+                            await self._send_event(writer, "done", {"response_id": event.response_id,
+                                                                    "source": event.source,
+                                                                    "cached_tokens": event.cached_tokens})
+                finally:
+                    await events.aclose()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.stats["disconnects"] += 1
+        except HTTPError:
+            raise
+        except Exception as e:
+            await self._send_event(writer, "error", {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            session.active -= 1
+            session.last_active = time.monotonic()
+
+    # ----- HTTP -----
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "无效的请求行")
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path, headers, body
+
+    @staticmethod
+    def _parse_json(body: bytes, *required: str) -> Dict[str, Any]:
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "请求体不是有效的JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "请求体应为JSON对象")
+        missing = [field for field in required if not payload.get(field)]
+        if missing:
+            raise HTTPError(400, f"缺少字段: {', '.join(missing)}")
+        return payload
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Any,
+                         headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        lines = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+                 "Content-Type: application/json; charset=utf-8",
+                 f"Content-Length: {len(body)}",
+                 "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _start_sse(writer: asyncio.StreamWriter) -> None:
+        writer.transport.set_write_buffer_limits(high=SSE_WRITE_BUFFER_HIGH)
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _send_event(writer: asyncio.StreamWriter, event: str, data: Dict[str, Any]) -> None:
+        writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()  # 背压：客户端读取跟不上时在此等待，不继续消费上游流
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        if method == "GET" and path == "/healthz":
+            await self._send_json(writer, 200, {"status": "ok", "reports": len(self.reports),
+                                                "sessions": len(self.sessions), **self.stats})
+        elif method == "POST" and path == "/extract":
+            payload = self._parse_json(body, "file")
+            report, existed = await self.extract_report(payload["file"])
+            response = {"report_id": report.report_id, "file": report.file_path, "existed": existed,
+                        "result": report.result.model_dump(exclude_none=True)}
+            if payload.get("user"):
+                response["session"] = self.get_session(report.report_id, str(payload["user"])).to_dict()
+            await self._send_json(writer, 200, response)
+        elif method == "POST" and path == "/ask":
+            payload = self._parse_json(body, "report_id", "user", "question")
+            session = self.get_session(str(payload["report_id"]), str(payload["user"]))
+            await self.ask(session, str(payload["question"]), writer)
+        elif method == "GET" and path == "/sessions":
+            await self._send_json(writer, 200, [session.to_dict() for session in self.sessions.values()])
+        elif method == "DELETE" and path == "/sessions":
+            payload = self._parse_json(body, "report_id", "user")
+            removed = self.sessions.pop((str(payload["report_id"]), str(payload["user"])), None)
+            await self._send_json(writer, 200, {"removed": removed is not None})
+        else:
+            raise HTTPError(404, f"未知接口: {method} {path}")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, path, _, body = request
+            self.stats["requests"] += 1
+            await self._route(method, path, body, writer)
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": str(e)}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self._log(f"❌ 处理请求时出错: {type(e).__name__}: {e}")
+            try:
+                await self._send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+# ========== 命令行入口 ==========
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="矿山储量核实报告提取与对话服务（HTTP + SSE）")
+    parser.add_argument("--provider", choices=["gemini", "openai"], default="openai", help="AI提供商（对话仅支持OpenAI）")
+    parser.add_argument("--model", help=f"模型名称（Gemini默认 {GEMINI_MODELS[0]}，OpenAI默认 {OPENAI_MODELS[0]}）")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument("--report-dir", help="只允许提取该目录下的PDF（请求中的file为相对路径）")
+    parser.add_argument("--env-file", default=".env", help="环境变量文件路径")
+    parser.add_argument("--base-url", help="服务商API地址（代理或本地模拟服务）")
+    parser.add_argument("--mock", action="store_true", help="在进程内启动本地模拟服务并连接（不消耗配额）")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS, help="最大会话数")
+    parser.add_argument("--session-concurrency", type=int, default=DEFAULT_SESSION_CONCURRENCY,
+                        help="同一会话同时进行的提问数上限")
+    parser.add_argument("--max-streams", type=int, default=DEFAULT_MAX_STREAMS, help="全局同时进行的模型流数上限")
+    parser.add_argument("--max-extractions", type=int, default=DEFAULT_MAX_EXTRACTIONS, help="同时进行的提取数上限")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT, help="会话空闲超时（秒）")
+    parser.add_argument("--no-cache", action="store_true", help="禁用提取结果缓存")
+    parser.add_argument("-q", "--quiet", action="store_true", help="静默模式：不输出提取进度")
+    return parser
+
+
+async def _serve(server: ConversationServer) -> None:
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+        await server.extractor.pool.aclose()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    model = args.model or (GEMINI_MODELS[0] if args.provider == "gemini" else OPENAI_MODELS[0])
+
+    extractor_kwargs: Dict[str, Any] = {"env_file": args.env_file, "quiet": args.quiet,
+                                        "upload_registry": UploadRegistry()}
+    if not args.no_cache:
+        extractor_kwargs["cache"] = ExtractionCache()
+    mock = None
+    if args.mock:
+        from mining_report_benchmark import MOCK_API_KEY, MockProviderServer
+        mock = MockProviderServer().start()
+        extractor_kwargs["api_key"] = MOCK_API_KEY
+        args.base_url = mock.openai_base_url if args.provider == "openai" else mock.gemini_base_url
+        print(f"🧪 已启动本地模拟服务: {mock.url}")
+    if args.base_url:
+        extractor_kwargs["base_url"] = args.base_url
+
+    extractor = create_async_extractor(args.provider, model, **extractor_kwargs)
+    server = ConversationServer(
+        extractor, report_dir=args.report_dir, host=args.host, port=args.port,
+        max_sessions=args.max_sessions, session_concurrency=args.session_concurrency,
+        max_streams=args.max_streams, max_extractions=args.max_extractions,
+        idle_timeout=args.idle_timeout, quiet=args.quiet,
+    )
+    print(f"🏔️  矿山储量核实报告服务: {args.provider} - {model}")
+    try:
+        asyncio.run(_serve(server))
+    except KeyboardInterrupt:
+        print("\n👋 服务已停止")
+    finally:
+        if mock is not None:
+            mock.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,395 @@
+"""
+矿山储量核实报告结果库（SQLite）
+
+将MiningReport批量写入规范化、带索引的表，替代"每个PDF一个JSON文件"的存储方式：
+- reports：报告（来源文件、文件哈希、提供商/模型、报告信息、完整JSON）
+- mining_rights：矿权信息（附省份、ISO日期）
+- resources：资源量（每个矿种 × 资源量类别一行，附规范化的吨/千克/品位数值）
+- ore_bodies：矿体分布（附规范化的米/吨/千克/品位数值）
+
+写入按批次在单个事务中完成；查询通过索引按矿种、类别、金属量、省份等条件过滤；
+可导出为Parquet列式文件（需要pyarrow）。
+
+用法示例:
+    with ResultStore("mining_reports.db") as store:
+        store.add(result, source_file="report.pdf", provider="gemini", model="gemini-2.5-flash")
+        rows = store.query_resources(mineral="金矿", category="探明资源量", min_metal_kg=1000, province="四川")
+
+    python mining_report_store.py import results/ --db mining_reports.db
+    python mining_report_store.py query --mineral 金矿 --category 探明资源量 --min-metal-kg 1000 --province 四川
+    python mining_report_store.py export -o parquet_dir
+"""
+import argparse
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+
+from mining_report_extractor_stream import MiningReport, MiningRightsInfo, OreBodyDistribution, normalize_mineral_name
+from mining_report_normalize import (
+    load_reports,
+    ore_body_table,
+    parse_date,
+    parse_province,
+    resource_table,
+)
+
+
+DEFAULT_STORE_PATH = "mining_reports.db"
+STORE_TABLES = ["reports", "mining_rights", "resources", "ore_bodies"]
+
+_MINING_RIGHTS_FIELDS = list(MiningRightsInfo.model_fields)
+_ORE_BODY_FIELDS = list(OreBodyDistribution.model_fields)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    source_file TEXT UNIQUE,
+    file_sha256 TEXT,
+    provider TEXT,
+    model TEXT,
+    stored_at REAL NOT NULL,
+    报告名称 TEXT,
+    编制单位 TEXT,
+    编制日期 TEXT,
+    编制日期_iso TEXT,
+    其它信息 TEXT,
+    result_json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_sha256 ON reports(file_sha256);
+
+CREATE TABLE IF NOT EXISTS mining_rights (
+    report_id INTEGER PRIMARY KEY REFERENCES reports(id) ON DELETE CASCADE,
+    {", ".join(f"{field} TEXT" for field in _MINING_RIGHTS_FIELDS)},
+    province TEXT,
+    start_date_iso TEXT,
+    end_date_iso TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_mining_rights_province ON mining_rights(province);
+CREATE INDEX IF NOT EXISTS idx_mining_rights_number ON mining_rights(矿权编号);
+CREATE INDEX IF NOT EXISTS idx_mining_rights_level ON mining_rights(勘查程度);
+
+CREATE TABLE IF NOT EXISTS resources (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    矿种 TEXT,
+    类别 TEXT,
+    矿石量 TEXT,
+    金属量 TEXT,
+    品位 TEXT,
+    ore_tonnes REAL,
+    metal_kg REAL,
+    grade_value REAL,
+    grade_unit TEXT,
+    confidence TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_resources_mineral ON resources(矿种, 类别, metal_kg);
+CREATE INDEX IF NOT EXISTS idx_resources_report ON resources(report_id);
+
+CREATE TABLE IF NOT EXISTS ore_bodies (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    {", ".join(f"{field} TEXT" for field in _ORE_BODY_FIELDS)},
+    length_m REAL,
+    width_m REAL,
+    thickness_m REAL,
+    ore_tonnes REAL,
+    metal_kg REAL,
+    grade_value REAL,
+    grade_unit TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ore_bodies_report ON ore_bodies(report_id);
+"""
+
+
+def _number(value: Any) -> Optional[float]:
+    """NaN转为None（SQLite中存为NULL）"""
+    value = float(value)
+    return None if value != value else value
+
+
+def _weakest(*confidences: str) -> str:
+    """多个数值中最低的置信度（failed < approx < exact），缺失的数值不参与比较"""
+    order = {"failed": 0, "approx": 1, "exact": 2}
+    present = [c for c in confidences if c]
+    return min(present, key=order.__getitem__) if present else "failed"
+
+
+# ========== 结果库 ==========
+class ResultStore:
+    """SQLite结果库：add()缓冲写入，达到batch_size或调用flush()时在单个事务中批量写入
+
+    同一source_file再次写入时替换旧记录。实例可在多个线程间共享（内部加锁）。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_STORE_PATH, batch_size: int = 200):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._pending: List[Tuple[MiningReport, Dict[str, Any]]] = []
+        self._lock = threading.RLock()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    # ---------- 写入 ----------
+    def add(self, result: MiningReport, source_file: Optional[str] = None, provider: Optional[str] = None,
+            model: Optional[str] = None, file_sha256: Optional[str] = None) -> None:
+        """缓冲一份提取结果，缓冲区达到batch_size时自动写入"""
+        meta = {"source_file": source_file, "provider": provider, "model": model, "file_sha256": file_sha256}
+        with self._lock:
+            self._pending.append((result, meta))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> int:
+        """在一个事务中写入所有缓冲的结果，返回写入的报告数；失败时整批回滚"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, []
+            try:
+                with self._conn:
+                    self._write_batch(batch)
+            except Exception:
+                self._pending = batch + self._pending
+                raise
+            return len(batch)
+
+    def _write_batch(self, batch: List[Tuple[MiningReport, Dict[str, Any]]]) -> None:
+        # 同一批次内重复的source_file只保留最后一次写入
+        latest = {meta["source_file"]: i for i, (_, meta) in enumerate(batch) if meta["source_file"]}
+        batch = [item for i, item in enumerate(batch) if latest.get(item[1]["source_file"], i) == i]
+        reports = [result for result, _ in batch]
+        replaced = [meta["source_file"] for _, meta in batch if meta["source_file"]]
+        if replaced:
+            self._conn.executemany("DELETE FROM reports WHERE source_file = ?", [(f,) for f in replaced])
+
+        stored_at = time.time()
+        report_ids = []
+        for result, meta in batch:
+            info = result.报告信息
+            cursor = self._conn.execute(
+                "INSERT INTO reports (source_file, file_sha256, provider, model, stored_at, 报告名称, 编制单位, "
+                "编制日期, 编制日期_iso, 其它信息, result_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (meta["source_file"], meta["file_sha256"], meta["provider"], meta["model"], stored_at,
+                 info.报告名称 if info else None, info.编制单位 if info else None,
+                 info.编制日期 if info else None, parse_date(info.编制日期 if info else None)[0],
+                 result.其它信息, result.model_dump_json(exclude_none=True)),
+            )
+            report_ids.append(cursor.lastrowid)
+
+        rights_rows = []
+        for report_id, result in zip(report_ids, reports):
+            rights = result.矿权信息
+            if rights is None:
+                continue
+            rights_rows.append((report_id, *(getattr(rights, field) for field in _MINING_RIGHTS_FIELDS),
+                                parse_province(rights.矿权位置), parse_date(rights.矿权起始日期)[0],
+                                parse_date(rights.矿权截止日期)[0]))
+        columns = ["report_id", *_MINING_RIGHTS_FIELDS, "province", "start_date_iso", "end_date_iso"]
+        self._conn.executemany(
+            f"INSERT INTO mining_rights ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rights_rows)
+
+        # 数值列使用批量规范化（同一批次内的重复写法只解析一次）
+        resources = resource_table(reports)
+        ore, metal, grade = resources["ore_tonnes"], resources["metal_kg"], resources["grade"]
+        self._conn.executemany(
+            "INSERT INTO resources (report_id, 矿种, 类别, 矿石量, 金属量, 品位, ore_tonnes, metal_kg, "
+            "grade_value, grade_unit, confidence) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(report_ids[index], resources["矿种"][i], resources["类别"][i],
+              ore.original[i], metal.original[i], grade.original[i],
+              _number(ore.values[i]), _number(metal.values[i]), _number(grade.values[i]), grade.units[i],
+              _weakest(*(column.confidence[i] for column in (ore, metal, grade) if column.original[i])))
+             for i, index in enumerate(resources["report_index"])],
+        )
+
+        bodies = ore_body_table(reports)
+        columns = ["report_id", *_ORE_BODY_FIELDS, "length_m", "width_m", "thickness_m", "ore_tonnes",
+                   "metal_kg", "grade_value", "grade_unit"]
+        body_rows = []
+        position = 0
+        for report_id, result in zip(report_ids, reports):
+            for ore_body in result.矿体分布 or []:
+                body_rows.append((
+                    report_id, *(getattr(ore_body, field) for field in _ORE_BODY_FIELDS),
+                    *(_number(bodies[name].values[position])
+                      for name in ("length_m", "width_m", "thickness_m", "ore_tonnes", "metal_kg", "grade")),
+                    bodies["grade"].units[position],
+                ))
+                position += 1
+        self._conn.executemany(
+            f"INSERT INTO ore_bodies ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", body_rows)
+
+    # ---------- 查询 ----------
+    def query_resources(self, mineral: Optional[str] = None, category: Optional[str] = None,
+                        min_metal_kg: Optional[float] = None, min_ore_tonnes: Optional[float] = None,
+                        province: Optional[str] = None, exploration_level: Optional[str] = None,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按矿种、资源量类别、金属量/矿石量下限、省份、勘查程度过滤资源量记录（均走索引）
+
+        矿种和省份按写入时的规则规范化后再比较（"金"与"金矿"、"内蒙古自治区"与"内蒙古"等价）。
+        """
+        self.flush()
+        conditions, params = [], []
+        if mineral:
+            conditions.append("r.矿种 = ?")
+            params.append(normalize_mineral_name(mineral))
+        if category:
+            conditions.append("r.类别 = ?")
+            params.append(category)
+        if min_metal_kg is not None:
+            conditions.append("r.metal_kg >= ?")
+            params.append(min_metal_kg)
+        if min_ore_tonnes is not None:
+            conditions.append("r.ore_tonnes >= ?")
+            params.append(min_ore_tonnes)
+        if province:
+            conditions.append("m.province = ?")
+            params.append(parse_province(province) or province)
+        if exploration_level:
+            conditions.append("m.勘查程度 = ?")
+            params.append(exploration_level)
+        sql = ("SELECT p.id AS report_id, p.source_file, p.报告名称, m.矿权名称, m.矿权编号, m.province, m.勘查程度, "
+               "r.矿种, r.类别, r.矿石量, r.金属量, r.品位, r.ore_tonnes, r.metal_kg, r.grade_value, r.grade_unit, "
+               "r.confidence FROM resources r JOIN reports p ON p.id = r.report_id "
+               "LEFT JOIN mining_rights m ON m.report_id = r.report_id")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY r.metal_kg DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def get_report(self, report_id: int) -> Optional[MiningReport]:
+        """按报告ID读取完整的MiningReport"""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute("SELECT result_json FROM reports WHERE id = ?", (report_id,)).fetchone()
+        return MiningReport.model_validate_json(row["result_json"]) if row else None
+
+    def find_by_sha256(self, file_sha256: str) -> Optional[MiningReport]:
+        """按PDF文件哈希读取最近写入的结果"""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute("SELECT result_json FROM reports WHERE file_sha256 = ? ORDER BY stored_at DESC",
+                                     (file_sha256,)).fetchone()
+        return MiningReport.model_validate_json(row["result_json"]) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """各表的行数"""
+        self.flush()
+        with self._lock:
+            return {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in STORE_TABLES}
+
+    # ---------- 导出 ----------
+    def export_parquet(self, output_dir: str, batch_rows: int = 50000) -> List[str]:
+        """将各表导出为Parquet文件（按批读取，避免一次性载入整表），返回文件路径列表"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("请安装必需包: pip install pyarrow")
+
+        self.flush()
+        output_root = pathlib.Path(output_dir)
+        output_root.mkdir(parents=True, exist_ok=True)
+        arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string()}
+        paths = []
+        with self._lock:
+            for table in STORE_TABLES:
+                # 按声明类型构造schema，避免首批数据全为NULL时推断出错误类型
+                columns = self._conn.execute(f"PRAGMA table_info({table})").fetchall()
+                schema = pa.schema([(column["name"], arrow_types.get(column["type"].upper(), pa.string()))
+                                    for column in columns])
+                path = output_root / f"{table}.parquet"
+                cursor = self._conn.execute(f"SELECT {', '.join(schema.names)} FROM {table}")
+                with pq.ParquetWriter(str(path), schema) as writer:
+                    while True:
+                        rows = cursor.fetchmany(batch_rows)
+                        if not rows:
+                            break
+                        writer.write_table(pa.Table.from_pylist([dict(row) for row in rows], schema=schema))
+                paths.append(str(path))
+        return paths
+
+    def close(self) -> None:
+        """写入剩余缓冲并关闭数据库连接"""
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+# ========== 命令行入口 ==========
+def build_arg_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="矿山储量核实报告结果库（SQLite）")
+    parser.add_argument("--db", default=DEFAULT_STORE_PATH, help="结果库文件路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="导入已有的结果JSON文件")
+    import_parser.add_argument("source", help="结果JSON目录、glob模式或单个文件")
+
+    query_parser = subparsers.add_parser("query", help="按条件查询资源量")
+    query_parser.add_argument("--mineral", help="矿种，如 金矿")
+    query_parser.add_argument("--category", choices=["推断资源量", "控制资源量", "探明资源量", "总计"], help="资源量类别")
+    query_parser.add_argument("--min-metal-kg", type=float, help="金属量下限（千克）")
+    query_parser.add_argument("--min-ore-tonnes", type=float, help="矿石量下限（吨）")
+    query_parser.add_argument("--province", help="省份简称，如 四川")
+    query_parser.add_argument("--level", help="勘查程度（普查/详查/勘探）")
+    query_parser.add_argument("--limit", type=int, default=50, help="最多返回的记录数")
+    query_parser.add_argument("--json", action="store_true", help="以JSON输出")
+
+    export_parser = subparsers.add_parser("export", help="导出为Parquet列式文件")
+    export_parser.add_argument("-o", "--output-dir", default="mining_reports_parquet", help="输出目录")
+
+    subparsers.add_parser("stats", help="显示各表行数")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """结果库命令行主函数"""
+    args = build_arg_parser().parse_args(argv)
+    with ResultStore(args.db) as store:
+        if args.command == "import":
+            names, reports = load_reports(args.source)
+            if not reports:
+                print(f"❌ 未找到提取结果: {args.source}")
+                return 1
+            for name, report in zip(names, reports):
+                store.add(report, source_file=name)
+            store.flush()
+            print(f"✅ 已导入 {len(reports)} 份报告到 {args.db}")
+        elif args.command == "query":
+            rows = store.query_resources(mineral=args.mineral, category=args.category, min_metal_kg=args.min_metal_kg,
+                                         min_ore_tonnes=args.min_ore_tonnes, province=args.province,
+                                         exploration_level=args.level, limit=args.limit)
+            if args.json:
+                print(json.dumps(rows, ensure_ascii=False, indent=2))
+            else:
+                print(f"📊 共 {len(rows)} 条记录")
+                for row in rows:
+                    print(f"  • {row['矿权名称'] or row['报告名称'] or row['source_file']} [{row['province'] or 'N/A'}] "
+                          f"{row['矿种']} {row['类别']}: 矿石量 {row['矿石量'] or 'N/A'}，金属量 {row['金属量'] or 'N/A'}，"
+                          f"品位 {row['品位'] or 'N/A'}")
+        elif args.command == "export":
+            for path in store.export_parquet(args.output_dir):
+                print(f"✅ 已导出: {path}")
+        else:
+            for table, count in store.counts().items():
+                print(f"  • {table}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
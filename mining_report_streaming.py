@@ -0,0 +1,102 @@
+"""
+矿山储量核实报告流式结构化输出的增量JSON解析
+
+模型按MiningReport的JSON Schema流式输出时，IncrementalJSONSectionParser逐段接收文本，
+根对象中每个顶层字段的值完整时、以及顶层数组（资源信息、矿体分布）中每个元素完整时立即返回其原始JSON文本，
+提取器据此在整份结果生成完毕之前逐章节、逐条产出（见extract_stream）。解析与文本的分段方式无关。
+
+用法示例:
+    parser = IncrementalJSONSectionParser()
+    for delta in response_text_deltas:
+        for section, index, raw in parser.feed(delta):
+            print(section, index, raw)   # 如 ("资源信息", 0, '{"矿种": "金矿", ...}')
+"""
+import json
+from typing import Optional, List, Tuple
+
+
+# ========== 增量解析 ==========
+class IncrementalJSONSectionParser:
+    """增量解析MiningReport的JSON文本流
+
+    逐字符跟踪字符串/转义状态和嵌套深度，根对象中每个顶层字段的值完整时、
+    以及顶层数组中每个对象元素完整时，立即返回其原始JSON文本。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.key_start: Optional[int] = None
+        self.current_key: Optional[str] = None
+        self.value_start: Optional[int] = None
+        self.element_start: Optional[int] = None
+        self.element_index = 0
+
+    def feed(self, text: str) -> List[Tuple[str, Optional[int], str]]:
+        """输入新文本，返回新完成的(顶层字段名, 数组元素序号或None, 原始JSON文本)列表"""
+        self.buffer += text
+        completed = []
+        while self.pos < len(self.buffer):
+            i, c = self.pos, self.buffer[self.pos]
+            self.pos += 1
+            depth = len(self.stack)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if depth == 1 and self.expect_key and self.key_start is not None:
+                        self.current_key = json.loads(self.buffer[self.key_start:i + 1])
+                        self.key_start = None
+                continue
+
+            if c == '"':
+                self.in_string = True
+                if depth == 1 and self.expect_key:
+                    self.key_start = i
+                elif depth == 1 and self.value_start is None:
+                    self.value_start = i
+            elif c in "{[":
+                if depth == 1 and not self.expect_key and self.value_start is None:
+                    self.value_start = i
+                    self.element_index = 0
+                if depth == 2 and self.stack[1] == "[" and c == "{":
+                    self.element_start = i
+                self.stack.append(c)
+                if depth == 0:
+                    self.expect_key = True
+            elif c in "}]":
+                if depth == 1:
+                    # 根对象结束，输出尚未结束的标量值
+                    completed.extend(self._finish_scalar(i))
+                self.stack.pop()
+                depth -= 1
+                if depth == 2 and self.stack[1] == "[" and self.element_start is not None:
+                    completed.append((self.current_key, self.element_index, self.buffer[self.element_start:i + 1]))
+                    self.element_index += 1
+                    self.element_start = None
+                elif depth == 1 and self.value_start is not None:
+                    completed.append((self.current_key, None, self.buffer[self.value_start:i + 1]))
+                    self.value_start = None
+            elif depth == 1 and c == ":":
+                self.expect_key = False
+            elif depth == 1 and c == ",":
+                completed.extend(self._finish_scalar(i))
+                self.expect_key = True
+            elif depth == 1 and not self.expect_key and self.value_start is None and not c.isspace():
+                self.value_start = i  # 数字、null、true/false
+        return completed
+
+    def _finish_scalar(self, end: int) -> List[Tuple[str, Optional[int], str]]:
+        if self.value_start is None:
+            return []
+        raw = self.buffer[self.value_start:end].strip()
+        self.value_start = None
+        return [(self.current_key, None, raw)]
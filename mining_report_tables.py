@@ -0,0 +1,490 @@
+"""
+矿山储量核实报告资源量汇总表本地解析（确定性，不调用模型）
+
+许多带文本层的报告中，资源量估算结果汇总表格式很规整：行为资源量类别（333/332/331/122b或推断/控制/探明/合计），
+列为矿石量/金属量/品位并在表头注明单位。ResourceTableParser从PDF文本层识别这类表格，
+按EXTRACTION_PROMPT中的类别对应关系（333→推断，332→控制，331及1、2开头的编码→探明）解析为ResourceInfo，
+并给出0~1的置信度。置信度达到阈值时，提取器只请求模型提取其余章节，资源信息直接使用本地解析结果。
+
+置信度由以下因素相乘得到：
+- 表头单位：矿石量、金属量、品位的单位是否齐全
+- 行解析率：表内带数值的行中，能确定类别且数值个数与表头列数一致的比例
+- 合计校验：表中合计行与各类别之和一致（误差1%以内）；缺少合计行时由各类别相加
+- 矿种：来自表内行/列、表题，或只能按全文出现次数推断
+- 范围：表题含"保有"/"汇总"；表内混有"消耗"/"累计查明"等其它口径时降低
+- 一致性：多张候选表的同一矿种合计不一致时降低
+
+用法示例:
+    parser = ResourceTableParser(min_confidence=0.8)
+    result = parser.parse("report.pdf")
+    if result.confident:
+        print(result.resources, result.confidence)
+
+    extractor = create_extractor("gemini", "gemini-2.5-flash", table_parser=parser)   # 置信时跳过模型提取资源信息
+
+    python mining_report_tables.py report.pdf --json
+"""
+import argparse
+import json
+import re
+from collections import Counter
+from typing import Optional, List, Dict, Tuple, NamedTuple
+
+from mining_report_extractor_stream import (
+    ResourceCategory,
+    ResourceInfo,
+    ResourceQuantityDetail,
+    normalize_mineral_name,
+)
+from mining_report_pages import RESOURCE_CODE_PATTERN
+
+
+DEFAULT_MIN_CONFIDENCE = 0.8
+TOTAL_TOLERANCE = 0.01  # 合计行与各类别之和的相对误差上限
+MAX_GAP_LINES = 2  # 表格中连续出现的非数据行超过该数量时视为表格结束
+
+CATEGORY_TOTAL = "总计"
+CATEGORY_FIELDS = ["推断资源量", "控制资源量", "探明资源量"]
+
+# ========== 单位与矿种 ==========
+# 表头单位 → 输出单位（与EXTRACTION_PROMPT示例一致，如"120万吨"、"1000千克"、"2.7克/吨"）
+ORE_UNITS: Dict[str, str] = {
+    "亿吨": "亿吨", "亿t": "亿吨", "百万吨": "百万吨", "Mt": "百万吨",
+    "万吨": "万吨", "万t": "万吨", "10⁴t": "万吨", "×10⁴t": "万吨", "104t": "万吨",
+    "千吨": "千吨", "kt": "千吨", "吨": "吨", "t": "吨",
+}
+METAL_UNITS: Dict[str, str] = {
+    "万吨": "万吨", "万t": "万吨", "千吨": "千吨", "kt": "千吨", "吨": "吨", "t": "吨",
+    "千克": "千克", "公斤": "千克", "kg": "千克", "克": "克", "g": "克",
+}
+GRADE_UNITS: Dict[str, str] = {
+    "g/t": "克/吨", "克/吨": "克/吨", "×10⁻⁶": "克/吨", "10⁻⁶": "克/吨", "×10-6": "克/吨", "10-6": "克/吨",
+    "ppm": "克/吨", "kg/t": "千克/吨", "千克/吨": "千克/吨", "%": "%",
+}
+# 元素符号与常见矿种名称 → 矿种（伴生矿常以元素符号作列名，如"Au金属量(kg)"）
+ELEMENT_MINERALS: Dict[str, str] = {
+    "Au": "金", "Ag": "银", "Cu": "铜", "Pb": "铅", "Zn": "锌", "Mo": "钼", "WO3": "钨", "W": "钨",
+    "Sn": "锡", "TFe": "铁", "Fe": "铁", "Mn": "锰", "Sb": "锑", "Ni": "镍", "Co": "钴", "Li2O": "锂",
+    "Bi": "铋", "Hg": "汞", "S": "硫",
+}
+MINERAL_NAMES = ["稀土", "铝土", "萤石", "石墨", "硫铁", "金", "银", "铜", "铅", "锌", "钼", "钨", "锡", "铁",
+                 "锰", "铬", "镍", "钴", "锑", "汞", "铋", "锂", "铍", "铌", "钽", "磷"]
+
+# ========== 预编译正则 ==========
+_FULLWIDTH = str.maketrans("０１２３４５６７８９．，（）％／", "0123456789.,()%/")
+_NUMBER_TOKEN = re.compile(r"^-?\d{1,3}(?:,\d{3})+(?:\.\d+)?$|^-?\d+(?:\.\d+)?$")
+_EMPTY_CELL = re.compile(r"^[-—–/]+$")
+_UNIT_IN_PARENS = re.compile(r"\(([^()]+)\)")
+_CODE_TOKEN = re.compile(r"^\(?(?:33[1-4]|[12][12]{2}b?|2S2[12]|TD|KZ|TM)\)?$")
+_ELEMENT_PREFIX = re.compile(r"^(" + "|".join(sorted(ELEMENT_MINERALS, key=len, reverse=True)) + r")(?![a-z])")
+_MINERAL_PATTERN = re.compile(r"(伴生)?(" + "|".join(MINERAL_NAMES) + r")(?:矿|金属)")
+_CATEGORY_WORDS = [("推断资源量", re.compile(r"推断|TD")), ("控制资源量", re.compile(r"控制|KZ")),
+                   ("探明资源量", re.compile(r"探明|TM")), (CATEGORY_TOTAL, re.compile(r"合计|总计|小计"))]
+_OTHER_SCOPE = re.compile(r"消耗|动用|累计查明|累计探明|采空")
+_PREFERRED_CAPTION = re.compile(r"保有|汇总|总表")
+_LABEL_HEADER = re.compile(r"矿种|类别|级别|类型|编码|编号|矿体|块段|序号|名称|中段|标高|资源储量|资源量$")
+
+
+class TableColumn(NamedTuple):
+    """表头中的数值列：kind为ore/metal/grade/other，mineral为列名中带的矿种（如Au金属量）"""
+    kind: str
+    unit: Optional[str]
+    mineral: Optional[str]
+
+
+class ResourceTableResult(NamedTuple):
+    """资源量表解析结果"""
+    resources: List[ResourceInfo]
+    confidence: float
+    pages: List[int]  # 解析所用表格所在页码（从1开始）
+    notes: List[str]  # 降低置信度的原因
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE
+
+    @property
+    def confident(self) -> bool:
+        return bool(self.resources) and self.confidence >= self.min_confidence
+
+
+class _Row(NamedTuple):
+    category: str
+    mineral: Optional[str]
+    values: List[Optional[str]]
+
+
+class _ParsedTable(NamedTuple):
+    page: int
+    caption: str
+    columns: List[TableColumn]
+    rows: List[_Row]
+    rejected_rows: int
+    mixed_scope: bool
+    mineral_source: str  # rows/caption/document/unknown
+
+
+def _clean(text: str) -> str:
+    return text.translate(_FULLWIDTH).replace("（", "(").replace("）", ")")
+
+
+def _mineral_of(text: str) -> Optional[str]:
+    """从文本中识别矿种（如"伴生银矿" → "银矿"，"Au" → "金矿"）"""
+    match = _MINERAL_PATTERN.search(text)
+    if match:
+        return normalize_mineral_name(match.group(2))
+    match = _ELEMENT_PREFIX.match(text)
+    if match:
+        return normalize_mineral_name(ELEMENT_MINERALS[match.group(1)])
+    return None
+
+
+def _category_of(text: str) -> Optional[str]:
+    """按EXTRACTION_PROMPT中的对应关系识别资源量类别；334等不计入的编码返回None"""
+    for category, pattern in _CATEGORY_WORDS:
+        if pattern.search(text):
+            return category
+    code = RESOURCE_CODE_PATTERN.search(text)
+    if code:
+        return {"333": "推断资源量", "332": "控制资源量"}.get(code.group(0), "探明资源量")
+    return None
+
+
+def _decimals(value: str) -> int:
+    return len(value.split(".")[1]) if "." in value else 0
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    return float(value.replace(",", "")) if value else None
+
+
+def _format(value: float, decimals: int) -> str:
+    return f"{value:.{decimals}f}"
+
+
+# ========== 解析器 ==========
+class ResourceTableParser:
+    """从PDF文本层识别并解析资源量汇总表"""
+
+    def __init__(self, min_confidence: float = DEFAULT_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+
+    def parse(self, file_path: str) -> ResourceTableResult:
+        """读取PDF文本层并解析（需要pypdf；扫描件没有文本层时返回置信度0）"""
+        try:
+            import pypdf
+        except ImportError:
+            raise ImportError("请安装必需包: pip install pypdf")
+
+        texts = []
+        for page in pypdf.PdfReader(file_path).pages:
+            try:
+                texts.append(page.extract_text() or "")
+            except Exception:
+                texts.append("")
+        return self.parse_pages(texts)
+
+    def parse_pages(self, texts: List[str]) -> ResourceTableResult:
+        """解析各页文本，返回合并后的资源信息和置信度"""
+        document_mineral = self._dominant_mineral(texts)
+        tables = []
+        for page_number, text in enumerate(texts, 1):
+            if "矿石量" not in text or not RESOURCE_CODE_PATTERN.search(text) and not re.search(r"推断|控制|探明", text):
+                continue
+            lines = [_clean(line).strip() for line in text.splitlines()]
+            tables.extend(self._parse_page(page_number, [line for line in lines if line], document_mineral))
+        tables = [table for table in tables if table.rows]
+        if not tables:
+            return ResourceTableResult([], 0.0, [], ["未找到资源量汇总表"], self.min_confidence)
+
+        # 存在表题含"保有"/"汇总"的表格时只使用这些表格
+        preferred = [table for table in tables if _PREFERRED_CAPTION.search(table.caption)]
+        candidates = preferred or tables
+        notes: List[str] = []
+        confidence = 1.0 if preferred else 0.9
+        if not preferred:
+            notes.append("表题未注明保有/汇总")
+
+        resources: Dict[str, Dict[str, ResourceQuantityDetail]] = {}
+        totals_seen: Dict[str, List[Tuple[Optional[float], Optional[float]]]] = {}
+        table_confidences = []
+        for table in candidates:
+            table_resources, table_confidence, table_notes = self._assemble(table)
+            table_confidences.append(table_confidence)
+            notes.extend(f"第{table.page}页: {note}" for note in table_notes)
+            for mineral, categories in table_resources.items():
+                total = categories.get(CATEGORY_TOTAL)
+                totals_seen.setdefault(mineral, []).append(
+                    (_to_float_detail(total, "矿石量"), _to_float_detail(total, "金属量")))
+                resources.setdefault(mineral, categories)
+        confidence *= min(table_confidences)
+
+        for mineral, totals in totals_seen.items():
+            if len({total for total in totals}) > 1:
+                confidence *= 0.6
+                notes.append(f"{mineral}在多张表中的合计不一致")
+
+        infos = [
+            ResourceInfo(矿种=mineral, 资源量情况=ResourceCategory(**{
+                field: categories.get(field) for field in CATEGORY_FIELDS + [CATEGORY_TOTAL]
+            }))
+            for mineral, categories in resources.items()
+        ]
+        return ResourceTableResult(infos, round(confidence, 3), sorted({table.page for table in candidates}),
+                                   notes, self.min_confidence)
+
+    @staticmethod
+    def _dominant_mineral(texts: List[str]) -> Optional[str]:
+        """全文出现次数最多的主矿种（表格中未注明矿种时使用）"""
+        counts = Counter()
+        for text in texts:
+            for match in _MINERAL_PATTERN.finditer(_clean(text)):
+                if not match.group(1):
+                    counts[normalize_mineral_name(match.group(2))] += 1
+        return counts.most_common(1)[0][0] if counts else None
+
+    # ---------- 表格识别 ----------
+    @staticmethod
+    def _parse_header(line: str, next_line: str) -> Optional[List[TableColumn]]:
+        """识别表头（含"矿石量"及"金属量"或"品位"），返回数值列；单位可在下一行单独列出"""
+        if "矿石量" not in line or ("金属量" not in line and "品位" not in line):
+            return None
+        tokens = re.sub(r"\s+\(", "(", line).split()
+        columns = []
+        for token in tokens:
+            unit_match = _UNIT_IN_PARENS.search(token)
+            unit = unit_match.group(1).replace(" ", "") if unit_match else None
+            name = _UNIT_IN_PARENS.sub("", token)
+            if "矿石量" in name:
+                columns.append(TableColumn("ore", ORE_UNITS.get(unit), None))
+            elif "金属量" in name:
+                columns.append(TableColumn("metal", METAL_UNITS.get(unit), _mineral_of(name)))
+            elif "品位" in name:
+                columns.append(TableColumn("grade", GRADE_UNITS.get(unit), _mineral_of(name)))
+            elif not _LABEL_HEADER.search(name):
+                columns.append(TableColumn("other", unit, None))
+
+        # 单位单独成行，如"(万吨) (千克) (g/t)"
+        units = _UNIT_IN_PARENS.findall(next_line)
+        if units and len(units) == len(columns) and not re.search(r"\d", _UNIT_IN_PARENS.sub("", next_line)):
+            tables = {"ore": ORE_UNITS, "metal": METAL_UNITS, "grade": GRADE_UNITS}
+            columns = [
+                column._replace(unit=column.unit or tables.get(column.kind, {}).get(unit.replace(" ", ""), unit))
+                for column, unit in zip(columns, units)
+            ]
+        return columns
+
+    def _parse_page(self, page_number: int, lines: List[str], document_mineral: Optional[str]) -> List[_ParsedTable]:
+        tables = []
+        index = 0
+        while index < len(lines):
+            columns = self._parse_header(lines[index], lines[index + 1] if index + 1 < len(lines) else "")
+            if not columns:
+                index += 1
+                continue
+
+            caption = next((line for line in reversed(lines[max(0, index - 3):index]) if "表" in line), "")
+            caption_mineral = _mineral_of(caption)
+            current_mineral = None
+            rows: List[_Row] = []
+            rejected = 0
+            gap = 0
+            mixed_scope = False
+            index += 1
+            while index < len(lines) and gap <= MAX_GAP_LINES:
+                line = lines[index]
+                if self._parse_header(line, "") or (line.startswith("表") and rows):
+                    break
+                index += 1
+                tokens = line.split()
+                labels, values = self._split_row(tokens)
+                label_text = "".join(labels)
+                mineral = _mineral_of(label_text) if label_text else None
+                if mineral and not re.search(r"\d", line):
+                    current_mineral, gap = mineral, 0  # 矿种单独成行作为分组标题
+                    continue
+                if not values:
+                    gap += 1
+                    continue
+                gap = 0
+                if _OTHER_SCOPE.search(label_text):
+                    mixed_scope = True
+                    continue
+                category = _category_of(label_text)
+                if category is None or len(values) != len(columns):
+                    if not re.search(r"334|预测", label_text):
+                        rejected += 1
+                    continue
+                if mineral:
+                    current_mineral = mineral
+                rows.append(_Row(category, current_mineral, values))
+
+            if rows:
+                row_minerals = any(row.mineral for row in rows) or any(column.mineral for column in columns)
+                mineral_source = ("rows" if row_minerals else "caption" if caption_mineral
+                                  else "document" if document_mineral else "unknown")
+                default_mineral = caption_mineral or document_mineral
+                rows = [row if row.mineral else row._replace(mineral=default_mineral) for row in rows]
+                tables.append(_ParsedTable(page_number, caption, columns, rows, rejected, mixed_scope, mineral_source))
+        return tables
+
+    @staticmethod
+    def _split_row(tokens: List[str]) -> Tuple[List[str], List[Optional[str]]]:
+        """拆分行首的标签（矿种、类别编码等）和其后的数值单元格（"-"、"/"等空单元格记为None）"""
+        labels: List[str] = []
+        values: List[Optional[str]] = []
+        for token in tokens:
+            if not values and (_CODE_TOKEN.match(token) or not (_NUMBER_TOKEN.match(token) or _EMPTY_CELL.match(token))):
+                labels.append(token)
+            elif _NUMBER_TOKEN.match(token):
+                values.append(token.replace(",", ""))
+            elif _EMPTY_CELL.match(token):
+                values.append(None)
+            else:
+                return labels, []  # 数值之间夹杂文字，不是规整的数据行
+        return labels, values
+
+    # ---------- 组装与置信度 ----------
+    def _assemble(self, table: _ParsedTable) -> Tuple[Dict[str, Dict[str, ResourceQuantityDetail]], float, List[str]]:
+        notes = []
+        confidence = 1.0
+        kinds = {column.kind: column for column in table.columns if column.mineral is None}
+        if "ore" not in kinds or kinds["ore"].unit is None:
+            confidence *= 0.8
+            notes.append("矿石量缺少单位")
+        for column in table.columns:
+            if column.kind in ("metal", "grade") and column.unit is None:
+                confidence *= 0.8 if column.kind == "metal" else 0.9
+                notes.append(f"{'金属量' if column.kind == 'metal' else '品位'}缺少单位")
+        parsed_ratio = len(table.rows) / (len(table.rows) + table.rejected_rows)
+        if parsed_ratio < 1:
+            confidence *= parsed_ratio
+            notes.append(f"{table.rejected_rows}行无法解析")
+        if table.mixed_scope:
+            confidence *= 0.7
+            notes.append("表内混有消耗/累计查明等其它口径")
+        confidence *= {"rows": 1.0, "caption": 1.0, "document": 0.9, "unknown": 0.5}[table.mineral_source]
+        if table.mineral_source != "rows" and table.mineral_source != "caption":
+            notes.append("矿种按全文推断" if table.mineral_source == "document" else "无法确定矿种")
+
+        # 每行按列拆分到各矿种：带矿种的金属量/品位列属于该矿种，矿石量列由同一行的矿种共享
+        entries: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+        for row in table.rows:
+            per_mineral: Dict[Optional[str], Dict[str, str]] = {}
+            shared_ore = None
+            for column, value in zip(table.columns, row.values):
+                if value is None or column.kind == "other":
+                    continue
+                if column.kind == "ore":
+                    shared_ore = value
+                    continue
+                per_mineral.setdefault(column.mineral or row.mineral, {})[column.kind] = value
+            if not per_mineral and shared_ore is not None:
+                per_mineral[row.mineral] = {}
+            for mineral, values in per_mineral.items():
+                if shared_ore is not None and (values or len(per_mineral) == 1):
+                    values["ore"] = shared_ore
+                entries.setdefault(mineral or "", {}).setdefault(row.category, []).append(values)
+
+        units = {column.kind if column.mineral is None else (column.kind, column.mineral): column.unit
+                 for column in table.columns}
+        resources: Dict[str, Dict[str, ResourceQuantityDetail]] = {}
+        for mineral, categories in entries.items():
+            def unit(kind: str) -> str:
+                return units.get((kind, mineral)) or units.get(kind) or ""
+
+            repeated = [category for category, rows in categories.items() if len(rows) > 1]
+            if repeated and CATEGORY_TOTAL in repeated:
+                confidence *= 0.7
+                notes.append(f"{mineral or '未知矿种'}含多个合计/小计行")
+            summed = {category: self._sum_rows(rows) for category, rows in categories.items()
+                      if category != CATEGORY_TOTAL}
+            stated_total = self._sum_rows(categories[CATEGORY_TOTAL][-1:]) if CATEGORY_TOTAL in categories else None
+            computed_total = self._sum_rows([values for values in summed.values()]) if summed else None
+            # 多矿种共用矿石量列时，伴生矿的合计矿石量可能包含不含该矿种的块段，只校验金属量
+            shared_ore = len(entries) > 1 and mineral not in (row.mineral for row in table.rows)
+            if stated_total and computed_total and summed:
+                if not self._totals_match(stated_total, computed_total, ("metal",) if shared_ore else ("ore", "metal")):
+                    confidence *= 0.6
+                    notes.append(f"{mineral or '未知矿种'}合计与各类别之和不一致")
+            elif summed:
+                confidence *= 0.9
+                notes.append(f"{mineral or '未知矿种'}缺少合计行，由各类别相加")
+            total = stated_total or computed_total
+            if total:
+                summed[CATEGORY_TOTAL] = total
+            resources[mineral] = {
+                category: ResourceQuantityDetail(
+                    矿石量=values["ore"] + unit("ore") if values.get("ore") else None,
+                    金属量=values["metal"] + unit("metal") if values.get("metal") else None,
+                    品位=values["grade"] + unit("grade") if values.get("grade") else None,
+                )
+                for category, values in summed.items()
+            }
+        if "" in resources:
+            resources.pop("")
+            confidence *= 0.5
+        return resources, confidence, notes
+
+    @staticmethod
+    def _sum_rows(rows: List[Dict[str, str]]) -> Dict[str, str]:
+        """合并同一类别的多行（如111b与122b均计入探明）：矿石量、金属量相加，品位按矿石量加权"""
+        if len(rows) == 1:
+            return dict(rows[0])
+        merged: Dict[str, str] = {}
+        for kind in ("ore", "metal"):
+            values = [row[kind] for row in rows if row.get(kind)]
+            if values:
+                merged[kind] = _format(sum(float(value) for value in values), max(map(_decimals, values)))
+        weighted = [(float(row["grade"]), float(row["ore"])) for row in rows if row.get("grade") and row.get("ore")]
+        if weighted and sum(ore for _, ore in weighted) > 0:
+            decimals = max(2, max(_decimals(row["grade"]) for row in rows if row.get("grade")))
+            merged["grade"] = _format(sum(grade * ore for grade, ore in weighted) / sum(ore for _, ore in weighted),
+                                      decimals)
+        return merged
+
+    @staticmethod
+    def _totals_match(stated: Dict[str, str], computed: Dict[str, str], kinds: Tuple[str, ...]) -> bool:
+        for kind in kinds:
+            if stated.get(kind) and computed.get(kind):
+                expected = float(stated[kind])
+                if abs(float(computed[kind]) - expected) > TOTAL_TOLERANCE * max(abs(expected), 1e-9):
+                    return False
+        return True
+
+
+def _to_float_detail(detail: Optional[ResourceQuantityDetail], field: str) -> Optional[float]:
+    """取资源量明细中某字段的数值部分（用于比较多张表的合计）"""
+    value = getattr(detail, field, None) if detail else None
+    match = re.match(r"\d+(?:\.\d+)?", value or "")
+    return float(match.group(0)) if match else None
+
+
+# ========== 命令行入口 ==========
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="本地解析矿山储量核实报告中的资源量汇总表")
+    parser.add_argument("file", help="PDF文件路径")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE, help="置信度阈值")
+    parser.add_argument("--json", action="store_true", help="以JSON输出资源信息")
+    args = parser.parse_args(argv)
+
+    result = ResourceTableParser(args.min_confidence).parse(args.file)
+    if args.json:
+        print(json.dumps({
+            "confidence": result.confidence, "confident": result.confident, "pages": result.pages,
+            "notes": result.notes, "资源信息": [info.model_dump(exclude_none=True) for info in result.resources],
+        }, ensure_ascii=False, indent=2))
+        return 0 if result.confident else 1
+
+    status = "✅ 可直接使用" if result.confident else "⚠️ 置信度不足，需由模型提取"
+    print(f"📊 置信度 {result.confidence:.2f}（阈值 {args.min_confidence:.2f}）{status}")
+    if result.pages:
+        print(f"📄 表格所在页: {', '.join(map(str, result.pages))}")
+    for note in result.notes:
+        print(f"  • {note}")
+    for info in result.resources:
+        print(f"\n💎 {info.矿种}")
+        for field, detail in info.资源量情况.model_dump(exclude_none=True).items():
+            print(f"  • {field}: " + "，".join(f"{key} {value}" for key, value in detail.items()))
+    return 0 if result.confident else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
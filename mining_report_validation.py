@@ -0,0 +1,311 @@
+"""
+矿山储量核实报告提取结果校验与定向重提取
+
+提取结果有误时（总计与推断+控制+探明之和不一致、勘查程度不是普查/详查/勘探、资源信息为空），
+以往只能换更大的模型重跑整份文档。本模块在本地校验MiningReport，只对未通过校验的子结构重新提问：
+
+- check_report：本地一致性校验，返回ValidationIssue列表（不调用模型）
+- repair_report：可以确定性修复的问题直接修复（如"详查阶段" → "详查"，只有一个类别时以其补全总计）
+- ValidatedExtractor：先用最便宜的模型整体提取；校验失败的子结构（单个矿种的资源量、勘查程度、
+  整个资源信息）带着校验错误定向重提，按模型阶梯逐级升级（gemini-2.5-flash → gemini-2.5-pro，
+  o4-mini → o3），只有便宜模型仍未通过校验时才调用更强的模型
+
+大部分文档只走便宜模型的一次请求；重提请求、升级次数记录在运行指标的
+validation_issues / reask_requests / escalations 中。
+
+用法示例:
+    from mining_report_validation import ValidatedExtractor, check_report
+
+    issues = check_report(report)                  # [ValidationIssue(...), ...]
+
+    extractor = create_extractor("gemini", "gemini-2.5-flash")
+    result = ValidatedExtractor(extractor).extract_from_file("report.pdf")
+
+    python mining_report_validation.py results/    # 校验已保存的JSON结果
+"""
+import argparse
+import contextvars
+import glob
+import json
+import math
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple, Type, NamedTuple, Literal
+
+from pydantic import BaseModel
+
+from mining_report_extractor_stream import (
+    BaseMiningReportExtractor,
+    MiningReport,
+    MiningRightsInfo,
+    ResourceCategory,
+    ResourceInfo,
+    ResourceInfoList,
+    normalize_mineral_name,
+    prompt_section_text,
+)
+from mining_report_normalize import parse_metal_kg, parse_tonnes
+
+
+# 模型阶梯：先用便宜的模型，校验未通过时逐级升级
+ESCALATION_MODELS: Dict[str, List[str]] = {
+    "gemini": ["gemini-2.5-flash", "gemini-2.5-pro"],
+    "openai": ["o4-mini", "o3"],
+}
+EXPLORATION_STAGES = ["普查", "详查", "勘探"]
+CATEGORY_FIELDS = ["推断资源量", "控制资源量", "探明资源量"]
+TOTAL_TOLERANCE = 0.01  # 总计与各类别之和的相对误差上限（报告中的数值通常四舍五入）
+
+ISSUE_EMPTY_RESOURCES = "empty_resources"
+ISSUE_TOTAL_MISMATCH = "total_mismatch"
+ISSUE_INVALID_STAGE = "invalid_exploration_stage"
+
+# ========== 定向重提取提示词 ==========
+REASK_PROMPT_TEMPLATE = """
+你是一名地质和矿业领域的专家。此前从这份矿山储量核实报告PDF中提取的以下信息未通过一致性校验：
+
+{problems}
+
+请重新仔细核对报告原文（特别是资源量估算结果汇总表），只重新提取下面要求的部分并以JSON格式返回：
+
+{section_text}
+
+如果某些信息在文档中未找到，请在对应字段填入null，切不可没有根据地胡乱编造！
+"""
+
+MINERAL_SECTION_TEXT = """## 资源信息（仅限「{mineral}」）
+只返回「{mineral}」这一个矿种的资源量，矿种字段填写"{mineral}"。
+{section_text}"""
+
+STAGE_SECTION_TEXT = """## 勘查程度
+本次储量核实的勘查程度，有且仅有以下三种类型（如果没有找到则返回null）：普查、详查、勘探"""
+
+
+class ExplorationStage(BaseModel):
+    """勘查程度重提取模型（结构化输出限定取值）"""
+    勘查程度: Optional[Literal["普查", "详查", "勘探"]] = None
+
+
+class ValidationIssue(NamedTuple):
+    """校验问题：target为需要重提取的子结构（资源信息 / 资源信息:矿种 / 矿权信息.勘查程度）"""
+    code: str
+    target: str
+    message: str
+
+
+# ========== 本地校验 ==========
+def _field_sums(category: ResourceCategory, field: str, parser) -> Optional[Tuple[float, float]]:
+    """返回(各类别之和, 总计)；总计或任一有数据的类别缺少该字段、无法解析时返回None（不做比较）"""
+    total = category.总计
+    if total is None or not getattr(total, field):
+        return None
+    parts = [getattr(category, name) for name in CATEGORY_FIELDS if getattr(category, name) is not None]
+    if not parts:
+        return None
+    values = []
+    for part in parts:
+        value, _ = parser(getattr(part, field))
+        if math.isnan(value):
+            return None
+        values.append(value)
+    total_value, _ = parser(getattr(total, field))
+    if math.isnan(total_value):
+        return None
+    return sum(values), total_value
+
+
+def check_resource(info: ResourceInfo, tolerance: float = TOTAL_TOLERANCE) -> List[ValidationIssue]:
+    """校验单个矿种：总计的矿石量、金属量应等于推断+控制+探明之和"""
+    issues = []
+    category = info.资源量情况
+    if category is None:
+        return issues
+    mineral = normalize_mineral_name(info.矿种)
+    # 没有矿种名称时无法单独重提该矿种，改为重提整个资源信息
+    target = f"资源信息:{mineral}" if mineral else "资源信息"
+    label = mineral or "未注明矿种的资源量"
+    for field, parser in (("矿石量", parse_tonnes), ("金属量", parse_metal_kg)):
+        sums = _field_sums(category, field, parser)
+        if sums is None:
+            continue
+        parts_sum, total = sums
+        if abs(parts_sum - total) > tolerance * max(abs(total), 1e-9):
+            parts = "+".join(getattr(getattr(category, name), field) or "null"
+                             for name in CATEGORY_FIELDS if getattr(category, name) is not None)
+            issues.append(ValidationIssue(
+                ISSUE_TOTAL_MISMATCH, target,
+                f"{label}的总计{field}为{getattr(category.总计, field)}，但推断+控制+探明为{parts}，两者不一致",
+            ))
+    return issues
+
+
+def check_report(report: MiningReport, tolerance: float = TOTAL_TOLERANCE) -> List[ValidationIssue]:
+    """本地一致性校验，返回未通过的子结构及原因"""
+    issues = []
+    if not report.资源信息:
+        issues.append(ValidationIssue(ISSUE_EMPTY_RESOURCES, "资源信息", "资源信息为空，未提取到任何矿种的资源量"))
+    else:
+        for info in report.资源信息:
+            issues.extend(check_resource(info, tolerance))
+    stage = report.矿权信息.勘查程度 if report.矿权信息 else None
+    if stage is not None and stage not in EXPLORATION_STAGES:
+        issues.append(ValidationIssue(
+            ISSUE_INVALID_STAGE, "矿权信息.勘查程度",
+            f"勘查程度为\"{stage}\"，只能是{'、'.join(EXPLORATION_STAGES)}之一（未找到时为null）",
+        ))
+    return issues
+
+
+def repair_report(report: MiningReport) -> MiningReport:
+    """确定性修复（不调用模型）：勘查程度只包含一种合法取值时取该值；缺少总计且只有一个类别时以该类别作为总计"""
+    rights = report.矿权信息
+    if rights is not None and rights.勘查程度 is not None and rights.勘查程度 not in EXPLORATION_STAGES:
+        matches = [stage for stage in EXPLORATION_STAGES if stage in rights.勘查程度]
+        if len(matches) == 1:
+            rights = rights.model_copy(update={"勘查程度": matches[0]})
+    resources = [_fill_total(info) for info in report.资源信息] if report.资源信息 else report.资源信息
+    return report.model_copy(update={"矿权信息": rights, "资源信息": resources})
+
+
+def _fill_total(info: ResourceInfo) -> ResourceInfo:
+    category = info.资源量情况
+    if category is None or category.总计 is not None:
+        return info
+    parts = [getattr(category, name) for name in CATEGORY_FIELDS if getattr(category, name) is not None]
+    if len(parts) != 1:
+        return info  # 多个类别相加需换算单位，交给模型核对
+    return info.model_copy(update={"资源量情况": category.model_copy(update={"总计": parts[0]})})
+
+
+# ========== 定向重提取与模型升级 ==========
+class ValidatedExtractor:
+    """校验驱动的提取：便宜模型整体提取 → 本地校验 → 仅对失败的子结构定向重提并逐级升级模型"""
+
+    def __init__(self, extractor: BaseMiningReportExtractor, models: Optional[List[str]] = None,
+                 tolerance: float = TOTAL_TOLERANCE):
+        self.extractor = extractor
+        self.models = models or ESCALATION_MODELS.get(extractor.PROVIDER) or [extractor.model]
+        self.tolerance = tolerance
+        self.last_issues: List[ValidationIssue] = []  # 最近一次提取在所有模型重提后仍未通过的问题
+
+    def extract_from_file(self, file_path: str) -> MiningReport:
+        """从PDF文件提取信息（结果只在通过校验时写入缓存）"""
+        extractor = self.extractor
+        if not pathlib.Path(file_path).exists():
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        variant = "validated=" + ">".join(self.models)
+        with extractor.track(file_path, "validated") as metrics:
+            cached = extractor.get_cached_result(file_path, variant)
+            if cached is not None:
+                self.last_issues = []
+                return cached
+
+            local_resources = extractor.local_resources(file_path)
+            # 上下文缓存为阶梯中第一个模型创建（大部分文档只需要该模型的请求）
+            with extractor.open_document(file_path, model=self.models[0]) as document:
+                extractor.log(f"🔍 正在分析文档内容（{self.models[0]}）...")
+                result, _ = extractor.request_report(document, local_resources, self.models[0])
+                result = repair_report(result)
+                issues = check_report(result, self.tolerance)
+                metrics.validation_issues = len(issues)
+                if not issues:
+                    extractor.log("✅ 本地校验通过")
+                for level, model in enumerate(self.models):
+                    if not issues:
+                        break
+                    extractor.log(f"🔁 {len(issues)} 处未通过校验，使用 {model} 定向重提: "
+                                   f"{', '.join(sorted({issue.target for issue in issues}))}")
+                    if level > 0:
+                        extractor.add_metrics(escalations=1)
+                    result = repair_report(self._reask(document, result, issues, model))
+                    issues = check_report(result, self.tolerance)
+
+            self.last_issues = issues
+            if issues:
+                extractor.log(f"⚠️ 已尝试 {' → '.join(self.models)}，仍有 {len(issues)} 处未通过校验:")
+                for issue in issues:
+                    extractor.log(f"  • {issue.message}")
+            else:
+                extractor.log("✅ 文档分析完成")
+                extractor.put_cached_result(file_path, result, variant)
+            return result
+
+    def _reask(self, document: Any, report: MiningReport, issues: List[ValidationIssue], model: str) -> MiningReport:
+        """并发重提各失败子结构，将通过校验的结果合并回报告（仍未通过的保留较新的回答，供下一级模型参考）"""
+        targets: Dict[str, List[ValidationIssue]] = {}
+        for issue in issues:
+            targets.setdefault(issue.target, []).append(issue)
+
+        def reask(target: str) -> Tuple[str, Optional[BaseModel]]:
+            prompt, schema = self._reask_request(report, target, targets[target])
+            try:
+                value, _ = self.extractor.request_structured(document, prompt, schema, model)
+            except Exception as e:
+                self.extractor.log(f"⚠️ {target} 重提失败: {e}")
+                return target, None
+            self.extractor.add_metrics(reask_requests=1)
+            return target, value
+
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, reask, target) for target in targets]
+            answers = [future.result() for future in futures]
+        for target, value in answers:
+            if value is not None:
+                report = self._apply(report, target, value)
+        return report
+
+    @staticmethod
+    def _reask_request(report: MiningReport, target: str, issues: List[ValidationIssue]) -> Tuple[str, Type[BaseModel]]:
+        """重提请求的提示词和Schema：提示词中附带校验错误，Schema只覆盖失败的子结构"""
+        problems = "\n".join(f"- {issue.message}" for issue in issues)
+        if target == "矿权信息.勘查程度":
+            return REASK_PROMPT_TEMPLATE.format(problems=problems, section_text=STAGE_SECTION_TEXT), ExplorationStage
+        resource_text = prompt_section_text("资源信息")
+        if target.startswith("资源信息:"):
+            mineral = target.split(":", 1)[1]
+            section_text = MINERAL_SECTION_TEXT.format(mineral=mineral, section_text=resource_text.split("\n", 1)[1])
+            return REASK_PROMPT_TEMPLATE.format(problems=problems, section_text=section_text), ResourceInfo
+        return REASK_PROMPT_TEMPLATE.format(problems=problems, section_text=resource_text), ResourceInfoList
+
+    @staticmethod
+    def _apply(report: MiningReport, target: str, value: BaseModel) -> MiningReport:
+        """将重提结果合并回报告"""
+        if isinstance(value, ExplorationStage):
+            rights = report.矿权信息 or MiningRightsInfo()
+            return report.model_copy(update={"矿权信息": rights.model_copy(update={"勘查程度": value.勘查程度})})
+        if isinstance(value, ResourceInfoList):
+            return report.model_copy(update={"资源信息": value.资源信息 or report.资源信息})
+        mineral = target.split(":", 1)[1]
+        value = value.model_copy(update={"矿种": mineral})
+        resources = [value if normalize_mineral_name(info.矿种) == mineral else info for info in report.资源信息 or []]
+        return report.model_copy(update={"资源信息": resources})
+
+
+# ========== 命令行入口 ==========
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="校验已保存的矿山报告提取结果（总计、勘查程度、资源信息）")
+    parser.add_argument("source", help="结果JSON文件、目录或glob模式")
+    parser.add_argument("--tolerance", type=float, default=TOTAL_TOLERANCE, help="总计与各类别之和的相对误差上限")
+    args = parser.parse_args(argv)
+
+    source = pathlib.Path(args.source)
+    paths = sorted(source.glob("*.json")) if source.is_dir() else sorted(map(pathlib.Path, glob.glob(args.source)))
+    failed = 0
+    for path in paths:
+        try:
+            report = MiningReport.model_validate(json.loads(path.read_text(encoding="utf-8")))
+        except (ValueError, OSError):
+            continue
+        issues = check_report(report, args.tolerance)
+        if issues:
+            failed += 1
+            print(f"❌ {path.name}")
+            for issue in issues:
+                print(f"  • {issue.message}")
+    print(f"📊 共校验 {len(paths)} 个文件，{failed} 个未通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
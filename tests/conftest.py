@@ -0,0 +1,45 @@
+import pathlib
+import sys
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import pytest
+
+
+def write_text_pdf(path, pages):
+    """生成带文本层的多页PDF（Helvetica字体，仅支持ASCII文本），返回文件路径"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = b"".join(b"BT /F1 9 Tf 20 %d Td (%s) Tj ET\n" % (800 - 12 * i, line.encode("ascii"))
+                         for i, line in enumerate(text.split("\n")))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(lines) + lines + b"endstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    pathlib.Path(path).write_bytes(bytes(data))
+    return str(path)
+
+
+@pytest.fixture
+def mock_server():
+    """本地模拟的OpenAI/Gemini服务（固定10ms延迟）"""
+    from mining_report_benchmark import LatencyProfile, MockProviderServer, MockServerConfig
+
+    fast = LatencyProfile(distribution="fixed", median_seconds=0.01)
+    server = MockProviderServer(MockServerConfig(upload_latency=fast, generation_latency=fast))
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from conftest import write_text_pdf
+from mining_report_async import AsyncClientPool, create_async_extractor
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import UploadCheckpoints
+from mining_report_extractor_stream import MiningReport
+
+
+def make_async(provider, mock_server, **kwargs):
+    return create_async_extractor(provider, "gemini-2.5-flash" if provider == "gemini" else "gpt-4.1",
+                                  api_key=MOCK_API_KEY, quiet=True, base_url=mock_server.base_url_for(provider),
+                                  pool=AsyncClientPool(), **kwargs)
+
+
+def run(extractor, coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await extractor.pool.aclose()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("provider", ["gemini", "openai"])
+def test_async_extractors_return_reports(mock_server, tmp_path, provider):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_async(provider, mock_server)
+    result = run(extractor, extractor.extract_from_file(report))
+    assert isinstance(result, MiningReport)
+    assert result.报告信息.报告名称
+
+
+def test_async_gemini_honours_inline_max_bytes(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_async("gemini", mock_server, inline_max_bytes=0)
+    run(extractor, extractor.extract_from_file(report))
+    assert mock_server.request_counts["gemini.files.upload"] == 1
+
+
+def test_async_gemini_without_text_raises_clear_error(mock_server, tmp_path, monkeypatch):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_async("gemini", mock_server)
+
+    class Blocked:
+        text = None
+        candidates = []
+        prompt_feedback = "SAFETY"
+
+    async def blocked(*args, **kwargs):
+        return Blocked()
+
+    async def extract():
+        monkeypatch.setattr(extractor.client.aio.models, "generate_content", blocked)
+        return await extractor.extract_from_file(report)
+
+    with pytest.raises(ValueError, match="未返回可解析的结构化结果"):
+        run(extractor, extract())
+
+
+def test_async_openai_refusal_raises_clear_error(mock_server, tmp_path, monkeypatch):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_async("openai", mock_server)
+
+    class Refused:
+        """模型拒答时SDK返回的响应没有解析结果"""
+        output_parsed = None
+
+        def __init__(self, response):
+            self.response = response
+
+        def __getattr__(self, name):
+            return getattr(self.response, name)
+
+    async def extract():
+        parse = extractor.client.responses.parse
+
+        async def refused(**kwargs):
+            return Refused(await parse(**kwargs))
+
+        monkeypatch.setattr(extractor.client.responses, "parse", refused)
+        return await extractor.extract_with_response(report)
+
+    with pytest.raises(ValueError, match="未返回可解析的结构化结果"):
+        run(extractor, extract())
+
+
+@pytest.mark.parametrize("option", ["scheduler", "upload_checkpoints", "context_cache"])
+def test_async_extractors_reject_sync_only_options(mock_server, tmp_path, option):
+    value = UploadCheckpoints(str(tmp_path / "checkpoints.json")) if option == "upload_checkpoints" else object()
+    with pytest.raises(ValueError, match=option):
+        make_async("openai", mock_server, **{option: value})
@@ -0,0 +1,99 @@
+import pathlib
+
+import pytest
+
+import mining_report_batch as batch
+from conftest import write_text_pdf
+from mining_report_batch import collect_pdf_files, run_batch
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_journal import JobJournal
+from mining_report_store import ResultStore
+
+
+@pytest.fixture
+def reports(tmp_path):
+    report_dir = tmp_path / "reports"
+    report_dir.mkdir()
+    for name in ["a", "b", "c"]:
+        write_text_pdf(report_dir / f"{name}.pdf", [f"mining report {name}"])
+    return report_dir
+
+
+def openai_kwargs(mock_server):
+    return {"api_key": MOCK_API_KEY, "quiet": True, "base_url": mock_server.base_url_for("openai")}
+
+
+def test_batch_writes_store_and_journal_and_cleans_up_uploads(mock_server, tmp_path, reports):
+    files = collect_pdf_files(str(reports))
+    store = ResultStore(str(tmp_path / "reports.db"))
+    journal = JobJournal(str(tmp_path / "journal.jsonl"))
+    summary = run_batch(files, "openai", "gpt-4.1", output_dir=str(tmp_path / "out"), concurrency=2,
+                        extractor_kwargs=openai_kwargs(mock_server), store=store, write_json=False, journal=journal)
+    assert (summary.succeeded, summary.failed, summary.skipped) == (3, 0, 0)
+    assert store.counts()["reports"] == 3
+    assert journal.counts()["saved"] == 3
+    assert list((tmp_path / "out").iterdir()) == []  # write_json=False时只写入结果库
+    assert mock_server.files == {}  # 未启用登记表时每个文档处理后删除上传文件
+    store.close()
+
+    generated = mock_server.request_counts["openai.responses.create"]
+    rerun = run_batch(files, "openai", "gpt-4.1", output_dir=str(tmp_path / "out"),
+                      extractor_kwargs=openai_kwargs(mock_server), journal=JobJournal(str(tmp_path / "journal.jsonl")))
+    assert (rerun.succeeded, rerun.skipped) == (0, 3)
+    assert mock_server.request_counts["openai.responses.create"] == generated
+
+
+def test_failed_document_is_recorded_and_retried(mock_server, tmp_path, reports):
+    files = collect_pdf_files(str(reports))
+    journal_path = str(tmp_path / "journal.jsonl")
+
+    def fail_on_b(extractor, file_path):
+        if pathlib.Path(file_path).stem == "b":
+            raise RuntimeError("模拟失败")
+        return extractor.extract_from_file(file_path)
+
+    summary = run_batch(files, "openai", "gpt-4.1", output_dir=str(tmp_path / "out"),
+                        extractor_kwargs=openai_kwargs(mock_server), extract_fn=fail_on_b,
+                        journal=JobJournal(journal_path))
+    assert (summary.succeeded, summary.failed) == (2, 1)
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == ["a_result.json", "c_result.json"]
+    assert JobJournal(journal_path).counts()["failed"] == 1
+
+    retry = run_batch(files, "openai", "gpt-4.1", output_dir=str(tmp_path / "out"),
+                      extractor_kwargs=openai_kwargs(mock_server), journal=JobJournal(journal_path))
+    assert (retry.succeeded, retry.skipped) == (1, 2)
+    assert mock_server.files == {}
+
+
+def test_cli_batch_with_store_and_journal(mock_server, monkeypatch, tmp_path, reports):
+    monkeypatch.chdir(tmp_path)
+    create = batch.create_extractor
+    monkeypatch.setattr(batch, "create_extractor", lambda provider, model, **kwargs: create(
+        provider, model, api_key=MOCK_API_KEY, base_url=mock_server.base_url_for(provider), **kwargs))
+    argv = [str(reports), "--provider", "openai", "--model", "gpt-4.1", "-o", "out", "-q",
+            "--store", "reports.db", "--no-json", "--journal", "journal.jsonl"]
+    assert batch.main(argv) == 0
+    assert ResultStore("reports.db").counts()["reports"] == 3
+    assert JobJournal("journal.jsonl").counts()["saved"] == 3
+    assert [path.name for path in (tmp_path / "out").iterdir()] == [batch.SUMMARY_FILENAME]
+    assert batch.main(argv) == 0  # 重新运行时按任务日志跳过全部文档
+    assert ResultStore("reports.db").counts()["reports"] == 3
+
+
+@pytest.mark.parametrize("flags, message", [
+    (["--no-json"], "--no-json 需要配合 --store"),
+    (["--hedge-provider", "gemini", "--sections"], "--hedge-provider 不能与"),
+    (["--validate", "--chunk-pages", "10"], "--validate 不能与"),
+    (["--dedup-index", "similarity.db", "--sections"], "--dedup-index 不能与"),
+])
+def test_incompatible_flags_are_rejected_before_extraction(monkeypatch, capsys, tmp_path, reports, flags, message):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(batch, "run_batch", lambda *args, **kwargs: pytest.fail("不应开始提取"))
+    assert batch.main([str(reports), "--provider", "openai", "--no-cache", "--no-upload-reuse", *flags]) == 1
+    assert message in capsys.readouterr().out
+    assert not (tmp_path / "similarity.db").exists()
+
+
+def test_missing_source_returns_error(capsys, tmp_path):
+    assert batch.main([str(tmp_path / "missing"), "--provider", "gemini"]) == 1
+    assert "未找到PDF文件" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+from conftest import write_text_pdf
+from mining_report_benchmark import LatencyProfile, MockProviderServer, MockServerConfig, run_case
+
+FAST = LatencyProfile(distribution="fixed", median_seconds=0.01)
+
+
+def start_mock(**config):
+    return MockProviderServer(MockServerConfig(upload_latency=FAST, generation_latency=FAST, **config)).start()
+
+
+def test_injected_errors_are_retried_per_request(tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    server = start_mock(error_rate=0.3, error_statuses=[503], seed=7)
+    try:
+        result = run_case("gemini", "gemini-2.5-flash", server.gemini_base_url, report, 0.0,
+                          concurrency=2, docs=6, retries=5)
+        errors = server.error_counts.get("gemini.generate_content", 0)
+        assert errors > 0
+        assert result.succeeded == 6 and result.failed == 0
+        # 每次注入的错误只重发一个生成请求
+        assert server.request_counts["gemini.generate_content"] == 6 + errors
+    finally:
+        server.stop()
+
+
+def test_injected_errors_fail_documents_without_retries(tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    server = start_mock(error_rate=1.0, error_statuses=[503], seed=7)
+    try:
+        result = run_case("gemini", "gemini-2.5-flash", server.gemini_base_url, report, 0.0, concurrency=1, docs=2)
+        assert result.succeeded == 0 and result.failed == 2 and result.errors
+    finally:
+        server.stop()
+
+
+def test_generation_latency_is_injected(tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    server = MockProviderServer(MockServerConfig(
+        generation_latency=LatencyProfile(distribution="fixed", median_seconds=0.2))).start()
+    try:
+        result = run_case("gemini", "gemini-2.5-flash", server.gemini_base_url, report, 0.0, concurrency=1, docs=2)
+        assert result.succeeded == 2 and result.latency_p50 >= 0.2
+    finally:
+        server.stop()
@@ -0,0 +1,74 @@
+import os
+import time
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import ExtractionCache
+from mining_report_extractor_stream import MiningReport, create_extractor
+from mining_report_pages import PageSelector
+from mining_report_tables import ResourceTableParser
+
+
+def make_extractor(**kwargs):
+    return create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY, quiet=True, **kwargs)
+
+
+def test_cache_key_includes_every_option(tmp_path):
+    report = tmp_path / "report.pdf"
+    report.write_bytes(b"%PDF-1.4 test")
+    keys = [
+        make_extractor()._cache_key(str(report)),
+        make_extractor()._cache_key(str(report), "chunks=20"),
+        make_extractor(page_selector=PageSelector())._cache_key(str(report)),
+        # 同时指定variant和页面预筛选时两者都参与缓存键
+        make_extractor(page_selector=PageSelector())._cache_key(str(report), "chunks=20"),
+        make_extractor(page_selector=PageSelector(head_pages=1))._cache_key(str(report)),
+        make_extractor(page_selector=PageSelector(keywords={"储量": 1.0}))._cache_key(str(report)),
+        make_extractor(page_selector=PageSelector(), table_parser=ResourceTableParser())._cache_key(str(report)),
+    ]
+    assert len(set(keys)) == len(keys)
+    assert make_extractor(page_selector=PageSelector())._cache_key(str(report)) == keys[2]
+
+
+def test_extraction_cache_expires_by_write_time_and_evicts_least_recently_read(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_age_days=1)
+    report = MiningReport(其它信息="x" * 1000)
+    for key in ("a" * 64, "b" * 64, "c" * 64):
+        cache.put(key, report)
+    old, read, unread = (cache._entry_path(key * 64) for key in "abc")
+    day = 24 * 3600
+    os.utime(old, (time.time(), time.time() - 2 * day))  # 最近读取过，但写入已超过一天
+    assert cache.get("a" * 64) is None and not old.exists()
+
+    os.utime(read, (time.time() - 3600, time.time() - 3600))
+    os.utime(unread, (time.time() - 7200, time.time() - 7200))
+    assert cache.get("b" * 64) == report  # 读取只更新访问时间
+    assert time.time() - read.stat().st_mtime >= 3600
+    cache.max_size_bytes = read.stat().st_size
+    assert cache.evict() == 1 and read.exists() and not unread.exists()
+
+
+def test_extraction_cache_scans_only_when_over_budget(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "cache"))
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+    report = MiningReport(其它信息="x" * 1000)
+    for i in range(5):
+        cache.put(f"{i:064d}", report)
+    assert len(scans) == 1  # 首次写入扫描得到总大小，之后累计
+    cache.max_size_bytes = 3000
+    cache.put("f" * 64, report)
+    assert len(scans) == 2 and len(list(tmp_path.glob("cache/*/*.json"))) == 2
+    assert not list(tmp_path.glob("cache/*/*.tmp"))
+
+
+def test_openai_cache_hit_clears_previous_conversation_state(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = create_extractor("openai", "gpt-4.1", api_key=MOCK_API_KEY, quiet=True,
+                                 base_url=mock_server.base_url_for("openai"),
+                                 cache=ExtractionCache(str(tmp_path / "cache")))
+    extractor.extract_from_file(report)
+    assert extractor.initial_response_id is not None
+    assert extractor.extract_from_file(report) is not None  # 命中缓存
+    assert extractor.initial_response_id is None and extractor.file_id is None
@@ -0,0 +1,95 @@
+import pytest
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import UploadRegistry
+from mining_report_extractor_stream import (
+    MiningReport,
+    OreBodyDistribution,
+    ReportInfo,
+    ResourceCategory,
+    ResourceInfo,
+    ResourceQuantityDetail,
+    create_extractor,
+    merge_mining_reports,
+)
+
+
+def test_merge_takes_first_non_empty_field_and_groups_minerals_and_ore_bodies():
+    first = MiningReport(
+        报告信息=ReportInfo(报告名称="某金矿核实报告"),
+        资源信息=[ResourceInfo(矿种="金", 资源量情况=ResourceCategory(
+            推断资源量=ResourceQuantityDetail(矿石量="120万吨")))],
+        矿体分布=[OreBodyDistribution(矿体编号="Au1", 矿体长度="850米")],
+        其它信息="第一段",
+    )
+    second = MiningReport(
+        报告信息=ReportInfo(报告名称="其它名称", 编制单位="某地质勘查院"),
+        资源信息=[ResourceInfo(矿种="金矿", 资源量情况=ResourceCategory(
+            推断资源量=ResourceQuantityDetail(矿石量="999万吨", 品位="3.0克/吨"),
+            控制资源量=ResourceQuantityDetail(矿石量="80万吨")))],
+        矿体分布=[OreBodyDistribution(矿体编号="Au1", 矿体厚度="2.3米"), OreBodyDistribution(矿体编号="Au2")],
+        其它信息="第一段",
+    )
+    merged = merge_mining_reports([first, second])
+    assert merged.报告信息 == ReportInfo(报告名称="某金矿核实报告", 编制单位="某地质勘查院")
+    [gold] = merged.资源信息
+    assert gold.矿种 == "金矿"
+    assert gold.资源量情况.推断资源量 == ResourceQuantityDetail(矿石量="120万吨", 品位="3.0克/吨")
+    assert gold.资源量情况.控制资源量.矿石量 == "80万吨"
+    assert [body.矿体编号 for body in merged.矿体分布] == ["Au1", "Au2"]
+    assert merged.矿体分布[0].矿体厚度 == "2.3米"
+    assert merged.其它信息 == "第一段"
+
+
+def make_openai(mock_server, tmp_path):
+    return create_extractor("openai", "gpt-4.1", api_key=MOCK_API_KEY, quiet=True,
+                            base_url=mock_server.base_url_for("openai"),
+                            upload_registry=UploadRegistry(str(tmp_path / "uploads.json")))
+
+
+def test_chunk_uploads_are_not_registered_and_are_deleted(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", [f"page {i}" for i in range(6)])
+    extractor = make_openai(mock_server, tmp_path)
+    extractor.extract_chunked(report, pages_per_chunk=2, overlap_pages=0)
+    assert extractor.upload_registry._load() == {}
+    assert mock_server.files == {}
+
+
+def test_missing_parsed_output_raises_clear_error(mock_server, tmp_path, monkeypatch):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_openai(mock_server, tmp_path)
+    parse = extractor.client.responses.parse
+
+    class Refused:
+        """模型拒答时SDK返回的响应没有解析结果"""
+        output_parsed = None
+
+        def __init__(self, response):
+            self.response = response
+
+        def __getattr__(self, name):
+            return getattr(self.response, name)
+
+    def refused(**kwargs):
+        return Refused(parse(**kwargs))
+
+    monkeypatch.setattr(extractor.client.responses, "parse", refused)
+    with pytest.raises(ValueError, match="未返回可解析的结构化结果"):
+        extractor.extract_from_file(report)
+
+
+def make_gemini(mock_server, tmp_path):
+    # inline_max_bytes=0 使每个分块都经File API上传
+    return create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY, quiet=True, inline_max_bytes=0,
+                            base_url=mock_server.base_url_for("gemini"),
+                            upload_registry=UploadRegistry(str(tmp_path / "uploads.json")))
+
+
+def test_gemini_chunk_uploads_are_not_registered_and_are_deleted(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", [f"page {i}" for i in range(6)])
+    extractor = make_gemini(mock_server, tmp_path)
+    extractor.extract_chunked(report, pages_per_chunk=2, overlap_pages=0)
+    assert mock_server.request_counts["gemini.files.upload"] == 3
+    assert extractor.upload_registry._load() == {}
+    assert mock_server.files == {}
@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import ContextCacheRegistry
+from mining_report_extractor_stream import STREAM_COMPLETE, create_extractor
+from mining_report_pages import PageSelector
+
+
+@pytest.fixture
+def long_report(tmp_path):
+    pages = [f"page {i}\n" + ("resource tonnes grade " if i % 3 == 0 else "geology notes ") * 8 for i in range(8)]
+    return write_text_pdf(tmp_path / "report.pdf", pages)
+
+
+def make_extractor(mock_server, tmp_path):
+    return create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY,
+                            base_url=mock_server.base_url_for("gemini"), quiet=True,
+                            page_selector=PageSelector(page_budget=3, head_pages=1, keywords={"resource": 1.0}),
+                            context_cache=ContextCacheRegistry(str(tmp_path / "caches.json")))
+
+
+def test_sections_with_other_model_reuse_cache_and_read_trimmed_pdf(mock_server, tmp_path, long_report):
+    make_extractor(mock_server, tmp_path).extract_sections(long_report, sections=["报告信息"])
+    # 复用缓存时不读取文档；fast_model与缓存模型不同的章节需要在请求时读取精简PDF
+    extractor = make_extractor(mock_server, tmp_path)
+    result = extractor.extract_sections(long_report, fast_model="gemini-2.5-pro")
+    assert result.报告信息 is not None and result.资源信息 is not None
+    assert extractor.last_metrics.context_cache_reused == 1
+
+
+def test_stream_after_server_side_cache_expiry(mock_server, tmp_path, long_report):
+    make_extractor(mock_server, tmp_path).extract_sections(long_report, sections=["报告信息"])
+    mock_server.cached_contents.clear()  # 服务端缓存过期，请求返回403后改为直接发送文档
+    items = list(make_extractor(mock_server, tmp_path).extract_stream(long_report))
+    assert items[-1].section == STREAM_COMPLETE
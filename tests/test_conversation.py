@@ -0,0 +1,96 @@
+import pytest
+
+from conftest import write_text_pdf
+from mining_report_conversation import (
+    INSUFFICIENT_MARKER,
+    AnswerCache,
+    BM25Index,
+    ConversationAccelerator,
+    Passage,
+    normalize_question,
+)
+from mining_report_extractor_stream import ConversationEvent, MiningReport, MiningRightsInfo, ReportInfo
+
+
+class FakeExtractor:
+    """按提问内容返回预设回答：带摘录的小提示词或完整文档链式提问"""
+
+    model = "gpt-4.1"
+
+    def __init__(self, excerpt_answer, chained_answer="完整文档回答"):
+        self.excerpt_answer = excerpt_answer
+        self.chained_answer = chained_answer
+        self.calls = []
+        self.uploads = 0
+
+    def log(self, message):
+        pass
+
+    def conversation_document(self, file_path):
+        self.uploads += 1
+        return "file-report"
+
+    def stream_answer(self, question, previous_response_id=None, document=None, model=None):
+        chained = "【已提取字段】" not in question
+        self.calls.append("chained" if chained else "excerpt")
+        answer = self.chained_answer if chained else self.excerpt_answer
+        for start in range(0, len(answer), 3):
+            yield ConversationEvent("delta", answer[start:start + 3])
+        yield ConversationEvent("done", response_id="resp_1" if chained else None, source="model")
+
+
+@pytest.fixture
+def accelerator_for(tmp_path):
+    report_path = write_text_pdf(tmp_path / "report.pdf", ["gold grade 4.11 g/t", "copper ore body"])
+    report = MiningReport(报告信息=ReportInfo(编制单位="四川省地质调查队"),
+                          矿权信息=MiningRightsInfo(矿区面积="2.88平方千米"))
+
+    def build(extractor):
+        return ConversationAccelerator(extractor, report_path, report, cache=AnswerCache(str(tmp_path / "conv")))
+    return build
+
+
+def answer(accelerator, question, previous_response_id=None):
+    events = list(accelerator.stream_answer(question, previous_response_id))
+    return "".join(event.text for event in events if event.type == "delta"), events[-1]
+
+
+def test_normalize_question_ignores_spacing_punctuation_and_polite_prefix():
+    assert normalize_question("请问，这份报告的 编制单位是？") == normalize_question("这份报告的编制单位是")
+    assert normalize_question("ＧＯＬＤ 品位？") == "gold品位"
+
+
+def test_bm25_ranks_matching_passage_first_and_ignores_stopwords():
+    index = BM25Index([Passage(1, "铜矿 矿石量 120万吨"), Passage(2, "金矿 平均品位 4.11克/吨"),
+                       Passage(3, "金矿 矿区 交通 位置")])
+    ranked = index.search("金矿的平均品位是多少")
+    assert [passage.page for passage, _ in ranked] == [2, 3] and ranked[0][1] > ranked[1][1]
+    assert index.search("是什么") == []
+
+
+def test_cached_answer_is_replayed_without_calling_the_model(accelerator_for):
+    extractor = FakeExtractor("四川省地质调查队")
+    first = accelerator_for(extractor)
+    assert answer(first, "编制单位是哪家？")[0] == "四川省地质调查队"
+
+    second_extractor = FakeExtractor("不应调用")
+    text, done = answer(accelerator_for(second_extractor), "请问 编制单位是哪家")
+    assert text == "四川省地质调查队" and done.source == "cache"
+    assert second_extractor.calls == []
+
+
+def test_insufficient_excerpts_fall_back_to_full_document(accelerator_for):
+    extractor = FakeExtractor(INSUFFICIENT_MARKER)
+    accelerator = accelerator_for(extractor)
+    text, done = answer(accelerator, "矿区面积有多大？")
+    assert extractor.calls == ["excerpt", "chained"]
+    assert text == "完整文档回答" and done.source == "model" and done.response_id == "resp_1"
+    assert extractor.uploads == 1  # 没有可链接的响应时随问题发送文档
+    assert accelerator.cache.get_answer(accelerator.file_sha256, "矿区面积有多大")["source"] == "model"
+
+
+def test_follow_up_marker_does_not_match_qita(accelerator_for):
+    accelerator = accelerator_for(FakeExtractor("四川省地质调查队"))
+    answer(accelerator, "编制单位是哪家？")
+    assert accelerator._is_follow_up("它的面积呢？")
+    assert not accelerator._is_follow_up("其它矿种有哪些？")
@@ -0,0 +1,46 @@
+import threading
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY, SAMPLE_REPORT
+from mining_report_daemon import WorkerDaemon, send_request
+from mining_report_extractor_stream import MiningReport
+
+
+def test_daemon_serves_ping_extract_status_and_shutdown(mock_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # 缓存、上传登记表和续传断点写在临时目录
+    socket_path = str(tmp_path / "daemon.sock")
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    daemon = WorkerDaemon(socket_path, provider="openai", model="gpt-4.1", max_workers=2,
+                          api_key=MOCK_API_KEY, base_url=mock_server.openai_base_url)
+    daemon.warm_up()
+    assert "init_extractors" in daemon.startup
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for _ in range(100):
+            if (tmp_path / "daemon.sock").exists():
+                break
+            thread.join(0.05)
+        assert send_request({"op": "ping"}, socket_path, timeout=5) == {"ok": True}
+
+        response = send_request({"op": "extract", "file": report}, socket_path, timeout=30)
+        assert response["ok"], response.get("error")
+        result = MiningReport.model_validate(response["result"])
+        assert result.报告信息.报告名称 == SAMPLE_REPORT["报告信息"]["报告名称"]
+        assert [resource.矿种 for resource in result.资源信息] == ["金矿"]
+        assert response["metrics"] is not None
+
+        missing = send_request({"op": "extract", "file": str(tmp_path / "missing.pdf")}, socket_path, timeout=5)
+        assert not missing["ok"]
+
+        status = send_request({"op": "status"}, socket_path, timeout=5)
+        assert (status["provider"], status["model"]) == ("openai", "gpt-4.1")
+        assert (status["requests"], status["succeeded"], status["failed"]) == (2, 1, 1)
+
+        assert send_request({"op": "shutdown"}, socket_path, timeout=5) == {"ok": True}
+        thread.join(5)
+        assert not thread.is_alive()
+        assert not (tmp_path / "daemon.sock").exists()
+    finally:
+        if thread.is_alive():
+            daemon._server.shutdown()
@@ -0,0 +1,135 @@
+import pytest
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import ContextCacheRegistry
+from mining_report_dedup import (
+    DeduplicatingExtractor,
+    MinHasher,
+    SimilarityIndex,
+    apply_revision,
+    changed_pages,
+    estimate_similarity,
+    removed_pages,
+)
+from mining_report_extractor_stream import (
+    MiningReport,
+    ResourceCategory,
+    ResourceInfo,
+    ResourceQuantityDetail,
+    create_extractor,
+)
+
+WORDS = ["granite", "quartz", "vein", "drill", "assay", "fault", "schist", "pyrite", "basalt", "gneiss",
+         "cobalt", "marble", "breccia", "skarn", "tuff", "dolomite"]
+
+
+def page_text(i, numbers=None):
+    words = " ".join(WORDS[(i * 7 + k) % len(WORDS)] + str(i) for k in range(40))
+    return f"section {i} {numbers or i * 111} tonnes\n{words[:90]}\n{words[90:180]}\n{words[180:]}"
+
+
+def resource(mineral, total, **categories):
+    return ResourceInfo(矿种=mineral, 资源量情况=ResourceCategory(
+        总计=ResourceQuantityDetail(矿石量=total),
+        **{name: ResourceQuantityDetail(矿石量=value) for name, value in categories.items()}))
+
+
+def test_minhash_similarity_tracks_text_overlap():
+    hasher = MinHasher()
+    texts = [page_text(i) for i in range(6)]
+    same = hasher.fingerprint_pages(texts)
+    assert estimate_similarity(same.signature, hasher.fingerprint_pages(list(texts)).signature) == 1.0
+    other = hasher.fingerprint_pages([page_text(i + 100) for i in range(6)])
+    assert estimate_similarity(same.signature, other.signature) < 0.3
+
+
+def test_changed_pages_detects_edited_numbers_and_tolerates_inserted_pages():
+    hasher = MinHasher()
+    baseline = hasher.fingerprint_pages([page_text(i) for i in range(5)]).pages
+    edited = [page_text(0), page_text(1), page_text(42), page_text(2), page_text(3, numbers=999), page_text(4)]
+    assert changed_pages(hasher.fingerprint_pages(edited).pages, baseline) == [2, 4]
+
+
+def test_removed_pages_reports_baseline_pages_missing_from_revision():
+    hasher = MinHasher()
+    baseline = hasher.fingerprint_pages([page_text(i) for i in range(10)]).pages
+    revision = hasher.fingerprint_pages([page_text(i) for i in range(10) if i != 6]).pages
+    assert changed_pages(revision, baseline) == []
+    assert removed_pages(revision, baseline) == [6]
+    edited = hasher.fingerprint_pages([page_text(i, numbers=5 if i == 6 else None) for i in range(10)]).pages
+    assert changed_pages(edited, baseline) == [6] and removed_pages(edited, baseline) == []
+    # 没有文本层的页面无法比较，基线中多出的此类页面视为已删除
+    scanned = hasher.fingerprint_pages([page_text(0), "", ""]).pages
+    assert removed_pages(hasher.fingerprint_pages([page_text(0), ""]).pages, scanned) == [2]
+
+
+def test_apply_revision_replaces_resource_quantities_wholesale():
+    baseline = MiningReport(其它信息="旧版", 资源信息=[
+        resource("金", "200万吨", 推断资源量="120万吨", 控制资源量="80万吨"),
+        resource("银", "50万吨", 推断资源量="50万吨")])
+    delta = MiningReport(资源信息=[resource("金矿", "150万吨", 推断资源量="150万吨")])
+    merged = apply_revision(delta, baseline)
+    gold, silver = merged.资源信息
+    assert gold.资源量情况.总计.矿石量 == "150万吨"
+    assert gold.资源量情况.控制资源量 is None  # 不与基线的类别拼接
+    assert silver.资源量情况 == baseline.资源信息[1].资源量情况
+    assert merged.其它信息 == "旧版"
+
+
+@pytest.fixture
+def baseline_index(tmp_path):
+    index = SimilarityIndex(str(tmp_path / "index.db"))
+    baseline = write_text_pdf(tmp_path / "baseline.pdf", [page_text(i) for i in range(10)])
+    report = MiningReport(其它信息="基线", 资源信息=[resource("金", "200万吨", 推断资源量="120万吨", 控制资源量="80万吨")])
+    index.add(index.hasher.fingerprint(baseline), report, source_file=baseline)
+    yield index
+    index.close()
+
+
+def make_extractor(mock_server, tmp_path):
+    return create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY,
+                            base_url=mock_server.base_url_for("gemini"), quiet=True,
+                            context_cache=ContextCacheRegistry(str(tmp_path / "caches.json")))
+
+
+def test_deleted_page_forces_full_extraction(mock_server, tmp_path, baseline_index, monkeypatch):
+    revision = write_text_pdf(tmp_path / "revision.pdf", [page_text(i) for i in range(10) if i != 6])
+    extractor = make_extractor(mock_server, tmp_path)
+    full = []
+    monkeypatch.setattr(extractor, "extract_from_file", lambda path: full.append(path) or MiningReport())
+    dedup = DeduplicatingExtractor(extractor, baseline_index)
+    dedup.extract_from_file(revision)
+    assert full == [revision] and dedup.last_match is None
+
+
+def test_changed_pages_are_sent_while_the_delta_pdf_exists(mock_server, tmp_path, baseline_index):
+    revision = write_text_pdf(tmp_path / "revision.pdf", [page_text(i, numbers=777 if i == 3 else None)
+                                                          for i in range(10)])
+    for attempt in range(2):
+        # 第二次使用的上下文缓存已在服务端过期，返回403后在请求时才读取文档
+        mock_server.cached_contents.clear()
+        index = SimilarityIndex(str(tmp_path / f"index{attempt}.db"))
+        index.add(baseline_index.hasher.fingerprint(str(tmp_path / "baseline.pdf")),
+                  baseline_index.query(baseline_index.hasher.fingerprint(revision)).report)
+        extractor = make_extractor(mock_server, tmp_path)
+        dedup = DeduplicatingExtractor(extractor, index)
+        result = dedup.extract_from_file(revision)
+        index.close()
+        assert dedup.last_match is not None and dedup.last_match.changed_pages == [3]
+        assert result.资源信息
+    assert not list(tmp_path.glob("changed_*"))
+
+
+def test_merged_result_failing_validation_falls_back_to_full_extraction(mock_server, tmp_path, baseline_index,
+                                                                        monkeypatch):
+    revision = write_text_pdf(tmp_path / "revision.pdf", [page_text(i, numbers=777 if i == 3 else None)
+                                                          for i in range(10)])
+    extractor = make_extractor(mock_server, tmp_path)
+    inconsistent = MiningReport(资源信息=[resource("金", "500万吨", 推断资源量="150万吨")])
+    monkeypatch.setattr(extractor, "_request_structured", lambda *args, **kwargs: (inconsistent, None))
+    full = []
+    monkeypatch.setattr(extractor, "extract_from_file", lambda path: full.append(path) or MiningReport())
+    dedup = DeduplicatingExtractor(extractor, baseline_index)
+    dedup.extract_from_file(revision)
+    assert full == [revision] and dedup.last_match is None
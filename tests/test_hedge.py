@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+import mining_report_hedge as hedge
+from mining_report_cache import UploadReconciler, UploadRegistry
+from mining_report_extractor_stream import MiningReport, ReportInfo
+from mining_report_hedge import HedgeStats, HedgedMiningReportExtractor
+
+
+class FakeExtractor:
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.cleaned = False
+
+    def extract_from_file(self, file_path):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def run_with_timeout(fn, seconds=10):
+    """在线程中运行fn，超时视为挂起"""
+    box = {}
+
+    def target():
+        try:
+            box["result"] = fn()
+        except Exception as e:
+            box["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), "对冲提取挂起"
+    return box
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    return str(path)
+
+
+def test_hedge_leg_construction_failure_does_not_hang(monkeypatch, pdf):
+    def fake_create(provider, model, **kwargs):
+        if provider == "gemini":
+            return FakeExtractor(RuntimeError("primary down"))
+        raise ValueError("未找到OpenAI API密钥")
+
+    monkeypatch.setattr(hedge, "create_extractor", fake_create)
+    hedged = HedgedMiningReportExtractor(("gemini", "gemini-2.5-flash"), ("openai", "o4-mini"),
+                                         default_hedge_delay=0.01, stats=HedgeStats(), quiet=True)
+    box = run_with_timeout(lambda: hedged.extract_from_file(pdf))
+    assert isinstance(box.get("error"), RuntimeError)
+    assert "primary down" in str(box["error"]) and "API密钥" in str(box["error"])
+    assert hedged._idle["hedge"] == []  # 未创建成功的提取器不会放回空闲池
+
+
+def test_failover_returns_hedge_result(monkeypatch, pdf):
+    report = MiningReport(报告信息=ReportInfo(报告名称="对冲"))
+
+    def fake_create(provider, model, **kwargs):
+        return FakeExtractor(RuntimeError("primary down") if provider == "gemini" else report)
+
+    monkeypatch.setattr(hedge, "create_extractor", fake_create)
+    hedged = HedgedMiningReportExtractor(("gemini", "gemini-2.5-flash"), ("openai", "o4-mini"),
+                                         default_hedge_delay=5, stats=HedgeStats(), quiet=True)
+    box = run_with_timeout(lambda: hedged.extract_from_file(pdf))
+    assert box["result"].报告信息.报告名称 == "对冲"
+    assert hedged.last_winner == "hedge:openai/o4-mini"
+
+
+def test_losing_leg_cleans_up_its_uploads(monkeypatch, pdf):
+    report = MiningReport(报告信息=ReportInfo(报告名称="结果"))
+    primary_done = threading.Event()
+    created = {}
+
+    class SlowExtractor(FakeExtractor):
+        def extract_from_file(self, file_path):
+            primary_done.wait(5)
+            return report
+
+    def fake_create(provider, model, **kwargs):
+        created[provider] = SlowExtractor(report) if provider == "gemini" else FakeExtractor(report)
+        return created[provider]
+
+    monkeypatch.setattr(hedge, "create_extractor", fake_create)
+    hedged = HedgedMiningReportExtractor(("gemini", "gemini-2.5-flash"), ("openai", "o4-mini"),
+                                         default_hedge_delay=0.01, stats=HedgeStats(), quiet=True)
+    box = run_with_timeout(lambda: hedged.extract_from_file(pdf))
+    assert hedged.last_winner == "hedge:openai/o4-mini"
+    primary_done.set()
+    run_with_timeout(lambda: [threading.Event().wait(0.01) for _ in range(100) if not created["gemini"].cleaned])
+    assert created["gemini"].cleaned and not created["openai"].cleaned
+    assert box["result"] == report
+
+
+def test_reconciler_uses_primary_leg_for_remote_uploads(monkeypatch, tmp_path):
+    deleted = []
+
+    class RemoteExtractor(FakeExtractor):
+        def list_remote_uploads(self):
+            return [("file-live", "mining-report-a.pdf"), ("file-orphan", "mining-report-b.pdf")]
+
+        def delete_remote_upload(self, remote_id):
+            deleted.append(remote_id)
+
+    monkeypatch.setattr(hedge, "create_extractor", lambda provider, model, **kwargs: RemoteExtractor(None))
+    hedged = HedgedMiningReportExtractor(("openai", "o4-mini"), ("gemini", "gemini-2.5-flash"),
+                                         stats=HedgeStats(), quiet=True)
+    registry = UploadRegistry(str(tmp_path / "uploads.json"))
+    registry.register("openai", "sha", "file-live", time.time() + 3600)
+    assert UploadReconciler(hedged, registry).run_once() == 1
+    assert deleted == ["file-orphan"]
+
+
+def test_winning_extractor_is_not_reused_until_next_extraction(monkeypatch, pdf):
+    report = MiningReport(报告信息=ReportInfo(报告名称="结果"))
+    created = []
+
+    def fake_create(provider, model, **kwargs):
+        created.append(FakeExtractor(report))
+        return created[-1]
+
+    monkeypatch.setattr(hedge, "create_extractor", fake_create)
+    hedged = HedgedMiningReportExtractor(("gemini", "gemini-2.5-flash"), ("openai", "o4-mini"),
+                                         default_hedge_delay=5, stats=HedgeStats(), quiet=True)
+    assert run_with_timeout(lambda: hedged.extract_from_file(pdf))["result"] is report
+    assert hedged.last_extractor is created[0] and hedged._idle["primary"] == []
+    run_with_timeout(lambda: hedged.extract_from_file(pdf))
+    assert hedged.last_extractor is created[0] and len(created) == 1
@@ -0,0 +1,65 @@
+import pytest
+
+import mining_report_journal as journal_module
+from mining_report_journal import JOB_FAILED, JOB_GENERATED, JOB_SAVED, JOB_UPLOADED, JobJournal
+
+
+@pytest.fixture
+def reports(tmp_path):
+    files = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(f"%PDF-1.4 {name}".encode())
+        files.append(path)
+    return files
+
+
+def test_replay_restores_progress_and_ignores_torn_last_line(tmp_path, reports):
+    path = str(tmp_path / "journal.jsonl")
+    journal = JobJournal(path, fsync=False)
+    pending, skipped = journal.plan(reports)
+    assert pending == reports and skipped == []
+    job = journal.claim(reports[0])
+    job.record(JOB_UPLOADED, provider="gemini", upload_sha256="abc", file_id="files/1")
+    job.record(JOB_GENERATED)
+    job.record(JOB_SAVED, output_path="a.json")
+    failed = journal.claim(reports[1])
+    failed.fail("boom")
+    with open(path, "ab") as f:
+        f.write(b'{"job": "torn", "sta')  # 崩溃时写了一半的记录
+
+    records = JobJournal(path, fsync=False).refresh()
+    a, b, c = (records[JobJournal.job_key(report)] for report in reports)
+    assert a.state == JOB_SAVED and a.remote_ids == {"gemini:abc": "files/1"} and a.output_path == "a.json"
+    assert b.state == JOB_FAILED and b.error == "boom" and b.attempts == 1
+    assert c.state == "queued" and "torn" not in records
+
+    rerun = JobJournal(path, fsync=False)
+    pending, skipped = rerun.plan(reports)
+    assert pending == reports[1:] and [reason for _, reason in skipped] == ["已完成"]
+    assert rerun.claim(reports[1]).attempts == 2
+
+
+def test_claim_uses_hash_from_plan(tmp_path, reports, monkeypatch):
+    journal = JobJournal(str(tmp_path / "journal.jsonl"), fsync=False)
+    journal.plan(reports)
+    monkeypatch.setattr(journal_module, "compute_file_sha256", lambda path: pytest.fail("claim重新计算了哈希"))
+    assert journal.claim(reports[0]) is not None
+
+
+def test_compact_refuses_live_claims_and_other_writers_replay_the_new_file(tmp_path, reports):
+    path = str(tmp_path / "journal.jsonl")
+    worker, admin = JobJournal(path, fsync=False), JobJournal(path, fsync=False)
+    worker.plan(reports)
+    job = worker.claim(reports[0])
+    with pytest.raises(RuntimeError, match="正被其它工作进程处理"):
+        admin.compact()
+
+    job.record(JOB_SAVED, output_path="a.json")
+    assert admin.compact() == 3
+    # 压缩后worker原来的读取位置已失效，需从头回放新文件
+    worker.claim(reports[1]).record(JOB_SAVED)
+    records = JobJournal(path, fsync=False).refresh()
+    assert [records[JobJournal.job_key(report)].state for report in reports] == [JOB_SAVED, JOB_SAVED, "queued"]
+    assert worker.refresh()[JobJournal.job_key(reports[2])].state == "queued"
+    assert admin.refresh()[JobJournal.job_key(reports[1])].state == JOB_SAVED
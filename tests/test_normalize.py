@@ -0,0 +1,44 @@
+import math
+
+import pytest
+
+from mining_report_normalize import (
+    CONFIDENCE_APPROX,
+    CONFIDENCE_EXACT,
+    CONFIDENCE_FAILED,
+    parse_date,
+    parse_grade,
+    parse_metal_kg,
+    parse_province,
+    parse_tonnes,
+)
+from mining_report_tables import ORE_UNITS
+
+TABLE_UNIT_TONNES = {"亿吨": 1e8, "百万吨": 1e6, "万吨": 1e4, "千吨": 1e3, "吨": 1.0}
+
+
+@pytest.mark.parametrize("text, tonnes, confidence", [
+    ("1.2亿t", 1.2e8, CONFIDENCE_EXACT),
+    ("12.5×10⁴t", 1.25e5, CONFIDENCE_EXACT),
+    ("12.5 10⁴t", 1.25e5, CONFIDENCE_EXACT),
+    ("3.5×10⁴吨", 3.5e4, CONFIDENCE_EXACT),
+    ("１２０万吨", 1.2e6, CONFIDENCE_EXACT),
+    ("约80-120万吨", 1e6, CONFIDENCE_APPROX),
+])
+def test_parse_tonnes(text, tonnes, confidence):
+    value, actual = parse_tonnes(text)
+    assert value == pytest.approx(tonnes) and actual == confidence
+
+
+@pytest.mark.parametrize("unit", sorted(set(ORE_UNITS) - {"104t"}))  # "104t"为"10⁴t"的文本层写法，与数值无法区分
+def test_parse_tonnes_accepts_every_table_ore_unit(unit):
+    value, _ = parse_tonnes(f"2{unit}")
+    assert value == pytest.approx(2 * TABLE_UNIT_TONNES[ORE_UNITS[unit]])
+
+
+def test_parse_failures_and_other_fields():
+    assert math.isnan(parse_tonnes("不详")[0]) and parse_tonnes(None)[1] == CONFIDENCE_FAILED
+    assert parse_metal_kg("3600千克")[0] == pytest.approx(3600)
+    assert parse_grade("3.2克/吨")[:2] == (pytest.approx(3.2), "g/t")
+    assert parse_province("内蒙古自治区赤峰市") == "内蒙古"
+    assert parse_date("2023年6月")[0] == "2023-06"
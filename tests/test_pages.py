@@ -0,0 +1,47 @@
+import hashlib
+import json
+
+import pypdf
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import UploadRegistry, compute_file_sha256
+from mining_report_extractor_stream import create_extractor
+from mining_report_pages import PageSelector
+
+
+def long_report(tmp_path):
+    pages = [f"page {i}\n" + ("resource tonnes grade " if i % 3 == 0 else "geology notes ") * 8 for i in range(8)]
+    return write_text_pdf(tmp_path / "report.pdf", pages)
+
+
+def test_build_trimmed_pdf_parses_the_source_once(tmp_path, monkeypatch):
+    report = long_report(tmp_path)
+    opened = []
+    real_reader = pypdf.PdfReader
+    monkeypatch.setattr(pypdf, "PdfReader", lambda *args, **kwargs: opened.append(args) or real_reader(*args, **kwargs))
+    trimmed_path, pages, total_pages = PageSelector(page_budget=3, head_pages=1,
+                                                    keywords={"resource": 1.0}).build_trimmed_pdf(report)
+    assert len(opened) == 1
+    assert pages == [0, 3, 6] and total_pages == 8
+    assert len(real_reader(trimmed_path).pages) == 3
+
+
+def test_trimmed_upload_is_registered_by_source_and_selection(mock_server, tmp_path):
+    report = long_report(tmp_path)
+    registry_path = tmp_path / "uploads.json"
+
+    def extract():
+        extractor = create_extractor("openai", "o4-mini", api_key=MOCK_API_KEY,
+                                     base_url=mock_server.base_url_for("openai"), quiet=True,
+                                     page_selector=PageSelector(page_budget=3, head_pages=1, keywords={"resource": 1.0}),
+                                     upload_registry=UploadRegistry(str(registry_path)))
+        extractor.extract_from_file(report)
+        assert extractor._upload_keys == {}  # 临时精简PDF删除后不再保留映射
+        return extractor.last_metrics
+
+    assert extract().upload_bytes > 0
+    assert extract().upload_bytes == 0  # 第二次运行复用已登记的远程文件
+    key = hashlib.sha256(f"{compute_file_sha256(report)}|pages=0,3,6".encode("utf-8")).hexdigest()
+    assert list(json.loads(registry_path.read_text(encoding="utf-8"))) == [f"openai:{key}"]
+    assert len(mock_server.files) == 1
@@ -0,0 +1,58 @@
+import threading
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_extractor_stream import EXTRACTION_SECTIONS, create_extractor
+from mining_report_scheduler import (
+    OUTPUT_TOKENS,
+    PDF_TOKENS_PER_PAGE,
+    PROMPT_TOKENS,
+    ExtractionScheduler,
+    RateLimit,
+    estimate_tokens,
+)
+
+
+class ServiceUnavailable(Exception):
+    status_code = 503
+
+
+def test_scheduler_retries_only_the_failed_section_request(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    scheduler = ExtractionScheduler({"gemini/gemini-2.5-flash": RateLimit(rpm=6000)}, base_delay=0.01, quiet=True)
+    extractor = create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY, quiet=True,
+                                 base_url=mock_server.base_url_for("gemini"), scheduler=scheduler)
+    generate = extractor.client.models.generate_content
+    calls = []
+    lock = threading.Lock()
+
+    def flaky(**kwargs):
+        with lock:
+            calls.append(kwargs["model"])
+            first = len(calls) == 1
+        if first:
+            raise ServiceUnavailable("503")
+        return generate(**kwargs)
+
+    extractor.client.models.generate_content = flaky
+    result = extractor.extract_sections(report, max_retries=0)
+    assert result.资源信息 is not None
+    assert len(calls) == len(EXTRACTION_SECTIONS) + 1  # 只重发失败的那个章节请求
+    assert extractor.last_metrics.retries == 1
+
+
+def test_chunk_requests_are_charged_for_their_own_pages(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", [f"page {i}" for i in range(6)])
+    scheduler = ExtractionScheduler({"gemini/gemini-2.5-flash": RateLimit(tpm=10_000_000)}, quiet=True)
+    extractor = create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY, quiet=True,
+                                 base_url=mock_server.base_url_for("gemini"), scheduler=scheduler)
+    charged = []
+    run = scheduler.run
+
+    def recording_run(provider, model, fn, file_path=None, **kwargs):
+        charged.append(estimate_tokens(file_path))
+        return run(provider, model, fn, file_path=file_path, **kwargs)
+
+    scheduler.run = recording_run
+    extractor.extract_chunked(report, pages_per_chunk=2, overlap_pages=0)
+    assert charged == [2 * PDF_TOKENS_PER_PAGE + PROMPT_TOKENS + OUTPUT_TOKENS] * 3
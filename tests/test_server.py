@@ -0,0 +1,161 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import write_text_pdf
+from mining_report_async import AsyncClientPool, create_async_extractor
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import ExtractionCache
+from mining_report_server import ConversationServer
+
+
+@pytest.fixture
+def report_dir(tmp_path):
+    write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    return tmp_path
+
+
+def make_server(mock_server, report_dir, cache_dir, **kwargs):
+    extractor = create_async_extractor("openai", "gpt-4.1", api_key=MOCK_API_KEY, quiet=True,
+                                       base_url=mock_server.base_url_for("openai"), pool=AsyncClientPool(),
+                                       cache=ExtractionCache(str(cache_dir)))
+    return ConversationServer(extractor, report_dir=str(report_dir), port=0, quiet=True, **kwargs)
+
+
+def run_server(server, scenario):
+    async def main():
+        await server.start()
+        try:
+            return await scenario()
+        finally:
+            await server.close()
+            await server.extractor.pool.aclose()
+    return asyncio.run(main())
+
+
+async def open_request(server, method, path, payload=None):
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    body = json.dumps(payload or {}).encode("utf-8")
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    return status, reader, writer
+
+
+async def request(server, method, path, payload=None):
+    status, reader, writer = await open_request(server, method, path, payload)
+    body = await reader.read()
+    writer.close()
+    return status, body
+
+
+async def read_event(reader):
+    """读取一条SSE事件，返回(事件名, 数据)；流结束时返回None"""
+    event = data = None
+    while True:
+        line = (await reader.readline()).decode("utf-8")
+        if not line:
+            return None
+        if line == "\n" and event:
+            return event, json.loads(data)
+        if line.startswith("event: "):
+            event = line[len("event: "):].strip()
+        elif line.startswith("data: "):
+            data = line[len("data: "):]
+
+
+async def ask(server, payload):
+    status, reader, writer = await open_request(server, "POST", "/ask", payload)
+    events = []
+    while (item := await read_event(reader)) is not None:
+        events.append(item)
+    writer.close()
+    return status, events
+
+
+def test_ask_streams_deltas_then_done(mock_server, report_dir, tmp_path):
+    server = make_server(mock_server, report_dir, tmp_path / "cache")
+
+    async def scenario():
+        status, body = await request(server, "POST", "/extract", {"file": "report.pdf", "user": "alice"})
+        assert status == 200
+        report_id = json.loads(body)["report_id"]
+        return await ask(server, {"report_id": report_id, "user": "alice", "question": "主要矿种是什么？"})
+
+    status, events = run_server(server, scenario)
+    assert status == 200
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and names.count("delta") > 1
+    assert "".join(data["text"] for name, data in events if name == "delta")
+    assert events[-1][1]["response_id"]
+
+
+def test_second_question_in_same_session_is_rejected_with_429(mock_server, report_dir, tmp_path):
+    server = make_server(mock_server, report_dir, tmp_path / "cache")
+    gate = None
+    stream_answer = server.extractor.stream_answer
+
+    async def gated_stream_answer(*args, **kwargs):
+        async for event in stream_answer(*args, **kwargs):
+            if event.type == "done":
+                await gate.wait()  # 第一个提问在结束前保持进行中
+            yield event
+
+    server.extractor.stream_answer = gated_stream_answer
+
+    async def scenario():
+        nonlocal gate
+        gate = asyncio.Event()  # 在事件循环内创建（Python 3.8/3.9的Event绑定创建时的循环）
+        _, body = await request(server, "POST", "/extract", {"file": "report.pdf"})
+        payload = {"report_id": json.loads(body)["report_id"], "user": "alice", "question": "矿区面积？"}
+        status, reader, writer = await open_request(server, "POST", "/ask", payload)
+        assert status == 200 and (await read_event(reader))[0] == "delta"
+        rejected, body = await request(server, "POST", "/ask", payload)
+        other_user = asyncio.create_task(ask(server, {**payload, "user": "bob"}))
+        gate.set()
+        while (item := await read_event(reader)) is not None:
+            last = item
+        writer.close()
+        return rejected, json.loads(body), last, await other_user
+
+    rejected, body, last, (other_status, other_events) = run_server(server, scenario)
+    assert rejected == 429 and "正在进行的提问" in body["error"]
+    assert last[0] == "done"
+    assert other_status == 200 and other_events[-1][0] == "done"
+    assert server.stats["rejected"] == 1
+
+
+def test_cache_hit_report_is_uploaded_once_for_concurrent_sessions(mock_server, report_dir, tmp_path):
+    warm = make_server(mock_server, report_dir, tmp_path / "cache")
+    run_server(warm, lambda: request(warm, "POST", "/extract", {"file": "report.pdf"}))
+    uploads = mock_server.request_counts.get("openai.files.create", 0)
+
+    server = make_server(mock_server, report_dir, tmp_path / "cache")
+
+    async def scenario():
+        _, body = await request(server, "POST", "/extract", {"file": "report.pdf"})
+        report_id = json.loads(body)["report_id"]
+        return await asyncio.gather(*(ask(server, {"report_id": report_id, "user": user, "question": "品位？"})
+                                      for user in ["alice", "bob", "carol"]))
+
+    results = run_server(server, scenario)
+    assert all(status == 200 and events[-1][0] == "done" for status, events in results)
+    assert mock_server.request_counts["openai.files.create"] == uploads + 1
+
+
+def test_idle_sessions_are_evicted_by_sweeper(mock_server, report_dir, tmp_path):
+    server = make_server(mock_server, report_dir, tmp_path / "cache", idle_timeout=0.05, sweep_interval=0.05)
+
+    async def scenario():
+        await request(server, "POST", "/extract", {"file": "report.pdf", "user": "alice"})
+        _, before = await request(server, "GET", "/sessions")
+        await asyncio.sleep(0.3)
+        _, after = await request(server, "GET", "/sessions")
+        return json.loads(before), json.loads(after)
+
+    before, after = run_server(server, scenario)
+    assert [session["user"] for session in before] == ["alice"]
+    assert after == [] and server.stats["evicted"] == 1
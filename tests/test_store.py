@@ -0,0 +1,32 @@
+import pytest
+
+from mining_report_extractor_stream import (
+    MiningReport,
+    MiningRightsInfo,
+    ResourceCategory,
+    ResourceInfo,
+    ResourceQuantityDetail,
+)
+from mining_report_store import ResultStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / "reports.db"))
+    store.add(MiningReport(
+        矿权信息=MiningRightsInfo(矿权位置="内蒙古自治区赤峰市", 勘查程度="详查"),
+        资源信息=[ResourceInfo(矿种="金", 资源量情况=ResourceCategory(
+            推断资源量=ResourceQuantityDetail(矿石量="120万吨", 金属量="3600千克")))],
+    ), source_file="a.pdf")
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("mineral, province", [("金", "内蒙古"), ("金矿", "内蒙古自治区"), (" 金 ", None)])
+def test_query_filters_are_normalized_like_stored_values(store, mineral, province):
+    [row] = store.query_resources(mineral=mineral, province=province)
+    assert row["矿种"] == "金矿" and row["province"] == "内蒙古" and row["metal_kg"] == pytest.approx(3600)
+
+
+def test_unknown_province_matches_nothing(store):
+    assert store.query_resources(province="火星") == []
@@ -0,0 +1,54 @@
+import json
+
+import mining_report_metrics as metrics
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY, SAMPLE_REPORT
+from mining_report_extractor_stream import STREAM_COMPLETE, create_extractor
+from mining_report_streaming import IncrementalJSONSectionParser
+
+
+def feed_all(text, step):
+    parser = IncrementalJSONSectionParser()
+    completed = []
+    for start in range(0, len(text), step):
+        completed.extend(parser.feed(text[start:start + step]))
+    return completed
+
+
+def test_parser_emits_sections_and_list_items_regardless_of_chunking():
+    report = dict(SAMPLE_REPORT, 其它信息='含"引号"、{括号}和\\反斜杠的说明')
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    expected = feed_all(text, len(text))
+    assert [(section, index) for section, index, _ in expected] == [
+        ("报告信息", None), ("矿权信息", None), ("资源信息", 0), ("资源信息", None),
+        ("矿体分布", 0), ("矿体分布", 1), ("矿体分布", None), ("其它信息", None)]
+    assert json.loads(expected[-1][2]) == report["其它信息"]
+    assert json.loads(expected[4][2]) == report["矿体分布"][0]
+    for step in (1, 3, 17):
+        assert feed_all(text, step) == expected
+
+
+def make_extractor(mock_server):
+    return create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY, quiet=True,
+                            base_url=mock_server.base_url_for("gemini"))
+
+
+def test_stream_metrics_context_does_not_leak_between_items(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_extractor(mock_server)
+    items = extractor.extract_stream(report)
+    next(items)
+    assert metrics.current_metrics() is None  # 两次迭代之间调用方的上下文不受影响
+    rest = list(items)
+    assert rest[-1].section == STREAM_COMPLETE
+    assert extractor.last_metrics.status == "success" and extractor.last_metrics.mode == "stream"
+
+
+def test_closing_stream_early_records_cancelled(mock_server, tmp_path):
+    report = write_text_pdf(tmp_path / "report.pdf", ["mining report"])
+    extractor = make_extractor(mock_server)
+    items = extractor.extract_stream(report)
+    next(items)
+    items.close()
+    assert extractor.last_metrics.status == "cancelled"
+    assert metrics.current_metrics() is None
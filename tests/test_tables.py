@@ -0,0 +1,70 @@
+import pytest
+
+from mining_report_tables import ResourceTableParser
+
+SUMMARY = """表3-1 金矿保有资源量估算结果汇总表
+类别 矿石量(万吨) 金属量(kg) 品位(g/t)
+333 80.00 2400 3.00
+332 40.00 1600 4.00
+合计 120.00 4000 3.33
+"""
+
+
+def parse(*pages, min_confidence=0.8):
+    return ResourceTableParser(min_confidence=min_confidence).parse_pages(list(pages))
+
+
+def categories(result, mineral="金矿"):
+    info = next(info for info in result.resources if info.矿种 == mineral)
+    return info.资源量情况
+
+
+def test_parse_pages_reads_a_consistent_summary_table():
+    result = parse("封面\n某某金矿资源储量核实报告", SUMMARY)
+    assert result.confident and result.confidence == 1.0 and result.pages == [2]
+    gold = categories(result)
+    assert gold.推断资源量.矿石量 == "80.00万吨" and gold.推断资源量.金属量 == "2400千克"
+    assert gold.控制资源量.品位 == "4.00克/吨"
+    assert gold.总计.矿石量 == "120.00万吨" and gold.探明资源量 is None
+
+
+def test_rows_of_the_same_category_are_summed_with_weighted_grade():
+    table = """表4 资源量汇总表
+矿种 类别 矿石量(万吨) 金属量(吨) 品位(%)
+铜矿 111b 10.0 100 1.00
+122b 30.0 600 2.00
+333 60.0 600 1.00
+合计 100.0 1300 1.30
+"""
+    proven = categories(parse(table), "铜矿").探明资源量
+    assert proven.矿石量 == "40.0万吨" and proven.金属量 == "700吨" and proven.品位 == "1.75%"
+
+
+def test_units_on_a_separate_line_and_by_product_columns():
+    table = """表5 保有资源量汇总表
+类别 矿石量 Au金属量 Ag金属量
+(万吨) (kg) (t)
+333 50.0 500 20
+332 50.0 700 30
+合计 100.0 1200 50
+"""
+    result = parse(table)
+    assert result.confident
+    assert categories(result, "金矿").总计.金属量 == "1200千克"
+    assert categories(result, "银矿").总计.金属量 == "50吨"
+
+
+@pytest.mark.parametrize("table, note", [
+    (SUMMARY.replace("合计 120.00 4000", "合计 150.00 4000"), "合计与各类别之和不一致"),
+    (SUMMARY + "消耗 333 5.00 150 3.00\n", "消耗"),
+    (SUMMARY.replace("矿石量(万吨)", "矿石量"), "矿石量缺少单位"),
+])
+def test_inconsistencies_lower_confidence(table, note):
+    result = parse(table)
+    assert result.resources and result.confidence < 1.0
+    assert any(note in item for item in result.notes)
+
+
+def test_pages_without_summary_tables_return_zero_confidence():
+    result = parse("地质概况\n矿区位于某省", "矿体特征\n矿石量较大但未列表")
+    assert result.resources == [] and result.confidence == 0.0 and not result.confident
@@ -0,0 +1,40 @@
+import multiprocessing
+import pathlib
+import time
+
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import UPLOAD_NAME_PREFIX, UploadReconciler, UploadRegistry
+from mining_report_extractor_stream import create_extractor
+
+
+def register_many(path, worker, count):
+    registry = UploadRegistry(path)
+    for i in range(count):
+        registry.register("openai", f"{worker}-{i}", f"file-{worker}-{i}", time.time() + 3600)
+
+
+def test_concurrent_processes_do_not_lose_registrations(tmp_path):
+    path = str(tmp_path / "uploads.json")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=register_many, args=(path, worker, 25)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(30)
+        assert process.exitcode == 0
+    assert len(UploadRegistry(path).live_remote_ids("openai")) == 100
+    assert (tmp_path / "uploads.json.lock").exists()
+
+
+def test_reconciler_keeps_unregistered_gemini_uploads_in_use(mock_server, tmp_path):
+    registry = UploadRegistry(str(tmp_path / "uploads.json"))
+    extractor = create_extractor("gemini", "gemini-2.5-flash", api_key=MOCK_API_KEY, quiet=True,
+                                 base_url=mock_server.base_url_for("gemini"), upload_registry=registry)
+    chunk = extractor._upload_file(pathlib.Path(write_text_pdf(tmp_path / "chunk.pdf", ["chunk"])), register=False)
+    registered = extractor._upload_file(pathlib.Path(write_text_pdf(tmp_path / "report.pdf", ["report"])))
+    names = dict(extractor.list_remote_uploads())
+    assert names[registered.name].startswith(UPLOAD_NAME_PREFIX)
+    assert not (names[chunk.name] or "").startswith(UPLOAD_NAME_PREFIX)
+    assert UploadReconciler(extractor, registry).run_once() == 0
+    assert set(dict(extractor.list_remote_uploads())) == {chunk.name, registered.name}
@@ -0,0 +1,113 @@
+import os
+import pathlib
+import time
+
+import pytest
+
+import mining_report_extractor_stream as core
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import UploadCheckpoints, compute_file_sha256
+from mining_report_extractor_stream import FileSlice, create_extractor
+
+CHUNK = 64 * 1024
+
+
+def test_file_slice_reads_seeks_and_buffers_only_its_range(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    with FileSlice(str(path), 100, 50) as chunk:
+        assert chunk.length == 50
+        assert chunk.read() == (bytes(range(256)) * 4)[100:150]
+        assert chunk.read() == b""
+        assert chunk.seek(-10, os.SEEK_END) == 40
+        assert chunk.read(5) == bytes(range(140, 145))
+        assert chunk.seek(500) == 50  # 超出区间时停在末尾
+        assert b"".join(chunk.iter_buffers(buffer_size=16)) == bytes(range(100, 150))
+        assert [len(piece) for piece in chunk.iter_buffers(buffer_size=16)] == [16, 16, 16, 2]
+
+
+def test_upload_checkpoints_match_size_and_expire(tmp_path):
+    checkpoints = UploadCheckpoints(str(tmp_path / "checkpoints.json"))
+    state = {"session": "upload_1", "size": 300, "offset": 100, "part_ids": ["part_1"], "created_at": time.time()}
+    checkpoints.save("openai", "abc", state)
+    assert checkpoints.get("openai", "abc", 300)["offset"] == 100
+    assert checkpoints.get("openai", "abc", 301) is None  # 文件大小不一致视为另一份内容
+    assert checkpoints.get("gemini", "abc", 300) is None
+
+    checkpoints.save("openai", "old", {**state, "created_at": time.time() - 2 * 3600})
+    assert checkpoints.get("openai", "old", 300) is None  # 超过OpenAI Upload对象的有效期
+
+    checkpoints.remove("openai", "abc")
+    assert checkpoints.get("openai", "abc", 300) is None
+    assert list(UploadCheckpoints(str(tmp_path / "checkpoints.json"))._load()) == ["openai:old"]
+
+
+def make_large_report(tmp_path):
+    """三个分块大小的PDF（末尾填充不影响模拟服务）"""
+    report = pathlib.Path(write_text_pdf(tmp_path / "large.pdf", ["mining report"]))
+    with open(report, "ab") as f:
+        f.write(b"\n" * (3 * CHUNK - report.stat().st_size))
+    return str(report)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(core, "UPLOAD_CHUNK_BYTES", CHUNK)
+    monkeypatch.setattr(core, "RESUMABLE_UPLOAD_THRESHOLD", CHUNK)
+    monkeypatch.setattr(core.time, "sleep", lambda seconds: None)
+
+
+def make_openai(mock_server, tmp_path):
+    return create_extractor("openai", "gpt-4.1", api_key=MOCK_API_KEY, quiet=True,
+                            base_url=mock_server.base_url_for("openai"),
+                            upload_checkpoints=UploadCheckpoints(str(tmp_path / "checkpoints.json")))
+
+
+def test_upload_resumes_from_checkpoint_after_crash(mock_server, tmp_path, monkeypatch, small_chunks):
+    report = make_large_report(tmp_path)
+    crashed = make_openai(mock_server, tmp_path)
+    send = crashed._send_upload_chunk
+
+    def crash_on_second_chunk(state, chunk, offset, final):
+        if offset == CHUNK:
+            raise KeyboardInterrupt  # 模拟进程在第二块上传中途被终止
+        return send(state, chunk, offset, final)
+
+    monkeypatch.setattr(crashed, "_send_upload_chunk", crash_on_second_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        crashed.extract_from_file(report)
+    saved = crashed.upload_checkpoints.get("openai", compute_file_sha256(report), 3 * CHUNK)
+    assert saved["offset"] == CHUNK and len(saved["part_ids"]) == 1
+
+    resumed = make_openai(mock_server, tmp_path)
+    resumed.extract_from_file(report)
+    metrics = resumed.last_metrics
+    assert (metrics.upload_chunks, metrics.upload_bytes, metrics.upload_resumed_bytes) == (2, 2 * CHUNK, CHUNK)
+    assert resumed.upload_checkpoints._load() == {}
+    [upload] = [upload for upload in mock_server.uploads.values() if upload["status"] == "completed"]
+    assert len(upload["parts"]) == 3
+
+
+class ConnectionDropped(Exception):
+    status_code = 503
+
+
+def test_in_run_retries_count_the_furthest_resume_point_once(mock_server, tmp_path, monkeypatch, small_chunks):
+    report = make_large_report(tmp_path)
+    extractor = make_openai(mock_server, tmp_path)
+    send = extractor._send_upload_chunk
+    failed = set()
+
+    def drop_once_per_chunk(state, chunk, offset, final):
+        if offset and offset not in failed:
+            failed.add(offset)
+            raise ConnectionDropped("connection reset")
+        return send(state, chunk, offset, final)
+
+    monkeypatch.setattr(extractor, "_send_upload_chunk", drop_once_per_chunk)
+    extractor.extract_from_file(report)
+    metrics = extractor.last_metrics
+    assert failed == {CHUNK, 2 * CHUNK}
+    assert metrics.upload_chunks == 3
+    assert metrics.upload_resumed_bytes == 2 * CHUNK  # 而非 CHUNK + 2 * CHUNK
@@ -0,0 +1,77 @@
+import mining_report_validation as validation
+from conftest import write_text_pdf
+from mining_report_benchmark import MOCK_API_KEY
+from mining_report_cache import ContextCacheRegistry
+from mining_report_extractor_stream import (
+    MiningReport,
+    MiningRightsInfo,
+    ResourceCategory,
+    ResourceInfo,
+    ResourceQuantityDetail,
+    create_extractor,
+)
+from mining_report_pages import PageSelector
+from mining_report_validation import ValidatedExtractor, ValidationIssue, check_report, repair_report
+
+
+def resource(mineral, total, **categories):
+    return ResourceInfo(矿种=mineral, 资源量情况=ResourceCategory(
+        总计=ResourceQuantityDetail(矿石量=total) if total else None,
+        **{name: ResourceQuantityDetail(矿石量=value) for name, value in categories.items()}))
+
+
+def test_consistent_totals_across_units_pass():
+    report = MiningReport(资源信息=[resource("金", "200万吨", 推断资源量="1200000吨", 控制资源量="80万吨")])
+    assert check_report(report) == []
+
+
+def test_total_mismatch_targets_the_mineral():
+    report = MiningReport(资源信息=[resource("铜", "250万吨", 推断资源量="120万吨", 控制资源量="80万吨")])
+    [issue] = check_report(report)
+    assert issue.code == validation.ISSUE_TOTAL_MISMATCH and issue.target == "资源信息:铜矿"
+
+
+def test_mismatch_without_mineral_name_targets_whole_list():
+    report = MiningReport(资源信息=[resource(None, "250万吨", 推断资源量="120万吨", 控制资源量="80万吨")])
+    [issue] = check_report(report)
+    assert issue.target == "资源信息"
+    assert "「」" not in validation.ValidatedExtractor._reask_request(report, issue.target, [issue])[0]
+
+
+def test_empty_resources_and_invalid_stage():
+    report = MiningReport(矿权信息=MiningRightsInfo(勘查程度="预查"))
+    assert {issue.code for issue in check_report(report)} == {validation.ISSUE_EMPTY_RESOURCES,
+                                                            validation.ISSUE_INVALID_STAGE}
+
+
+def test_repair_maps_stage_and_fills_single_category_total():
+    report = MiningReport(矿权信息=MiningRightsInfo(勘查程度="详查阶段"),
+                          资源信息=[resource("金矿", None, 推断资源量="12万吨")])
+    repaired = repair_report(report)
+    assert repaired.矿权信息.勘查程度 == "详查"
+    assert repaired.资源信息[0].资源量情况.总计.矿石量 == "12万吨"
+    # 多个类别相加需要换算单位，不做修复
+    report = MiningReport(资源信息=[resource("金矿", None, 推断资源量="12万吨", 控制资源量="3000吨")])
+    assert repair_report(report).资源信息[0].资源量情况.总计 is None
+
+
+def test_escalation_reads_trimmed_pdf_and_caches_for_first_model(mock_server, tmp_path, monkeypatch):
+    pages = [f"page {i}\n" + ("resource tonnes grade " if i % 3 == 0 else "geology notes ") * 8 for i in range(8)]
+    pdf = write_text_pdf(tmp_path / "report.pdf", pages)
+    registry = ContextCacheRegistry(str(tmp_path / "caches.json"))
+    issue = ValidationIssue(validation.ISSUE_INVALID_STAGE, "矿权信息.勘查程度", "勘查程度无效")
+
+    def run():
+        checks = iter([[issue], [issue], []])  # 首次提取和便宜模型重提均未通过，升级到更强的模型
+        monkeypatch.setattr(validation, "check_report", lambda report, tolerance: next(checks))
+        extractor = create_extractor("gemini", "gemini-2.5-pro", api_key=MOCK_API_KEY,
+                                     base_url=mock_server.base_url_for("gemini"), quiet=True, context_cache=registry,
+                                     page_selector=PageSelector(page_budget=3, head_pages=1, keywords={"resource": 1.0}))
+        validated = ValidatedExtractor(extractor, ["gemini-2.5-flash", "gemini-2.5-pro"])
+        validated.extract_from_file(pdf)
+        return extractor.last_metrics
+
+    run()
+    metrics = run()  # 复用缓存时文档延迟读取
+    assert metrics.escalations == 1 and metrics.context_cache_reused == 1
+    assert [entry.split(":")[1] for entry in registry._load()] == ["gemini-2.5-flash"]